@@ -18,6 +18,10 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.fsm.context import FSMContext
 import re
 from db.db import  ServerDatabase
+from db.pool import servers_pool
+from db.repo import ServerRepo
+from handlers.balancing import STRATEGIES
+from handlers.config import server_registry
 from aiogram import Router
 from log import logger
 from bot import bot
@@ -119,7 +123,7 @@ async def change_server_ids_handler(callback_query: types.CallbackQuery, state:
     """Обработчик изменения server_ids(списка серверов)"""
     await callback_query.answer()
 
-    current_server_ids = get_current_server_ids()
+    current_server_ids = await get_current_server_ids()
     cancel_button = InlineKeyboardBuilder().add(
         InlineKeyboardButton(text=BUTTON_TEXTS["cancel"], callback_data="cancel_admin")
     )
@@ -139,7 +143,7 @@ async def process_server_ids(message: types.Message, state: FSMContext):
     """Обработка нового значения server_ids"""
     try:
         server_ids = list(map(int, message.text.split(',')))
-        update_server_ids_in_db(server_ids)
+        await update_server_ids_in_db(server_ids)
         user_data = await state.get_data()
         sent_message_id = user_data.get('sent_message_id')
         chat_id = user_data.get('chat_id')
@@ -172,7 +176,7 @@ async def process_server_data(msg: types.Message, state: FSMContext):
             },
             "inbound_ids": list(map(int, data[10].split(";"))),
         }
-        server_db.add_server(server_data)
+        await server_db.add_server(server_data)
 
         await msg.answer("✅ Сервер успешно добавлен!")
         await state.clear()
@@ -186,7 +190,7 @@ async def show_full_servers_info_handler(callback_query: types.CallbackQuery, st
     """Отображение полной информации о серверах и кластерах(группах)."""
     await callback_query.answer()
 
-    server_info = get_full_server_info()
+    server_info = await get_full_server_info()
     if server_info:
         servers_text = "Информация о серверах:\n\n"
         for server in server_info:
@@ -206,7 +210,7 @@ async def show_full_servers_info_handler(callback_query: types.CallbackQuery, st
     else:
         servers_text = "Сервера не найдены.\n\n"
 
-    server_groups = get_server_groups()
+    server_groups = await get_server_groups()
     if server_groups:
         clusters_text = "Информация о кластерах:\n\n"
         for group in server_groups:
@@ -222,7 +226,7 @@ async def show_full_servers_info_handler(callback_query: types.CallbackQuery, st
 async def edit_server_select(callback_query: types.CallbackQuery, state: FSMContext):
     """Запрашивает выбор сервера для редактирования"""
     await callback_query.answer()
-    servers = get_servers()
+    servers = await get_servers()
     if not servers:
         await callback_query.message.edit_text("❌ Нет доступных серверов для редактирования.")
         return
@@ -278,7 +282,7 @@ async def process_edit_server_param(msg: types.Message, state: FSMContext):
         if param not in valid_params:
             await msg.answer(f"❌ Неверный параметр. Пожалуйста, выберите один из следующих: {', '.join(valid_params)}.")
             return
-        success = update_server_data(server_id, param, new_value)
+        success = await update_server_data(server_id, param, new_value)
 
         if success:
             await msg.answer(f"✅ Параметр '{param}' успешно обновлён на '{new_value}'.")
@@ -295,7 +299,7 @@ async def process_edit_server_param(msg: types.Message, state: FSMContext):
 async def delete_server_select(callback_query: types.CallbackQuery, state: FSMContext):
     """Запрашивает выбор сервера для удаления"""
     await callback_query.answer()
-    servers = get_servers()
+    servers = await get_servers()
     if not servers:
         await callback_query.message.edit_text("❌ Нет доступных серверов для удаления.")
         return
@@ -336,7 +340,7 @@ async def process_delete_server(callback_query: types.CallbackQuery, state: FSMC
     await callback_query.answer()
 
     server_id = int(callback_query.data.split("_")[-1])
-    success = delete_server(server_id)
+    success = await delete_server(server_id)
     if success:
         await callback_query.message.edit_text(f"✅ Сервер с ID {server_id} был успешно удалён.")
     else:
@@ -398,7 +402,9 @@ async def process_group_name(message: types.Message, state: FSMContext):
         "Введите список ID серверов через запятую, которые будут включены в кластер (например, '1,3,5'):\n\n"
         "При выборе сервера бот будет сравнивать нагрузку на каждый сервер из этого списка. "
         "Например, если клиент выбрал сервер '1', бот проверит, сколько клиентов сейчас на серверах 1, 2 и 3, "
-        "и создаст подписку на наименее загруженном сервере.",
+        "и создаст подписку на наименее загруженном сервере.\n\n"
+        f"Через пробел можно указать стратегию выбора ({', '.join(STRATEGIES)}), например '1,3,5 p2c'. "
+        "Без нее — стратегия по умолчанию.",
         reply_markup=keyboard.as_markup()
     )
     await state.update_data(
@@ -416,7 +422,8 @@ async def process_server(message: types.Message, state: FSMContext):
     """
     user_data = await state.get_data()
     group_name = user_data["group_name"]
-    server_ids = message.text
+    server_ids, _, strategy = message.text.strip().partition(" ")
+    strategy = strategy.strip() or None
     sent_message_id = user_data.get('sent_message_id')
     chat_id = user_data.get('chat_id')
     previous_message_id = user_data.get('previous_message_id')
@@ -432,20 +439,20 @@ async def process_server(message: types.Message, state: FSMContext):
             "Введите ID серверов через запятую (например, '1,3,5')."
         )
         return
+    if strategy is not None and strategy not in STRATEGIES:
+        await message.answer(f"❌ Неизвестная стратегия. Доступны: {', '.join(STRATEGIES)}.")
+        return
 
     try:
-        connection = sqlite3.connect(SERVEDATABASE)
-        cursor = connection.cursor()
-
-        cursor.execute(
-            "INSERT OR REPLACE INTO server_groups (group_name, server_ids) VALUES (?, ?)",
-            (group_name, server_ids),
-        )
-        connection.commit()
+        async with servers_pool.acquire() as connection:
+            await ServerRepo(connection).upsert_group(group_name, server_ids, strategy)
+            await connection.commit()
+        server_registry.invalidate()
 
         await message.answer(
             f"✅ Группа серверов '{group_name}' успешно добавлена или обновлена.\n\n"
-            f"Список серверов: {server_ids}"
+            f"Список серверов: {server_ids}\n"
+            f"Стратегия: {strategy or 'по умолчанию'}"
         )
     except Exception as e:
         if sent_message_id and chat_id:
@@ -459,6 +466,5 @@ async def process_server(message: types.Message, state: FSMContext):
                 f"❌ Ошибка при добавлении/обновлении группы серверов: {e}"
             )
     finally:
-        connection.close()
         await state.clear()
         
\ No newline at end of file
@@ -16,7 +16,7 @@
 5. Перезагрузка бота и создание резервных копий базы данных.
 """
 
-import sqlite3, asyncio, os, shutil, aiosqlite
+import sqlite3, asyncio, os
 from datetime import datetime
 from aiogram import types
 import io
@@ -28,7 +28,12 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from datetime import datetime
-from db.db import Database, get_server_ids_as_list
+from db.db import get_server_ids_as_list
+from db.pool import users_pool, servers_pool
+from db.repo import UserRepo, SubscriptionRepo, ServerRepo, PromoRepo, ReferralRepo, DAY_MS, days_left_from_expiry
+from db.writer import users_writer
+from db.cache import profile_cache
+from db.backup import create_backup as create_db_backup, prune_backups, BackupError
 from aiogram.types.input_file import FSInputFile
 from aiogram import Router, F
 from aiogram.types import ContentType, Message
@@ -36,19 +41,18 @@ from aiogram.fsm.state import State, StatesGroup
 import random
 import string
 import logging
-import aiohttp
-import json
 from db.db import get_referral_info_by_code
 from aiogram.types import InlineKeyboardMarkup
-from client.upd_sub import update_client_subscription
+from client.upd_sub import extend_subscriptions_bulk, notify_subscription_extended
 
 logger = logging.getLogger(__name__)
 
 from log import logger
 from admin.delete_clients import get_inactive_clients, delete_depleted_clients
 from bot import bot
-from client.add_client import login
-from handlers.config import get_server_data
+from handlers.panel import get_panel
+from handlers.panel_json import CLIENT_FIELDS
+from handlers.config import get_server_data, server_registry
 from admin.sub_check import scheduled_check_subscriptions, get_server_ids_as_list_for_days_left
 from handlers.states import BroadcastState, AddPromoCodeState, ManagePromoCodeState, ManageServerGroupState
 from buttons.admin import BUTTON_TEXTS
@@ -61,7 +65,6 @@ ADMIN_IDS = list(map(int, os.getenv("ADMIN_IDS").split(",")))
 USERSDATABASE = os.getenv("USERSDATABASE")
 SERVEDATABASE = os.getenv("SERVEDATABASE")
 DATABASE_PATH = os.getenv("DATABASE_PATH")
-BACKUP_DIR = os.getenv("BACKUP_DIR")
 router = Router()
 
 @router.message(Command("get_chat_id"))
@@ -163,7 +166,7 @@ async def export_referrals_handler(callback_query: types.CallbackQuery):
     await callback_query.answer("⏳ Подготовка файла...", show_alert=False)
 
     try:
-        async with aiosqlite.connect("users.db") as conn:
+        async with users_pool.acquire() as conn:
             cursor = await conn.execute("SELECT id, telegram_user FROM referal_tables")
             rows = await cursor.fetchall()
 
@@ -280,22 +283,9 @@ async def broadcast_to_expired_subscribers(message: Message, state: FSMContext):
         await message.answer('Рассылка отменена.')
         return
 
-    # Собираем всех пользователей, у которых days_left <= 0
-    async with aiosqlite.connect("users.db") as conn:
-        # Нам нужно:
-        # users.telegram_id
-        # WHERE у пользователя есть email в user_emails
-        # И хотя бы один user_configs.days_left <= 0
-        query = """
-            SELECT DISTINCT u.telegram_id
-            FROM users u
-            JOIN user_emails ue ON u.id = ue.user_id
-            JOIN user_configs uc ON ue.email = uc.email
-            WHERE uc.days_left <= 0
-        """
-        async with conn.execute(query) as cursor:
-            rows = await cursor.fetchall()
-            users_data = [(row[0],) for row in rows]  # telegram_id
+    # Собираем всех пользователей, у которых хотя бы одна подписка закончилась
+    async with users_pool.acquire() as conn:
+        users_data = [(telegram_id,) for telegram_id in await SubscriptionRepo(conn).expired_telegram_ids()]
 
     await state.clear()
 
@@ -355,7 +345,7 @@ async def universe_broadcast(message: Message, state: FSMContext):
     else:  # all
         query = "SELECT telegram_id FROM users"
 
-    async with aiosqlite.connect(USERSDATABASE) as conn:
+    async with users_pool.acquire() as conn:
         async with conn.cursor() as cursor:
             await cursor.execute(query)
             users_data = await cursor.fetchall()
@@ -460,18 +450,16 @@ async def show_statistics(message: types.Message):
     args = message.text.split()
     user_id = int(args[1]) if len(args) > 1 and args[1].isdigit() else None
 
-    conn = sqlite3.connect(USERSDATABASE)
-    cursor = conn.cursor()
-
     if user_id:
-        cursor.execute(
-            """
-            SELECT telegram_link, telegram_id, referral_count, sum_my, sum_ref, entry_date
-            FROM users WHERE telegram_id = ?
-            """,
-            (user_id,)
-        )
-        user_data = cursor.fetchone()
+        async with users_pool.acquire() as conn:
+            async with conn.execute(
+                """
+                SELECT telegram_link, telegram_id, referral_count, sum_my, sum_ref, entry_date
+                FROM users WHERE telegram_id = ?
+                """,
+                (user_id,)
+            ) as cursor:
+                user_data = await cursor.fetchone()
 
         if user_data:
             telegram_link, telegram_id, referral_count, sum_my, sum_ref, entry_date = user_data
@@ -491,29 +479,19 @@ async def show_statistics(message: types.Message):
 
     else:
         # Общие статистики
-        cursor.execute("SELECT COUNT(*) FROM users")
-        total_bot_users = cursor.fetchone()[0]
-
-        cursor.execute("SELECT COUNT(*) FROM users WHERE sum_my != 0")
-        total_bot_userssum = cursor.fetchone()[0]
-
-        cursor.execute("SELECT COUNT(*) FROM user_emails")
-        total_clients = cursor.fetchone()[0]
-
-        cursor.execute("SELECT COUNT(*) FROM users WHERE has_trial = 1")
-        users_with_trial = cursor.fetchone()[0]
-
-        cursor.execute("SELECT COUNT(*) FROM users WHERE has_trial = 0 OR sum_my = 0")
-        users_bez_podpiski = cursor.fetchone()[0]
-
-        cursor.execute("SELECT COUNT(*) FROM users WHERE promo_code_usage > 0")
-        users_with_promo = cursor.fetchone()[0]
-
-        cursor.execute("SELECT SUM(referral_count) FROM users")
-        total_referrals = cursor.fetchone()[0] or 0
-
-        cursor.execute("SELECT MIN(entry_date), MAX(entry_date) FROM users")
-        first_user_date, last_user_date = cursor.fetchone()
+        async with users_pool.acquire() as conn:
+            async def fetch_one(query):
+                async with conn.execute(query) as cursor:
+                    return await cursor.fetchone()
+
+            total_bot_users = (await fetch_one("SELECT COUNT(*) FROM users"))[0]
+            total_bot_userssum = (await fetch_one("SELECT COUNT(*) FROM users WHERE sum_my != 0"))[0]
+            total_clients = (await fetch_one("SELECT COUNT(*) FROM user_emails"))[0]
+            users_with_trial = (await fetch_one("SELECT COUNT(*) FROM users WHERE has_trial = 1"))[0]
+            users_bez_podpiski = (await fetch_one("SELECT COUNT(*) FROM users WHERE has_trial = 0 OR sum_my = 0"))[0]
+            users_with_promo = (await fetch_one("SELECT COUNT(*) FROM users WHERE promo_code_usage > 0"))[0]
+            total_referrals = (await fetch_one("SELECT SUM(referral_count) FROM users"))[0] or 0
+            first_user_date, last_user_date = await fetch_one("SELECT MIN(entry_date), MAX(entry_date) FROM users")
 
         # Формируем основную часть статистики
         stats_text = (
@@ -534,10 +512,6 @@ async def show_statistics(message: types.Message):
         # Отправляем итоговое сообщение
         await message.answer(stats_text, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
 
-    # Закрываем соединение
-    cursor.close()
-    conn.close()
-
 
 @router.message(F.text == BUTTON_TEXTS["top_referrers"])
 @router.message(Command("top"))
@@ -551,41 +525,35 @@ async def show_top_referrers(message: types.Message):
 
     await message.delete()
 
-    # Проверка существования файла БД
-    if not os.path.exists(USERSDATABASE):
+    # Проверка существования файла БД (у базы в памяти файла нет)
+    if users_pool.storage.path and not os.path.exists(users_pool.storage.path):
         logger.error("Файл базы данных не найден")
         await message.answer("⚠️ Файл базы данных не найден.")
         return
 
     try:
-        conn = sqlite3.connect(USERSDATABASE)
-        cursor = conn.cursor()
-    except Exception as e:
-        logger.error(f"Ошибка подключения к БД: {e}")
-        await message.answer("⚠️ Не удалось подключиться к базе данных.")
-        return
-
-    try:
-        # Проверка, существует ли таблица users
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users';")
-        if not cursor.fetchone():
-            await message.answer("⚠️ Таблица 'users' не найдена.")
-            return
-
-        # Запрос топ-100 рефоводов
-        cursor.execute("""
-            SELECT 
-                telegram_link, 
-                telegram_id, 
-                referral_count, 
-                sum_my, 
-                sum_ref 
-            FROM users 
-            WHERE referral_count > 0 
-            ORDER BY referral_count DESC 
-            LIMIT 100
-        """)
-        top_referrers = cursor.fetchall()
+        async with users_pool.acquire() as conn:
+            # Проверка, существует ли таблица users
+            async with conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users';") as cursor:
+                users_table = await cursor.fetchone()
+            if not users_table:
+                await message.answer("⚠️ Таблица 'users' не найдена.")
+                return
+
+            # Запрос топ-100 рефоводов
+            async with conn.execute("""
+                SELECT 
+                    telegram_link, 
+                    telegram_id, 
+                    referral_count, 
+                    sum_my, 
+                    sum_ref 
+                FROM users 
+                WHERE referral_count > 0 
+                ORDER BY referral_count DESC 
+                LIMIT 100
+            """) as cursor:
+                top_referrers = await cursor.fetchall()
 
         if not top_referrers:
             await message.answer("🤷‍♂️ Пока нет ни одного рефовода.")
@@ -613,13 +581,6 @@ async def show_top_referrers(message: types.Message):
         logger.error(f"Ошибка при выводе топа рефоводов: {e}", exc_info=True)
         await message.answer("⚠️ Произошла ошибка при получении топа рефоводов.")
 
-    finally:
-        try:
-            cursor.close()
-            conn.close()
-        except:
-            pass
-
 
 @router.message(F.text == BUTTON_TEXTS["delete_clients"])
 async def cmd_delete_clients(message: types.Message):
@@ -641,15 +602,12 @@ async def cmd_delete_clients(message: types.Message):
             continue
 
         try:
-            session_id = await login(server_data['login_url'], {
-                "username": server_data['username'],
-                "password": server_data['password']
-            })
+            panel = get_panel(server_data)
 
-            inactive_clients = await get_inactive_clients(server_data['list_clients_url'], session_id)
+            inactive_clients = await get_inactive_clients(panel)
             results.append(f"Сервер {server_data['name']}:\n{inactive_clients}")
             await scheduled_delete_clients()
-            deleted_clients = await delete_depleted_clients(server_data['delete_depleted_clients_url'], session_id)
+            deleted_clients = await delete_depleted_clients(panel)
             results.append(f"Сервер {server_data['name']}: {deleted_clients}")
         except Exception as e:
             results.append(f"❌ Ошибка при удалении клиентов на сервере {server_data['name']}: {str(e)}")
@@ -684,24 +642,22 @@ async def create_backup(message: types.Message):
         await message.answer("❌ У вас нет прав для выполнения этой команды.")
         return
 
-    backup_filename = f"backup_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.db"
-    backup_path = os.path.join(BACKUP_DIR, backup_filename)
-
     try:
-        shutil.copy(DATABASE_PATH, backup_path)
-        logger.info(f"Бекап базы данных создан: {backup_path}")
+        # Копия через backup API в отдельном потоке, проверенная integrity_check и сжатая
+        backup_path = await create_db_backup(DATABASE_PATH or USERSDATABASE)
+        prune_backups(DATABASE_PATH or USERSDATABASE)
+        backup_filename = os.path.basename(backup_path)
         await message.answer_document(
             document=FSInputFile(backup_path),
             caption=f"💾 Резервная копия базы данных: `{backup_filename}`",
             parse_mode="Markdown"
         )
+    except BackupError as e:
+        logger.error(f"Ошибка при создании бекапа: {e}")
+        await message.answer("❌ Ошибка при создании бекапа базы данных. Попробуйте позже.")
     except Exception as e:
-        logger.error(f"Ошибка при создании бекапа: {e}", exc_info=True)
+        logger.error(f"Ошибка при отправке бекапа: {e}", exc_info=True)
         await message.answer("❌ Ошибка при создании бекапа базы данных. Попробуйте позже.")
-    finally:
-        if os.path.exists(backup_path):
-            os.remove(backup_path)
-            logger.info(f"Временный файл бекапа удален: {backup_path}")
             
 
 class AddPromoCodeState(StatesGroup):
@@ -714,9 +670,8 @@ async def start_adding_promo_code(message: types.Message, state: FSMContext):
     """Начинает процесс добавления нового промокода, отображая список активных промокодов."""
     await message.delete()
     try:
-        db = Database(USERSDATABASE) 
-        db.cursor.execute('''SELECT code, discount, days FROM promo_codes WHERE is_active = 1''')
-        promo_codes = db.cursor.fetchall()
+        async with users_pool.acquire() as conn:
+            promo_codes = await PromoRepo(conn).list_active()
 
         keyboard = InlineKeyboardBuilder()
         keyboard.add(
@@ -725,7 +680,7 @@ async def start_adding_promo_code(message: types.Message, state: FSMContext):
 
         if promo_codes:
             promo_codes_list = "\n".join(
-                [f"🤑 Промокод: {promo_code[0]} - Скидка: {promo_code[1]}% - Дней: {promo_code[2]}" 
+                [f"🤑 Промокод: {promo_code.code} - Скидка: {promo_code.discount}% - Дней: {promo_code.days}" 
                  for promo_code in promo_codes]
             )
             sent_message = await message.answer(
@@ -784,18 +739,9 @@ async def process_days(message: types.Message, state: FSMContext):
         discount = data["discount"]
 
         try:
-            db = Database(USERSDATABASE)
-            # Обновляем структуру таблицы, если нужно
-            try:
-                db.cursor.execute("ALTER TABLE promo_codes ADD COLUMN days INTEGER DEFAULT 30")
-            except sqlite3.OperationalError:
-                pass  # Колонка уже существует
-                
-            db.cursor.execute('''
-                INSERT INTO promo_codes (code, discount, days, is_active)
-                VALUES (?, ?, ?, 1)
-            ''', (promo_code, discount, days))
-            db.connection.commit()
+            async with users_pool.acquire() as conn:
+                await PromoRepo(conn).add(promo_code, discount, days)
+                await conn.commit()
             
             await message.answer(
                 f"✅ Промокод '{promo_code}' добавлен успешно!\n"
@@ -817,17 +763,16 @@ async def start_deleting_promo_code(message: types.Message):
     """Начинает процесс удаления промокода, отображая список активных промокодов."""
     await message.delete()
     try:
-        db = Database(USERSDATABASE)
-        db.cursor.execute('''SELECT code, discount FROM promo_codes WHERE is_active = 1''')
-        promo_codes = db.cursor.fetchall()
+        async with users_pool.acquire() as conn:
+            promo_codes = await PromoRepo(conn).list_active()
 
         if promo_codes:
             keyboard = InlineKeyboardBuilder()
             for promo_code in promo_codes:
                 keyboard.add(
                     InlineKeyboardButton(
-                        text=f"🤑 {promo_code[0]} - {promo_code[1]}%",
-                        callback_data=f"delete_{promo_code[0]}"
+                        text=f"🤑 {promo_code.code} - {promo_code.discount}%",
+                        callback_data=f"delete_{promo_code.code}"
                     )
                 )
             await message.answer("Выберите промокод для удаления:", reply_markup=keyboard.adjust(1).as_markup())
@@ -840,7 +785,7 @@ async def start_deleting_promo_code(message: types.Message):
 @router.callback_query(lambda c: c.data.startswith("delete_"))
 async def confirm_delete_promo_code(callback_query: types.CallbackQuery, state: FSMContext):
     """Запрашивает подтверждение удаления выбранного промокода."""
-    promo_code = callback_query.data.split("_")[1]
+    promo_code = callback_query.data.split("_", 1)[1]
     await state.update_data(promo_code_to_delete=promo_code)
 
     keyboard = InlineKeyboardBuilder()
@@ -865,12 +810,9 @@ async def delete_promo_code(callback_query: types.CallbackQuery, state: FSMConte
     data = await state.get_data()
     promo_code_to_delete = data.get("promo_code_to_delete")
     try:
-        db = Database(USERSDATABASE)
-        db.cursor.execute('''
-            DELETE FROM promo_codes
-            WHERE code = ?
-        ''', (promo_code_to_delete,))
-        db.connection.commit()
+        async with users_pool.acquire() as conn:
+            await PromoRepo(conn).delete(promo_code_to_delete)
+            await conn.commit()
         await callback_query.message.edit_text(f"✅ Промокод '{promo_code_to_delete}' успешно удалён!")
     except Exception as e:
         await callback_query.message.edit_text(f"❌ Ошибка при удалении промокода: {e}")
@@ -893,17 +835,18 @@ async def reset_referral_sum(message: types.Message):
 
     user_id = int(args[1])
 
-    conn = sqlite3.connect(USERSDATABASE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT telegram_link, sum_ref FROM users WHERE telegram_id = ?", (user_id,))
-    user_data = cursor.fetchone()
+    async with users_pool.acquire() as conn:
+        users = UserRepo(conn)
+        user_data = await users.get(user_id)
+        if user_data:
+            await users.reset_sum_ref(user_id)
+            await conn.commit()
+    profile_cache.invalidate(user_id)
 
     if not user_data:
         await message.answer("⚠️ Пользователь не найден в базе.")
     else:
-        telegram_link, sum_ref = user_data
-        cursor.execute("UPDATE users SET sum_ref = 0 WHERE telegram_id = ?", (user_id,))
-        conn.commit()
+        telegram_link, sum_ref = user_data.telegram_link, user_data.sum_ref
 
         await message.answer(
             f"✅ <b>Обнулена реферальная сумма</b>\n"
@@ -913,9 +856,6 @@ async def reset_referral_sum(message: types.Message):
             parse_mode=ParseMode.HTML,
             disable_web_page_preview=True
         )
-
-    cursor.close()
-    conn.close()
     
     
 @router.callback_query(lambda c: c.data == "cluster_delete")
@@ -923,11 +863,9 @@ async def start_deleting_server_group(callback_query: types.CallbackQuery):
     """Начинает процесс удаления группы серверов, отображая список групп."""
     await callback_query.message.delete()
 
-    db = Database(SERVEDATABASE)
     try:
-        db.cursor.execute('SELECT group_name FROM server_groups')
-        server_groups = db.cursor.fetchall()
-        db.connection.close()
+        async with servers_pool.acquire() as conn:
+            server_groups = await ServerRepo(conn).groups()
 
         if server_groups:
             keyboard = InlineKeyboardBuilder()
@@ -945,7 +883,6 @@ async def start_deleting_server_group(callback_query: types.CallbackQuery):
         else:
             await callback_query.message.answer("❌ Нет доступных групп для удаления.")
     except Exception as e:
-        db.connection.close()
         await callback_query.message.answer(f"❌ Ошибка при получении списка групп: {e}")
 
 
@@ -954,15 +891,14 @@ async def delete_server_group(callback_query: types.CallbackQuery):
     """Удаляет выбранную группу серверов без подтверждения."""
     group_name = callback_query.data.split("_", 2)[2]
 
-    db = Database(SERVEDATABASE)
     try:
-        db.cursor.execute('DELETE FROM server_groups WHERE group_name = ?', (group_name,))
-        db.connection.commit()
-        db.connection.close()
+        async with servers_pool.acquire() as conn:
+            await ServerRepo(conn).delete_group(group_name)
+            await conn.commit()
+        server_registry.invalidate()
 
         await callback_query.message.edit_text(f"✅ Группа серверов '{group_name}' успешно удалена!")
     except Exception as e:
-        db.connection.close()
         await callback_query.message.edit_text(f"❌ Ошибка при удалении группы серверов: {e}")
 
 #все рефералы
@@ -989,11 +925,9 @@ async def create_referral(message: types.Message, state: FSMContext, bot):
     user_id = message.from_user.id
     code = ''.join(random.choices(string.ascii_letters + string.digits, k=10))
 
-    conn = sqlite3.connect("users.db")
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO referals (user_id, name, code) VALUES (?, ?, ?)", (user_id, name, code))
-    conn.commit()
-    conn.close()
+    async with users_pool.acquire() as conn:
+        await ReferralRepo(conn).create(user_id, name, code)
+        await conn.commit()
 
     bot_username = (await bot.get_me()).username
     link = f"https://t.me/{bot_username}?start={code}"
@@ -1005,19 +939,16 @@ async def create_referral(message: types.Message, state: FSMContext, bot):
 async def list_all_referrals(message: types.Message):
     user_id = message.from_user.id
 
-    conn = sqlite3.connect("users.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT name, code FROM referals WHERE user_id = ?", (user_id,))
-    referals = cursor.fetchall()
-    conn.close()
+    async with users_pool.acquire() as conn:
+        referals = await ReferralRepo(conn).list_by_owner(user_id)
 
     if not referals:
         await message.answer("У вас пока нет рефералов.")
         return
 
     kb = InlineKeyboardBuilder()
-    for name, code in referals:
-        kb.add(InlineKeyboardButton(text=name, callback_data=f"ref_link:{code}"))
+    for referal in referals:
+        kb.add(InlineKeyboardButton(text=referal.name, callback_data=f"ref_link:{referal.code}"))
 
     await message.answer("Ваши рефералы:", reply_markup=kb.adjust(1).as_markup())
 
@@ -1031,7 +962,7 @@ async def show_referral_details(callback: types.CallbackQuery):
         await callback.answer("Загружаем данные…", show_alert=False)
         name, code, clicks = referral
 
-        async with aiosqlite.connect("users.db") as conn:
+        async with users_pool.acquire() as conn:
             # Получаем сумму покупок из таблицы referals
             cursor = await conn.execute(
                 "SELECT amount FROM referals WHERE code = ?",
@@ -1085,16 +1016,15 @@ def create_ref_stats_keyboard():
 
 async def sync_days_left_from_servers():
     """
-    Синхронизирует days_left в user_configs с данными с серверов.
+    Синхронизирует expires_at в user_configs с данными с серверов.
+    Записываются только клиенты, у которых срок на сервере изменился.
     Может вызываться как по расписанию, так и по кнопке.
     """
     logger.info("🔄 [sync_days_left_from_servers] Начало синхронизации...")
 
     try:
-        async with aiosqlite.connect("users.db") as conn:
-            async with conn.execute("SELECT email FROM user_configs") as cursor:
-                rows = await cursor.fetchall()
-                emails = [row[0] for row in rows]
+        async with users_pool.acquire() as conn:
+            emails = await SubscriptionRepo(conn).all_expires_at()  # email -> expires_at
         logger.info(f"📁 Найдено {len(emails)} email'ов в user_configs.")
     except Exception as e:
         logger.error(f"❌ Ошибка чтения user_configs: {e}")
@@ -1105,7 +1035,7 @@ async def sync_days_left_from_servers():
         return
 
     try:
-        server_ids = await get_server_ids_as_list_for_days_left("servers.db")
+        server_ids = await get_server_ids_as_list_for_days_left(SERVEDATABASE)
         if not server_ids:
             logger.warning("📭 Нет активных серверов.")
             return
@@ -1114,54 +1044,43 @@ async def sync_days_left_from_servers():
         return
 
     updated_count = 0
+    pending_writes = []
 
     for server_id in server_ids:
         server_data = await get_server_data(server_id)
         if not server_data:
             continue
 
-        async with aiohttp.ClientSession() as session:
-            try:
-                # Логин
-                login_resp = await session.post(
-                    server_data["login_url"],
-                    json={"username": server_data["username"], "password": server_data["password"]}
-                )
-                if login_resp.status != 200:
+        panel = get_panel(server_data)
+        try:
+            for inbound_id in server_data["inbound_ids"]:
+                inbound = await panel.get_inbound(inbound_id, fields=CLIENT_FIELDS)
+                if inbound is None:
                     continue
-                session_id = login_resp.cookies.get('3x-ui').value
-                headers = {'Accept': 'application/json', 'Cookie': f'3x-ui={session_id}'}
 
-                for inbound_id in server_data["inbound_ids"]:
-                    inbound_url = f"{server_data['config_client_url']}/{inbound_id}"
-                    resp = await session.get(inbound_url, headers=headers)
-                    if resp.status != 200:
+                for client in inbound.clients:
+                    email = client.get('email')
+                    if not email or email not in emails:
                         continue
-                    data = await resp.json()
-                    clients = json.loads(data['obj']['settings']).get('clients', [])
-
-                    for client in clients:
-                        email = client.get('email')
-                        if not email or email not in emails:
-                            continue
-
-                        expiry_time = client.get('expiryTime')
-                        if not expiry_time or expiry_time <= 0:
-                            days_left = -1
-                        else:
-                            expiry_dt = datetime.fromtimestamp(expiry_time / 1000)
-                            days_left = (expiry_dt.date() - datetime.now().date()).days
-
-                        async with aiosqlite.connect("users.db") as conn:
-                            await conn.execute(
-                                "UPDATE user_configs SET days_left = ? WHERE email = ?",
-                                (days_left, email)
-                            )
-                            await conn.commit()
-                        updated_count += 1
-
-            except Exception as e:
-                logger.error(f"❌ Ошибка при обработке сервера {server_id}: {e}")
+
+                    expires_at = int(client.get('expiryTime') or 0)
+                    if emails[email] == expires_at:
+                        continue  # срок не менялся — писать нечего
+                    emails[email] = expires_at
+
+                    # Не ждем каждую запись по отдельности — писатель сложит их в общие пачки
+                    pending_writes.append(users_writer.enqueue(
+                        lambda conn, email=email, expires_at=expires_at: SubscriptionRepo(conn).set_expires_at(email, expires_at)
+                    ))
+                    updated_count += 1
+
+        except Exception as e:
+            logger.error(f"❌ Ошибка при обработке сервера {server_id}: {e}")
+
+    results = await asyncio.gather(*pending_writes, return_exceptions=True)
+    for error in (r for r in results if isinstance(r, Exception)):
+        logger.error(f"❌ Ошибка обновления expires_at: {error}")
+        updated_count -= 1
 
     logger.info(f"✅ Синхронизация завершена. Обновлено: {updated_count} записей.")
 
@@ -1220,7 +1139,7 @@ async def process_user_identifier(message: Message, state: FSMContext):
 
     pattern = f"%t.me/{search_username}%"
 
-    async with aiosqlite.connect("users.db") as conn:
+    async with users_pool.acquire() as conn:
         cursor = await conn.cursor()
         await cursor.execute("SELECT * FROM users WHERE LOWER(telegram_link) LIKE ?", (pattern,))
         row = await cursor.fetchone()
@@ -1292,7 +1211,7 @@ async def user_info_callback_for_admin(call: types.CallbackQuery, state: FSMCont
     user_details = None
     configs = []
 
-    async with aiosqlite.connect("users.db") as conn:
+    async with users_pool.acquire() as conn:
         cursor = await conn.cursor()
 
         # Получаем email и id_server из user_emails по users.id
@@ -1308,7 +1227,7 @@ async def user_info_callback_for_admin(call: types.CallbackQuery, state: FSMCont
             for email, id_server in emails_rows:
                 # Для каждого email получаем конфиги из user_configs
                 await cursor.execute("""
-                    SELECT config, days_left 
+                    SELECT config, expires_at 
                     FROM user_configs 
                     WHERE email = ?
                 """, (email,))
@@ -1346,7 +1265,8 @@ async def user_info_callback_for_admin(call: types.CallbackQuery, state: FSMCont
             full_info_text += f"🔹 <b>Сервер:</b> {id_server or '—'}\n"
 
             if configs:
-                for i, (config, days_left) in enumerate(configs):
+                for i, (config, expires_at) in enumerate(configs):
+                    days_left = days_left_from_expiry(expires_at)
                     full_info_text += f"  🔹 <b>Конфиг {i+1}:</b> <code>{config}</code>\n"
                     full_info_text += f"     🔹 <b>Дней осталось:</b> {days_left if days_left != -1 else 'бессрочно'}\n"
             else:
@@ -1417,7 +1337,7 @@ async def process_extension_days(message: Message, state: FSMContext):
     user_id_in_db = target_user['id']
 
     # Получаем все email пользователя
-    async with aiosqlite.connect("users.db") as conn:
+    async with users_pool.acquire() as conn:
         cursor = await conn.cursor()
 
         await cursor.execute("SELECT email FROM user_emails WHERE user_id = ?", (user_id_in_db,))
@@ -1429,30 +1349,31 @@ async def process_extension_days(message: Message, state: FSMContext):
 
         emails = [row[0] for row in emails_rows]
 
-        # 📦 Обновляем days_left в user_configs (если не бессрочный)
+        # 📦 Сдвигаем expires_at в user_configs (если не бессрочный)
         updated_configs_count = 0
         for email in emails:
             await cursor.execute("""
                 UPDATE user_configs 
-                SET days_left = CASE 
-                    WHEN days_left = -1 THEN -1 
-                    ELSE COALESCE(days_left, 0) + ?
-                END
-                WHERE email = ?
-            """, (days, email))
+                SET expires_at = expires_at + ?
+                WHERE email = ? AND expires_at > 0
+            """, (days * DAY_MS, email))
             updated_configs_count += cursor.rowcount
 
         await conn.commit()
 
-    # 🌐 Обновляем подписку на сервере для каждого email
-    server_results = []
-    for email in emails:
+    # 🌐 Продлеваем подписки на серверах пакетно: один проход на inbound вместо запроса на каждый email
+    try:
+        results_by_email, extended = await extend_subscriptions_bulk(emails, days)
+        server_results = [line for lines in results_by_email.values() for line in lines]
+    except Exception as e:
+        logger.error(f"Ошибка при пакетном продлении подписок {emails}: {e}")
+        server_results, extended = [f"❌ Ошибка: {str(e)}"], {}
+
+    for email, new_expiry_time in extended.items():
         try:
-            result = await update_client_subscription(telegram_id, email, days)
-            server_results.append(result)
+            await notify_subscription_extended(telegram_id, email, new_expiry_time)
         except Exception as e:
-            logger.error(f"Ошибка при обновлении подписки на сервере для {email}: {e}")
-            server_results.append(f"❌ Ошибка для {email}: {str(e)}")
+            logger.error(f"Ошибка уведомления о продлении {email}: {e}")
 
     # 📢 Формируем итоговое сообщение
     success_count = sum(1 for r in server_results if "успешно" in r or "success" in r)
@@ -1494,7 +1415,7 @@ async def user_stats_callback_for_admin(call: types.CallbackQuery, state: FSMCon
     telegram_id = target_user['telegram_id']  # Это и есть TARGET_USER_ID для статистики
 
     try:
-        async with aiosqlite.connect("users.db") as db:
+        async with users_pool.acquire() as db:
             # Количество рефералов
             async with db.execute(
                 "SELECT COUNT(*) FROM users WHERE referred_by = ?", (telegram_id,)
@@ -1548,11 +1469,10 @@ async def block_user(call: types.CallbackQuery, state: FSMContext):
     username = target_user['username'] or "Пользователь"
 
     # Обновляем статус в БД
-    async with aiosqlite.connect("users.db") as conn:
-        await conn.execute(
-            "UPDATE users SET is_blocked = 1 WHERE telegram_id = ?", (telegram_id,)
-        )
+    async with users_pool.acquire() as conn:
+        await UserRepo(conn).set_blocked(telegram_id, True)
         await conn.commit()
+    profile_cache.invalidate(telegram_id)
 
     # Обновляем данные в состоянии
     target_user['is_blocked'] = 1
@@ -1601,11 +1521,10 @@ async def unblock_user(call: types.CallbackQuery, state: FSMContext):
     username = target_user['username'] or "Пользователь"
 
     # Обновляем статус в БД
-    async with aiosqlite.connect("users.db") as conn:
-        await conn.execute(
-            "UPDATE users SET is_blocked = 0 WHERE telegram_id = ?", (telegram_id,)
-        )
+    async with users_pool.acquire() as conn:
+        await UserRepo(conn).set_blocked(telegram_id, False)
         await conn.commit()
+    profile_cache.invalidate(telegram_id)
 
     # Обновляем данные в состоянии
     target_user['is_blocked'] = 0
@@ -1690,7 +1609,7 @@ async def delete_user_execute(call: types.CallbackQuery, state: FSMContext):
     deleted_configs = 0
 
     try:
-        async with aiosqlite.connect("users.db") as conn:
+        async with users_pool.acquire() as conn:
             cursor = await conn.cursor()
 
             # 1. Получаем все email пользователя
@@ -1710,6 +1629,7 @@ async def delete_user_execute(call: types.CallbackQuery, state: FSMContext):
             # 4. Удаляем пользователя
             await cursor.execute("DELETE FROM users WHERE telegram_id = ?", (telegram_id,))
             await conn.commit()
+        profile_cache.invalidate(telegram_id)
 
         # 📢 Уведомление админу
         success_text = (
@@ -1,9 +1,10 @@
-import sqlite3
-import aiohttp
-import requests
 from handlers.config import  get_server_data
-from client.add_client import login
+from handlers.panel import get_panel, PanelError
+from handlers.locator import locator
+from handlers.capacity import slot_tracker
 from db.db import get_server_ids_as_list
+from db.pool import users_pool
+from db.cache import profile_cache
 from dotenv import load_dotenv
 import os
 from log import logger
@@ -36,16 +37,15 @@ async def scheduled_delete_clients():
                 continue
 
             try:
-                session_id = await login(server_data['login_url'], {
-                    "username": server_data['username'],
-                    "password": server_data['password']
-                })
+                panel = get_panel(server_data)
 
-                inactive_clients = await get_inactive_clients(server_data['list_clients_url'], session_id)
+                inactive_clients = await get_inactive_clients(panel)
                 results.append(f"Сервер {server_data['name']}:\n{inactive_clients}")
 
-                deleted_clients = await delete_depleted_clients(server_data['delete_depleted_clients_url'], session_id)
+                deleted_clients = await delete_depleted_clients(panel)
                 results.append(f"Сервер {server_data['name']}: {deleted_clients}")
+                # Сколько клиентов удалила панель, неизвестно — пересчитаем места при следующем выборе
+                slot_tracker.invalidate(server_selection)
             except Exception as e:
                 results.append(f"❌ Ошибка при удалении клиентов на сервере {server_data['name']}: {str(e)}")
 
@@ -54,68 +54,44 @@ async def scheduled_delete_clients():
         logger.error(f"Ошибка в процессе планировщика: {e}")
 
 
-async def get_inactive_clients(list_clients_url, session_id):
+async def get_inactive_clients(panel):
     """
     Получает список отключенных клиентов с сервера и удаляет их из базы данных.
     """
-    conn = sqlite3.connect(USERSDATABASE)
-    cursor = conn.cursor()
-
-    headers = {
-        'Accept': 'application/json, text/plain, */*',
-        'X-Requested-With': 'XMLHttpRequest',
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 YaBrowser/24.7.0.0 Safari/537.36',
-        'Cookie': f'3x-ui={session_id}'
-    }
-    async with aiohttp.ClientSession() as session:
-        async with session.post(list_clients_url, headers=headers) as response:
-            if response.status == 200:
-                try:
-                    response_data = await response.json()
-                    clients = response_data.get('obj', [])
-
-                    if isinstance(clients, list):
-                        disabled_emails = [
-                            client['email'] 
-                            for inbound in clients 
-                            for client in inbound.get('clientStats', []) 
-                            if not client.get('enable', True)
-                        ]
-                        
-                        if disabled_emails:
-                            for email in disabled_emails:
-                                cursor.execute('DELETE FROM user_emails WHERE email = ?', (email,))
-                            conn.commit()
-                            return f"Подписка истекла у: {', '.join(disabled_emails)}. Отключенные email удалены из базы данных."
-                        else:
-                            return "Нет клиентов."
-                    else:
-                        return "Ожидался список клиентов, но ответ имеет другой формат."
-                except ValueError:
-                    return "Ответ от API не в формате JSON."
-            else:
-                return f"Ошибка при получении списка клиентов: статус {response.status}"
-
-    conn.close()
-
-async def delete_depleted_clients(delete_url, session_id):
+    try:
+        inbounds = await panel.list_inbounds()
+    except PanelError as e:
+        return f"Ошибка при получении списка клиентов: {e}"
+
+    disabled_emails = [
+        client['email']
+        for inbound in inbounds
+        for client in inbound.client_stats
+        if not client.get('enable', True)
+    ]
+
+    if not disabled_emails:
+        return "Нет клиентов."
+
+    async with users_pool.acquire() as conn:
+        await conn.executemany(
+            'DELETE FROM user_emails WHERE email = ?',
+            [(email,) for email in disabled_emails]
+        )
+        await conn.commit()
+    for email in disabled_emails:
+        locator.remove(email)
+    # Владельцев удаленных логинов не знаем — сбрасываем кэш профилей целиком
+    profile_cache.clear()
+    return f"Подписка истекла у: {', '.join(disabled_emails)}. Отключенные email удалены из базы данных."
+
+async def delete_depleted_clients(panel):
     """
     Удаляет отключенных клиентов с сервера.
     """
-    headers = {
-        'Accept': 'application/json',
-        'Cookie': f'3x-ui={session_id}'
-    }
     try:
-        response = requests.post(delete_url, headers=headers)
-        if response.status_code == 200:
-            deleted_clients = response.json().get('deleted_clients', [])           
-            if deleted_clients:
-                return f"✅ Отключенные клиенты успешно удалены: {', '.join(deleted_clients)}."
-            else:
-                return "✅ Отключенные клиенты успешно удалены:."
-        else:
-            return "❌ Не удалось удалить отключенных клиентов."
-    except Exception as e:
+        await panel.delete_depleted_clients()
+        return "✅ Отключенные клиенты успешно удалены."
+    except PanelError as e:
         logger.error(f"Ошибка при удалении клиентов: {e}")
-        return "❌ Произошла ошибка при удалении клиентов."
+        return "❌ Не удалось удалить отключенных клиентов."
@@ -2,6 +2,7 @@ from dotenv import load_dotenv
 import os
 from bot import bot
 import aiosqlite
+from db.pool import users_pool
 from log import logger
 
 load_dotenv()
@@ -23,7 +24,7 @@ async def notify_admins(telegram_id: int, referral_code: str, username: str, tel
         
         # 🔍 Поиск реферера: кто пригласил (у кого referral_code == referral_code)
         referrer_info = "не указан"
-        async with aiosqlite.connect(USERSDATABASE) as db:
+        async with users_pool.acquire() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute(
                 "SELECT telegram_id, username, telegram_link FROM users WHERE referral_code = ?",
@@ -4,6 +4,10 @@ from apscheduler.schedulers import SchedulerAlreadyRunningError
 from apscheduler.triggers.interval import IntervalTrigger
 from contextlib import suppress
 from db.db import clean_referal_table
+from db.pool import checkpoint_wal
+from db.writer import log_writer_stats
+from db.cache import log_profile_cache_stats
+from db.backup import scheduled_backup
 from admin.admin import sync_days_left_from_servers
 from admin.sub_check import (
     check_subscription_expiry,
@@ -13,6 +17,9 @@ from admin.sub_check import (
     check_all_user_subscriptions
 )
 from admin.delete_clients import scheduled_delete_clients
+from handlers.locator import reconcile_locator
+from handlers.capacity import reconcile_slots
+from handlers.health import probe_servers
 
 from log import logger
 
@@ -24,7 +31,14 @@ task_names = {
     "send_no_trial_broadcast": "Рассылка пользователям без пробного периода",
     "send_promo_not_used_broadcast": "Рассылка о неиспользованных промокодах",
     "send_inactive_users_broadcast": "Рассылка неактивным пользователям",
-    "sync_days_left_daily": "Синхронизация даты подписок"
+    "sync_days_left_daily": "Синхронизация даты подписок",
+    "checkpoint_wal": "Чекпоинт WAL баз данных",
+    "log_writer_stats": "Метрики очереди записи в базу",
+    "log_profile_cache_stats": "Метрики кэша профилей",
+    "scheduled_backup": "Резервное копирование баз данных",
+    "reconcile_locator": "Сверка индекса логинов с панелями",
+    "reconcile_slots": "Сверка учета мест на серверах",
+    "probe_servers": "Проверка здоровья серверов"
 }
 
 tasks = {
@@ -44,6 +58,50 @@ tasks = {
         "days": "*"
     },
     
+    "checkpoint_wal": {
+        "function": checkpoint_wal,
+        "interval_minutes": 15,
+        "enabled": True
+    },
+
+    "log_writer_stats": {
+        "function": log_writer_stats,
+        "interval_minutes": 10,
+        "enabled": True
+    },
+
+    "log_profile_cache_stats": {
+        "function": log_profile_cache_stats,
+        "interval_minutes": 10,
+        "enabled": True
+    },
+
+    "reconcile_locator": {
+        "function": reconcile_locator,
+        "interval_minutes": 30,
+        "enabled": True
+    },
+
+    "reconcile_slots": {
+        "function": reconcile_slots,
+        "interval_minutes": 10,
+        "enabled": True
+    },
+
+    "probe_servers": {
+        "function": probe_servers,
+        "interval_minutes": 1,
+        "enabled": True
+    },
+
+    "scheduled_backup": {
+        "function": scheduled_backup,
+        "hour": 3,
+        "minute": 15,
+        "enabled": True,
+        "days": "*"
+    },
+
     # НОВАЯ ЗАДАЧА: запускать проверку подписок КАЖДУЮ МИНУТУ
     #"check_subscription_expiry_interval": {
     #    "function": check_all_user_subscriptions,
@@ -1,9 +1,11 @@
 
 from datetime import datetime, timedelta as td
-import aiohttp
-import json
-import aiosqlite
+from db.pool import users_pool, servers_pool
+from db.repo import UserRepo, SubscriptionRepo
+from db.writer import users_writer
 from handlers.config import get_server_data
+from handlers.panel import get_panel
+from handlers.panel_json import CLIENT_FIELDS
 from bot import bot
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardButton
@@ -19,32 +21,23 @@ SERVEDATABASE = os.getenv("SERVEDATABASE")
 
 async def check_all_user_subscriptions():
     """
-    Проверяет все подписки через user_configs.days_left
-    и отправляет уведомления пользователям через telegram_id из user_emails.
+    Проверяет подписки, у которых срок окончания попадает в дни напоминаний
+    (от 7 дней назад до 3 дней вперед), и отправляет уведомления пользователям
+    через telegram_id из user_emails.
     """
-    logger.info("🔄 Запущена проверка всех подписок по days_left")
-
-    async with aiosqlite.connect("users.db") as conn:
-        # Выполняем JOIN всех таблиц
-        async with conn.execute("""
-            SELECT 
-                uc.email,
-                uc.days_left,
-                u.telegram_id,
-                u.notified_after_3_days,
-                u.notified_after_7_days
-            FROM user_configs uc
-            JOIN user_emails ue ON uc.email = ue.email
-            JOIN users u ON ue.user_id = u.id
-            WHERE u.telegram_id IS NOT NULL
-        """) as cursor:
-            rows = await cursor.fetchall()
+    logger.info("🔄 Запущена проверка подписок по expires_at")
+
+    async with users_pool.acquire() as conn:
+        # Только подписки из окна напоминаний — диапазон по индексу expires_at
+        rows = await SubscriptionRepo(conn).expiring(-7, 3)
 
     if not rows:
         logger.info("📭 Нет пользователей для проверки.")
         return
 
-    for email, days_left, telegram_id, notified_3d, notified_7d in rows:
+    for row in rows:
+        email, _, telegram_id, notified_3d, notified_7d = row
+        days_left = row.days_left
         try:
             # === 1. Уведомления ДО окончания 3 ===
             if days_left == 3:
@@ -131,64 +124,42 @@ async def check_subscription_expiry():
     current_date = datetime.today().date()
     logger.info(f"Текущая дата: {current_date}")
 
-    async with aiohttp.ClientSession() as session:
-        for server_id in await get_server_ids_as_list(SERVEDATABASE):
-            server_data = await get_server_data(server_id)
-            if not server_data:
-                logger.error(f"Не удалось получить данные для сервера ID {server_id}")
-                continue
-            await process_server_subscriptions(server_data, current_date, session)
+    for server_id in await get_server_ids_as_list(SERVEDATABASE):
+        server_data = await get_server_data(server_id)
+        if not server_data:
+            logger.error(f"Не удалось получить данные для сервера ID {server_id}")
+            continue
+        await process_server_subscriptions(server_data, current_date)
 
-async def process_server_subscriptions(server_data, current_date, session):
+async def process_server_subscriptions(server_data, current_date):
     """
-    Авторизуется на сервере и обрабатывает подписки клиентов.
+    Обрабатывает подписки клиентов сервера через клиент панели.
     Проверяет подписки клиентов на сервере и отправляет уведомления, если срок подписки истекает.
     """
-    login_data = {
-        "username": server_data["username"],
-        "password": server_data["password"],
-    }
-
-    try:
-        async with session.post(server_data["login_url"], json=login_data) as response:
-            if response.status != 200:
-                logger.error(f"Ошибка входа на сервер {server_data['name']}: {await response.text()}")
-                return
-
-            cookies = response.cookies
-            session_id = cookies.get('3x-ui').value
-            headers = {'Accept': 'application/json', 'Cookie': f'3x-ui={session_id}'}
-
-            logger.info(f"Авторизация на сервере {server_data['name']} успешна.")
-            for inbound_id in server_data["inbound_ids"]:
-                await process_inbound_clients(inbound_id, server_data, headers, current_date, session)
+    panel = get_panel(server_data)
+    for inbound_id in server_data["inbound_ids"]:
+        await process_inbound_clients(inbound_id, panel, current_date)
 
-    except Exception as e:
-        logger.error(f"Ошибка при работе с сервером {server_data['name']}: {e}")
-
-async def process_inbound_clients(inbound_id, server_data, headers, current_date, session):
+async def process_inbound_clients(inbound_id, panel, current_date):
     """
     Обрабатывает данные клиентов для конкретного inbound.
     Проверяет подписки клиентов и отправляет уведомления о скором окончании подписки.
     """
-    url = f"{server_data['config_client_url']}/{inbound_id}"
     try:
-        async with session.get(url, headers=headers) as response:
-            if response.status != 200:
-                logger.error(f"Ошибка получения данных inbound для ID {inbound_id}: {await response.text()}")
-                return
-
-            data = await response.json()
-            clients = json.loads(data['obj']['settings']).get('clients', [])
-            for client in clients:
-                await check_client_subscription(client, current_date)
+        # Нужны только email и tgId — облегченный разбор без clientStats
+        inbound = await panel.get_inbound(inbound_id, fields=CLIENT_FIELDS)
+        if inbound is None:
+            logger.error(f"Нет данных inbound для ID {inbound_id} на панели {panel.name}")
+            return
+        for client in inbound.clients:
+            await check_client_subscription(client, current_date)
 
     except Exception as e:
         logger.error(f"Ошибка при обработке inbound {inbound_id}: {e}")
 
 async def check_client_subscription(client, current_date):
     """
-    Проверяет подписку клиента по days_left из user_configs.
+    Проверяет подписку клиента по сроку из user_configs.expires_at.
     Отправляет уведомления:
     - за 3, 2, 1 день до окончания (days_left = 3,2,1)
     - при days_left = 0 (в день окончания)
@@ -201,27 +172,19 @@ async def check_client_subscription(client, current_date):
         logger.warning(f"Telegram ID не найден для клиента {email}")
         return
 
-    async with aiosqlite.connect("users.db") as conn:
-        # Получаем days_left из user_configs по email
-        async with conn.execute(
-            "SELECT days_left FROM user_configs WHERE email = ?", (email,)
-        ) as cursor:
-            result = await cursor.fetchone()
-            if result is None:
-                logger.warning(f"Конфиг для email {email} не найден в user_configs.")
-                return
-            days_left = result[0]
-
-        # Получаем флаги уведомлений и has_trial из users
-        async with conn.execute(
-            "SELECT has_trial, sum_my, notified_after_3_days, notified_after_7_days FROM users WHERE telegram_id = ?",
-            (telegram_id,)
-        ) as cursor:
-            result = await cursor.fetchone()
-            if result is None:
-                logger.warning(f"Пользователь с Telegram ID {telegram_id} не найден.")
-                return
-            has_trial, sum_my, notified_3d, notified_7d = result
+    async with users_pool.acquire() as conn:
+        # days_left считается из expires_at в user_configs
+        days_left = await SubscriptionRepo(conn).days_left(email)
+        if days_left is None:
+            logger.warning(f"Конфиг для email {email} не найден в user_configs.")
+            return
+
+        # Получаем флаги уведомлений из users
+        user = await UserRepo(conn).get(telegram_id)
+        if user is None:
+            logger.warning(f"Пользователь с Telegram ID {telegram_id} не найден.")
+            return
+        notified_3d, notified_7d = user.notified_after_3_days, user.notified_after_7_days
 
     # === 1. Уведомления ДО окончания (за 3, 2, 1 день) ===
     if days_left in [3, 2, 1]:
@@ -246,8 +209,7 @@ async def check_client_subscription(client, current_date):
             f"Мы скучаем! 🫂\n\nТы пропустил MoyVPN уже 3 дня.\n\nВозьми 3 дня бесплатно — попробуй снова!",
             InlineKeyboardButton(text="Получить 3 дня бесплатно", callback_data="trial_go")
         )
-        await conn.execute("UPDATE users SET notified_after_3_days = 1 WHERE telegram_id = ?", (telegram_id,))
-        await conn.commit()
+        await update_notified_flag(telegram_id, "notified_after_3_days")
 
     # === 4. Через 7 дней после окончания (days_left == -7) и если ещё не отправляли ===
     elif days_left == -7 and not notified_7d:
@@ -256,8 +218,7 @@ async def check_client_subscription(client, current_date):
             f"Финальный шанс! 🔥\n\nТы давно не заходил.\n\nПопробуй ещё 3 дня бесплатно — вдруг снова понравится?",
             InlineKeyboardButton(text="Попробовать бесплатно", callback_data="trial_go")
         )
-        await conn.execute("UPDATE users SET notified_after_7_days = 1 WHERE telegram_id = ?", (telegram_id,))
-        await conn.commit()
+        await update_notified_flag(telegram_id, "notified_after_7_days")
 
     else:
         logger.debug(f"Пропускаем уведомление для {email}, days_left = {days_left}")
@@ -273,9 +234,7 @@ async def send_subscription_notification(telegram_id, notification_text, button=
 
 async def update_notified_flag(telegram_id, column_name):
     """Обновляет флаг (например, notified_after_3_days) в таблице users"""
-    async with aiosqlite.connect("users.db") as conn:
-        await conn.execute(f"UPDATE users SET {column_name} = 1 WHERE telegram_id = ?", (telegram_id,))
-        await conn.commit()
+    await users_writer.submit(lambda conn: UserRepo(conn).set_notified(telegram_id, column_name))
     logger.info(f"📌 Флаг {column_name} установлен для пользователя {telegram_id}")
 
 def get_days_word(days):
@@ -294,7 +253,7 @@ async def send_no_trial_broadcast():
     Рассылка сообщений пользователям, которые ввели промокод, но не использовали его.
     Сообщает о возможности использования скидки.
     """
-    async with aiosqlite.connect(USERSDATABASE) as conn:
+    async with users_pool.acquire() as conn:
         async with conn.cursor() as cursor:
             await cursor.execute(
                 """
@@ -338,7 +297,7 @@ async def send_promo_not_used_broadcast():
     Рассылка сообщений пользователям, которые давно не заходили.
     Сообщает о новых возможностях и призывает вернуться.
     """
-    async with aiosqlite.connect(USERSDATABASE) as conn:
+    async with users_pool.acquire() as conn:
         async with conn.cursor() as cursor:
             await cursor.execute(
                 """
@@ -383,7 +342,7 @@ async def send_inactive_users_broadcast():
     current_date = datetime.now().date()
     inactive_threshold = current_date - td(days=15)  # Порог для неактивных пользователей (15 дней)
 
-    async with aiosqlite.connect(USERSDATABASE) as conn:
+    async with users_pool.acquire() as conn:
         async with conn.cursor() as cursor:
             await cursor.execute(
                 """
@@ -422,7 +381,7 @@ async def get_server_ids_as_list_for_days_left(db_path):
     Получает список ID всех серверов из таблицы 'servers' в БД.
     """
     try:
-        async with aiosqlite.connect(db_path) as conn:
+        async with servers_pool.acquire() as conn:
             async with conn.execute("SELECT id FROM servers") as cursor:
                 rows = await cursor.fetchall()
                 server_ids = [row[0] for row in rows]
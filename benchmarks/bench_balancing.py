@@ -0,0 +1,130 @@
+"""
+Симуляция дня регистраций для стратегий выбора сервера (handlers/balancing.py).
+
+Группа серверов с разной емкостью, начальной занятостью и задержкой панели.
+За сутки приходит --signups регистраций с суточным профилем (ночью мало,
+вечером пик), часть клиентов за день уходит (--churn). Стратегия видит
+счетчики, обновляемые раз в --refresh регистраций: 1 — учет мест в памяти,
+больше — всплеск одновременных регистраций, которые выбирают сервер до
+того, как учтены соседние.
+
+Отчет по каждой стратегии: разброс заполненности серверов (max - min) в
+конце дня и в среднем по часам, стандартное отклонение заполненности,
+переполнения (клиент поставлен на уже полный сервер), отказы и доля
+регистраций на медленных панелях.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_balancing --signups 3000 --refresh 1,20
+"""
+
+import argparse
+import math
+import random
+import statistics
+
+from handlers.balancing import Candidate, STRATEGIES
+
+
+def make_servers(args, rng):
+    servers = []
+    for server_id, (total, latency) in enumerate(zip(args.capacity, args.latency), start=1):
+        occupied = int(total * rng.uniform(args.fill_min, args.fill_max))
+        servers.append(Candidate(server_id, occupied, total, latency=latency / 1000))
+    return servers
+
+
+def signup_times(count, rng):
+    """Моменты регистраций (мин) с суточным профилем: минимум в 5 утра, пик в 20."""
+    times = []
+    while len(times) < count:
+        minute = rng.uniform(0, 24 * 60)
+        intensity = 0.55 + 0.45 * math.cos((minute / 60 - 20) / 24 * 2 * math.pi)
+        if rng.random() < intensity:
+            times.append(minute)
+    return sorted(times)
+
+
+def simulate(strategy, args, refresh):
+    rng = random.Random(args.seed)
+    servers = make_servers(args, rng)
+    by_id = {server.id: server for server in servers}
+    events = [(minute, "signup") for minute in signup_times(args.signups, rng)]
+    events += [(rng.uniform(0, 24 * 60), "leave") for _ in range(int(args.signups * args.churn))]
+    events.sort()
+
+    view = [Candidate(s.id, s.occupied, s.total, s.latency) for s in servers]
+    placed = overbooked = rejected = slow = since_refresh = 0
+    hourly_spread, next_hour = [], 60
+    strategy_rng = random.Random(args.seed + 1)
+
+    for minute, kind in events:
+        while minute >= next_hour:
+            hourly_spread.append(spread(servers))
+            next_hour += 60
+        if kind == "leave":
+            server = rng.choice([s for s in servers if s.occupied > 0])
+            server.occupied -= 1
+            continue
+
+        if since_refresh >= refresh:
+            view = [Candidate(s.id, s.occupied, s.total, s.latency) for s in servers]
+            since_refresh = 0
+        choice = strategy.choose(view, strategy_rng)
+        since_refresh += 1
+        if choice is None:
+            rejected += 1
+            continue
+        server = by_id[choice.id]
+        if server.occupied >= server.total:
+            overbooked += 1
+        server.occupied += 1
+        placed += 1
+        if server.latency >= args.slow / 1000:
+            slow += 1
+
+    return {
+        "spread": spread(servers),
+        "hourly": statistics.mean(hourly_spread) if hourly_spread else spread(servers),
+        "stdev": statistics.pstdev(s.utilization for s in servers),
+        "overbooked": overbooked,
+        "rejected": rejected,
+        "slow": slow / placed if placed else 0.0,
+    }
+
+
+def spread(servers):
+    utilization = [server.utilization for server in servers]
+    return max(utilization) - min(utilization)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--signups", type=int, default=3000, help="регистраций за сутки")
+    parser.add_argument("--churn", type=float, default=0.3, help="доля ушедших клиентов от числа регистраций")
+    parser.add_argument("--capacity", default="1000,1000,1500,2000,800", help="total_slots серверов через запятую")
+    parser.add_argument("--latency", default="40,60,450,80,50", help="задержка панелей, мс, через запятую")
+    parser.add_argument("--slow", type=float, default=300, help="панель медленная от этой задержки, мс")
+    parser.add_argument("--fill-min", type=float, default=0.3)
+    parser.add_argument("--fill-max", type=float, default=0.7)
+    parser.add_argument("--refresh", default="1,20", help="раз в сколько регистраций обновляются счетчики")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    args.capacity = [int(value) for value in args.capacity.split(",")]
+    args.latency = [float(value) for value in args.latency.split(",")]
+    if len(args.latency) != len(args.capacity):
+        parser.error("--latency и --capacity должны быть одной длины")
+
+    print(f"signups={args.signups} churn={args.churn} capacity={args.capacity} latency={args.latency} мс")
+    for refresh in (int(value) for value in args.refresh.split(",")):
+        print(f"\nсчетчики обновляются раз в {refresh} регистраций")
+        print(f"{'стратегия':<10} {'разброс':>8} {'за час':>8} {'σ':>7} {'перепол.':>9} {'отказов':>8} {'медл.':>7}")
+        for name, strategy in STRATEGIES.items():
+            result = simulate(strategy, args, refresh)
+            print(
+                f"{name:<10} {result['spread']:>8.3f} {result['hourly']:>8.3f} {result['stdev']:>7.3f} "
+                f"{result['overbooked']:>9} {result['rejected']:>8} {result['slow']:>7.1%}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Бенчмарк чтения одного клиента для личного кабинета: сколько байт приходит
+с панели и сколько длится один просмотр.
+
+Режимы:
+- inbounds — как раньше: get по каждому inbound сервера и поиск email в
+  разобранном списке клиентов;
+- snapshot — снимок всех inbounds (/list), загружаемый заново на каждый
+  просмотр (худший случай: снимок устарел);
+- client — getClientTraffics/{email}: в ответе только нужный клиент.
+
+Панель заменена фейковой (benchmarks/fake_panel.py) с --clients клиентами в
+каждом из --inbounds inbounds и задержкой --latency на запрос.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_cabinet_view --clients 5000 --inbounds 2 --views 200
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from benchmarks.fake_panel import FakePanel
+from handlers.panel import XUIPanelClient
+
+
+async def view_inbounds(panel, inbound_ids, email):
+    for inbound in await asyncio.gather(*[panel.get_inbound(inbound_id) for inbound_id in inbound_ids]):
+        client = inbound.find_client(email) if inbound else None
+        if client:
+            return client["expiryTime"]
+    return None
+
+
+async def view_snapshot(panel, inbound_ids, email):
+    _, client = (await panel.snapshot(max_age=0)).locate(email, inbound_ids)
+    return client["expiryTime"] if client else None
+
+
+async def view_client(panel, inbound_ids, email):
+    state = await panel.client_state(email, inbound_ids)
+    return state["expiryTime"] if state else None
+
+
+async def run(args):
+    fake = FakePanel(inbounds=args.inbounds, clients=args.clients, latency=args.latency, seed=1)
+    stats = fake.stats
+    panel = XUIPanelClient(await fake.start(port=args.port), fake.username, fake.password, name="bench")
+    await panel.login()
+
+    inbound_ids = list(range(1, args.inbounds + 1))
+    emails = [
+        f"user-{random.randint(1, args.inbounds)}-{random.randrange(args.clients)}" for _ in range(args.views)
+    ]
+
+    print(f"inbounds={args.inbounds} clients/inbound={args.clients} views={args.views} latency={args.latency} мс")
+    print(f"{'режим':<10} {'запросов':>9} {'КБ/просмотр':>12} {'p50, мс':>9} {'p95, мс':>9}")
+    for name, view in (("inbounds", view_inbounds), ("snapshot", view_snapshot), ("client", view_client)):
+        stats["requests"] = stats["bytes"] = 0
+        latencies = []
+        for email in emails:
+            started = time.perf_counter()
+            if await view(panel, inbound_ids, email) is None:
+                raise RuntimeError(f"{name}: клиент {email} не найден")
+            latencies.append((time.perf_counter() - started) * 1000)
+        p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) >= 20 else max(latencies)
+        print(
+            f"{name:<10} {stats['requests'] / args.views:>9.1f} {stats['bytes'] / args.views / 1024:>12.1f} "
+            f"{statistics.median(latencies):>9.2f} {p95:>9.2f}"
+        )
+
+    await panel.close()
+    await fake.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=5000, help="клиентов в каждом inbound")
+    parser.add_argument("--inbounds", type=int, default=2)
+    parser.add_argument("--views", type=int, default=200, help="просмотров кабинета")
+    parser.add_argument("--latency", default="5", help='задержка панели на запрос, мс ("5", "2-10", "exp:5")')
+    parser.add_argument("--port", type=int, default=18091)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
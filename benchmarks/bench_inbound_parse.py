@@ -0,0 +1,81 @@
+"""
+Бенчмарк разбора ответа get/{id} панели для большого inbound: время, пиковая
+память (tracemalloc) и сколько памяти остается занято разобранным Inbound.
+
+Режимы:
+- json — как раньше: стандартный json, весь ответ и все поля клиентов;
+- fast — то же через handlers.panel_json.loads (orjson, если установлен);
+- slim — get_inbound(..., fields=CLIENT_FIELDS): ответ без clientStats,
+  клиенты из settings читаются по одному и только с нужными полями.
+
+Ответ строит фейковая панель (benchmarks/fake_panel.py) в формате 3x-ui:
+settings — строка JSON с отступами, рядом clientStats по каждому клиенту.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_inbound_parse --clients 50000
+"""
+
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+
+from benchmarks.fake_panel import FakePanel
+from handlers.panel import Inbound
+from handlers.panel_json import CLIENT_FIELDS
+from handlers.panel_json import JSON_BACKEND, loads, loads_without_client_stats
+
+
+def make_body(clients):
+    panel = FakePanel(clients=clients, seed=1)
+    return json.dumps({"success": True, "msg": "", "obj": panel.render(1)})
+
+
+def parse_json(body):
+    obj = json.loads(body)["obj"]
+    obj["settings"] = json.loads(obj["settings"])
+    return Inbound.from_api(obj)
+
+
+def parse_fast(body):
+    return Inbound.from_api(loads(body)["obj"])
+
+
+def parse_slim(body):
+    return Inbound.from_api(loads_without_client_stats(body)["obj"], CLIENT_FIELDS)
+
+
+def measure(parse, body):
+    # Время — отдельным прогоном: под tracemalloc разбор в разы медленнее
+    gc.collect()
+    started = time.perf_counter()
+    parse(body)
+    elapsed = time.perf_counter() - started
+
+    gc.collect()
+    tracemalloc.start()
+    inbound = parse(body)
+    kept, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return inbound, elapsed, peak, kept
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=50000)
+    args = parser.parse_args()
+
+    body = make_body(args.clients)
+    print(f"clients={args.clients} ответ={len(body) / 2**20:.1f} МБ json-бэкенд={JSON_BACKEND}")
+    print(f"{'режим':<6} {'мс':>8} {'пик, МБ':>9} {'занято, МБ':>11} {'клиентов':>9}")
+    for name, parse in (("json", parse_json), ("fast", parse_fast), ("slim", parse_slim)):
+        inbound, elapsed, peak, kept = measure(parse, body)
+        if inbound.find_client(f"user-1-{args.clients - 1}") is None:
+            raise RuntimeError(f"{name}: последний клиент не найден")
+        print(f"{name:<6} {elapsed * 1000:>8.0f} {peak / 2**20:>9.1f} {kept / 2**20:>11.1f} {len(inbound.clients):>9}")
+        del inbound
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Бенчмарк пакетных операций панели: addClient по одному клиенту против пачек
+и последовательный updateClient против update_clients_bulk.
+
+Панель заменена фейковой (benchmarks/fake_panel.py) с задержкой --latency
+на каждый запрос (сеть + обработка на панели), поэтому видно, сколько стоит
+круговой запрос на одного пользователя.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_panel_bulk --clients 2000 --latency 20 --batch 1,10,50,100,500
+"""
+
+import argparse
+import asyncio
+import time
+
+from benchmarks.fake_panel import FakePanel
+from handlers.panel import XUIPanelClient
+
+
+def make_clients(prefix, count):
+    return [
+        {"id": f"{prefix}-{i}", "email": f"{prefix}-{i}", "expiryTime": 0, "enable": True, "limitIp": 3}
+        for i in range(count)
+    ]
+
+
+async def run(args):
+    fake = FakePanel(latency=args.latency)
+    panel = XUIPanelClient(await fake.start(port=args.port), fake.username, fake.password, name="bench")
+    await panel.login()
+
+    print(f"clients={args.clients} latency={args.latency} мс")
+    print(f"{'операция':<28} {'запросов':>9} {'сек':>8} {'клиентов/с':>11} {'ошибок':>7}")
+
+    def report(name, result, elapsed):
+        print(f"{name:<28} {result.requests:>9} {elapsed:>8.2f} {args.clients / elapsed:>11.0f} {len(result.failed):>7}")
+
+    for batch_size in args.batch:
+        clients = make_clients(f"add{batch_size}", args.clients)
+        started = time.perf_counter()
+        result = await panel.add_clients_bulk(1, clients, batch_size=batch_size)
+        report(f"addClient, пачка {batch_size}", result, time.perf_counter() - started)
+
+    # Один занятый email в первой пачке: видно цену деления отклоненной пачки
+    clients = make_clients(f"add{args.batch[-1]}", 1) + make_clients("dup", args.clients - 1)
+    started = time.perf_counter()
+    result = await panel.add_clients_bulk(1, clients, batch_size=args.batch[-1])
+    report(f"addClient, пачка {args.batch[-1]} + дубль", result, time.perf_counter() - started)
+
+    clients = make_clients(f"add{args.batch[0]}", args.clients)
+    for client in clients:
+        client["expiryTime"] = 1
+    started = time.perf_counter()
+    result = await panel.update_clients_bulk(1, clients, concurrency=1)
+    report("updateClient последовательно", result, time.perf_counter() - started)
+
+    for concurrency in args.concurrency:
+        started = time.perf_counter()
+        result = await panel.update_clients_bulk(1, clients, concurrency=concurrency)
+        report(f"update_clients_bulk x{concurrency}", result, time.perf_counter() - started)
+
+    await panel.close()
+    await fake.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=2000)
+    parser.add_argument("--latency", default="20", help='задержка панели на запрос, мс ("20", "5-50", "exp:20")')
+    parser.add_argument("--batch", default="1,10,50,100,500", help="размеры пачек addClient через запятую")
+    parser.add_argument("--concurrency", default="4,8,16", help="параллельность updateClient через запятую")
+    parser.add_argument("--port", type=int, default=18090)
+    args = parser.parse_args()
+    args.batch = [int(value) for value in args.batch.split(",")]
+    args.concurrency = [int(value) for value in args.concurrency.split(",")]
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Бенчмарк конкурентного чтения/записи SQLite: режим по умолчанию против профиля WAL.
+
+Моделирует нагрузку бота: несколько читателей делают точечные запросы по
+telegram_id (меню, расчет цены), а писатель обновляет days_left пачками, как
+ночная синхронизация sync_days_left_from_servers.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_sqlite_wal --users 20000 --readers 8 --seconds 5
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from db.sqlite_profile import apply_storage_profile
+
+
+def prepare_db(path, users):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, telegram_id INTEGER UNIQUE, has_trial INTEGER, sum_my REAL)")
+    conn.execute("CREATE TABLE user_configs (id INTEGER PRIMARY KEY, email TEXT UNIQUE, days_left INTEGER)")
+    conn.executemany(
+        "INSERT INTO users (telegram_id, has_trial, sum_my) VALUES (?, ?, ?)",
+        ((100000 + i, i % 2, 0) for i in range(users))
+    )
+    conn.executemany(
+        "INSERT INTO user_configs (email, days_left) VALUES (?, ?)",
+        ((f"user{i}", 30) for i in range(users))
+    )
+    conn.commit()
+    conn.close()
+
+
+def open_conn(path, profile):
+    # timeout=5 совпадает со значением aiosqlite/sqlite3 по умолчанию
+    conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+    if profile:
+        apply_storage_profile(conn)
+    return conn
+
+
+def reader(path, profile, users, stop, stats):
+    conn = open_conn(path, profile)
+    latencies, errors = [], 0
+    while not stop.is_set():
+        telegram_id = 100000 + random.randrange(users)
+        started = time.perf_counter()
+        try:
+            conn.execute("SELECT has_trial, sum_my FROM users WHERE telegram_id = ?", (telegram_id,)).fetchone()
+            latencies.append(time.perf_counter() - started)
+        except sqlite3.OperationalError:
+            errors += 1
+    conn.close()
+    stats.append(("read", latencies, errors))
+
+
+def writer(path, profile, users, batch, stop, stats):
+    conn = open_conn(path, profile)
+    latencies, errors = [], 0
+    while not stop.is_set():
+        start = random.randrange(max(1, users - batch))
+        started = time.perf_counter()
+        try:
+            conn.executemany(
+                "UPDATE user_configs SET days_left = ? WHERE email = ?",
+                ((random.randint(-7, 365), f"user{i}") for i in range(start, start + batch))
+            )
+            conn.commit()
+            latencies.append(time.perf_counter() - started)
+        except sqlite3.OperationalError:
+            conn.rollback()
+            errors += 1
+    conn.close()
+    stats.append(("write", latencies, errors))
+
+
+def run(profile, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        prepare_db(path, args.users)
+        if profile:
+            conn = sqlite3.connect(path)
+            apply_storage_profile(conn)
+            conn.close()
+
+        stop, stats = threading.Event(), []
+        threads = [threading.Thread(target=reader, args=(path, profile, args.users, stop, stats)) for _ in range(args.readers)]
+        threads.append(threading.Thread(target=writer, args=(path, profile, args.users, args.batch, stop, stats)))
+        for thread in threads:
+            thread.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    result = {}
+    for kind in ("read", "write"):
+        latencies = [value for k, lat, _ in stats if k == kind for value in lat]
+        errors = sum(err for k, _, err in stats if k == kind)
+        p95 = statistics.quantiles(latencies, n=20)[-1] * 1000 if len(latencies) >= 20 else 0.0
+        result[kind] = (len(latencies) / args.seconds, p95, errors)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--batch", type=int, default=500, help="строк в одной транзакции писателя")
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    print(f"users={args.users} readers={args.readers} batch={args.batch} seconds={args.seconds}")
+    print(f"{'режим':<10} {'чтений/с':>10} {'p95 чт, мс':>11} {'ошибок чт':>10} {'записей/с':>10} {'p95 зп, мс':>11} {'ошибок зп':>10}")
+    for name, profile in (("default", False), ("wal", True)):
+        res = run(profile, args)
+        r_ops, r_p95, r_err = res["read"]
+        w_ops, w_p95, w_err = res["write"]
+        print(f"{name:<10} {r_ops:>10.0f} {r_p95:>11.2f} {r_err:>10} {w_ops:>10.1f} {w_p95:>11.2f} {w_err:>10}")
+
+
+if __name__ == "__main__":
+    main()
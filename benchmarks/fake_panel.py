@@ -0,0 +1,412 @@
+"""
+Локальная фейковая панель 3x-ui для нагрузочных прогонов и бенчмарков.
+
+aiohttp-сервер с теми маршрутами панели, которые использует бот:
+POST /login, GET /panel/api/inbounds/get/{id} и /list, POST /panel/inbound/list,
+addClient, updateClient/{id}, {inbound}/delClient/{id}, delDepletedClients/{id}
+и getClientTraffics/{email}. Клиенты хранятся в памяти, ответы повторяют
+формат 3x-ui (settings — строка JSON с отступами, рядом clientStats).
+
+Настраивается:
+- число inbounds и клиентов в каждом (email вида user-{inbound}-{i});
+- задержка на запрос: "20" (мс), "5-50" (равномерно), "exp:20" (среднее),
+  "lognormal:20:0.5" (медиана и сигма);
+- доля запросов с ответом 500 (error_rate);
+- срок сессии: после session_ttl секунд cookie перестает действовать, и
+  API отвечает 404, как панель без входа; announce_ttl=False не сообщает
+  срок в Max-Age, чтобы проверить повторный вход по 404.
+
+В коде бенчмарков:
+
+    panel = FakePanel(inbounds=2, clients=5000, latency="exp:10")
+    base_url = await panel.start(port=18091)
+    ...
+    await panel.stop()
+
+Для прогона всего бота на одной машине команда ниже поднимает --servers
+панелей на портах подряд и пишет servers.db, указывающую на них:
+
+    python -m benchmarks.fake_panel --servers 3 --clients 1000 --latency exp:20 \\
+        --error-rate 0.01 --session-ttl 600 --servers-db /tmp/fake/servers.db
+    SERVEDATABASE=/tmp/fake/servers.db USERSDATABASE=/tmp/fake/users.db python main.py
+
+Пробный период, покупка, продление, смена сервера и задачи планировщика
+после этого ходят в фейковые панели.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import secrets
+import sqlite3
+import time
+import uuid
+from collections import Counter
+
+from aiohttp import web
+
+API = "/panel/api/inbounds"
+LEGACY = "/panel/inbound"
+DAY_MS = 24 * 60 * 60 * 1000
+
+
+def parse_latency(spec):
+    """Строка задержки в функцию, возвращающую секунды (см. описание модуля)."""
+    spec = str(spec or "0").strip()
+    kind, _, args = spec.partition(":")
+    if kind == "exp":
+        mean = float(args) / 1000
+        return lambda rnd: rnd.expovariate(1 / mean) if mean > 0 else 0
+    if kind == "lognormal":
+        median, sigma = (float(value) for value in args.split(":"))
+        return lambda rnd: rnd.lognormvariate(math.log(median / 1000), sigma)
+    if "-" in spec:
+        low, high = (float(value) / 1000 for value in spec.split("-"))
+        return lambda rnd: rnd.uniform(low, high)
+    fixed = float(spec) / 1000
+    return lambda rnd: fixed
+
+
+class FakePanel:
+    def __init__(self, inbounds=1, clients=0, latency="0", error_rate=0.0, session_ttl=None,
+                 announce_ttl=True, username="admin", password="admin", base_path="", seed=None):
+        self.random = random.Random(seed)
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.session_ttl = session_ttl
+        self.announce_ttl = announce_ttl
+        self.username = username
+        self.password = password
+        self.base_path = base_path.rstrip("/")
+        self.sessions = {}  # cookie -> момент окончания (monotonic) или None
+        self.stats = Counter()  # requests, bytes, logins, errors, expired, ...
+        self.inbounds = {}  # id -> {"meta": {...}, "clients": {email: client}, "ids": {uuid: email}}
+        self.traffic = {}  # email -> запись clientStats
+        self._rendered = {}  # id -> готовая строка settings, сбрасывается при записи
+        self._runner = None
+
+        now_ms = int(time.time() * 1000)
+        for inbound_id in range(1, inbounds + 1):
+            self.inbounds[inbound_id] = {"meta": self._inbound_meta(inbound_id), "clients": {}, "ids": {}}
+            for i in range(clients):
+                self._put(inbound_id, {
+                    "id": self._uuid(), "flow": "xtls-rprx-vision", "email": f"user-{inbound_id}-{i}",
+                    "limitIp": 3, "totalGB": 0,
+                    "expiryTime": now_ms + self.random.randint(-7, 90) * DAY_MS,
+                    "enable": True, "tgId": 100000 + i, "subId": f"{self.random.getrandbits(64):016x}", "comment": "", "reset": 0,
+                })
+
+    def _uuid(self):
+        return str(uuid.UUID(int=self.random.getrandbits(128), version=4))
+
+    def _inbound_meta(self, inbound_id):
+        reality = {
+            "show": False, "xver": 0, "dest": "www.google.com:443", "serverNames": ["www.google.com"],
+            "privateKey": secrets.token_urlsafe(32), "shortIds": [secrets.token_hex(4)],
+            "settings": {"publicKey": secrets.token_urlsafe(32), "fingerprint": "chrome", "serverName": "",
+                         "spiderX": "/"},
+        }
+        return {
+            "id": inbound_id, "up": 0, "down": 0, "total": 0, "remark": f"fake-{inbound_id}", "enable": True,
+            "expiryTime": 0, "listen": "", "port": 443 + inbound_id - 1, "protocol": "vless",
+            "streamSettings": json.dumps(
+                {"network": "tcp", "security": "reality", "realitySettings": reality, "tcpSettings": {}}, indent=2
+            ),
+            "tag": f"inbound-{443 + inbound_id - 1}",
+            "sniffing": json.dumps({"enabled": True, "destOverride": ["http", "tls", "quic"]}, indent=2),
+        }
+
+    # --- состояние ---
+
+    def _put(self, inbound_id, client):
+        email = client["email"]
+        self.inbounds[inbound_id]["clients"][email] = client
+        self.inbounds[inbound_id]["ids"][client["id"]] = email
+        stat = self.traffic.get(email) or {
+            "id": len(self.traffic) + 1, "inboundId": inbound_id, "enable": True, "email": email,
+            "up": 0, "down": 0, "expiryTime": 0, "total": 0, "reset": 0,
+        }
+        stat.update(inboundId=inbound_id, enable=client.get("enable", True),
+                    expiryTime=client.get("expiryTime", 0), total=client.get("totalGB", 0))
+        self.traffic[email] = stat
+        self._rendered.pop(inbound_id, None)
+
+    def _remove(self, inbound_id, email):
+        client = self.inbounds[inbound_id]["clients"].pop(email, None)
+        if client is not None:
+            self.inbounds[inbound_id]["ids"].pop(client["id"], None)
+        self.traffic.pop(email, None)
+        self._rendered.pop(inbound_id, None)
+
+    def _depleted(self, email, now_ms):
+        stat = self.traffic[email]
+        expired = 0 < stat["expiryTime"] <= now_ms
+        exhausted = stat["total"] > 0 and stat["up"] + stat["down"] >= stat["total"]
+        return expired or exhausted
+
+    def render(self, inbound_id):
+        """Inbound в формате ответа панели."""
+        inbound = self.inbounds[inbound_id]
+        settings = self._rendered.get(inbound_id)
+        if settings is None:
+            settings = json.dumps(
+                {"clients": list(inbound["clients"].values()), "decryption": "none", "fallbacks": []}, indent=2
+            )
+            self._rendered[inbound_id] = settings
+        return {
+            **inbound["meta"],
+            "clientStats": [self.traffic[email] for email in inbound["clients"]],
+            "settings": settings,
+        }
+
+    # --- HTTP ---
+
+    @staticmethod
+    def _ok(obj=None, msg=""):
+        return web.json_response({"success": True, "msg": msg, "obj": obj})
+
+    @staticmethod
+    def _fail(msg):
+        return web.json_response({"success": False, "msg": msg, "obj": None})
+
+    @web.middleware
+    async def _middleware(self, request, handler):
+        self.stats["requests"] += 1
+        delay = self.latency(self.random)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.stats["errors"] += 1
+            return web.json_response({"success": False, "msg": "fake error", "obj": None}, status=500)
+        if not request.path.endswith("/login") and not self._authorized(request):
+            # Панель без действующей сессии отвечает на API 404
+            return web.Response(status=404, text="404 page not found")
+        response = await handler(request)
+        self.stats["bytes"] += len(response.body or b"")
+        return response
+
+    def _authorized(self, request):
+        token = request.cookies.get("3x-ui")
+        if token not in self.sessions:
+            return False
+        expires = self.sessions[token]
+        if expires is not None and time.monotonic() >= expires:
+            del self.sessions[token]
+            self.stats["expired"] += 1
+            return False
+        return True
+
+    async def login(self, request):
+        form = await request.post()
+        if form.get("username") != self.username or form.get("password") != self.password:
+            return self._fail("Неверное имя пользователя или пароль")
+        self.stats["logins"] += 1
+        token = secrets.token_hex(16)
+        self.sessions[token] = time.monotonic() + self.session_ttl if self.session_ttl else None
+        response = self._ok(msg="Вход выполнен")
+        max_age = int(self.session_ttl) if self.session_ttl and self.announce_ttl else None
+        response.set_cookie("3x-ui", token, max_age=max_age, httponly=True)
+        return response
+
+    async def get_inbound(self, request):
+        inbound_id = int(request.match_info["id"])
+        if inbound_id not in self.inbounds:
+            return self._fail("Obtain Failed: record not found")
+        return self._ok(self.render(inbound_id))
+
+    async def list_inbounds(self, request):
+        return self._ok([self.render(inbound_id) for inbound_id in self.inbounds])
+
+    @staticmethod
+    async def _body(request):
+        if request.content_type == "application/json":
+            data = await request.json()
+        else:
+            data = dict(await request.post())
+        return int(data["id"]), json.loads(data["settings"])["clients"]
+
+    async def add_client(self, request):
+        inbound_id, clients = await self._body(request)
+        if inbound_id not in self.inbounds:
+            return self._fail("Something went wrong! Failed: record not found")
+        # Как 3x-ui: занятый email (на любом inbound) отклоняет весь запрос
+        for client in clients:
+            if client["email"] in self.traffic:
+                return self._fail(f"Something went wrong! Failed: Duplicate email: {client['email']}")
+        for client in clients:
+            self._put(inbound_id, client)
+        self.stats["added"] += len(clients)
+        return self._ok(msg="Client(s) added Successfully")
+
+    async def update_client(self, request):
+        inbound_id, clients = await self._body(request)
+        client_id = request.match_info["client_id"]
+        inbound = self.inbounds.get(inbound_id)
+        email = inbound["ids"].get(client_id) if inbound else None
+        if email is None:
+            return self._fail("Something went wrong! Failed: client not found")
+        client = clients[0]
+        if client["email"] != email:
+            self._remove(inbound_id, email)
+        self._put(inbound_id, client)
+        self.stats["updated"] += 1
+        return self._ok(msg="Client updated Successfully")
+
+    async def delete_client(self, request):
+        inbound_id = int(request.match_info["id"])
+        client_id = request.match_info["client_id"]
+        inbound = self.inbounds.get(inbound_id)
+        email = inbound["ids"].get(client_id) if inbound else None
+        if email is None:
+            return self._fail("Something went wrong! Failed: client not found")
+        self._remove(inbound_id, email)
+        return self._ok(msg="Client deleted Successfully")
+
+    async def delete_depleted(self, request):
+        inbound_id = int(request.match_info["id"])
+        now_ms = int(time.time() * 1000)
+        inbound_ids = list(self.inbounds) if inbound_id == -1 else [inbound_id]
+        for current in inbound_ids:
+            for email in [e for e in self.inbounds.get(current, {}).get("clients", {}) if self._depleted(e, now_ms)]:
+                self._remove(current, email)
+                self.stats["depleted"] += 1
+        return self._ok(msg="All depleted clients are deleted Successfully")
+
+    async def client_traffics(self, request):
+        return self._ok(self.traffic.get(request.match_info["email"]))
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware])
+        prefix = self.base_path
+        app.router.add_post(f"{prefix}/login", self.login)
+        app.router.add_get(f"{prefix}{API}/get/{{id}}", self.get_inbound)
+        app.router.add_get(f"{prefix}{API}/list", self.list_inbounds)
+        app.router.add_post(f"{prefix}{LEGACY}/list", self.list_inbounds)
+        app.router.add_post(f"{prefix}{API}/addClient", self.add_client)
+        app.router.add_post(f"{prefix}{API}/updateClient/{{client_id}}", self.update_client)
+        app.router.add_post(f"{prefix}{API}/{{id}}/delClient/{{client_id}}", self.delete_client)
+        app.router.add_post(f"{prefix}{API}/delDepletedClients/{{id}}", self.delete_depleted)
+        app.router.add_post(f"{prefix}{LEGACY}/delDepletedClients/{{id}}", self.delete_depleted)
+        app.router.add_get(f"{prefix}{API}/getClientTraffics/{{email}}", self.client_traffics)
+        return app
+
+    async def start(self, host="127.0.0.1", port=18090) -> str:
+        """Запускает сервер; возвращает base_url панели."""
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        return f"http://{host}:{port}{self.base_path}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def write_servers_db(path, servers, username="admin", password="admin", total_slots=0):
+    """
+    Пишет servers.db (схема как в ServerDatabase.setup_tables_serv) с серверами
+    [(base_url, inbound_ids), ...]: id по порядку с 1, все в группах "1" и "random".
+    Существующие записи файла заменяются.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    connection = sqlite3.connect(path)
+    try:
+        connection.executescript('''
+            CREATE TABLE IF NOT EXISTS servers (
+                id INTEGER PRIMARY KEY,
+                total_slots INTEGER,
+                name TEXT,
+                username TEXT,
+                password TEXT,
+                server_ip TEXT,
+                base_url TEXT,
+                subscription_base TEXT,
+                sub_url TEXT,
+                json_sub TEXT,
+                inbound_ids TEXT
+            );
+            CREATE TABLE IF NOT EXISTS server_ids (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                server_ids TEXT
+            );
+            CREATE TABLE IF NOT EXISTS server_groups (
+                group_name TEXT PRIMARY KEY,
+                server_ids TEXT,
+                strategy TEXT
+            );
+            DELETE FROM servers;
+            DELETE FROM server_ids;
+            DELETE FROM server_groups;
+        ''')
+        server_ids = []
+        for server_id, (base_url, inbound_ids) in enumerate(servers, start=1):
+            connection.execute(
+                "INSERT INTO servers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (server_id, total_slots, f"Фейк-{server_id}", username, password, "127.0.0.1",
+                 base_url, base_url, "/sub/", "/json/", ",".join(map(str, inbound_ids))),
+            )
+            server_ids.append(str(server_id))
+        connection.execute("INSERT INTO server_ids (server_ids) VALUES (?)", (",".join(server_ids),))
+        for group_name in ("1", "random"):
+            connection.execute(
+                "INSERT INTO server_groups (group_name, server_ids) VALUES (?, ?)", (group_name, ",".join(server_ids))
+            )
+        connection.commit()
+    finally:
+        connection.close()
+
+
+async def serve(args):
+    panels = []
+    servers = []
+    for i in range(args.servers):
+        panel = FakePanel(
+            inbounds=args.inbounds, clients=args.clients, latency=args.latency, error_rate=args.error_rate,
+            session_ttl=args.session_ttl, announce_ttl=not args.hide_ttl, base_path=f"/fake{i + 1}",
+            seed=i,
+        )
+        base_url = await panel.start(args.host, args.port + i)
+        panels.append(panel)
+        servers.append((base_url, list(panel.inbounds)))
+        print(f"панель {i + 1}: {base_url} ({args.inbounds} inbounds x {args.clients} клиентов)")
+
+    if args.servers_db:
+        write_servers_db(args.servers_db, servers)
+        print(f"servers.db: {args.servers_db}")
+
+    try:
+        while True:
+            await asyncio.sleep(args.report)
+            for i, panel in enumerate(panels, start=1):
+                print(f"панель {i}: {dict(panel.stats)}")
+    finally:
+        for panel in panels:
+            await panel.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--servers", type=int, default=1, help="сколько панелей поднять")
+    parser.add_argument("--inbounds", type=int, default=1, help="inbounds на панели")
+    parser.add_argument("--clients", type=int, default=1000, help="клиентов в каждом inbound")
+    parser.add_argument("--latency", default="0", help='задержка: "20", "5-50", "exp:20", "lognormal:20:0.5"')
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 500")
+    parser.add_argument("--session-ttl", type=float, default=None, help="срок сессии, сек")
+    parser.add_argument("--hide-ttl", action="store_true", help="не сообщать срок сессии в Max-Age")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18100, help="порт первой панели, дальше по порядку")
+    parser.add_argument("--servers-db", help="записать servers.db, указывающую на поднятые панели")
+    parser.add_argument("--report", type=float, default=60, help="как часто печатать счетчики, сек")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,7 @@
-import json
 import random
 import string
 import uuid
 from datetime import datetime as dt
-import requests
 from aiogram import types
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.fsm.context import FSMContext
@@ -11,6 +9,11 @@ from aiogram.enums.parse_mode import ParseMode
 from bot import bot, dp
 from client.menu import get_instructions_button
 from handlers.config import get_server_data
+from handlers.panel import get_panel, PanelError, PanelAuthError
+from handlers.client_config import config_template
+from handlers.locator import locator
+from handlers.capacity import slot_tracker
+from handlers.balancing import get_strategy, INBOUND_BALANCING_STRATEGY
 from handlers.states import AddClient
 from pay.prices import get_expiry_time_keyboard, total_gb_values
 from pay.prices import get_expiry_time_description
@@ -18,10 +21,10 @@ from buttons.client import BUTTON_TEXTS
 from db.db import get_server_ids_as_list, save_config_to_new_table
 from dotenv import load_dotenv
 import os
-import aiohttp
 from log import logger
-from handlers.select_server import get_optimal_server
+from handlers.select_server import get_optimal_server, release_slot_reservation
 import aiosqlite
+from db.pool import users_pool
 from aiogram.types import Message
 
 load_dotenv()
@@ -142,120 +145,139 @@ async def country_selection_handler(callback_query: types.CallbackQuery, state:
     )
     await state.set_state(AddClient.WaitingForExpiryTime)
 
-async def add_client(name, expiry_time, inbound_ids, telegram_id, ADD_CLIENT_URL, LOGIN_URL, LOGIN_DATA):
+async def add_client(server_data, name, expiry_time, telegram_id, state: FSMContext = None):
     """
-    Функция для добавления клиента на сервер. Включает процесс аутентификации и отправку данных клиента.
+    Функция для добавления клиента на сервер через клиент панели.
     Возвращает результат операции.
+    Если передан state, готовый конфиг нового клиента сохраняется в нем (issued_config),
+    и generate_config_from_pay отдает его без запросов к панели; резерв места,
+    сделанный при выборе сервера (slot_reservation), подтверждается или снимается.
     """
-    session_id = await login(LOGIN_URL, LOGIN_DATA)
-    if session_id:
-        if name and expiry_time:
-            client_id = ''.join(random.choices(string.ascii_letters + string.digits, k=20))
-            add_client_result = await add_client_request(session_id, name, expiry_time, client_id, inbound_ids, ADD_CLIENT_URL, telegram_id)
-            return add_client_result
-        else:
-            return "❌ Ошибка: имя или срок действия подписки не указаны."
-    else:
-        return "❌ Ошибка аутентификации."
+    if not (name and expiry_time):
+        if state is not None:
+            await release_slot_reservation(state)
+        return "❌ Ошибка: имя или срок действия подписки не указаны."
+    client_id = ''.join(random.choices(string.ascii_letters + string.digits, k=20))
+    panel = get_panel(server_data)
+    added = {}
+    reservation = None
+    if state is not None:
+        reservation = (await state.get_data()).get("slot_reservation")
+    result = await add_client_request(
+        panel, name, expiry_time, client_id, server_data['inbound_ids'], telegram_id,
+        server_id=server_data.get('id'), added=added, reservation=reservation
+    )
+    if reservation:
+        await state.update_data(slot_reservation=None)
+    if state is not None and added:
+        try:
+            template = await config_template(panel, server_data, added["inbound_id"])
+        except PanelError as e:
+            logger.error(f"Не удалось получить параметры inbound {added['inbound_id']} для {name}: {e}")
+            template = None
+        if template is not None:
+            await state.update_data(issued_config=[name.lower(), *render_client_config(template, added["client"], name.lower())])
+    return result
+
+def choose_inbound(server_id, inbound_ids):
+    """Inbound для нового клиента по стратегии INBOUND_BALANCING_STRATEGY и учету мест."""
+    if server_id is not None and len(inbound_ids) > 1:
+        candidate = get_strategy(INBOUND_BALANCING_STRATEGY).choose(
+            slot_tracker.inbound_candidates(server_id, inbound_ids)
+        )
+        if candidate is not None:
+            return candidate.id
+    return random.choice(inbound_ids)
 
-async def add_client_request(session_id, name, expiry_time, client_id, inbound_ids, ADD_CLIENT_URL, telegram_id):
+async def add_client_request(panel, name, expiry_time, client_id, inbound_ids, telegram_id, server_id=None, added=None, reservation=None):
     """
-    Функция для отправки запроса на добавление клиента на сервер. 
-    Использует сессионный ID для аутентификации и данные для создания клиента.
-    Возвращает результат операции.
+    Функция для отправки запроса на добавление клиента на сервер.
+    Возвращает результат операции. В added (если передан) кладутся inbound и данные добавленного клиента.
+    reservation — токен резерва места (slot_tracker.reserve): подтверждается при успехе, снимается при ошибке.
     """
-    logger.info(f"Начинаем добавление клиента с ID {client_id} на сервер с URL: {ADD_CLIENT_URL}")
+    logger.info(f"Начинаем добавление клиента с ID {client_id} на панель {panel.name}")
 
-    id_vless = random.choice(inbound_ids)
+    id_vless = choose_inbound(server_id, inbound_ids)
     sub_id = f"{LOGIN}-{uuid.uuid4().hex[:8]}"
-    client_data = {
-        "id": id_vless,
-        "settings": json.dumps({
-            "clients": [{
-                "id": client_id,
-                "alterId": 0,
-                "email": name,
-                "limitIp": 5,
-                "totalGB": total_gb_values.get(int(expiry_time), 0),
-                "expiryTime": expiry_time,
-                "enable": True,
-                "subId": sub_id,
-                "tgId": telegram_id,
-                "flow": "xtls-rprx-vision"
-            }]
-        })
+    client = {
+        "id": client_id,
+        "alterId": 0,
+        "email": name,
+        "limitIp": 5,
+        "totalGB": total_gb_values.get(int(expiry_time), 0),
+        "expiryTime": expiry_time,
+        "enable": True,
+        "subId": sub_id,
+        "tgId": telegram_id,
+        "flow": "xtls-rprx-vision"
     }
-    headers = {"Accept": "application/json", "Content-Type": "application/json", "Cookie": f"3x-ui={session_id}"}
-    async with aiohttp.ClientSession() as session:
-        try:
-            response = await session.post(ADD_CLIENT_URL, headers=headers, json=client_data)
-            if response.status == 200:
-                return "✅ Оплата успешно подтверждена и подписка активирована. 🎆."
-            else:
-                return "❌ Произошла ошибка при добавлении клиента."
-        except Exception as e:
-            return "❌ Произошла ошибка при добавлении клиента."
-        
-async def login(LOGIN_URL, LOGIN_DATA):
-    """
-    Функция для аутентификации клиента через внешний сервис, используя данные для логина.
-    Возвращает session_id в случае успешной аутентификации.
-    """
-    response = requests.post(LOGIN_URL, data=LOGIN_DATA)
-    if response.status_code == 200:
-        session_id = response.cookies.get("3x-ui")
-        return session_id
-    return None
+    try:
+        await panel.add_clients(id_vless, [client])
+        if server_id is not None:
+            locator.add(name, server_id)
+            slot_tracker.commit(reservation, server_id, id_vless)
+        if added is not None:
+            added.update(inbound_id=id_vless, client=client)
+        return "✅ Оплата успешно подтверждена и подписка активирована. 🎆."
+    except PanelError as e:
+        slot_tracker.release(reservation)
+        logger.error(f"Ошибка при добавлении клиента {name}: {e}")
+        return "❌ Произошла ошибка при добавлении клиента."
+
+def render_client_config(template, client, email):
+    """Строки конфига клиента по шаблону inbound: срок, подписка, JSON-подписка, vless."""
+    expiry_time_ms = client['expiryTime']
+    expiry_text = "Новая подписка." if int(expiry_time_ms) < 0 else dt.fromtimestamp(expiry_time_ms / 1000).strftime('%Y-%m-%d %H:%M:%S')
+    sub_id = client.get('subId', None)
+    return (
+        f"{expiry_text}\n",
+        template.sub_url(sub_id),
+        template.json_url(sub_id),
+        f"{template.vless(client['id'], email)}\n",
+    )
 
 async def generate_config_from_pay(telegram_id, email, state):
     """
     Генерация конфигурации для клиента на основе его данных. Возвращает конфигурации для разных устройств.
+    Конфиг, выданный при добавлении клиента (issued_config), берется из состояния без запросов к панели.
     """
     data = await state.get_data()
+    issued = data.get('issued_config')
+    if issued and issued[0] == email:
+        return tuple(issued[1:])
+
     LOGIN_URL = data.get('login_url')
     LOGIN_DATA = data.get('login_data')
-    CONFIG_CLIENT_URL = data.get('config_client_url')
     INBOUND_IDS = data.get('inbound_ids')
-    session = requests.Session()
-    login_response = session.post(LOGIN_URL, json=LOGIN_DATA)
-    if login_response.status_code != 200:
-        return "", ""
-    
+    panel = get_panel({
+        "base_url": LOGIN_URL.removesuffix("/login"),
+        "username": LOGIN_DATA["username"],
+        "password": LOGIN_DATA["password"],
+    })
+    server_data = {"server_ip": data['server_ip'], "sub_url": data['sub_url'], "json_sub": data['json_sub']}
+
     userdata_list, config_list, config_list2, config_list3 = [], [], [], []
     for INBOUND_ID in INBOUND_IDS:
         try:
-            inbound_url = f"{CONFIG_CLIENT_URL}/{INBOUND_ID}"
-            inbound_response = session.get(inbound_url, headers={'Accept': 'application/json'})
-            if inbound_response.status_code != 200:
-                continue
-            inbound_data = inbound_response.json().get('obj')
-            if not inbound_data:
+            inbound = await panel.get_inbound(INBOUND_ID)
+            if not inbound:
                 continue
-            port = inbound_data['port']
-            settings = json.loads(inbound_data['settings'])
-            stream_settings = json.loads(inbound_data['streamSettings'])
-            client = next((client for client in settings['clients'] if client['email'].lower() == email), None)
+            client = next((client for client in inbound.clients if client['email'].lower() == email), None)
             if not client:
                 continue
-            client_id = client['id']
-            sub_id = client.get('subId', None)
-            network = stream_settings['network']
-            security = stream_settings['security']
-            public_key = stream_settings['realitySettings']['settings']['publicKey']
-            fingerprint = stream_settings['realitySettings']['settings']['fingerprint']
-            sni = stream_settings['realitySettings']['serverNames'][0]
-            short_id = stream_settings['realitySettings']['shortIds'][0]
-            spider_x_encoded = stream_settings['realitySettings']['settings']['spiderX'].replace('/', '%2F')
-
-            config_url = f"{data['sub_url']}{sub_id}"
-            config_json = f"{data['json_sub']}{sub_id}"
-            vless_config = f"vless://{client_id}@{data['server_ip']}:{port}?type={network}&security={security}&pbk={public_key}&fp={fingerprint}&sni={sni}&sid={short_id}&spx={spider_x_encoded}F&flow=xtls-rprx-vision#{email}\n"
-            expiry_time_ms = client['expiryTime']
-            expiry_text = "Новая подписка." if int(expiry_time_ms) < 0 else dt.fromtimestamp(expiry_time_ms / 1000).strftime('%Y-%m-%d %H:%M:%S')
-            userdata_list.append(f"{expiry_text}\n")
+            template = await config_template(panel, server_data, INBOUND_ID)
+            if template is None:
+                continue
+            userdata, config_url, config_json, vless_config = render_client_config(template, client, email)
+            userdata_list.append(userdata)
             config_list.append(config_url)
             config_list2.append(config_json)
             config_list3.append(vless_config)
+        except PanelError as e:
+            logger.error(f"Ошибка получения inbound {INBOUND_ID} для {email}: {e}")
+            if isinstance(e, PanelAuthError):
+                return "", "", "", ""
+            continue
         except Exception:
             continue
 
@@ -315,7 +337,7 @@ async def send_config_from_state(message: Message, state: FSMContext, telegram_i
 
         # 🔍 Поиск реферера и формирование Telegram-ссылки
         referrer_link = None
-        async with aiosqlite.connect(USERSDATABASE) as db:
+        async with users_pool.acquire() as db:
             db.row_factory = aiosqlite.Row
 
             # Шаг 1: Получаем referrer_code текущего пользователя
@@ -368,7 +390,7 @@ async def send_config_from_state(message: Message, state: FSMContext, telegram_i
             logger.error(f"❌ Ошибка отправки в GROUP_CHAT_ID: {e}")
 
         # 🔍 Проверка referrer_code == 'eb1a1788' → уведомление в REFERRAL_CHAT_ID
-        async with aiosqlite.connect(USERSDATABASE) as db:
+        async with users_pool.acquire() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute(
                 "SELECT referred_by FROM users WHERE telegram_id = ?", (telegram_id,)
@@ -1,4 +1,8 @@
 import aiosqlite
+from db.pool import users_pool
+from db.repo import UserRepo, SubscriptionRepo, ReferralRepo
+from db.writer import users_writer
+from db.cache import profile_cache
 import uuid
 from aiogram import types, Router
 from aiogram.fsm.context import FSMContext
@@ -17,6 +21,7 @@ from client.pers_account import process_email_for_all_servers
 from client.menu import get_main_menu, main_menu
 from db.db import get_emails_from_database, get_user_referral_code, increment_referral_clicks
 from client.add_client import start_add_client
+from handlers.select_server import release_slot_reservation
 from client.referral import referral_info
 from buttons.client import BUTTON_TEXTS
 from client.menu import get_cabinet_menu
@@ -50,8 +55,52 @@ async def delete_previous_message(chat_id: int, message_id: int):
         logger.error(f"Ошибка при удалении сообщения: {e}")
 
 
-async def handle_user_registration(
+async def _register_user(
     conn: aiosqlite.Connection,
+    telegram_id: int,
+    username: str,
+    telegram_link: str,
+    referral_code: str,
+    referred_by_code: str,
+    entry_date: str
+):
+    """
+    Операция для писателя users.db: обновляет или создает пользователя.
+    Возвращает (allowed, created, is_new_referral).
+    """
+    users = UserRepo(conn)
+    user_data = await users.get(telegram_id)
+
+    # Если пользователь уже существует и заблокирован — выходим
+    if user_data and user_data.is_blocked:
+        return False, False, False  # Признак, что пользователь заблокирован
+
+    if user_data:
+        # Обычное обновление
+        await users.touch(telegram_id, username, telegram_link, entry_date)
+        return True, False, False
+
+    # Проверяем: если пришёл по 99ecf8a4 — создаём, но помечаем как заблокированного
+    is_blocked = 1 if referred_by_code == "99ecf8a4" else 0
+
+    referrer_id = None
+    if referred_by_code and not is_blocked:
+        referrer_id = await users.telegram_id_by_referral_code(referred_by_code)
+
+    await users.register(
+        telegram_id, username, telegram_link, referral_code,
+        referrer_id, referred_by_code, entry_date, is_blocked
+    )
+
+    is_new_referral = bool(referred_by_code and not is_blocked)
+    if is_new_referral:
+        await ReferralRepo(conn).add_link(referred_by_code, telegram_id)
+
+    # Возвращаем статус блокировки
+    return not is_blocked, True, is_new_referral
+
+
+async def handle_user_registration(
     telegram_id: int, 
     username: str, 
     telegram_link: str, 
@@ -59,71 +108,35 @@ async def handle_user_registration(
     referred_by_code: str, 
     entry_date: str
 ):
-    async with conn.cursor() as cursor:
-        await cursor.execute(
-            "SELECT referral_code, referred_by, referrer_code, is_blocked FROM users WHERE telegram_id = ?", 
-            (telegram_id,)
-        )
-        user_data = await cursor.fetchone()
-
-        # Если пользователь уже существует и заблокирован — выходим
-        if user_data and user_data[3]:  # is_blocked == 1
-            return False  # Признак, что пользователь заблокирован
-
-        if user_data:
-            # Обычное обновление
-            await cursor.execute(
-                """UPDATE users 
-                SET username = ?, telegram_link = ?, entry_date = ?
-                WHERE telegram_id = ?""",
-                (username, telegram_link, entry_date, telegram_id)
-            )
-        else:
-            # Проверяем: если пришёл по 99ecf8a4 — создаём, но помечаем как заблокированного
-            is_blocked = 1 if referred_by_code == "99ecf8a4" else 0
-
-            referrer_id = None
-            if referred_by_code and not is_blocked:
-                await cursor.execute(
-                    "SELECT telegram_id FROM users WHERE referral_code = ?", 
-                    (referred_by_code,)
-                )
-                result = await cursor.fetchone()
-                referrer_id = result[0] if result else None
-
-            await cursor.execute(
-                """INSERT INTO users 
-                (telegram_id, username, telegram_link, referral_code, referral_count, referred_by, referrer_code, entry_date, is_blocked)
-                VALUES (?, ?, ?, ?, 0, ?, ?, ?, ?)""",
-                (telegram_id, username, telegram_link, referral_code, referrer_id, referred_by_code, entry_date, is_blocked)
-            )
-
-            if referred_by_code and not is_blocked:
-                await cursor.execute(
-                    "INSERT INTO referral_links (referrer_code, invited_user_id) VALUES (?, ?)",
-                    (referred_by_code, telegram_id)
-                )
-                await notify_admins(telegram_id, referred_by_code, username, telegram_link)
-                if referred_by_code == "gtpiHVFvkE":
-                    await notify_referral_chat(telegram_id, username, telegram_link)
+    # Вызывается на каждое обновление: известного пользователя без изменений
+    # берем из кэша профилей и в users.db не пишем
+    profile = await profile_cache.get(telegram_id)
+    if profile is not None:
+        if profile.is_blocked:
+            return False
+        if (profile.user.username, profile.user.telegram_link) == (username, telegram_link):
+            return True
+
+    allowed, created, is_new_referral = await users_writer.submit(
+        _register_user, telegram_id, username, telegram_link, referral_code, referred_by_code, entry_date
+    )
+    profile_cache.invalidate(telegram_id)
 
-        await conn.commit()
+    # Уведомления отправляем после коммита, а не внутри транзакции
+    if is_new_referral:
+        await notify_admins(telegram_id, referred_by_code, username, telegram_link)
+        if referred_by_code == "gtpiHVFvkE":
+            await notify_referral_chat(telegram_id, username, telegram_link)
 
-        # Возвращаем статус блокировки
-        return not (is_blocked if not user_data else user_data[3])
+    return allowed
 
 @router.message(Command("start"))
 async def start(message: types.Message):
     telegram_id = message.from_user.id
 
-    async with aiosqlite.connect("users.db", timeout=30) as conn:
-        cursor = await conn.execute(
-            "SELECT is_blocked FROM users WHERE telegram_id = ?", 
-            (telegram_id,)
-        )
-        row = await cursor.fetchone()
-        if row and row[0]:
-            return  # 🔴 Заблокированный пользователь — ничего не делаем
+    profile = await profile_cache.get(telegram_id)
+    if profile and profile.is_blocked:
+        return  # 🔴 Заблокированный пользователь — ничего не делаем
 
     # Если не заблокирован — продолжаем
     logger.info(f"Пользователь {telegram_id} нажал /start")
@@ -143,28 +156,26 @@ async def start(message: types.Message):
             else:
                 referred_by_code = code
 
-    async with aiosqlite.connect("users.db", timeout=30) as conn:
-        user_referral_code = await get_user_referral_code(telegram_id, conn) or str(uuid.uuid4())[:8]
-        username = message.from_user.first_name or "Без имени"
-        telegram_link = f"https://t.me/{message.from_user.username}" if message.from_user.username else None
-        entry_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        try:
-            # Передаём referred_by_code — если 99ecf8a4, будет is_blocked = 1
-            allowed = await handle_user_registration(
-                conn=conn,
-                telegram_id=telegram_id,
-                username=username,
-                telegram_link=telegram_link,
-                referral_code=user_referral_code,
-                referred_by_code=referred_by_code,
-                entry_date=entry_date
-            )
-            if not allowed:
-                return  # 🔴 Заблокирован
-        except Exception as e:
-            logger.error(f"Ошибка при регистрации: {e}")
-            return
+    user_referral_code = await get_user_referral_code(telegram_id) or str(uuid.uuid4())[:8]
+    username = message.from_user.first_name or "Без имени"
+    telegram_link = f"https://t.me/{message.from_user.username}" if message.from_user.username else None
+    entry_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    try:
+        # Передаём referred_by_code — если 99ecf8a4, будет is_blocked = 1
+        allowed = await handle_user_registration(
+            telegram_id=telegram_id,
+            username=username,
+            telegram_link=telegram_link,
+            referral_code=user_referral_code,
+            referred_by_code=referred_by_code,
+            entry_date=entry_date
+        )
+        if not allowed:
+            return  # 🔴 Заблокирован
+    except Exception as e:
+        logger.error(f"Ошибка при регистрации: {e}")
+        return
 
     await main_menu(message)
 
@@ -188,7 +199,7 @@ async def handle_main_menu(callback_query: types.CallbackQuery):
         text,
         parse_mode=ParseMode.HTML,
         disable_web_page_preview=True,
-        reply_markup=get_main_menu(callback_query)
+        reply_markup=await get_main_menu(callback_query)
     )
     await callback_query.answer()
 
@@ -205,21 +216,22 @@ async def cancel_action(callback_query: types.CallbackQuery, state: FSMContext):
                 chat_id=callback_query.message.chat.id,
                 message_id=sent_message_id,
                 text="❌ Действие отменено.",
-                reply_markup=get_main_menu(callback_query)
+                reply_markup=await get_main_menu(callback_query)
             )
         else:
             await bot.send_message(
                 chat_id=callback_query.message.chat.id,
                 text="Нет активной покупки. Выберите опцию:",
-                reply_markup=get_main_menu(callback_query)
+                reply_markup=await get_main_menu(callback_query)
             )
     except Exception as e:
         logger.error(f"Ошибка при отмене действия: {e}")
         await bot.send_message(
             chat_id=callback_query.message.chat.id,
             text="Не удалось отменить покупку. Выберите действие:",
-            reply_markup=get_main_menu(callback_query)
+            reply_markup=await get_main_menu(callback_query)
         )
+    await release_slot_reservation(state)
     await state.clear()
     await callback_query.answer()
 
@@ -504,32 +516,17 @@ async def get_days_left_by_telegram_id(telegram_id: int) -> int | None:
     Использует связку: users → user_emails → user_configs.
     """
     try:
-        async with aiosqlite.connect("users.db") as conn:
+        async with users_pool.acquire() as conn:
+            subscriptions = SubscriptionRepo(conn)
             # Получаем email через users → user_emails
-            async with conn.execute("""
-                SELECT ue.email
-                FROM users u
-                JOIN user_emails ue ON u.id = ue.user_id
-                WHERE u.telegram_id = ?
-                LIMIT 1
-            """, (telegram_id,)) as cursor:
-                row = await cursor.fetchone()
-                if not row:
-                    return None
-                email = row[0]
-
-            # Получаем days_left из user_configs
-            async with conn.execute("""
-                SELECT days_left
-                FROM user_configs
-                WHERE email = ?
-                LIMIT 1
-            """, (email,)) as cursor:
-                row = await cursor.fetchone()
-                if row and row[0] is not None:
-                    return int(row[0])
+            emails = await subscriptions.emails(telegram_id)
+            if not emails:
                 return None
 
+            # days_left считается из expires_at в user_configs
+            days_left = await subscriptions.days_left(emails[0])
+            return int(days_left) if days_left is not None else None
+
     except Exception as e:
         logger.error(f"Ошибка получения days_left для telegram_id={telegram_id}: {e}")
         return None
@@ -1,15 +1,11 @@
 from aiogram import types
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import FSInputFile, InlineKeyboardButton
-from handlers.config import get_server_data
-from db.db import get_server_ids_as_list
+from handlers.health import server_health
 from buttons.client import BUTTON_TEXTS
 from bot import bot
 from client.menu import get_back_button
-import aiohttp
-import asyncio
 from aiogram.enums import ChatAction
-from log import logger
 from dotenv import load_dotenv
 import os
 from client.text import SERVICE_TEXT, PRICE_TEXT
@@ -26,57 +22,14 @@ IOS = os.getenv("IOS")
 SERVEDATABASE = os.getenv("SERVEDATABASE")
 
 
-async def check_server_status(server_url: str, server_name: str) -> str:
-    """
-    Проверяет статус сервера по его URL.
-    
-    :param server_url: URL сервера
-    :param server_name: Название сервера
-    :return: Статус сервера (онлайн/оффлайн)
-    """
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(server_url) as response:
-                if response.status == 200:
-                    return f"🟢 Сервер {server_name}: онлайн"
-                else:
-                    return f"🔴 Сервер {server_name}: недоступен"
-    except aiohttp.ClientError as e:
-        logger.error(f"Ошибка при проверке сервера {server_name}: {e}")
-        return f"🔴 Сервер {server_name}: в данный момент недоступен"
-
-
-async def check_all_servers() -> dict:
-    """
-    Проверяет статус всех серверов.
-    """
-    server_ids = await get_server_ids_as_list(SERVEDATABASE)
-    statuses = {}
-
-    tasks = []
-    for server_id in server_ids:
-        server_data = await get_server_data(server_id)
-        if server_data:
-            server_url = server_data["server"]
-            server_name = server_data["name"]
-            tasks.append(check_server_status(server_url, server_name))
-        else:
-            statuses[server_id] = f"🔴 Сервер с ID {server_id} не найден"
-
-    results = await asyncio.gather(*tasks, return_exceptions=True)
-    for server_id, result in zip(server_ids, results):
-        if isinstance(result, str):
-            statuses[server_id] = result
-
-    return statuses
-
 async def show_server_info(callback_query: types.CallbackQuery):
     """
     Отображает информацию о серверах и условиях использования VPN.
     """
     server_info_text = SERVICE_TEXT
-    statuses = await check_all_servers()
-    status_text = "\n".join(statuses.values())
+    # Статусы из фоновой проверки (handlers/health.py), без запросов к панелям
+    statuses = server_health.statuses()
+    status_text = "\n".join(statuses.values()) or "⏳ Статус серверов проверяется, загляните через минуту."
 
     final_text = f"🌐 Статус серверов:\n\n{status_text}\n\n{server_info_text}\n"
 
@@ -94,8 +47,8 @@ async def show_router_instructions(callback_query: types.CallbackQuery):
     Отображает информацию о серверах и условиях использования VPN.
     """
     server_info_text = SERVICE_TEXT
-    statuses = await check_all_servers()
-    status_text = "\n".join(statuses.values())
+    statuses = server_health.statuses()
+    status_text = "\n".join(statuses.values()) or "⏳ Статус серверов проверяется, загляните через минуту."
 
     final_text = f"🌐 Статус серверов:\n\n{status_text}\n\n{server_info_text}\n"
 
@@ -30,14 +30,14 @@ async def main_menu(message, edit=False, callback_query=None):
             text,
             parse_mode=ParseMode.HTML,
             disable_web_page_preview=True,
-            reply_markup=get_main_menu(callback_query)
+            reply_markup=await get_main_menu(callback_query)
         )
     else:
         await message.answer(
             text,
             parse_mode=ParseMode.HTML,
             disable_web_page_preview=True,
-            reply_markup=get_main_menu(callback_query)
+            reply_markup=await get_main_menu(callback_query)
         )
 
 
@@ -73,7 +73,7 @@ def get_button_not_sub():
     keyboard.add(InlineKeyboardButton(text=BUTTON_TEXTS["main_menu"], callback_data="main_menu"))
     return keyboard.as_markup()
 
-def get_main_menu(callback_query: types.CallbackQuery):
+async def get_main_menu(callback_query: types.CallbackQuery):
     """
     Создает основное меню с кнопками для пользователя с учетом подписки.
     """
@@ -81,7 +81,7 @@ def get_main_menu(callback_query: types.CallbackQuery):
     builder = InlineKeyboardBuilder()
 
     # Проверяем условия для пробной подписки
-    if not has_active_subscription(telegram_id):
+    if not await has_active_subscription(telegram_id):
         builder.add(types.InlineKeyboardButton(
             text=BUTTON_TEXTS["trial"], 
             callback_data="trial_go"
@@ -96,7 +96,7 @@ def get_main_menu(callback_query: types.CallbackQuery):
     )
 
     # Определяем какую кнопку показывать (Купить/Продлить)
-    if should_show_prodlit_button(telegram_id):
+    if await should_show_prodlit_button(telegram_id):
         builder.row(
             InlineKeyboardButton(
                 text=BUTTON_TEXTS["extend_subscription_subscr"], 
@@ -1,9 +1,9 @@
-import aiohttp
 import asyncio
-import json
 from datetime import datetime as dt
 from aiogram import types
 from handlers.config import get_server_data
+from handlers.panel import get_panel
+from handlers.client_config import config_template
 from log import logger
 from db.db import Database, get_server_ids_as_list
 from aiogram import Router
@@ -101,59 +101,31 @@ async def config_from_lk(client_id, email, server_data):
     """
     Получает конфигурацию клиента из личного кабинета, выполняет авторизацию и собирает данные о пользователе и конфигурации.
     """
-    LOGIN_DATA = {
-        "username": server_data["username"],
-        "password": server_data["password"],
-    }
-
-    async with aiohttp.ClientSession() as session:
-        try:
-            login_response = await session.post(server_data["login_url"], json=LOGIN_DATA)
-            if login_response.status != 200:
-                logger.error("Ошибка входа: " + await login_response.text())
-                return [], []
-
-            userdata_list, config_list = [], []
-            result = await get_client_config(client_id, email, server_data, session)
-            userdata, config_url, config_json, config_vless = result
+    try:
+        userdata_list, config_list = [], []
+        result = await get_client_config(email, server_data, get_panel(server_data))
+        userdata, config_url, config_json, config_vless = result
 
-            if userdata:
-                userdata_list.append(userdata)
-                config_list.extend([config_json, config_url, config_vless])
+        if userdata:
+            userdata_list.append(userdata)
+            config_list.extend([config_json, config_url, config_vless])
 
-            return userdata_list, config_list
-        except Exception as e:
-            logger.error(f"Ошибка при получении конфигурации: {e}")
-            return [], []
+        return userdata_list, config_list
+    except Exception as e:
+        logger.error(f"Ошибка при получении конфигурации: {e}")
+        return [], []
 
 
-async def get_client_config(email, server_data, session):
+async def get_client_config(email, server_data, panel):
     """
     Получает конфигурацию клиента с сервера, включая данные о подписке, порте и настройках безопасности. 
     Формирует информацию о подписке и возвращает ссылки для автоконфигурации.
     """
     all_inbound_ids = server_data.get("inbound_ids", [])
-    
-    for inbound_id in all_inbound_ids:
-        try:
-            inbound_url = f"{server_data['config_client_url']}/{inbound_id}"
-            inbound_response = await session.get(inbound_url, headers={'Accept': 'application/json'})
-
-            if inbound_response.status != 200:
-                logger.error(f"Ошибка получения данных inbound для ID {inbound_id}: {await inbound_response.text()}")
-                continue
 
-            inbound_data = await inbound_response.json()
-            if inbound_data.get('obj') is None:
-                logger.info(f"Нет данных для inbound ID {inbound_id}")
-                continue
-
-            clients = json.loads(inbound_data['obj']['settings']).get('clients', [])
-            client = next((c for c in clients if c['email'] == email), None)
-
-            if not client:
-                continue
-            
+    inbound, client = await panel.locate(email, all_inbound_ids)
+    if client is not None:
+        try:
             expiry_time = client.get('expiryTime', 0)
             current_time = int(dt.utcnow().timestamp() * 1000)
 
@@ -161,25 +133,20 @@ async def get_client_config(email, server_data, session):
                 expiry_text = "❌ Подписка неактивна (срок истек).\n➖➖➖➖➖➖➖➖➖➖"
                 return expiry_text, "", "", ""
 
-            port = inbound_data['obj']['port']
-            stream_settings = json.loads(inbound_data['obj']['streamSettings'])
+            template = await config_template(panel, server_data, inbound.id)
+            if template is None:
+                return "", "", "", ""
             sub_id = client.get('subId', '')
 
             expiry_text = f"📅 Подписка до: {dt.fromtimestamp(expiry_time / 1000).strftime('%Y-%m-%d %H:%M:%S')}"
-            config_url = f"{server_data['sub_url']}{sub_id}\n"
-            config_json = f"{server_data['json_sub']}{sub_id}\n"
-            config_vless = (
-                f"vless://{client['id']}@{server_data['server_ip']}:{port}?type={stream_settings['network']}&security={stream_settings['security']}"
-                f"&pbk={stream_settings['realitySettings']['settings']['publicKey']}&fp={stream_settings['realitySettings']['settings']['fingerprint']}&"
-                f"sni={stream_settings['realitySettings']['serverNames'][0]}&sid={stream_settings['realitySettings']['shortIds'][0]}&"
-                f"spx={stream_settings['realitySettings']['settings']['spiderX'].replace('/', '%2F')}&flow=xtls-rprx-vision#{email}\n"
-            )
+            config_url = f"{template.sub_url(sub_id)}\n"
+            config_json = f"{template.json_url(sub_id)}\n"
+            config_vless = f"{template.vless(client['id'], email)}\n"
 
             expiry_text = f"\n{expiry_text}"
 
             return expiry_text, config_url, config_json, config_vless
         except Exception as e:
-            logger.error(f"Ошибка при обработке inbound ID {inbound_id}: {e}")
-            continue
+            logger.error(f"Ошибка при обработке inbound ID {inbound.id}: {e}")
 
     return "", "", "", ""
@@ -3,7 +3,9 @@ from aiogram.types import InlineKeyboardButton, Message
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram import Router, types
 import string
-import aiosqlite
+from db.pool import users_pool
+from db.repo import UserRepo, PromoRepo
+from db.cache import profile_cache
 import asyncio
 import random
 from log import logger
@@ -27,24 +29,21 @@ async def get_user_data(telegram_id: int) -> tuple:
     """
     Получает данные пользователя из базы данных.
     """
-    async with aiosqlite.connect(USERSDATABASE) as conn:
-        async with conn.execute("""
-            SELECT referral_code, referral_count, promo_code, sum_my, sum_ref
-            FROM users
-            WHERE telegram_id = ?
-        """, (telegram_id,)) as cursor:
-            return await cursor.fetchone()
+    profile = await profile_cache.get(telegram_id)
+    if profile is None:
+        return None
+    user = profile.user
+    return user.referral_code, user.referral_count, user.promo_code, user.sum_my, user.sum_ref
 
 
 async def update_user_referral_code(telegram_id: int, referral_code: str) -> None:
     """
     Обновляет реферальный код пользователя в базе данных.
     """
-    async with aiosqlite.connect(USERSDATABASE) as conn:
-        await conn.execute("""
-            UPDATE users SET referral_code = ? WHERE telegram_id = ?
-        """, (referral_code, telegram_id))
+    async with users_pool.acquire() as conn:
+        await UserRepo(conn).set_referral_code(telegram_id, referral_code)
         await conn.commit()
+    profile_cache.invalidate(telegram_id)
 
 
 async def referral_info(callback_query: types.CallbackQuery, bot, state: FSMContext):
@@ -69,7 +68,7 @@ async def referral_info(callback_query: types.CallbackQuery, bot, state: FSMCont
 
         # Получаем скидку и цену
         expiry_time = 30 
-        price, total_discount, referral_count = get_price_with_referral_info(expiry_time, telegram_id, user_promo_code)
+        price, total_discount, referral_count = await get_price_with_referral_info(expiry_time, telegram_id, user_promo_code)
 
         # 🔽 Форматируем текст с полной статистикой
         formatted_ref_text = REF_TEXT.format(
@@ -145,63 +144,43 @@ async def process_promo_code(message: types.Message, state: FSMContext):
         # Сохраняем ID входящего сообщения для возможного удаления
         await state.update_data(input_message_id=message.message_id)
         
-        async with aiosqlite.connect(USERSDATABASE) as conn:
+        async with users_pool.acquire() as conn:
+            promos = PromoRepo(conn)
+            users = UserRepo(conn)
             # Проверяем промокод в базе
-            async with conn.execute("""
-                SELECT id, discount, days, is_active
-                FROM promo_codes
-                WHERE code = ?
-            """, (promo_code,)) as cursor:
-                promo_data = await cursor.fetchone()
+            promo_data = await promos.get(promo_code)
 
             if not promo_data:
                 await handle_promo_code_error(message, state, "❌ Промокод не найден.")
                 return
 
-            promo_id, discount, days, is_active = promo_data
+            discount, days = promo_data.discount, promo_data.days
 
-            if not is_active:
+            if not promo_data.is_active:
                 await handle_promo_code_error(message, state, "❌ Этот промокод не активен.")
                 return
 
             # Проверяем, использовал ли пользователь уже этот промокод
-            async with conn.execute("""
-                SELECT COUNT(*)
-                FROM used_promo_codes
-                WHERE promo_code = ? AND user_id = (SELECT id FROM users WHERE telegram_id = ?)
-            """, (promo_code, user_id)) as cursor:
-                already_used = (await cursor.fetchone())[0]
+            already_used = await promos.used_count(user_id, promo_code)
 
             if already_used > 0:
                 await handle_promo_code_error(message, state, "❌ Вы уже использовали этот промокод.")
                 return
 
             # Получаем текущую подписку пользователя
-            async with conn.execute("""
-                SELECT subscription_end FROM users WHERE telegram_id = ?
-            """, (user_id,)) as cursor:
-                subscription_end = await cursor.fetchone()
-                current_end = datetime.strptime(subscription_end[0], "%Y-%m-%d %H:%M:%S") if subscription_end and subscription_end[0] else datetime.now()
+            user = await users.get(user_id)
+            subscription_end = user.subscription_end if user else None
+            current_end = datetime.strptime(subscription_end, "%Y-%m-%d %H:%M:%S") if subscription_end else datetime.now()
 
             # Вычисляем новую дату окончания подписки
             new_end = current_end + timedelta(days=days) if current_end > datetime.now() else datetime.now() + timedelta(days=days)
 
             # Обновляем данные пользователя
-            await conn.execute("""
-                INSERT INTO used_promo_codes (user_id, promo_code)
-                VALUES ((SELECT id FROM users WHERE telegram_id = ?), ?)
-            """, (user_id, promo_code))
-            
-            await conn.execute("""
-                UPDATE users
-                SET promo_code = ?,
-                    promo_code_usage = 0,
-                    subscription_end = ?,
-                    subscription_active = 1
-                WHERE telegram_id = ?
-            """, (promo_code, new_end.strftime("%Y-%m-%d %H:%M:%S"), user_id))
+            await promos.record_use(user_id, promo_code)
+            await users.apply_promo(user_id, promo_code, new_end.strftime("%Y-%m-%d %H:%M:%S"))
             
             await conn.commit()
+            profile_cache.invalidate(user_id)
 
             # Формируем сообщение об успехе
             success_msg = (
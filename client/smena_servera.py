@@ -1,17 +1,20 @@
-import aiohttp
-import sqlite3
 import  json
 import asyncio
 from aiogram import types
 from handlers.config import get_server_data
+from handlers.panel import get_panel, PanelError
+from handlers.locator import locator
+from handlers.capacity import slot_tracker
 from log import logger
-from db.db import get_server_id, get_server_ids_as_list
+from db.db import get_server_ids_as_list
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram import Router, types
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from handlers.select_server import get_optimal_server
+from handlers.select_server import get_optimal_server, release_slot_reservation
 from client.add_client import add_client
 from db.db import emails_from_smena_servera, ServerDatabase
+from db.repo import SubscriptionRepo
+from db.writer import users_writer
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from buttons.client import BUTTON_TEXTS
@@ -89,10 +92,10 @@ async def email_exists_on_any_server(email: str) -> tuple[bool, bool]:
     """
     Проверяет существование логина на любых серверах и определяет, истекла ли его подписка.
     """
-    server_ids_str = await get_server_id(SERVEDATABASE)  # Получаем строку "1,2,3"
-    server_ids = [int(sid) for sid in server_ids_str.split(",") if sid.isdigit()]  # Преобразуем в список
+    # Серверы логина берем из локатора, а не обходим весь парк
+    server_ids = await locator.servers(email)
 
-    logger.info(f"Список серверов: {server_ids}")
+    logger.info(f"Серверы логина {email}: {server_ids}")
     current_time_ms = int(time.time() * 1000)
 
     async def check_server(server_id):
@@ -101,43 +104,16 @@ async def email_exists_on_any_server(email: str) -> tuple[bool, bool]:
             logger.error(f"Данные сервера {server_id} не найдены.")
             return False, False
 
-        LOGIN_DATA = {
-            "username": server_data["username"],
-            "password": server_data["password"],
-        }
-
-        async with aiohttp.ClientSession() as session:
-            try:
-                login_response = await session.post(server_data["login_url"], json=LOGIN_DATA)
-                if login_response.status != 200:
-                    logger.error(f"Ошибка входа на сервер {server_id}: {await login_response.text()}")
-                    return False, False
-
-                for inbound_id in server_data.get("inbound_ids", []):
-                    inbound_url = f"{server_data['config_client_url']}/{inbound_id}"
-                    inbound_response = await session.get(inbound_url, headers={'Accept': 'application/json'})
-
-                    if inbound_response.status != 200:
-                        logger.error(f"Ошибка получения inbound ID {inbound_id}: {await inbound_response.text()}")
-                        continue
-
-                    inbound_data = await inbound_response.json()
-                    if inbound_data.get("obj") is None:
-                        logger.error(f"Нет данных для inbound ID {inbound_id}")
-                        continue
-
-                    clients = json.loads(inbound_data["obj"]["settings"]).get("clients", [])
-                    for client in clients:
-                        if client["email"] == email:
-                            expiry_time = int(client.get("expiryTime", 0))
-                            is_expired = expiry_time < current_time_ms
-                            return True, is_expired
-
-                return False, False
+        try:
+            client = await get_panel(server_data).client_state(email, server_data.get("inbound_ids", []))
+        except PanelError as e:
+            logger.error(f"Ошибка при проверке email {email} на сервере {server_id}: {e}")
+            return False, False
 
-            except Exception as e:
-                logger.error(f"Ошибка при проверке email {email} на сервере {server_id}: {e}")
-                return False, False
+        if client is None:
+            return False, False
+        expiry_time = int(client.get("expiryTime", 0))
+        return True, expiry_time < current_time_ms
 
     results = await asyncio.gather(*[check_server(server_id) for server_id in server_ids])
     for exists, is_expired in results:
@@ -213,7 +189,7 @@ async def select_country(callback_query: types.CallbackQuery, state: FSMContext)
     state_data = await state.get_data()
     new_server_id = state_data.get("new_server_id")
 
-    optimal_server = await get_optimal_server(new_server_id, server_db)
+    optimal_server = await get_optimal_server(new_server_id, server_db, state)
 
     if isinstance(optimal_server, str) and not optimal_server.isdigit():  
         await callback_query.message.edit_text(
@@ -226,6 +202,9 @@ async def select_country(callback_query: types.CallbackQuery, state: FSMContext)
         )
         return
 
+    # new_email берет сервер из state: туда же, где зарезервировано место
+    await state.update_data(new_server_id=optimal_server)
+
     # Получаем данные по серверам
     server_data = await get_server_data(selected_server_id)
     new_server_data = await get_server_data(optimal_server)
@@ -311,6 +290,10 @@ async def change_country(callback_query: types.CallbackQuery, state: FSMContext)
         )
 
 
+async def _move_email(conn, email, server_id):
+    await SubscriptionRepo(conn).move(email, server_id)
+
+
 async def new_email(telegram_id, server_data, state: FSMContext):
     """
     Обработчик для обновления логина клиента на новый сервер и добавления его на новый сервер.
@@ -332,36 +315,25 @@ async def new_email(telegram_id, server_data, state: FSMContext):
 
     if not client_id or not new_server_id:
         logger.error("Отсутствуют необходимые данные (client_id или new_server_id) в состоянии FSM.")
+        await release_slot_reservation(state)
         return None
     server_data = await get_server_data(new_server_id)
     if not server_data:
         logger.error(f"Не удалось получить данные для нового сервера с ID: {new_server_id}")
+        await release_slot_reservation(state)
         return None
     LOGIN_URL = server_data.get('login_url')
     ADD_CLIENT_URL = server_data.get("add_client_url")
     logger.info(f"{ADD_CLIENT_URL}   Данные для входа на сервер: {LOGIN_URL}, username: {server_data.get('username')}")
-    conn = sqlite3.connect(USERSDATABASE)
-    cursor = conn.cursor()
-
     try:
-        cursor.execute("""
-            UPDATE user_emails
-            SET id_server = ?
-            WHERE email = ?
-        """, (new_server_id, email))
-        conn.commit()
+        await users_writer.submit(_move_email, email, new_server_id)
         logger.info(f"Обновлен id_server для email: {email} на значение {new_server_id}")
     except Exception as e:
         logger.error(f"Ошибка обновления id_server для email {email}: {e}")
-    finally:
-        cursor.close()
-        conn.close()
-
-    await add_client(
-        email, expiry_time, server_data['inbound_ids'], telegram_id,
-        server_data['add_client_url'], server_data['login_url'], 
-        {"username": server_data['username'], "password": server_data['password']}
-    )
+    locator.move(email, new_server_id)
+
+    # С state add_client подтверждает резерв места, сделанный в select_country
+    await add_client(server_data, email, expiry_time, telegram_id, state)
 
 
 async def delete_client(telegram_id, server_data, state: FSMContext):
@@ -379,45 +351,18 @@ async def delete_client(telegram_id, server_data, state: FSMContext):
     client_id = state_data.get("client_id")
 
     if inbound_id and client_id:
-        LOGIN_URL = server_data.get('login_url')
-        logger.info(f"LOGIN_URL: {LOGIN_URL}")
-        login_data = {
-            'username': server_data['username'],
-            'password': server_data['password']
-        }
-        logger.info(f"Login data: {login_data}")
-        async with aiohttp.ClientSession() as session:
-            try:
-                login_response = await session.post(LOGIN_URL, json=login_data)
-                logger.info(f"Login response status: {login_response.status}")
-
-                if login_response.status == 200:
-                    session_id = login_response.cookies.get("3x-ui")
-                    delete_url = f"{server_data.get('base_url')}/panel/api/inbounds/{inbound_id}/delClient/{client_id}"
-
-                    if not delete_url:
-                        logger.error("URL для удаления клиента отсутствует в данных сервера.")
-                        return False
-                    logger.info(f"URL для удаления клиента: {delete_url}")
-                    response = await session.post(delete_url, cookies={"3x-ui": session_id})
-
-                    if response.status == 200:
-                        logger.info(f"Клиент с ID {client_id} успешно удален.")
-                        
-                        await state.update_data(client_id=None, inbound_id=None)
-                        return True
-                    elif response.status == 404:
-                        logger.error(f"Не найден ресурс для удаления клиента: {delete_url}")
-                        return False
-                    else:
-                        logger.error(f"Ошибка при удалении клиента: {response.status} - {response.text}")
-                        return False
-                else:
-                    logger.error(f"Ошибка при входе перед удалением клиента. Статус: {login_response.status} - {login_response.text}")
-                    return False
-            except Exception as e:
-                logger.error(f"Ошибка при запросе для удаления клиента: {str(e)}")
-                return False
+        try:
+            await get_panel(server_data).delete_client(inbound_id, client_id)
+        except PanelError as e:
+            logger.error(f"Ошибка при удалении клиента {client_id}: {e}")
+            return False
+        logger.info(f"Клиент с ID {client_id} успешно удален.")
+        slot_tracker.remove(server_data.get("id"), inbound_id)
+        # При смене страны логин уже переехал на новый сервер — убираем только старый
+        if str(server_data.get("id")) != str(state_data.get("new_server_id")):
+            locator.remove(state_data.get("email"), server_data.get("id"))
+        await state.update_data(client_id=None, inbound_id=None)
+        return True
     else:
         logger.error(f"Недостаточно данных для удаления клиента: inbound_id или client_id отсутствуют.")
         return False
@@ -428,25 +373,16 @@ async def fetch_client_data(telegram_id, email, server_data, state: FSMContext):
     Получает данные клиента с сервера для указанного email.
 
     Этот метод выполняет следующие действия:
-    - Производит вход на сервер с использованием учетных данных.
     - Получает конфигурацию клиента с сервера, используя email клиента.
     """
-    LOGIN_DATA = {
-        "username": server_data["username"],
-        "password": server_data["password"],
-    }
-
-    async with aiohttp.ClientSession() as session:
-        login_response = await session.post(server_data["login_url"], json=LOGIN_DATA)
-
-        if login_response.status != 200:
-            logger.error(f"Ошибка входа: {await login_response.text()}")
-            return None, []
-        userdata = await get_client_config(telegram_id, email, server_data, session, state)
-        return userdata
+    try:
+        return await get_client_config(telegram_id, email, server_data, get_panel(server_data), state)
+    except PanelError as e:
+        logger.error(f"Ошибка получения данных клиента {email}: {e}")
+        return None, []
 
 
-async def get_client_config(telegram_id, email, server_data, session, state: FSMContext):
+async def get_client_config(telegram_id, email, server_data, panel, state: FSMContext):
     """
     Получает конфигурацию клиента на сервере по логину.
 
@@ -456,29 +392,19 @@ async def get_client_config(telegram_id, email, server_data, session, state: FSM
     - Обновляет состояние FSM с данными клиента.
     """
     all_inbound_ids = server_data.get("inbound_ids", [])
-    for inbound_id in all_inbound_ids:
-        inbound_url = f"{server_data['config_client_url']}/{inbound_id}"
-        inbound_response = await session.get(inbound_url, headers={'Accept': 'application/json'})
-
-        if inbound_response.status != 200:
-            logger.error(f"Ошибка получения данных inbound для ID {inbound_id}: {await inbound_response.text()}")
-            continue
-        inbound_data = await inbound_response.json()
-        if not inbound_data.get('obj'):
-            continue
-        client = next((c for c in json.loads(inbound_data['obj']['settings']).get('clients', []) if c['email'] == email), None)
-
-        if client:
-            await state.update_data(
-                client_id=client.get('id'),
-                email=email,
-                expiry_time=client.get('expiryTime', 'N/A'),
-                sub_id=client.get('subId', 'N/A'),
-                telegram_id=telegram_id,
-                inbound_id=inbound_id,
-                server_id=server_data.get('id', 'N/A'),
-            )
-            state_data = await state.get_data()
-            logger.info(f"Данные FSM после обновления: {state_data}")
-            break
+    # Свежий снимок: срок переносится на новый сервер как есть
+    inbound, client = (await panel.snapshot(max_age=0)).locate(email, all_inbound_ids)
+
+    if client:
+        await state.update_data(
+            client_id=client.get('id'),
+            email=email,
+            expiry_time=client.get('expiryTime', 'N/A'),
+            sub_id=client.get('subId', 'N/A'),
+            telegram_id=telegram_id,
+            inbound_id=inbound.id,
+            server_id=server_data.get('id', 'N/A'),
+        )
+        state_data = await state.get_data()
+        logger.info(f"Данные FSM после обновления: {state_data}")
     return await state.get_data()
\ No newline at end of file
@@ -1,20 +1,23 @@
-import asyncio, json, requests, time, uuid
+import asyncio, json, time, uuid
 from datetime import datetime as dt
 from datetime import datetime
 from aiogram import types
 from aiogram.fsm.context import FSMContext
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from aiohttp import ClientSession, TCPConnector
 from aiogram import Router, F
-import aiosqlite
+from db.pool import users_pool
+from db.repo import SubscriptionRepo, days_left_from_expiry, DAY_MS
+from db.writer import users_writer
 from uuid import uuid4
 from aiogram.enums.parse_mode import ParseMode
 from bot import bot
 from log import logger
 from client.menu import get_main_menu, get_back_button
-from db.db import Database, get_emails_from_database, get_server_id, update_sum_my, update_sum_ref, add_free_days, get_db_connection
+from db.db import Database, get_emails_from_database, record_purchase
 from handlers.config import get_server_data
+from handlers.panel import get_panel, client_settings, PanelError
+from handlers.locator import locator
 from pay.prices import *
 from pay.payments import (
     create_payment_yookassa,
@@ -31,9 +34,7 @@ from pay.payments import (
     check_yoomoney_payment_status
 )
 from pay.process_bay import is_valid_email
-from db.db import  handle_database_operations
 from handlers.states import UpdClient
-from pay.promocode import log_promo_code_usage
 from pay.pay_metod import PAYMENT_METHODS
 from buttons.client import BUTTON_TEXTS
 from dotenv import load_dotenv
@@ -124,18 +125,13 @@ async def handle_get_config2(callback_query: types.CallbackQuery, state: FSMCont
 
             # Кнопка пробного периода — только если email передан
             try:
-                async with aiosqlite.connect("users.db") as conn:
-                    # Получаем days_left из user_configs
-                    async with conn.execute(
-                        "SELECT days_left FROM user_configs WHERE email = ?",
-                        (email,)
-                    ) as cursor:
-                        row = await cursor.fetchone()
-                        days_left = row[0] if row else None
+                async with users_pool.acquire() as conn:
+                    # days_left считается из expires_at в user_configs
+                    days_left = await SubscriptionRepo(conn).days_left(email)
 
                 db = Database(USERSDATABASE)
                 # Проверяем, использовал ли пользователь пробник
-                used_trial = db.has_used_trial_seven(telegram_id)
+                used_trial = await db.has_used_trial_seven(telegram_id)
 
                 # Показываем кнопку ТОЛЬКО если оба условия выполняются
                 if days_left == -7 and not used_trial:
@@ -332,13 +328,8 @@ async def from_upd_sub(email: str):
     # Fallback
     logger.info(f"🔁 [from_upd_sub] Используем fallback для {email}")
     try:
-        async with aiosqlite.connect("users.db") as conn:
-            async with conn.execute(
-                "SELECT days_left FROM user_configs WHERE email = ?",
-                (email,)
-            ) as cursor:
-                row = await cursor.fetchone()
-                days_left = row[0] if row else None
+        async with users_pool.acquire() as conn:
+            days_left = await SubscriptionRepo(conn).days_left(email)
 
         status = (
             "❌ <b>Ваша подписка закончилась</b>" if days_left is None or days_left <= 0
@@ -357,7 +348,7 @@ async def sub_server(server_id, client_id, email):
     """
     Возвращает статус подписки для одного клиента на одном сервере.
     Если не удалось получить данные с сервера (даже если есть кэш) — показываем ошибку.
-    Обновляет days_left в user_configs, если данные получены.
+    Обновляет expires_at в user_configs, если срок на сервере изменился.
     """
     logger.info(f"⚙️ [sub_server] Начало обработки: email={email}, server_id={server_id}, client_id={client_id}")
 
@@ -368,24 +359,21 @@ async def sub_server(server_id, client_id, email):
         logger.warning(f"❌ [sub_server] Не найдены данные для server_id={server_id}. Пропускаем запрос к серверу.")
         server_data = None
 
-    # Шаг 1: Получаем config и days_left из user_configs (кэш)
+    # Шаг 1: Получаем config и expires_at из user_configs (кэш)
     config = "❗ Config не найден"
     days_left = None
+    cached_expires_at = None
 
     try:
-        async with aiosqlite.connect("users.db") as conn:
-            async with conn.execute(
-                "SELECT config, days_left FROM user_configs WHERE email = ?",
-                (email,)
-            ) as cursor:
-                row = await cursor.fetchone()
-                if row:
-                    config = row[0] if row[0] else config
-                    if row[1] is not None:
-                        days_left = int(row[1])
-                    logger.debug(f"💾 [sub_server] Кэш загружен: config={'есть' if row[0] else 'нет'}, days_left={days_left}")
-                else:
-                    logger.info(f"🟡 [sub_server] Нет кэша для email={email}")
+        async with users_pool.acquire() as conn:
+            row = await SubscriptionRepo(conn).config(email)
+            if row:
+                config = row[0] if row[0] else config
+                cached_expires_at = row[1]
+                days_left = days_left_from_expiry(cached_expires_at)
+                logger.debug(f"💾 [sub_server] Кэш загружен: config={'есть' if row[0] else 'нет'}, days_left={days_left}")
+            else:
+                logger.info(f"🟡 [sub_server] Нет кэша для email={email}")
     except Exception as e:
         logger.error(f"🔧 [sub_server] Ошибка чтения user_configs: {e}", exc_info=True)
 
@@ -404,17 +392,15 @@ async def sub_server(server_id, client_id, email):
                 days_left = (expiry_dt.date() - now).days
                 server_data_fetched = True  # Данные успешно получены
 
-                # Обновляем days_left в БД
-                try:
-                    async with aiosqlite.connect("users.db") as conn:
-                        await conn.execute(
-                            "UPDATE user_configs SET days_left = ? WHERE email = ?",
-                            (days_left, email)
+                # Пишем в БД, только если срок на сервере изменился
+                if expiry_time != cached_expires_at:
+                    try:
+                        await users_writer.submit(
+                            lambda conn: SubscriptionRepo(conn).set_expires_at(email, expiry_time)
                         )
-                        await conn.commit()
-                    logger.info(f"✅ [sub_server] Успешно обновлено days_left={days_left} для {email} в user_configs")
-                except Exception as e:
-                    logger.error(f"💾 [sub_server] Ошибка обновления days_left в БД: {e}", exc_info=True)
+                        logger.info(f"✅ [sub_server] Обновлен expires_at={expiry_time} для {email} в user_configs")
+                    except Exception as e:
+                        logger.error(f"💾 [sub_server] Ошибка обновления expires_at в БД: {e}", exc_info=True)
 
                 # Формируем статус
                 if days_left > 0:
@@ -461,73 +447,44 @@ async def sub_server(server_id, client_id, email):
 
 
 async def sub_client(client_id, email, server_data):
-    logger.info(f"🔐 [sub_client] Авторизация на сервере {server_data['name']} для получения данных клиента {email}")
-    LOGIN_DATA = {
-        "username": server_data["username"],
-        "password": server_data["password"],
-    }
-    async with ClientSession(connector=TCPConnector(limit=100)) as session:
-        try:
-            login_response = await session.post(server_data["login_url"], json=LOGIN_DATA)
-            if login_response.status != 200:
-                text = await login_response.text()
-                logger.error(f"🔐 [sub_client] Ошибка входа на сервер {server_data['name']}: {text}")
-                return None
-            logger.info(f"✅ [sub_client] Успешный вход на сервер {server_data['name']}")
-
-            all_inbound_ids = server_data.get("inbound_ids", [])
-            logger.info(f"📡 [sub_client] Запрашиваем данные из {len(all_inbound_ids)} inbounds: {all_inbound_ids}")
-
-            tasks = [
-                fetch_inbound_data(session, inbound_id, email, server_data)
-                for inbound_id in all_inbound_ids
-            ]
-            results = await asyncio.gather(*tasks)
-            result = next((r for r in results if r is not None), None)
-
-            if result is not None:
-                logger.info(f"✅ [sub_client] Найден expiryTime={result} для email={email}")
-            else:
-                logger.warning(f"🔍 [sub_client] Подписка не найдена для email={email} ни в одном из inbounds")
+    panel = get_panel(server_data)
+    try:
+        all_inbound_ids = server_data.get("inbound_ids", [])
+        logger.info(f"📡 [sub_client] Запрашиваем клиента {email} на панели {panel.name}: {all_inbound_ids}")
 
-            return result
-        except Exception as e:
-            logger.error(f"🔐 [sub_client] Исключение при работе с сервером {server_data['name']}: {e}", exc_info=True)
-            return None
+        result = await fetch_inbound_data(panel, all_inbound_ids, email)
+
+        if result is not None:
+            logger.info(f"✅ [sub_client] Найден expiryTime={result} для email={email}")
+        else:
+            logger.warning(f"🔍 [sub_client] Подписка не найдена для email={email} ни в одном из inbounds")
+
+        return result
+    except Exception as e:
+        logger.error(f"🔐 [sub_client] Исключение при работе с сервером {server_data['name']}: {e}", exc_info=True)
+        return None
 
 
-async def fetch_inbound_data(session, inbound_id, email, server_data):
+async def fetch_inbound_data(panel, inbound_ids, email):
     """
     Возвращает timestamp окончания подписки (expiryTime) для клиента или None, если не найден.
     """
-    logger.debug(f"📥 [fetch_inbound_data] Запрос данных для inbound_id={inbound_id}, email={email}")
-    inbound_url = f"{server_data['config_client_url']}/{inbound_id}"
+    logger.debug(f"📥 [fetch_inbound_data] Поиск email={email} в inbounds {inbound_ids}")
     try:
-        inbound_response = await session.get(inbound_url, headers={'Accept': 'application/json'})
-        if inbound_response.status != 200:
-            text = await inbound_response.text()
-            logger.error(f"❌ [fetch_inbound_data] Ошибка получения inbound {inbound_id}: статус {inbound_response.status}, {text}")
-            return None
-
-        inbound_data = await inbound_response.json()
-        if inbound_data.get('obj') is None:
-            logger.error(f"❌ [fetch_inbound_data] Поле 'obj' отсутствует в ответе для inbound_id={inbound_id}")
-            return None
-
-        clients = json.loads(inbound_data['obj']['settings']).get('clients', [])
-        logger.debug(f"👥 [fetch_inbound_data] Найдено {len(clients)} клиентов в inbound_id={inbound_id}")
-
-        client = next((client for client in clients if client['email'] == email), None)
+        client = await panel.client_state(email, inbound_ids)
         if not client:
-            logger.info(f"🙈 [fetch_inbound_data] Клиент с email={email} не найден в inbound_id={inbound_id}")
+            logger.info(f"🙈 [fetch_inbound_data] Клиент с email={email} не найден в inbounds {inbound_ids}")
             return None
 
         expiry_time = int(client['expiryTime'])
         logger.info(f"🎯 [fetch_inbound_data] Найден клиент: expiryTime={expiry_time} для email={email}")
         return expiry_time
 
+    except PanelError as e:
+        logger.error(f"❌ [fetch_inbound_data] Ошибка получения inbounds {inbound_ids}: {e}")
+        return None
     except Exception as e:
-        logger.error(f"⚠️ [fetch_inbound_data] Ошибка при обработке inbound_id={inbound_id}: {e}", exc_info=True)
+        logger.error(f"⚠️ [fetch_inbound_data] Ошибка при обработке email={email}: {e}", exc_info=True)
         return None
 
 
@@ -546,7 +503,7 @@ async def process_extension(callback_query: types.CallbackQuery, state: FSMConte
     free_days = 0
     is_free_extension_enabled = ENABLE_FREE_UPD.lower() == "true"
     if can_extend and is_free_extension_enabled:
-        free_days = Database(USERSDATABASE).get_free_days_by_telegram_id(telegram_id)
+        free_days = await Database(USERSDATABASE).get_free_days_by_telegram_id(telegram_id)
         if free_days > 0:
             keyboard.add(InlineKeyboardButton(text="Продлить бесплатно", callback_data=f"extend_free_{email}"))
 
@@ -594,7 +551,7 @@ async def process_free(callback_query: types.CallbackQuery, state: FSMContext):
     await state.update_data(selected_email=email)
 
     db = Database(USERSDATABASE)
-    free_days = db.get_free_days_by_telegram_id(telegram_id)
+    free_days = await db.get_free_days_by_telegram_id(telegram_id)
     logger.info(f"Количество бесплатных дней для {telegram_id}: {free_days}")
     payment_methods_keyboard = InlineKeyboardBuilder()
     payment_methods_keyboard.add(InlineKeyboardButton(
@@ -603,7 +560,7 @@ async def process_free(callback_query: types.CallbackQuery, state: FSMContext):
     update_response = await update_client_subscription(telegram_id, email, free_days)
     if free_days > 0:
         new_free_days = free_days - free_days
-        db.update_free_days_by_telegram_id(telegram_id, new_free_days)
+        await db.update_free_days_by_telegram_id(telegram_id, new_free_days)
         logger.info(f"Обновлено количество бесплатных дней для {telegram_id}: {new_free_days}")
 
     if free_days > 0:
@@ -841,22 +798,20 @@ async def handle_payment_method_selection(callback_query: types.CallbackQuery, s
         185: SIX_M,
         365: ONE_YEAR,
     }.get(months, ONE_M)
-    conn_users = sqlite3.connect(USERSDATABASE)
-    cursor_users = conn_users.cursor()
-
-    cursor_users.execute("""
-        SELECT promo_code
-        FROM users
-        WHERE telegram_id = ?
-    """, (user_id,))
-    user_promo_code = cursor_users.fetchone()
+    async with users_pool.acquire() as conn_users:
+        async with conn_users.execute("""
+            SELECT promo_code
+            FROM users
+            WHERE telegram_id = ?
+        """, (user_id,)) as cursor_users:
+            user_promo_code = await cursor_users.fetchone()
 
     if user_promo_code and user_promo_code[0]:
         user_promo_code = user_promo_code[0]
     else:
         user_promo_code = None
         
-    price_info = get_price_with_referral_info(expiry_time, user_id, user_promo_code)
+    price_info = await get_price_with_referral_info(expiry_time, user_id, user_promo_code)
     final_price = int(price_info[0])
     try:
         if payment_method == "yookassa":
@@ -975,16 +930,11 @@ async def finalize_subscription(callback_query: types.CallbackQuery, state: FSMC
         name = data.get("name")
         final_price = data.get("price")
         months = data.get("selected_months")
-        user_promo_code = data.get("user_promo_code")
         telegram_id = callback_query.from_user.id
 
         # Обновление подписки
         await update_client_subscription(telegram_id, name, months)
-        await handle_database_operations(telegram_id, name, months)
-        await log_promo_code_usage(telegram_id, user_promo_code)
-        await update_sum_my(telegram_id, float(final_price))
-        await update_sum_ref(telegram_id, final_price)
-        await add_free_days(telegram_id, FREE_DAYS)
+        await record_purchase(telegram_id, float(final_price), free_days=FREE_DAYS)
 
         # Отправка первого сообщения о продлении подписки
         await callback_query.message.edit_text(
@@ -1074,105 +1024,74 @@ async def check_payment_status(callback_query: types.CallbackQuery, state: FSMCo
         logger.error(f"Ошибка при проверке платежа: {e}")
         await callback_query.answer("Произошла ошибка при проверке платежа. Пожалуйста, попробуйте позже.")
 
-async def create_update_data(client_id, email, new_expiry_time, client, INBOUND_ID, UPDATE_CLIENT):
+def updated_client(client_id, email, new_expiry_time, client):
     """
-    Создает данные для обновления подписки клиента на сервере.
+    Клиент панели с новым сроком подписки (остальные поля берутся из текущего клиента).
     """
     return {
-        "id": INBOUND_ID,
-        "settings": json.dumps({
-            "clients": [{
-                "id": f"{client_id}",
-                "email": email,
-                "expiryTime": new_expiry_time,
-                "enable": client.get('enable', True),
-                "tgId": client.get('tgId', ''),
-                "limitIp": client.get('limitIp', 3),
-                "subId": client.get('subId', ''),
-                "flow": 'xtls-rprx-vision',
-                "reset": 0
-            }]
-        }, indent=4)
+        "id": f"{client_id}",
+        "email": email,
+        "expiryTime": new_expiry_time,
+        "enable": client.get('enable', True),
+        "tgId": client.get('tgId', ''),
+        "limitIp": client.get('limitIp', 3),
+        "subId": client.get('subId', ''),
+        "flow": 'xtls-rprx-vision',
+        "reset": 0
     }
 
+async def create_update_data(client_id, email, new_expiry_time, client, INBOUND_ID, UPDATE_CLIENT):
+    """
+    Создает данные для обновления подписки клиента на сервере.
+    """
+    return client_settings(INBOUND_ID, [updated_client(client_id, email, new_expiry_time, client)])
+
 async def update_client_subscription(telegram_id, email, days):
     """
     Обновляет подписку клиента на всех серверах, используя дни.
     """
-    server_ids = await get_server_id(SERVEDATABASE)
-    server_ids = [sid for sid in server_ids if sid]  # убираем None, 0, ''
+    # Серверы логина из локатора вместо обхода всех серверов
+    server_ids = await locator.servers(email)
     full_response = []
     for server_id in server_ids:
         server_data = await get_server_data(server_id)
         if not server_data:
             continue
-        LOGIN_URL = server_data.get('login_url')
-        CONFIG_CLIENT_URL = server_data.get('config_client_url')
-        INBOUND_IDS = server_data.get('inbound_ids')
-        UPDATE_CLIENT = server_data.get('update_url')
-        if not LOGIN_URL:
-            continue
-        email = email
-        session = requests.Session()
-        login_response = session.post(LOGIN_URL, json={'username': server_data['username'], 'password': server_data['password']})
-        if login_response.status_code != 200:
+        panel = get_panel(server_data)
+        try:
+            # Свежий снимок: новый срок считается от текущего срока на панели
+            snapshot = await panel.snapshot(max_age=0)
+        except PanelError as e:
+            logger.error(f"Ошибка при обработке сервера {server_id}: {e}")
             continue
+        INBOUND_IDS = server_data.get('inbound_ids')
         for INBOUND_ID in INBOUND_IDS:
             try:
-                inbound_url = f"{CONFIG_CLIENT_URL}/{INBOUND_ID}"
-                inbound_response = session.get(inbound_url, headers={'Accept': 'application/json'})
-                if inbound_response.status_code != 200:
-                    continue
-                inbound_data = inbound_response.json().get('obj')
-                if inbound_data is None:
-                    continue
-
-                settings = json.loads(inbound_data['settings'])
-                client = next((client for client in settings['clients'] if client['email'] == email), None)
+                client = snapshot.client(INBOUND_ID, email)
                 if not client:
                     continue
                 client_id = client['id']
                 client_expiry_time = client.get('expiryTime', 0)
                 current_time_ms = int(time.time() * 1000)
-                
-                if client_expiry_time < current_time_ms:
-                    # Если срок подписки истек, то добавляем дни к текущему времени
-                    new_expiry_time = current_time_ms + (days * 24 * 60 * 60 * 1000)  # дни в миллисекундах
-                else:
-                    # Если срок подписки не истек, добавляем дни к текущему времени подписки
-                    new_expiry_time = int(client_expiry_time) + (days * 24 * 60 * 60 * 1000)  # дни в миллисекундах
+                new_expiry_time = extended_expiry_time(client_expiry_time, days, current_time_ms)
                 
                 logger.info(f"Найден клиент с email {email} на сервере {server_id}. Срок действия подписки: {client_expiry_time}.")
                 logger.info(f"Обновляем подписку для клиента с email {email} на сервере {server_id}, новый срок окончания: {new_expiry_time}.")
                 
-                update_data = await create_update_data(client_id, email, new_expiry_time, client, INBOUND_ID, UPDATE_CLIENT)
-                headers = {'Accept': 'application/json'}
-                response = session.post(f"{UPDATE_CLIENT}/{client_id}", json=update_data, headers=headers)
-                logger.info(f"Данные, отправляемые в POST-запросе: {json.dumps(update_data, indent=2)}")
-                
-                if response.status_code == 200:
+                new_client = updated_client(client_id, email, new_expiry_time, client)
+                logger.info(f"Данные, отправляемые в POST-запросе: {json.dumps(new_client, indent=2)}")
+                try:
+                    await panel.update_client(INBOUND_ID, new_client)
+                    updated = True
+                except PanelError as e:
+                    updated = False
+                    error_text = str(e)
+
+                if updated:
                     full_response.append(f"Подписка для клиента с email {email} успешно продлена на сервере {server_id}.")
-                    await send_telegram_message(telegram_id, "✅ Ваша подписка успешно обновлена.")
-		    
-		    # Отправка уведомления в группу
-                    user = await bot.get_chat(telegram_id)
-                    full_name = user.full_name or f"Пользователь {telegram_id}"
-                    user_link = f"<a href='tg://user?id={telegram_id}'>{full_name}</a>"
-                    expiry_time_description = time.strftime('%d.%m.%Y %H:%M', time.localtime(new_expiry_time / 1000))  # читаемый срок действия
-                    userdata = f"ID: {telegram_id}"
-                    email_raw = email
-
-                    await bot.send_message(
-                        chat_id=GROUP_CHAT_ID,
-                        text=(
-                            f"📩 <b>Пользователь</b> {user_link} продлил подписку до <b>{expiry_time_description}</b>\n"
-                            f"👤 {userdata}\n"
-                            f"📧 Email: <code>{email_raw}</code>"
-                        ),
-                        parse_mode=ParseMode.HTML
-                    )
+                    await notify_subscription_extended(telegram_id, email, new_expiry_time)
                 else:
-                    full_response.append(f"Ошибка продления подписки для клиента с email {email} на сервере {server_id}. Ответ: {response.text}")
+                    full_response.append(f"Ошибка продления подписки для клиента с email {email} на сервере {server_id}. Ответ: {error_text}")
             except Exception as e:
                 logger.error(f"Ошибка при обработке сервера {server_id}: {e}")
                 continue
@@ -1181,6 +1100,99 @@ async def update_client_subscription(telegram_id, email, days):
     else:
         return "❌ Ошибка продления подписки для клиента. Проверьте логин, данные или сервер."
 
+def extended_expiry_time(client_expiry_time, days, current_time_ms):
+    """Новый срок: истекшая подписка продлевается от текущего времени, активная — от своего срока."""
+    if client_expiry_time < current_time_ms:
+        return current_time_ms + days * DAY_MS
+    return int(client_expiry_time) + days * DAY_MS
+
+
+async def extend_subscriptions_bulk(emails, days):
+    """
+    Продлевает подписки нескольких логинов на days дней пакетами.
+
+    Логины группируются по серверам (через локатор) и inbounds, клиенты одного
+    inbound обновляются одним вызовом update_clients_bulk. Возвращает
+    ({email: [строки результата по серверам]}, {email: новый срок в мс}) —
+    уведомления пользователям отправляет вызывающий код.
+    """
+    results = {email: [] for email in emails}
+    extended = {}
+    by_server = {}
+    for email in emails:
+        server_ids = await locator.servers(email)
+        if not server_ids:
+            results[email].append(f"❌ Логин {email} не найден ни на одном сервере.")
+        for server_id in server_ids:
+            by_server.setdefault(server_id, []).append(email)
+
+    current_time_ms = int(time.time() * 1000)
+    for server_id, server_emails in by_server.items():
+        server_data = await get_server_data(server_id)
+        if not server_data:
+            for email in server_emails:
+                results[email].append(f"❌ Сервер {server_id} для {email} не найден.")
+            continue
+
+        panel = get_panel(server_data)
+        try:
+            # Свежий снимок: новый срок считается от текущего срока на панели
+            snapshot = await panel.snapshot(max_age=0)
+        except PanelError as e:
+            for email in server_emails:
+                results[email].append(f"❌ Ошибка для {email} на сервере {server_id}: {e}")
+            continue
+
+        by_inbound = {}
+        for email in server_emails:
+            for inbound_id in server_data.get('inbound_ids', []):
+                client = snapshot.client(inbound_id, email)
+                if client:
+                    new_expiry_time = extended_expiry_time(client.get('expiryTime', 0), days, current_time_ms)
+                    by_inbound.setdefault(inbound_id, []).append(
+                        (email, new_expiry_time, updated_client(client['id'], email, new_expiry_time, client))
+                    )
+
+        for inbound_id, updates in by_inbound.items():
+            batch = await panel.update_clients_bulk(inbound_id, [client for _, _, client in updates])
+            logger.info(f"📦 Продление на сервере {server_id}, inbound {inbound_id}: {batch}")
+            for email, new_expiry_time, _ in updates:
+                if email in batch.failed:
+                    results[email].append(
+                        f"❌ Ошибка продления подписки для клиента с email {email} на сервере {server_id}. "
+                        f"Ответ: {batch.failed[email]}"
+                    )
+                else:
+                    results[email].append(f"Подписка для клиента с email {email} успешно продлена на сервере {server_id}.")
+                    extended[email] = new_expiry_time
+
+    for email, lines in results.items():
+        if not lines:
+            lines.append(f"❌ Клиент {email} не найден в inbounds своего сервера.")
+    return results, extended
+
+
+async def notify_subscription_extended(telegram_id, email, new_expiry_time):
+    """Сообщает пользователю и в группу о продлении подписки."""
+    await send_telegram_message(telegram_id, "✅ Ваша подписка успешно обновлена.")
+
+    # Отправка уведомления в группу
+    user = await bot.get_chat(telegram_id)
+    full_name = user.full_name or f"Пользователь {telegram_id}"
+    user_link = f"<a href='tg://user?id={telegram_id}'>{full_name}</a>"
+    expiry_time_description = time.strftime('%d.%m.%Y %H:%M', time.localtime(new_expiry_time / 1000))  # читаемый срок действия
+    userdata = f"ID: {telegram_id}"
+
+    await bot.send_message(
+        chat_id=GROUP_CHAT_ID,
+        text=(
+            f"📩 <b>Пользователь</b> {user_link} продлил подписку до <b>{expiry_time_description}</b>\n"
+            f"👤 {userdata}\n"
+            f"📧 Email: <code>{email}</code>"
+        ),
+        parse_mode=ParseMode.HTML
+    )
+
 # Функция отправки сообщения
 async def send_telegram_message(telegram_id, message):
     try:
@@ -1222,13 +1234,13 @@ async def handle_cancel_payment(callback_query: types.CallbackQuery, state: FSMC
                 chat_id=callback_query.message.chat.id,
                 message_id=sent_message_id,
                 text="❌ Действие отменено.",
-                reply_markup=get_main_menu(callback_query)
+                reply_markup=await get_main_menu(callback_query)
             )
         else:
             await bot.send_message(
                 chat_id=callback_query.message.chat.id,
                 text="Нет активной покупки. Выберите опцию:",
-                reply_markup=get_main_menu(callback_query)
+                reply_markup=await get_main_menu(callback_query)
             )
 
         await state.clear()
@@ -1239,7 +1251,7 @@ async def handle_cancel_payment(callback_query: types.CallbackQuery, state: FSMC
         await bot.send_message(
             chat_id=callback_query.message.chat.id,
             text="Не удалось отменить покупку. Попробуйте снова.",
-            reply_markup=get_main_menu(callback_query)
+            reply_markup=await get_main_menu(callback_query)
         )
 
 
@@ -1266,7 +1278,6 @@ async def test_chats(message: Message):
 
 # ID пользователя, по которому проверяем рефералов
 TARGET_USER_ID = 1311997119
-DB_PATH = "users.db"  # ← Укажи правильный путь к твоему .db файлу
 
 @router.message(Command("ref_freez"))
 async def cmd_ref_freez(message: types.Message):
@@ -1277,7 +1288,7 @@ async def cmd_ref_freez(message: types.Message):
 
     try:
         # Подключаемся к базе данных
-        async with aiosqlite.connect(DB_PATH) as db:
+        async with users_pool.acquire() as db:
             # Запрос: количество рефералов
             async with db.execute(
                 "SELECT COUNT(*) FROM users WHERE referred_by = ?", (TARGET_USER_ID,)
@@ -1314,7 +1325,7 @@ async def process_trial_seven(callback_query: types.CallbackQuery, state: FSMCon
 
         db = Database(USERSDATABASE)
 
-        if db.has_used_trial_seven(telegram_id):
+        if await db.has_used_trial_seven(telegram_id):
             await callback_query.answer("🎁 Вы уже использовали пробный период.", show_alert=True)
             return
 
@@ -1329,16 +1340,11 @@ async def process_trial_seven(callback_query: types.CallbackQuery, state: FSMCon
 
         # Проверяем, был ли успех
         if "успешно" in result or "success" in result or "Подписка для клиента" in result:
-            # Обновляем days_left в user_configs
-            async with aiosqlite.connect("users.db") as conn:
-                await conn.execute(
-                    "UPDATE user_configs SET days_left = COALESCE(days_left, 0) + 7 WHERE email = ?",
-                    (email,)
-                )
-                await conn.commit()
+            # Сдвигаем срок в user_configs
+            await users_writer.submit(lambda conn: SubscriptionRepo(conn).add_days(email, 7))
 
             # Отмечаем использование
-            db.mark_trial_seven_used(telegram_id)
+            await db.mark_trial_seven_used(telegram_id)
 
             # Обновляем статус
             new_status = await from_upd_sub(email)
@@ -1364,8 +1370,7 @@ async def process_trial_seven(callback_query: types.CallbackQuery, state: FSMCon
 
 async def extend_subscription_on_server(server_id: int, email: str, days: int):
     """
-    Продлевает подписку, обновляя inbound через POST /panel/api/inbounds.
-    Исправлено для работы с self-signed SSL и XUI-панелью.
+    Продлевает подписку клиента на сервере через updateClient панели.
     """
     logger.info(f"🚀 [EXTEND] Продление: server_id={server_id}, email={email}, days={days}")
 
@@ -1374,128 +1379,29 @@ async def extend_subscription_on_server(server_id: int, email: str, days: int):
         logger.error(f"❌ [EXTEND] Не найдены данные сервера: {server_id}")
         return False
 
-    # URLs
-    LOGIN_URL = server_data["login_url"]
-    CONFIG_CLIENT_URL = server_data["config_client_url"]  # .../get/{id}
-    BASE_API_URL = CONFIG_CLIENT_URL.rstrip('/get')  # → .../panel/api/inbounds
-    UPDATE_URL = BASE_API_URL  # POST на этот URL
-
-    INBOUND_IDS = server_data.get("inbound_ids", [])
-    USERNAME = server_data["username"]
-    PASSWORD = server_data["password"]
-
-    # Важно: без / в конце и без пробелов
-    REFERER_URL = "https://3.vpnmojno.ru:48701/0LYlqkjIMRPFdSi/"
-
-    # Заголовки — как в браузере
-    headers = {
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-        "X-Requested-With": "XMLHttpRequest",
-        "Referer": REFERER_URL
-    }
-
-    # 🔽 Ключевое исправление: отключаем проверку SSL (self-signed сертификат)
-    connector = TCPConnector(limit=100, ssl=False)
-
-    async with ClientSession(connector=connector) as session:
-        try:
-            # 🔐 1. Логин
-            login_response = await session.post(
-                LOGIN_URL,
-                json={"username": USERNAME, "password": PASSWORD},
-                headers=headers
-            )
-            logger.info(f"🔐 [EXTEND] Статус входа: {login_response.status}")
-
-            if login_response.status != 200:
-                error_text = await login_response.text()
-                logger.error(f"🔴 Ошибка входа: {error_text}")
-                return False
-
-            logger.info("✅ Успешный вход")
-
-            # 🔁 Перебираем inbounds
-            for inbound_id in INBOUND_IDS:
-                get_url = f"{CONFIG_CLIENT_URL}/{inbound_id}"
-                logger.info(f"📥 Запрашиваем inbound {inbound_id}...")
-
-                get_response = await session.get(get_url, headers=headers)
-                logger.info(f"📡 Статус получения inbound: {get_response.status}")
+    panel = get_panel(server_data)
+    try:
+        inbound, target_client = await panel.find_client(server_data.get("inbound_ids", []), email)
+        if target_client is None:
+            logger.warning(f"❌ Не удалось продлить подписку для {email}: клиент не найден")
+            return False
 
-                if get_response.status != 200:
-                    error_text = await get_response.text()
-                    logger.warning(f"⚠️ Ошибка получения inbound {inbound_id}: {error_text}")
-                    continue
+        logger.info(f"🎯 Клиент найден: {email} (inbound {inbound.id})")
 
-                try:
-                    # Попытка распарсить JSON
-                    inbound_data = await get_response.json()
-                    obj = inbound_data.get("obj")
-                    if not obj:
-                        logger.warning(f"🟡 'obj' пустой в inbound {inbound_id}")
-                        continue
-
-                    settings = json.loads(obj["settings"])
-                    clients = settings.get("clients", [])
-                    target_client = next((c for c in clients if c["email"] == email), None)
-
-                    if not target_client:
-                        logger.info(f"🙈 Клиент с email={email} не найден в inbound {inbound_id}")
-                        # Для отладки — покажем первые email'ы
-                        sample_emails = [c.get("email") for c in clients[:3]]
-                        logger.info(f"📋 Пример email'ов: {sample_emails}")
-                        continue
-
-                    logger.info(f"🎯 Клиент найден: {email}")
-
-                    # 📅 Вычисляем новую дату
-                    now_ms = int(dt.now().timestamp() * 1000)
-                    current_expiry = target_client.get("expiryTime", 0)
-
-                    if current_expiry <= now_ms:
-                        new_expiry = now_ms + days * 24 * 3600 * 1000
-                        logger.info(f"🆕 Подписка просрочена — новая дата: {dt.fromtimestamp(new_expiry / 1000)}")
-                    else:
-                        new_expiry = current_expiry + days * 24 * 3600 * 1000
-                        logger.info(f"🆕 Продлеваем подписку: до {dt.fromtimestamp(new_expiry / 1000)}")
-
-                    # 📤 Создаём тело запроса
-                    update_data = await create_update_data(
-                        client_id=target_client["id"],
-                        email=email,
-                        new_expiry_time=new_expiry,
-                        client=target_client,
-                        INBOUND_ID=inbound_id,
-                        UPDATE_CLIENT=UPDATE_URL
-                    )
+        # 📅 Вычисляем новую дату
+        now_ms = int(dt.now().timestamp() * 1000)
+        current_expiry = target_client.get("expiryTime", 0)
 
-                    logger.info(f"📤 Отправляем обновление на: {UPDATE_URL}")
-                    logger.debug(f"📊 Данные для отправки: {update_data}")
-
-                    # 🚀 Отправляем обновление
-                    save_response = await session.post(UPDATE_URL, json=update_data, headers=headers)
-                    logger.info(f"💾 Статус сохранения: {save_response.status}")
-
-                    if save_response.status == 200:
-                        try:
-                            result = await save_response.json()
-                            logger.info(f"✅ Успешный JSON-ответ: {result}")
-                        except Exception:
-                            text = await save_response.text()
-                            logger.info(f"✅ Успешно (text): '{text.strip()}'")
-                        return True
-                    else:
-                        error_text = await save_response.text()
-                        logger.error(f"❌ Ошибка сохранения: {error_text}")
-
-                except Exception as e:
-                    logger.error(f"🔧 Ошибка при обработке inbound {inbound_id}: {e}", exc_info=True)
-                    continue
+        new_expiry = extended_expiry_time(current_expiry, days, now_ms)
+        if current_expiry < now_ms:
+            logger.info(f"🆕 Подписка просрочена — новая дата: {dt.fromtimestamp(new_expiry / 1000)}")
+        else:
+            logger.info(f"🆕 Продлеваем подписку: до {dt.fromtimestamp(new_expiry / 1000)}")
 
-            logger.warning(f"❌ Не удалось продлить подписку для {email}")
-            return False
+        await panel.update_client(inbound.id, updated_client(target_client["id"], email, new_expiry, target_client))
+        logger.info(f"✅ Подписка {email} продлена на сервере {server_id}")
+        return True
 
-        except Exception as e:
-            logger.error(f"💥 Критическая ошибка: {e}", exc_info=True)
-            return False
\ No newline at end of file
+    except Exception as e:
+        logger.error(f"💥 Критическая ошибка: {e}", exc_info=True)
+        return False
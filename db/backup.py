@@ -0,0 +1,121 @@
+"""
+Резервные копии баз через online backup API SQLite.
+
+Копирование идет в отдельном потоке по BACKUP_PAGES_PER_STEP страниц за шаг
+с паузой между шагами, поэтому бот продолжает читать и писать в базу во
+время бекапа, а копия всегда согласована (в отличие от копирования файла,
+которое может захватить базу посреди записи). Готовая копия проверяется
+`PRAGMA integrity_check`, затем потоково сжимается в .gz. В каталоге
+хранится не больше BACKUP_KEEP последних копий каждой базы.
+"""
+
+import asyncio
+import gzip
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from log import logger
+from db.pool import USERSDATABASE, SERVEDATABASE
+from db.storage import get_storage
+
+load_dotenv()
+
+BACKUP_DIR = os.getenv("BACKUP_DIR") or "backups"
+BACKUP_PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", "256"))
+# Пауза между шагами копирования (сек), чтобы писатели успевали взять блокировку
+BACKUP_STEP_SLEEP = float(os.getenv("BACKUP_STEP_SLEEP", "0.005"))
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+
+
+class BackupError(Exception):
+    """Копия не создана или не прошла проверку целостности."""
+
+
+def _backup_prefix(db_path):
+    return f"backup_{os.path.splitext(os.path.basename(db_path))[0]}_"
+
+
+def _run_backup(db_path, target_path, pages, step_sleep):
+    """Копирует базу в target_path (.gz) и возвращает число скопированных страниц."""
+    raw_path = target_path[:-len(".gz")] + ".tmp"
+    source = sqlite3.connect(db_path)
+    copy = sqlite3.connect(raw_path)
+    try:
+        # progress вызывается после каждого шага — в паузе база свободна для бота
+        source.backup(copy, pages=pages, progress=lambda status, remaining, total: time.sleep(step_sleep))
+        result = copy.execute("PRAGMA integrity_check").fetchone()[0]
+        if result != "ok":
+            raise BackupError(f"integrity_check копии {db_path}: {result}")
+        page_count = copy.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        copy.close()
+        source.close()
+
+    try:
+        with open(raw_path, "rb") as src, gzip.open(target_path, "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, length=1024 * 1024)
+    finally:
+        os.remove(raw_path)
+    return page_count
+
+
+async def create_backup(db_path, backup_dir=BACKUP_DIR, pages=BACKUP_PAGES_PER_STEP,
+                        step_sleep=BACKUP_STEP_SLEEP):
+    """
+    Создает сжатую копию базы и возвращает путь к файлу .db.gz.
+    При ошибке или неудачной проверке целостности выбрасывает BackupError.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    filename = f"{_backup_prefix(db_path)}{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.db.gz"
+    target_path = os.path.join(backup_dir, filename)
+
+    started = time.monotonic()
+    try:
+        page_count = await asyncio.to_thread(_run_backup, db_path, target_path, pages, step_sleep)
+    except Exception as e:
+        if os.path.exists(target_path):
+            os.remove(target_path)
+        if isinstance(e, BackupError):
+            raise
+        raise BackupError(f"Не удалось создать копию {db_path}: {e}") from e
+
+    logger.info(
+        f"💾 Бекап {db_path} → {target_path}: {page_count} страниц, "
+        f"{os.path.getsize(target_path) / 1024:.0f} KB, {time.monotonic() - started:.1f} сек"
+    )
+    return target_path
+
+
+def prune_backups(db_path, backup_dir=BACKUP_DIR, keep=BACKUP_KEEP):
+    """Удаляет старые копии базы, оставляя keep последних."""
+    prefix = _backup_prefix(db_path)
+    try:
+        backups = sorted(
+            name for name in os.listdir(backup_dir)
+            if name.startswith(prefix) and name.endswith(".db.gz")
+        )
+    except FileNotFoundError:
+        return []
+    removed = backups[:-keep] if keep > 0 else backups
+    for name in removed:
+        os.remove(os.path.join(backup_dir, name))
+        logger.info(f"🗑 Удален старый бекап: {name}")
+    return removed
+
+
+async def scheduled_backup():
+    """Задача планировщика: бекап users.db и servers.db с ротацией."""
+    for db_path in (USERSDATABASE, SERVEDATABASE):
+        if get_storage(db_path).path is None:
+            logger.info(f"💾 {db_path} хранится в памяти — бекап пропущен")
+            continue
+        try:
+            await create_backup(db_path)
+            prune_backups(db_path)
+        except BackupError as e:
+            logger.error(f"❌ {e}")
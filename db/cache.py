@@ -0,0 +1,125 @@
+"""
+Кэш профилей пользователей в памяти процесса (LRU + TTL).
+
+Главное меню, middleware и расчет цены на каждое нажатие кнопки читали из
+users.db одни и те же поля: has_trial, sum_my, referral_count, is_blocked,
+промокод и список логинов. Теперь строка пользователя вместе с логинами
+загружается один раз и хранится до PROFILE_CACHE_TTL секунд.
+
+Кэш не следит за базой сам: каждый путь записи, меняющий эти поля, обязан
+вызвать `profile_cache.invalidate(telegram_id)` после коммита.
+"""
+
+import os
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+from log import logger
+from db.pool import users_pool
+from db.repo import UserRepo, SubscriptionRepo
+
+load_dotenv()
+
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "300"))
+
+
+class UserProfile:
+    """Строка пользователя из users и его логины из user_emails."""
+    __slots__ = ("user", "emails")
+
+    def __init__(self, user, emails):
+        self.user = user
+        self.emails = tuple(emails)
+
+    @property
+    def is_blocked(self):
+        return bool(self.user.is_blocked)
+
+    @property
+    def has_trial(self):
+        return self.user.has_trial == 1
+
+    @property
+    def referral_count(self):
+        return self.user.referral_count or 0
+
+
+class ProfileCache:
+    def __init__(self, maxsize=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # telegram_id -> (expires_at, UserProfile)
+        # Растет при каждой инвалидации: загрузка, начатая до записи,
+        # не должна положить в кэш устаревшие данные
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def get(self, telegram_id) -> UserProfile | None:
+        """Профиль пользователя или None, если пользователя нет в базе."""
+        entry = self._entries.get(telegram_id)
+        if entry is not None:
+            expires_at, profile = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(telegram_id)
+                self.hits += 1
+                return profile
+            del self._entries[telegram_id]
+
+        self.misses += 1
+        version = self._version
+        profile = await self._load(telegram_id)
+        if profile is not None and version == self._version:
+            self._put(telegram_id, profile)
+        return profile
+
+    async def _load(self, telegram_id):
+        async with users_pool.acquire() as conn:
+            user = await UserRepo(conn).get(telegram_id)
+            if user is None:
+                return None
+            emails = await SubscriptionRepo(conn).emails(telegram_id)
+        return UserProfile(user, emails)
+
+    def _put(self, telegram_id, profile):
+        self._entries[telegram_id] = (time.monotonic() + self.ttl, profile)
+        self._entries.move_to_end(telegram_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, *telegram_ids):
+        """Сбрасывает профили пользователей после изменения их данных."""
+        self._version += 1
+        for telegram_id in telegram_ids:
+            if telegram_id is not None and self._entries.pop(telegram_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        self._version += 1
+        self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total * 100, 1) if total else 0,
+            "invalidations": self.invalidations,
+        }
+
+
+profile_cache = ProfileCache()
+
+
+async def log_profile_cache_stats():
+    """Периодически пишет в лог попадания и промахи кэша профилей."""
+    s = profile_cache.stats()
+    logger.info(
+        f"👤 Кэш профилей: записей {s['size']}, попаданий {s['hits']}, промахов {s['misses']} "
+        f"({s['hit_rate']}% попаданий), инвалидаций {s['invalidations']}"
+    )
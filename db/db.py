@@ -1,11 +1,18 @@
 
-import sqlite3
 from log import logger
 from dotenv import load_dotenv
 import os
 import aiosqlite
 from bot import bot
 from client.notify_client import notify_user_about_free_days
+from db.pool import users_pool, servers_pool
+from db.repo import UserRepo, SubscriptionRepo, ServerRepo, ReferralRepo, ServerRow
+from db.writer import users_writer
+from db.cache import profile_cache
+from handlers.capacity import slot_tracker
+from handlers.config import server_registry
+from db.storage import get_storage
+from db.migrate import run_migrations
 
 load_dotenv()
 
@@ -14,13 +21,17 @@ USERSDATABASE = os.getenv("USERSDATABASE")
 class ServerDatabase:
     def __init__(self, db_path):
         self.db_path = db_path
-        self.connection = sqlite3.connect(db_path)
-        self.cursor = self.connection.cursor()
 
     def setup_tables_serv(self):
         """Создание таблиц servers и server_ids, если они еще не существуют."""
+        storage = get_storage(self.db_path)
+        connection = storage.connect_sync()
+        cursor = connection.cursor()
         try:
-            self.cursor.execute('''
+            journal_mode = storage.prepare(connection)
+            logger.info(f"🗄 {self.db_path}: journal_mode={journal_mode}")
+
+            cursor.execute('''
                 CREATE TABLE IF NOT EXISTS servers (
                     id INTEGER PRIMARY KEY,
                     total_slots INTEGER,
@@ -35,186 +46,146 @@ class ServerDatabase:
                     inbound_ids TEXT
                 )
             ''')
-            self.connection.commit()
+            connection.commit()
 
-            self.cursor.execute('''
+            cursor.execute('''
                 CREATE TABLE IF NOT EXISTS server_ids (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     server_ids TEXT
                 )
             ''')
-            self.connection.commit()
+            connection.commit()
             
-            self.cursor.execute('''
+            cursor.execute('''
                 CREATE TABLE IF NOT EXISTS server_groups (
                     group_name TEXT PRIMARY KEY,
-                    server_ids TEXT
+                    server_ids TEXT,
+                    strategy TEXT
                 )
             ''')
-            self.connection.commit() 
+            connection.commit() 
+
+            # Базы, созданные до стратегий балансировки
+            columns = [row[1] for row in cursor.execute("PRAGMA table_info(server_groups)")]
+            if "strategy" not in columns:
+                cursor.execute("ALTER TABLE server_groups ADD COLUMN strategy TEXT")
+                connection.commit()
         except Exception as e:
             logger.error(f"Ошибка при создании таблиц: {e}")
+        finally:
+            connection.close()
 
-    def add_server(self, server_data):
+    async def add_server(self, server_data):
         """Добавление данных о сервере в таблицу servers."""
+        server = ServerRow(
+            server_data["id"],
+            server_data["total_slots"],
+            server_data["name"],
+            server_data["username"],
+            server_data["password"],
+            server_data["server_ip"],
+            server_data["base_url"],
+            server_data["subscription_base"],
+            server_data["subscription_urls"]["sub_url"],
+            server_data["subscription_urls"]["json_sub"],
+            ";".join(map(str, server_data["inbound_ids"]))
+        )
         try:
-            self.cursor.execute('''
-                INSERT INTO servers (
-                    id, total_slots, name, username, password, 
-                    server_ip, base_url, subscription_base, sub_url, json_sub, inbound_ids
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                server_data["id"],
-                server_data["total_slots"],
-                server_data["name"],
-                server_data["username"],
-                server_data["password"],
-                server_data["server_ip"],
-                server_data["base_url"],
-                server_data["subscription_base"],
-                server_data["subscription_urls"]["sub_url"],
-                server_data["subscription_urls"]["json_sub"],
-                ";".join(map(str, server_data["inbound_ids"]))
-            ))
-            self.connection.commit()
+            async with servers_pool.acquire() as conn:
+                await ServerRepo(conn).add(server)
+                await conn.commit()
+            server_registry.invalidate()
+            slot_tracker.invalidate(server.id)
         except Exception as e:
             logger.error(f"Ошибка при добавлении сервера: {e}")
 
+    async def get_group_server_ids(self, group_name):
+        """Возвращает строку server_ids группы серверов или None, если группы нет."""
+        server_ids, _ = await server_registry.group(group_name)
+        return server_ids
+
+    async def get_group_strategy(self, group_name):
+        """Возвращает стратегию балансировки группы или None (стратегия по умолчанию)."""
+        _, strategy = await server_registry.group(group_name)
+        return strategy
+
     def close(self):
-        """Закрытие соединения с базой данных."""
-        if self.connection:
-            self.connection.close()
+        """Подключения принадлежат пулу и закрываются в close_pools()."""
+        pass
 
 
 class Database:
     def __init__(self, db_path):
-        self.connection = sqlite3.connect(db_path)
-        self.cursor = self.connection.cursor()
+        self.db_path = db_path
 
     def setup_tables(self):
-
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                telegram_id INTEGER UNIQUE,
-                username TEXT,
-                entry_date TEXT,
-                telegram_link TEXT,
-                referral_code TEXT,
-                referred_by INTEGER,
-                referral_count INTEGER,
-                has_trial BOOLEAN DEFAULT 0,  -- Флаг: 0 - не получал пробную подписку, 1 - получал
-                promo_code TEXT,                  -- Промокод, который использовал пользователь
-                promo_code_usage INTEGER DEFAULT 0,  -- Использовал или нет
-                FOREIGN KEY (referred_by) REFERENCES users(id)
-            )
-        ''')
-        try:
-            self.cursor.execute("ALTER TABLE users ADD COLUMN sum_ref REAL DEFAULT 0")
-        except sqlite3.OperationalError:
-            pass 
+        """Применяет профиль хранения и непримененные миграции схемы (db/migrations)."""
+        storage = get_storage(self.db_path)
+        connection = storage.connect_sync()
         try:
-            self.cursor.execute("ALTER TABLE users ADD COLUMN sum_my REAL DEFAULT 0")
-        except sqlite3.OperationalError:
-            pass 
-        try:
-            self.cursor.execute("ALTER TABLE users ADD COLUMN free_days REAL DEFAULT 0")
-        except sqlite3.OperationalError:
-            pass 
-        
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_emails (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                email TEXT,
-                id_server INTEGER,
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            )
-        ''')
-        
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS promo_codes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                code TEXT UNIQUE,            -- Уникальный промокод
-                discount INTEGER,            -- Процент скидки (например, 10, 20, 30)
-                is_active BOOLEAN DEFAULT 1   -- Флаг активности
-            )
-        ''') 
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS used_promo_codes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                promo_code TEXT,
-                usage_date TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            )
-        ''')
-        self.connection.commit()
+            journal_mode = storage.prepare(connection)
+            logger.info(f"🗄 {self.db_path}: journal_mode={journal_mode}")
+            run_migrations(connection)
+        finally:
+            connection.close()
 
     async def get_ids_by_email(self, email):
-        query = """
-            SELECT user_id, id_server
-            FROM user_emails
-            WHERE email = ?
-        """
-        self.cursor.execute(query, (email,))
-        return [(row[0], row[1]) for row in self.cursor.fetchall()]
+        async with users_pool.acquire() as conn:
+            rows = await SubscriptionRepo(conn).by_email(email)
+        return [(row.user_id, row.server_id) for row in rows]
     
-    def get_free_days_by_telegram_id(self, telegram_id):
-        query = "SELECT free_days FROM users WHERE telegram_id = ?"
-        self.cursor.execute(query, (telegram_id,))
-        result = self.cursor.fetchone()
-        if result:
-            return result[0]
+    async def get_free_days_by_telegram_id(self, telegram_id):
+        profile = await profile_cache.get(telegram_id)
+        if profile:
+            return profile.user.free_days
         return 0 
     
-    def update_free_days_by_telegram_id(self, telegram_id, new_free_days):
-        query = "UPDATE users SET free_days = ? WHERE telegram_id = ?"
-        self.cursor.execute(query, (new_free_days, telegram_id))
-        self.connection.commit()
+    async def update_free_days_by_telegram_id(self, telegram_id, new_free_days):
+        await users_writer.submit(_set_free_days, telegram_id, new_free_days)
+        profile_cache.invalidate(telegram_id)
         
     def close(self):
-        self.cursor.close()
-        self.connection.close()
+        """Подключения принадлежат пулу и закрываются в close_pools()."""
+        pass
 
-    def has_used_trial_seven(self, telegram_id: int) -> bool:
+    async def has_used_trial_seven(self, telegram_id: int) -> bool:
         """
         Проверяет, использовал ли пользователь пробный период (7 дней).
         """
-        query = "SELECT used_trial_seven FROM users WHERE telegram_id = ?"
-        self.cursor.execute(query, (telegram_id,))
-        result = self.cursor.fetchone()
-        return bool(result[0]) if result else False
+        profile = await profile_cache.get(telegram_id)
+        return bool(profile.user.used_trial_seven) if profile else False
 
-    def mark_trial_seven_used(self, telegram_id: int):
+    async def mark_trial_seven_used(self, telegram_id: int):
         """
         Отмечает, что пользователь использовал пробный период (7 дней).
         """
-        query = "UPDATE users SET used_trial_seven = 1 WHERE telegram_id = ?"
-        self.cursor.execute(query, (telegram_id,))
-        self.connection.commit()
+        await users_writer.submit(_mark_trial_seven_used, telegram_id)
+        profile_cache.invalidate(telegram_id)
 
     async def get_server_ids_by_email(self, email: str) -> list[int]:
         """
         Возвращает список server_id для указанного email.
         """
-        query = "SELECT id_server FROM user_emails WHERE email = ?"
         try:
-            self.cursor.execute(query, (email,))
-            rows = self.cursor.fetchall()
-            return [row[0] for row in rows]
+            async with users_pool.acquire() as conn:
+                rows = await SubscriptionRepo(conn).by_email(email)
+            return [row.server_id for row in rows]
         except Exception as e:
             logger.error(f"❌ Ошибка при получении server_id для email={email}: {e}")
             return []
 
+async def _set_free_days(conn, telegram_id, days):
+    await UserRepo(conn).set_free_days(telegram_id, days)
+
+
+async def _mark_trial_seven_used(conn, telegram_id):
+    await UserRepo(conn).mark_trial_seven_used(telegram_id)
+
+
 async def get_email_from_usersdatabase(client_id):
-    conn = sqlite3.connect(USERSDATABASE)
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT email FROM users WHERE id=?", (client_id,))
-    result = cursor.fetchone()
-    
-    conn.close()
+    async with users_pool.acquire() as conn:
+        async with conn.execute("SELECT email FROM users WHERE id=?", (client_id,)) as cursor:
+            result = await cursor.fetchone()
     
     if result:
         return result[0]
@@ -236,30 +207,27 @@ async def get_emails_from_database(telegram_id):
         list: Список строк, содержащих логины подписок, связанных с пользователем.
               Если пользователь с данным Telegram ID не найден, возвращается пустой список.
     """
-    conn = sqlite3.connect(USERSDATABASE)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT id FROM users WHERE telegram_id = ?
-    """, (telegram_id,))
-    user_id_result = cursor.fetchone()
-    
-    if user_id_result:
-        user_id = user_id_result[0]
+    profile = await profile_cache.get(telegram_id)
+    return list(profile.emails) if profile else []
 
-        cursor.execute("""
-            SELECT email FROM user_emails WHERE user_id = ?
-        """, (user_id,))
-        emails = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
-        
-        return [email[0] for email in emails]
+
+async def _count_referral(conn, telegram_id):
+    users = UserRepo(conn)
+    await users.get_or_create_id(telegram_id)
+    user = await users.get(telegram_id)
+
+    if not user.referred_by:
+        logger.info("Реферальный код для текущего пользователя не найден или пуст.")
+        return None
+
+    referred_by_id = user.referred_by
+    referrer_id = await users.get_id(referred_by_id)
+    if referrer_id:
+        await users.increment_referral_count(referrer_id)
+        logger.info(f"Засчитан реферал для {referred_by_id} от {telegram_id}")
     else:
-        cursor.close()
-        conn.close()
-        return []
+        logger.error(f"Реферальный код {referred_by_id} не найден.")
+    return referred_by_id
 
 
 async def handle_database_operations(telegram_id: int, name: str, expiry_time: int):
@@ -267,198 +235,95 @@ async def handle_database_operations(telegram_id: int, name: str, expiry_time: i
     Выполняет операции с базой данных: добавление пользователя, логин подписки, 
     обработка рефералов и обновление счетчиков.
     """
-    conn_users = None
-    cursor_users = None
-
     try:
-        conn_users = sqlite3.connect(USERSDATABASE)
-        cursor_users = conn_users.cursor()
-        cursor_users.execute("SELECT id FROM users WHERE telegram_id = ?", (telegram_id,))
-        user_id_result = cursor_users.fetchone()
-
-        if user_id_result:
-            user_id = user_id_result[0]
-        else:
-            cursor_users.execute("INSERT INTO users (telegram_id) VALUES (?)", (telegram_id,))
-            user_id = cursor_users.lastrowid
-        cursor_users.execute("""
-            SELECT 1 FROM user_emails 
-            WHERE user_id = ? AND email = ?
-        """, (user_id, name))
-        email_exists = cursor_users.fetchone()
-        cursor_users.execute("SELECT referred_by FROM users WHERE id = ?", (user_id,))
-        referred_by_result = cursor_users.fetchone()
-
-        if referred_by_result and referred_by_result[0]:
-            referred_by_id = referred_by_result[0]
-            cursor_users.execute("SELECT id FROM users WHERE telegram_id = ?", (referred_by_id,))
-            referrer_id_result = cursor_users.fetchone()
-
-            if referrer_id_result:
-                referrer_id = referrer_id_result[0]
-                cursor_users.execute(
-                    "UPDATE users SET referral_count = referral_count + 1 WHERE id = ?", 
-                    (referrer_id,)
-                )
-                logger.info(f"Засчитан реферал для {referred_by_id} от {telegram_id}")
-            else:
-                logger.error(f"Реферальный код {referred_by_id} не найден.")
-        else:
-            logger.info("Реферальный код для текущего пользователя не найден или пуст.")
-        conn_users.commit()
+        referred_by_id = await users_writer.submit(_count_referral, telegram_id)
+        profile_cache.invalidate(telegram_id, referred_by_id)
     except Exception as e:
         logger.error(f"Ошибка работы с базой данных: {e}")
-    finally:
-        if cursor_users:
-            cursor_users.close()
-        if conn_users:
-            conn_users.close()
-
-
-async def get_db_connection():
-    """Возвращает подключение к базе данных"""
-    return sqlite3.connect(USERSDATABASE)
 
 
 async def execute_query(query, params=None, fetch=False):
     """Выполняет запрос к базе данных и возвращает результат"""
     try:
-        conn = await get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(query, params)
-        conn.commit()
-        if fetch:
-            return cursor.fetchall()
+        async with users_pool.acquire() as conn:
+            async with conn.execute(query, params or ()) as cursor:
+                rows = await cursor.fetchall() if fetch else None
+            await conn.commit()
+            return rows
     except Exception as e:
         logger.error(f"Ошибка при выполнении запроса: {e}")
-    finally:
-        conn.close()
+
+async def _save_config(conn, email, config):
+    await SubscriptionRepo(conn).save_config(email, config)
+
 
 async def save_config_to_new_table(email, config3):
-    conn_users = await get_db_connection()
     try:
-        cursor = conn_users.cursor()
-        cursor.execute(
-            """
-            INSERT INTO user_configs (email, config) VALUES (?, ?)
-            """,
-            (email, config3)
-        )
-        conn_users.commit()
+        await users_writer.submit(_save_config, email, config3)
         logger.info(f"[save_config_to_new_table] Добавлен email {email} с config")
     except Exception as e:
         logger.error(f"[save_config_to_new_table] Ошибка при добавлении: {e}")
-    finally:
-        conn_users.close()
 
 
 
 #from trial
+async def _mark_trial_used(conn, telegram_id):
+    """(статус изменился, пользователь есть в базе)."""
+    users = UserRepo(conn)
+    if await users.mark_trial_used(telegram_id):
+        return True, True
+    return False, await users.get_id(telegram_id) is not None
+
+
 async def update_user_trial_status(telegram_id: int) -> bool:
     """
-    Полностью переработанная функция обновления trial статуса
-    Возвращает True если обновление прошло успешно
+    Отмечает, что пользователь получил пробный период.
+    Возвращает True если статус изменился: одно условное UPDATE вместо трех SELECT,
+    строка пользователя читается только когда обновление не прошло.
     """
-    conn = None
     try:
-        # Создаем новое подключение (не используем execute_query)
-        conn = await get_db_connection()
-        cursor = conn.cursor()
-        
-        # 1. Проверяем существует ли пользователь
-        cursor.execute("SELECT id FROM users WHERE telegram_id = ?", (telegram_id,))
-        if not cursor.fetchone():
+        changed, exists = await users_writer.submit(_mark_trial_used, telegram_id)
+        if changed:
+            profile_cache.invalidate(telegram_id)
+            logger.info(f"Успешно обновили trial статус для {telegram_id}")
+            return True
+
+        if not exists:
             logger.error(f"Пользователь {telegram_id} не найден")
-            return False
-        
-        # 2. Проверяем текущий статус trial
-        cursor.execute("SELECT has_trial FROM users WHERE telegram_id = ?", (telegram_id,))
-        current_status = cursor.fetchone()[0]
-        
-        if current_status == 1:
+        else:
             logger.info(f"Пользователь {telegram_id} уже имеет trial")
-            return False
-        
-        # 3. Выполняем обновление
-        cursor.execute("UPDATE users SET has_trial = 1 WHERE telegram_id = ?", (telegram_id,))
-        conn.commit()  # Явный коммит!
-        
-        # 4. Проверяем что обновилось
-        cursor.execute("SELECT has_trial FROM users WHERE telegram_id = ?", (telegram_id,))
-        updated_status = cursor.fetchone()[0]
-        
-        if updated_status != 1:
-            logger.error(f"Статус не обновился для {telegram_id}")
-            return False
-            
-        logger.info(f"Успешно обновили trial статус для {telegram_id}")
-        return True
+        return False
         
     except Exception as e:
         logger.error(f"Ошибка при обновлении trial: {str(e)}")
         return False
-    finally:
-        if conn:
-            conn.close()
+
+
+async def _link_email(conn, telegram_id, email, server_id):
+    # Находим или создаём пользователя
+    user_id = await UserRepo(conn).get_or_create_id(telegram_id)
+    # Вставка пропускается, если такая запись уже есть (избегаем дублей)
+    await SubscriptionRepo(conn).link(user_id, email, server_id)
+    return user_id
 
 
 async def insert_or_update_user(telegram_id, email, server_id):
     """
     Вставляет запись в user_emails, автоматически подтягивая telegram_id из таблицы users.
     """
-    conn_users = await get_db_connection()
     try:
-        cursor_users = conn_users.cursor()
-
-        # Проверяем, существует ли пользователь с данным telegram_id
-        cursor_users.execute("SELECT id FROM users WHERE telegram_id = ?", (telegram_id,))
-        user_id_result = cursor_users.fetchone()
-
-        if user_id_result:
-            user_id = user_id_result[0]
-        else:
-            # Создаём нового пользователя
-            cursor_users.execute("INSERT INTO users (telegram_id) VALUES (?)", (telegram_id,))
-            user_id = cursor_users.lastrowid
-
-        # Проверяем, есть ли уже такая запись (избегаем дублей)
-        cursor_users.execute(
-            "SELECT 1 FROM user_emails WHERE user_id = ? AND email = ? AND id_server = ?",
-            (user_id, email, server_id)
-        )
-        if not cursor_users.fetchone():
-            # Вставляем, подтягивая telegram_id из таблицы users
-            cursor_users.execute("""
-                INSERT INTO user_emails (user_id, email, id_server, telegram_id)
-                SELECT ?, ?, ?, telegram_id
-                FROM users
-                WHERE id = ?
-            """, (user_id, email, server_id, user_id))
-
-        conn_users.commit()
-        return user_id
-
+        user_id = await users_writer.submit(_link_email, telegram_id, email, server_id)
     except Exception as e:
         logger.error(f"Ошибка в insert_or_update_user: {e}")
-        conn_users.rollback()
         raise
-    finally:
-        conn_users.close()
+    profile_cache.invalidate(telegram_id)
+    return user_id
 
 
 async def get_server_ids_as_list(SERVEDATABASE):
-    """Получение server_ids из таблицы server_ids как списка."""
+    """Получение server_ids из таблицы server_ids как списка (из реестра серверов)."""
     try:
-
-        connection = sqlite3.connect(SERVEDATABASE)
-        cursor = connection.cursor()
-        cursor.execute('SELECT server_ids FROM server_ids ORDER BY id DESC LIMIT 1')
-        result = cursor.fetchone()
-
-        connection.close()
-        if result:
-            return result[0].split(',')
-        return []
+        return await server_registry.active_server_ids()
     except Exception as e:
         logger.error(f"Ошибка при получении server_ids: {e}")
         return []
@@ -467,15 +332,9 @@ async def get_server_ids_as_list(SERVEDATABASE):
 async def get_server_id(SERVEDATABASE):
     """Получение server_id из таблицы servers в виде строки '1,2,3'."""
     try:
-        connection = sqlite3.connect(SERVEDATABASE)
-        cursor = connection.cursor()
-        cursor.execute('SELECT id FROM servers ORDER BY id ASC')
-        result = cursor.fetchall()       
-        connection.close()
-       
-        if result:
-            return ",".join(str(row[0]) for row in result)
-        return ""
+        async with servers_pool.acquire() as conn:
+            server_ids = await ServerRepo(conn).ids()
+        return ",".join(str(server_id) for server_id in server_ids)
     except Exception as e:
         logger.error(f"Ошибка при получении server_ids: {e}")
         return ""
@@ -485,155 +344,172 @@ async def emails_from_smena_servera(telegram_id):
     """
     Получает список логинов подписок и server_id для заданного Telegram ID.
     """
-    conn = sqlite3.connect(USERSDATABASE)
-    cursor = conn.cursor()
-    
     try:
-        # Получаем ID пользователя по telegram_id
-        cursor.execute("""
-            SELECT id FROM users WHERE telegram_id = ?
-        """, (telegram_id,))
-        user_id_result = cursor.fetchone()
-        
-        if user_id_result:
-            user_id = user_id_result[0]
-
-            # Получаем email и server_id из таблицы user_emails
-            cursor.execute("""
-                SELECT email, id_server FROM user_emails WHERE user_id = ?
-            """, (user_id,))
-            emails_with_servers = cursor.fetchall()
-
-            return [
-                {"email": email, "server_id": server_id}
-                for email, server_id in emails_with_servers
-            ]
-        else:
-            return []
+        async with users_pool.acquire() as conn:
+            subscriptions = await SubscriptionRepo(conn).by_telegram_id(telegram_id)
+
+        return [
+            {"email": row.email, "server_id": row.server_id}
+            for row in subscriptions
+        ]
     except Exception as e:
         logger.error(f"Ошибка при получении данных из базы: {e}")
         return []
-    finally:
-        cursor.close()
-        conn.close()
+
+async def _add_sum_my(conn, telegram_id, amount):
+    await UserRepo(conn).add_sum_my(telegram_id, amount)
+    # Синхронизация после изменения — в той же транзакции
+    await ReferralRepo(conn).sync_amounts()
+
 
 async def update_sum_my(telegram_id, amount):
-    db_path = USERSDATABASE
-    async with aiosqlite.connect(db_path) as db:
-        await db.execute(
-            """
-            UPDATE users SET sum_my = sum_my + ? WHERE telegram_id = ?
-            """,
-            (amount, telegram_id)
-        )
-        await db.commit()
-    
-    # Синхронизация после изменения
-    await sync_referral_amounts()
+    await users_writer.submit(_add_sum_my, telegram_id, amount)
+    profile_cache.invalidate(telegram_id)
 
         
         
+async def _add_sum_ref(conn, telegram_id, amount):
+    users = UserRepo(conn)
+    user = await users.get(telegram_id)
+    if not (user and user.referred_by):
+        return None
+
+    referred_by_id = user.referred_by
+    invited_username = user.username or f"id:{telegram_id}"
+
+    # Получаем username пригласившего
+    referrer = await users.get(referred_by_id)
+    ref_username = referrer.username if referrer and referrer.username else f"id:{referred_by_id}"
+
+    # Обновляем сумму
+    await users.add_sum_ref(referred_by_id, amount)
+
+    # ✅ Вставляем обоих в referal_tables
+    await ReferralRepo(conn).add_tickets([invited_username, ref_username])
+    return referred_by_id
+
+
 async def update_sum_ref(telegram_id, amount):
     """Обновляет поле sum_ref у пригласившего пользователя и добавляет username обоих в referal_tables."""
-    db_path = USERSDATABASE
-    async with aiosqlite.connect(db_path) as db:
-        async with db.execute(
-            "SELECT referred_by, username FROM users WHERE telegram_id = ?", (telegram_id,)
-        ) as cursor:
-            row = await cursor.fetchone()
-
-        if row and row[0]:
-            referred_by_id = row[0]
-            invited_username = row[1] or f"id:{telegram_id}"
-
-            # Получаем username пригласившего
-            async with db.execute(
-                "SELECT username FROM users WHERE telegram_id = ?", (referred_by_id,)
-            ) as ref_cursor:
-                ref_row = await ref_cursor.fetchone()
-                ref_username = ref_row[0] if ref_row and ref_row[0] else f"id:{referred_by_id}"
-
-            logger.info(f"Пользователь {referred_by_id} пригласил {telegram_id}. Сумма к прибавлению: {amount}")
-
-            # Обновляем сумму
-            await db.execute(
-                "UPDATE users SET sum_ref = sum_ref + ? WHERE telegram_id = ?",
-                (amount, referred_by_id)
-            )
-
-            # ✅ Вставляем обоих в referal_tables
-            await db.executemany(
-                "INSERT INTO referal_tables (telegram_user) VALUES (?)",
-                [(invited_username,), (ref_username,)]
-            )
-
-            await db.commit()
-            logger.info(f"Обновлена сумма для {referred_by_id} и добавлены пользователи в referal_tables.")
-        else:
-            logger.warning(f"Пользователь {telegram_id} не имеет реферера или он не найден.") 
+    referred_by_id = await users_writer.submit(_add_sum_ref, telegram_id, amount)
+    profile_cache.invalidate(referred_by_id)
+    if referred_by_id:
+        logger.info(f"Пользователь {referred_by_id} пригласил {telegram_id}. Сумма к прибавлению: {amount}")
+        logger.info(f"Обновлена сумма для {referred_by_id} и добавлены пользователи в referal_tables.")
+    else:
+        logger.warning(f"Пользователь {telegram_id} не имеет реферера или он не найден.") 
+
+
+async def _add_referrer_free_days(conn, telegram_id, days):
+    users = UserRepo(conn)
+    user = await users.get(telegram_id)
+    if not (user and user.referred_by):
+        return None
+    await users.add_free_days(user.referred_by, days)
+    return user.referred_by
 
 
 async def add_free_days(telegram_id, FREE_DAYS):
     """Добавляет дней и отправляет сообщение пригласившему."""
-    db_path = USERSDATABASE
-    async with aiosqlite.connect(db_path) as db:
-        async with db.execute(
-            "SELECT referred_by FROM users WHERE telegram_id = ?", (telegram_id,)
-        ) as cursor:
-            row = await cursor.fetchone()
-
-        if row and row[0]:
-            referred_by_id = row[0]
-            logger.info(f"Пользователь {referred_by_id} пригласил пользователя {telegram_id}. Прибавляется: {FREE_DAYS}")
-            await db.execute(
-                "UPDATE users SET free_days = free_days + ? WHERE telegram_id = ?",
-                (FREE_DAYS, referred_by_id)
-            )
-            await db.commit()
-            await notify_user_about_free_days(referred_by_id, FREE_DAYS, bot)
-
-            logger.info(f"Обновлена сумма для пользователя {referred_by_id}. бесплатных дней: {FREE_DAYS}")
-        else:
-            logger.warning(f"Пользователь {telegram_id} не имеет реферера или реферер не найден.")
+    referred_by_id = await users_writer.submit(_add_referrer_free_days, telegram_id, FREE_DAYS)
+    profile_cache.invalidate(referred_by_id)
+
+    if referred_by_id:
+        logger.info(f"Пользователь {referred_by_id} пригласил пользователя {telegram_id}. Прибавляется: {FREE_DAYS}")
+        await notify_user_about_free_days(referred_by_id, FREE_DAYS, bot)
+
+        logger.info(f"Обновлена сумма для пользователя {referred_by_id}. бесплатных дней: {FREE_DAYS}")
+    else:
+        logger.warning(f"Пользователь {telegram_id} не имеет реферера или реферер не найден.")
+
+
+async def _record_purchase(conn, telegram_id, amount, email, server_id, tickets_user, tickets, free_days):
+    users = UserRepo(conn)
+    referrals = ReferralRepo(conn)
+
+    # Пользователь и засчитанный реферал (как в handle_database_operations)
+    user_id = await users.get_or_create_id(telegram_id)
+    user = await users.get(telegram_id)
+    referred_by_id = user.referred_by
+    referrer = await users.get(referred_by_id) if referred_by_id else None
+    if referrer:
+        await users.increment_referral_count(referrer.id)
+
+    # Логин подписки (как в insert_or_update_user)
+    if email:
+        await SubscriptionRepo(conn).link(user_id, email, server_id)
+
+    # Промокод считается использованным (как в log_promo_code_usage)
+    await users.mark_promo_used(user_id)
+
+    # Сумма покупок и суммы по реферальным ссылкам этого пользователя
+    await users.add_sum_my(telegram_id, amount)
+    await referrals.sync_amounts_for(telegram_id)
+
+    if referred_by_id:
+        # Сумма пригласившему и билеты обоим (как в update_sum_ref)
+        await users.add_sum_ref(referred_by_id, amount)
+        await referrals.add_tickets([
+            user.username or f"id:{telegram_id}",
+            referrer.username if referrer and referrer.username else f"id:{referred_by_id}",
+        ])
+        if free_days > 0:
+            await users.add_free_days(referred_by_id, free_days)
+
+    # Билеты за оплату
+    if tickets > 0 and tickets_user:
+        await referrals.add_tickets([tickets_user] * tickets)
+
+    return referred_by_id
+
+
+async def record_purchase(telegram_id, amount, email=None, server_id=None,
+                          tickets_user=None, tickets=0, free_days=0):
+    """
+    Учет оплаченной покупки одной транзакцией.
+
+    Заменяет цепочку handle_database_operations → insert_or_update_user →
+    log_promo_code_usage → update_sum_my (+ пересчет реферальных сумм) →
+    update_sum_ref → билеты → add_free_days. Либо применяются все изменения,
+    либо ни одного. Уведомление пригласившему о бесплатных днях отправляется
+    после коммита.
+
+    Аргументы:
+        email, server_id: новый логин подписки (для продления не передаются).
+        tickets_user, tickets: кому и сколько билетов начислить за оплату.
+        free_days: бесплатные дни пригласившему.
+
+    Возвращает telegram_id пригласившего или None.
+    """
+    referred_by_id = await users_writer.submit(
+        _record_purchase, telegram_id, amount, email, server_id, tickets_user, tickets, free_days
+    )
+    profile_cache.invalidate(telegram_id, referred_by_id)
+    logger.info(f"💾 Покупка пользователя {telegram_id} на {amount} RUB записана (пригласивший: {referred_by_id})")
+
+    if referred_by_id and free_days > 0:
+        await notify_user_about_free_days(referred_by_id, free_days, bot)
+    return referred_by_id
 
 
 async def get_user_referral_code(
     telegram_id: int, 
-    conn: aiosqlite.Connection  # Принимаем соединение извне
+    conn: aiosqlite.Connection | None = None  # Соединение извне или из пула
 ) -> str | None:
     """Получает реферальный код пользователя, если он уже зарегистрирован.
     
     Args:
         telegram_id: ID пользователя в Telegram
-        conn: Активное соединение с базой данных (передается из вызывающего кода)
+        conn: Активное соединение с базой данных (если не передано, берется из кэша профилей)
     
     Returns:
         Реферальный код (str) или None, если пользователь не найден
     """
-    async with conn.execute(
-        "SELECT referral_code FROM users WHERE telegram_id = ?", 
-        (telegram_id,)
-    ) as cursor:
-        row = await cursor.fetchone()
-        return row[0] if row else None
-
-#все рефералы
-def init_referal_table():
-    conn = sqlite3.connect("users.db")
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS referals (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            name TEXT,
-            code TEXT UNIQUE,
-            clicks INTEGER DEFAULT 0,
-            telegram_id INTEGER,
-            amount REAL
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    if conn is None:
+        profile = await profile_cache.get(telegram_id)
+        return profile.user.referral_code if profile else None
+
+    return await ReferralRepo(conn).referral_code(telegram_id)
 
 async def increment_referral_clicks(code: str, conn: aiosqlite.Connection):
     """
@@ -642,68 +518,32 @@ async def increment_referral_clicks(code: str, conn: aiosqlite.Connection):
     :param conn: Активное соединение с базой данных (должно передаваться извне)
     """
     try:
-        await conn.execute(
-            "UPDATE referals SET clicks = clicks + 1 WHERE code = ?", 
-            (code,)
-        )
+        await ReferralRepo(conn).increment_clicks(code)
         # Не нужно явно коммитить, если соединение управляется извне
     except Exception as e:
         logger.error(f"Ошибка при увеличении счетчика кликов для кода {code}: {e}")
         raise
 
 async def get_referral_info_by_code(code: str):
-    async with aiosqlite.connect("users.db") as conn:
-        cursor = await conn.execute("SELECT name, code, clicks FROM referals WHERE code = ?", (code,))
-        referral = await cursor.fetchone()
-    return referral  # (name, code, clicks)
+    async with users_pool.acquire() as conn:
+        return await ReferralRepo(conn).info(code)  # ReferralRow(name, code, clicks)
 
 async def add_purchase(referral_code: str, amount: float):
-    async with aiosqlite.connect("users.db") as conn:
-        cursor = await conn.execute(
-            "UPDATE referals SET amount = amount + ? WHERE code = ?",
-            (amount, referral_code)
-        )
+    async with users_pool.acquire() as conn:
+        await ReferralRepo(conn).add_amount(referral_code, amount)
         await conn.commit()
 
 async def sync_referral_amounts():
-    async with aiosqlite.connect(USERSDATABASE) as db:
-        await db.execute("""
-            UPDATE referals
-            SET amount = (
-                SELECT COALESCE(SUM(u.sum_my), 0)
-                FROM referral_links rl
-                JOIN users u ON rl.invited_user_id = u.telegram_id
-                WHERE rl.referrer_code = referals.code
-            )
-        """)
+    async with users_pool.acquire() as db:
+        await ReferralRepo(db).sync_amounts()
         await db.commit()
 
 async def clean_referal_table():
-    """Очищает таблицу referal_tables по заданной логике."""
-    async with aiosqlite.connect("users.db") as db:
-        async with db.execute("""
-            SELECT telegram_user, COUNT(*) as count
-            FROM referal_tables
-            GROUP BY telegram_user
-        """) as cursor:
-            rows = await cursor.fetchall()
-
-        for telegram_user, count in rows:
-            if count == 1:
-                await db.execute("""
-                    DELETE FROM referal_tables
-                    WHERE telegram_user = ?
-                    LIMIT 1
-                """, (telegram_user,))
-            elif count >= 2:
-                await db.execute("""
-                    DELETE FROM referal_tables
-                    WHERE id IN (
-                        SELECT id FROM referal_tables
-                        WHERE telegram_user = ?
-                        LIMIT 1
-                    )
-                """, (telegram_user,))
+    """Очищает таблицу referal_tables по заданной логике: по одной записи на каждого пользователя."""
+    async with users_pool.acquire() as db:
+        referrals = ReferralRepo(db)
+        for telegram_user, count in await referrals.ticket_counts():
+            if count >= 1:
+                await referrals.delete_one_ticket(telegram_user)
         
         await db.commit()
-
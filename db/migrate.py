@@ -0,0 +1,94 @@
+"""
+Версионные миграции схемы users.db.
+
+Миграции лежат в db/migrations/ в файлах вида `m0001_<описание>.py`; номер в
+имени — версия схемы. Каждый файл определяет функцию `upgrade(cursor)`.
+Примененные версии записываются в таблицу schema_version, поэтому каждая
+миграция выполняется ровно один раз и в своей транзакции: при ошибке
+изменения откатываются, а следующие миграции не запускаются.
+"""
+
+import importlib
+import pkgutil
+import re
+import sqlite3
+
+from log import logger
+
+MIGRATIONS_PACKAGE = "db.migrations"
+_MIGRATION_NAME = re.compile(r"^m(\d{4})_\w+$")
+
+
+def table_columns(cursor, table):
+    """Список колонок таблицы."""
+    return [row[1] for row in cursor.execute(f"PRAGMA table_info({table})").fetchall()]
+
+
+def add_column(cursor, table, column, definition):
+    """Добавляет колонку, если ее еще нет (старые базы могли получить ее вручную)."""
+    if column not in table_columns(cursor, table):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def discover_migrations():
+    """Возвращает список (версия, имя, модуль) в порядке возрастания версии."""
+    package = importlib.import_module(MIGRATIONS_PACKAGE)
+    migrations = []
+    for module_info in pkgutil.iter_modules(package.__path__):
+        match = _MIGRATION_NAME.match(module_info.name)
+        if not match:
+            continue
+        module = importlib.import_module(f"{MIGRATIONS_PACKAGE}.{module_info.name}")
+        migrations.append((int(match.group(1)), module_info.name, module))
+    migrations.sort(key=lambda item: item[0])
+
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Повторяющиеся номера миграций: {versions}")
+    return migrations
+
+
+def current_version(cursor):
+    """Текущая версия схемы (0 для пустой базы)."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    return cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def run_migrations(connection):
+    """
+    Применяет все непримененные миграции к открытому подключению sqlite3.
+    Возвращает итоговую версию схемы.
+    """
+    previous_isolation = connection.isolation_level
+    connection.isolation_level = None  # транзакциями управляем сами
+    cursor = connection.cursor()
+    try:
+        version = current_version(cursor)
+        for migration_version, name, module in discover_migrations():
+            if migration_version <= version:
+                continue
+            logger.info(f"🛠 Применяется миграция {name}")
+            cursor.execute("BEGIN")
+            try:
+                module.upgrade(cursor)
+                cursor.execute(
+                    "INSERT INTO schema_version (version, name) VALUES (?, ?)",
+                    (migration_version, name)
+                )
+                cursor.execute("COMMIT")
+            except sqlite3.Error as e:
+                cursor.execute("ROLLBACK")
+                logger.error(f"❌ Миграция {name} не применена: {e}")
+                raise
+            version = migration_version
+        logger.info(f"✅ Версия схемы базы: {version}")
+        return version
+    finally:
+        cursor.close()
+        connection.isolation_level = previous_isolation
@@ -0,0 +1,61 @@
+"""Исходная схема: таблицы из прежних setup_tables и init_referal_table."""
+
+
+def upgrade(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_id INTEGER UNIQUE,
+            username TEXT,
+            entry_date TEXT,
+            telegram_link TEXT,
+            referral_code TEXT,
+            referred_by INTEGER,
+            referral_count INTEGER,
+            has_trial BOOLEAN DEFAULT 0,  -- Флаг: 0 - не получал пробную подписку, 1 - получал
+            promo_code TEXT,                  -- Промокод, который использовал пользователь
+            promo_code_usage INTEGER DEFAULT 0,  -- Использовал или нет
+            FOREIGN KEY (referred_by) REFERENCES users(id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_emails (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            email TEXT,
+            id_server INTEGER,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS promo_codes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            code TEXT UNIQUE,            -- Уникальный промокод
+            discount INTEGER,            -- Процент скидки (например, 10, 20, 30)
+            is_active BOOLEAN DEFAULT 1   -- Флаг активности
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS used_promo_codes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            promo_code TEXT,
+            usage_date TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS referals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            name TEXT,
+            code TEXT UNIQUE,
+            clicks INTEGER DEFAULT 0,
+            telegram_id INTEGER,
+            amount REAL
+        )
+    ''')
@@ -0,0 +1,54 @@
+"""
+Колонки и таблицы, на которые опирается код, но которые раньше нигде не
+создавались (добавлялись в рабочую базу вручную).
+"""
+
+from db.migrate import add_column
+
+
+def upgrade(cursor):
+    # users: суммы, бесплатные дни и флаги уведомлений
+    add_column(cursor, "users", "sum_ref", "REAL DEFAULT 0")
+    add_column(cursor, "users", "sum_my", "REAL DEFAULT 0")
+    add_column(cursor, "users", "free_days", "REAL DEFAULT 0")
+    add_column(cursor, "users", "trial_type", "TEXT DEFAULT NULL")
+    add_column(cursor, "users", "subscription_end", "TEXT DEFAULT NULL")
+    add_column(cursor, "users", "subscription_active", "INTEGER DEFAULT 0")
+    add_column(cursor, "users", "referrer_code", "TEXT")
+    add_column(cursor, "users", "notified_after_3_days", "BOOLEAN DEFAULT FALSE")
+    add_column(cursor, "users", "notified_after_7_days", "BOOLEAN DEFAULT FALSE")
+    add_column(cursor, "users", "is_blocked", "INTEGER DEFAULT 0")
+    add_column(cursor, "users", "used_trial_seven", "INTEGER DEFAULT 0")
+
+    add_column(cursor, "user_emails", "config", "TEXT")
+    add_column(cursor, "user_emails", "telegram_id", "INTEGER")
+
+    add_column(cursor, "promo_codes", "days", "INTEGER DEFAULT 30")
+
+    add_column(cursor, "referals", "invited_user_id", "INTEGER")
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_configs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT NOT NULL,
+            config TEXT NOT NULL,
+            days_left INTEGER DEFAULT -1
+        )
+    ''')
+    add_column(cursor, "user_configs", "days_left", "INTEGER DEFAULT -1")
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS referral_links (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            referrer_code TEXT NOT NULL,
+            invited_user_id INTEGER NOT NULL,
+            FOREIGN KEY(invited_user_id) REFERENCES users(telegram_id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS referal_tables (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_user TEXT
+        )
+    ''')
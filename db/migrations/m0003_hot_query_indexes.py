@@ -0,0 +1,41 @@
+"""
+Индексы под горячие запросы.
+
+- user_emails(user_id, email, id_server) — проверка дублей в insert_or_update_user
+  (заменяет индекс только по user_id, который является его префиксом);
+- used_promo_codes(user_id, promo_code) — проверка промокода при расчете цены;
+- referral_links(referrer_code) — пересчет сумм в sync_referral_amounts;
+- уникальный user_configs(email) — одна строка конфига на логин.
+  Индекс по полному тексту config не используется ни одним запросом и удаляется.
+"""
+
+
+def upgrade(cursor):
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_user_emails_user_email_server "
+        "ON user_emails (user_id, email, id_server)"
+    )
+    cursor.execute("DROP INDEX IF EXISTS idx_user_emails_user_id")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_emails_email ON user_emails (email)")
+
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_used_promo_codes_user_code "
+        "ON used_promo_codes (user_id, promo_code)"
+    )
+
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_referral_links_referrer_code "
+        "ON referral_links (referrer_code)"
+    )
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_referral_code ON users (referral_code)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_referred_by ON users (referred_by)")
+
+    # Перед уникальным индексом оставляем по каждому email только последнюю запись
+    cursor.execute('''
+        DELETE FROM user_configs
+        WHERE id NOT IN (SELECT MAX(id) FROM user_configs GROUP BY email)
+    ''')
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_user_configs_email ON user_configs (email)")
+    cursor.execute("DROP INDEX IF EXISTS idx_user_configs_email")
+    cursor.execute("DROP INDEX IF EXISTS idx_user_configs_config")
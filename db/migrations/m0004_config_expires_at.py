@@ -0,0 +1,32 @@
+"""
+Абсолютный срок окончания подписки в user_configs.
+
+expires_at — expiryTime клиента из панели 3x-ui в миллисекундах:
+- больше 0 — момент окончания подписки;
+- 0 или меньше — срок не задан (бессрочно или отсчет с первого подключения);
+- NULL — срок еще не получен с сервера.
+
+days_left больше не пересчитывается каждую ночь, а вычисляется из expires_at
+при чтении. Старая колонка остается в таблице, но не обновляется; значения
+из нее переносятся в expires_at (с точностью до дня, ночная синхронизация
+уточнит их по серверам).
+"""
+
+from db.migrate import add_column
+
+
+def upgrade(cursor):
+    add_column(cursor, "user_configs", "expires_at", "INTEGER DEFAULT NULL")
+
+    # days_left = -1 писался для клиентов без срока
+    cursor.execute('''
+        UPDATE user_configs
+        SET expires_at = CASE
+            WHEN days_left = -1 THEN 0
+            ELSE CAST(strftime('%s', 'now', 'localtime', 'start of day', days_left || ' days', 'utc') AS INTEGER) * 1000
+        END
+        WHERE expires_at IS NULL AND days_left IS NOT NULL
+    ''')
+
+    # Напоминания выбирают подписки по диапазону expires_at
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_configs_expires_at ON user_configs (expires_at)")
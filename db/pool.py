@@ -0,0 +1,221 @@
+"""
+Пул асинхронных подключений к базам SQLite.
+
+Вместо открытия нового блокирующего `sqlite3.connect()` в каждом обработчике
+процесс держит фиксированный набор долгоживущих подключений aiosqlite.
+Подключение выдается через `async with pool.acquire() as conn:` и
+возвращается в пул после выхода из блока. Подключения открывает хранилище
+из db/storage.py (файл на диске или база в памяти, по DB_BACKEND).
+"""
+
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+from dotenv import load_dotenv
+
+from log import logger
+from db.sqlite_profile import wal_size, DB_WAL_TRUNCATE_BYTES
+from db.storage import get_storage
+
+load_dotenv()
+
+USERSDATABASE = os.getenv("USERSDATABASE", "users.db")
+SERVEDATABASE = os.getenv("SERVEDATABASE", "servers.db")
+
+# Размер пула и максимальное время ожидания свободного подключения (сек)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Как часто проверять подключение запросом SELECT 1 перед выдачей (сек)
+DB_POOL_HEALTH_INTERVAL = float(os.getenv("DB_POOL_HEALTH_INTERVAL", "30"))
+
+
+class PoolTimeoutError(Exception):
+    """Свободное подключение не освободилось за отведенное время."""
+
+
+class ConnectionPool:
+    def __init__(self, db_path, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT,
+                 health_interval=DB_POOL_HEALTH_INTERVAL, isolation_level=""):
+        self.db_path = db_path
+        self.storage = get_storage(db_path)
+        # None — транзакциями управляет вызывающий код (BEGIN/COMMIT вручную)
+        self.isolation_level = isolation_level
+        self.size = size
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self._queue = None
+        self._connections = []
+        self._last_used = {}
+        self._open_lock = asyncio.Lock()
+        self._closed = False
+
+    async def _connect(self):
+        """Открывает новое подключение к базе."""
+        conn = await self.storage.connect(isolation_level=self.isolation_level)
+        self._last_used[id(conn)] = time.monotonic()
+        return conn
+
+    async def open(self):
+        """Открывает все подключения пула. Повторный вызов ничего не делает."""
+        if self._queue is not None:
+            return
+        async with self._open_lock:
+            if self._queue is not None:
+                return
+            queue = asyncio.Queue()
+            for _ in range(self.size):
+                conn = await self._connect()
+                self._connections.append(conn)
+                queue.put_nowait(conn)
+            self._queue = queue
+            self._closed = False
+            logger.info(f"🗄 Пул подключений к {self.db_path} открыт ({self.size} подключений)")
+
+    async def close(self):
+        """Закрывает все подключения пула."""
+        if self._queue is None:
+            return
+        self._closed = True
+        for conn in self._connections:
+            try:
+                await conn.close()
+            except Exception as e:
+                logger.error(f"Ошибка при закрытии подключения к {self.db_path}: {e}")
+        self._connections.clear()
+        self._last_used.clear()
+        self._queue = None
+        logger.info(f"🗄 Пул подключений к {self.db_path} закрыт")
+
+    async def _checkout(self):
+        """Забирает подключение из пула, дожидаясь не дольше timeout."""
+        await self.open()
+        try:
+            conn = await asyncio.wait_for(self._queue.get(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            raise PoolTimeoutError(
+                f"Нет свободного подключения к {self.db_path} за {self.timeout} сек"
+            )
+        if conn is None:
+            # Прошлое переподключение не удалось — пробуем снова
+            return await self._reconnect()
+        return await self._ensure_healthy(conn)
+
+    async def _ensure_healthy(self, conn):
+        """Проверяет давно простаивающее подключение и пересоздает его при ошибке."""
+        if time.monotonic() - self._last_used.get(id(conn), 0) < self.health_interval:
+            return conn
+        try:
+            async with conn.execute("SELECT 1") as cursor:
+                await cursor.fetchone()
+            return conn
+        except Exception as e:
+            logger.warning(f"⚠️ Подключение к {self.db_path} неработоспособно, переподключаемся: {e}")
+            await self._discard(conn)
+            return await self._reconnect()
+
+    async def _discard(self, conn):
+        """Закрывает сломанное подключение и убирает его из пула."""
+        self._last_used.pop(id(conn), None)
+        if conn in self._connections:
+            self._connections.remove(conn)
+        try:
+            await conn.close()
+        except Exception:
+            pass
+
+    async def _reconnect(self):
+        """
+        Открывает подключение на место сломанного. Если открыть не удалось,
+        в очередь возвращается пустое место (None): пул не теряет размер,
+        а переподключение повторится при следующей выдаче.
+        """
+        try:
+            conn = await self._connect()
+        except Exception:
+            self._queue.put_nowait(None)
+            raise
+        self._connections.append(conn)
+        return conn
+
+    async def _checkin(self, conn):
+        """Возвращает подключение в пул, откатывая незавершенную транзакцию."""
+        if self._closed or self._queue is None:
+            return
+        try:
+            if conn.in_transaction:
+                await conn.rollback()
+            # Обработчики иногда ставят row_factory = aiosqlite.Row — сбрасываем
+            conn.row_factory = None
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось откатить транзакцию в {self.db_path}: {e}")
+            await self._discard(conn)
+            try:
+                conn = await self._reconnect()
+            except Exception as e:
+                logger.error(f"❌ Не удалось переподключиться к {self.db_path}, повторим при следующей выдаче: {e}")
+                return
+        self._last_used[id(conn)] = time.monotonic()
+        self._queue.put_nowait(conn)
+
+    @asynccontextmanager
+    async def acquire(self):
+        """
+        Выдает подключение из пула на время блока `async with`.
+
+        Незакоммиченные изменения при возврате подключения откатываются,
+        поэтому код записи должен сам вызывать `await conn.commit()`.
+        """
+        conn = await self._checkout()
+        try:
+            yield conn
+        finally:
+            await self._checkin(conn)
+
+    def stats(self):
+        """Текущее состояние пула для логов и админки."""
+        free = self._queue.qsize() if self._queue is not None else 0
+        return {"db_path": self.db_path, "size": self.size, "free": free, "in_use": self.size - free if self._queue is not None else 0}
+
+
+users_pool = ConnectionPool(USERSDATABASE)
+servers_pool = ConnectionPool(SERVEDATABASE)
+
+
+async def init_pools():
+    """Открывает пулы подключений к базам пользователей и серверов."""
+    await users_pool.open()
+    await servers_pool.open()
+
+
+async def close_pools():
+    """Закрывает пулы подключений при остановке бота."""
+    await users_pool.close()
+    await servers_pool.close()
+
+
+async def checkpoint_wal():
+    """
+    Периодический чекпоинт WAL для обеих баз.
+
+    Обычно выполняется PASSIVE (не мешает читателям и писателям). Если файл
+    -wal разросся больше DB_WAL_TRUNCATE_BYTES, выполняется TRUNCATE, чтобы
+    вернуть место на диске. Размер WAL до и после пишется в лог.
+    """
+    for pool in (users_pool, servers_pool):
+        if pool.storage.path is None:
+            continue  # база в памяти, WAL нет
+        size_before = wal_size(pool.db_path)
+        mode = "TRUNCATE" if size_before > DB_WAL_TRUNCATE_BYTES else "PASSIVE"
+        try:
+            async with pool.acquire() as conn:
+                async with conn.execute(f"PRAGMA wal_checkpoint({mode})") as cursor:
+                    busy, log_frames, checkpointed = await cursor.fetchone()
+            size_after = wal_size(pool.db_path)
+            logger.info(
+                f"🧾 WAL {pool.db_path}: {size_before / 1024:.0f} KB → {size_after / 1024:.0f} KB "
+                f"({mode}, кадров: {log_frames}, перенесено: {checkpointed}, busy: {busy})"
+            )
+        except Exception as e:
+            logger.error(f"❌ Ошибка чекпоинта WAL для {pool.db_path}: {e}")
@@ -0,0 +1,567 @@
+"""
+Слой репозиториев: весь SQL по пользователям, подпискам, серверам,
+промокодам и рефералам собран здесь.
+
+Репозиторий оборачивает одно подключение из пула, поэтому несколько вызовов
+можно выполнить в одной транзакции:
+
+    async with users_pool.acquire() as conn:
+        user = await UserRepo(conn).get(telegram_id)
+
+Тексты запросов — константы модуля, поэтому драйвер переиспользует уже
+подготовленные выражения из своего кэша (cached_statements в пуле), а не
+компилирует SQL заново на каждый вызов. Строки возвращаются объектами
+со `__slots__` вместо кортежей.
+"""
+
+from datetime import date, datetime, time, timedelta
+
+import aiosqlite
+
+
+class Row:
+    """Базовый класс строк: поля задаются в __slots__ в порядке колонок SELECT."""
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def __iter__(self):
+        # Позволяет распаковывать строку как кортеж: name, code, clicks = row
+        return (getattr(self, name) for name in self.__slots__)
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row) if row is not None else None
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class UserRow(Row):
+    __slots__ = (
+        "id", "telegram_id", "username", "telegram_link", "entry_date",
+        "referral_code", "referred_by", "referrer_code", "referral_count",
+        "has_trial", "promo_code", "promo_code_usage", "sum_my", "sum_ref",
+        "free_days", "is_blocked", "used_trial_seven",
+        "notified_after_3_days", "notified_after_7_days", "subscription_end",
+    )
+
+
+class SubscriptionRow(Row):
+    __slots__ = ("user_id", "email", "server_id")
+
+
+class ServerRow(Row):
+    __slots__ = (
+        "id", "total_slots", "name", "username", "password", "server_ip",
+        "base_url", "subscription_base", "sub_url", "json_sub", "inbound_ids",
+    )
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class PromoRow(Row):
+    __slots__ = ("id", "code", "discount", "days", "is_active")
+
+
+class ReferralRow(Row):
+    __slots__ = ("name", "code", "clicks")
+
+
+class ExpiringRow(Row):
+    __slots__ = ("email", "expires_at", "telegram_id", "notified_after_3_days", "notified_after_7_days")
+
+    @property
+    def days_left(self):
+        return days_left_from_expiry(self.expires_at)
+
+
+class _Repo:
+    __slots__ = ("conn",)
+
+    def __init__(self, conn: aiosqlite.Connection):
+        self.conn = conn
+
+    async def _one(self, query, params=()):
+        async with self.conn.execute(query, params) as cursor:
+            return await cursor.fetchone()
+
+    async def _all(self, query, params=()):
+        async with self.conn.execute(query, params) as cursor:
+            return await cursor.fetchall()
+
+    async def _scalar(self, query, params=(), default=None):
+        row = await self._one(query, params)
+        return row[0] if row is not None else default
+
+    async def _write(self, query, params=()):
+        """Выполняет запрос на запись и возвращает число затронутых строк."""
+        cursor = await self.conn.execute(query, params)
+        rowcount = cursor.rowcount
+        await cursor.close()
+        return rowcount
+
+
+# --- users ---------------------------------------------------------------
+
+_USER_COLUMNS = ", ".join(UserRow.__slots__)
+SQL_USER_BY_TG = f"SELECT {_USER_COLUMNS} FROM users WHERE telegram_id = ?"
+SQL_USER_ID_BY_TG = "SELECT id FROM users WHERE telegram_id = ?"
+SQL_USER_TG_BY_REFERRAL_CODE = "SELECT telegram_id FROM users WHERE referral_code = ?"
+SQL_USER_INSERT_TG = "INSERT INTO users (telegram_id) VALUES (?)"
+SQL_USER_REGISTER = """
+    INSERT INTO users
+    (telegram_id, username, telegram_link, referral_code, referral_count, referred_by, referrer_code, entry_date, is_blocked)
+    VALUES (?, ?, ?, ?, 0, ?, ?, ?, ?)
+"""
+SQL_USER_TOUCH = "UPDATE users SET username = ?, telegram_link = ?, entry_date = ? WHERE telegram_id = ?"
+SQL_USER_SET_REFERRAL_CODE = "UPDATE users SET referral_code = ? WHERE telegram_id = ?"
+SQL_USER_MARK_TRIAL = "UPDATE users SET has_trial = 1 WHERE telegram_id = ? AND has_trial IS NOT 1"
+SQL_USER_MARK_TRIAL_SEVEN = "UPDATE users SET used_trial_seven = 1 WHERE telegram_id = ?"
+SQL_USER_ADD_SUM_MY = "UPDATE users SET sum_my = sum_my + ? WHERE telegram_id = ?"
+SQL_USER_ADD_SUM_REF = "UPDATE users SET sum_ref = sum_ref + ? WHERE telegram_id = ?"
+SQL_USER_RESET_SUM_REF = "UPDATE users SET sum_ref = 0 WHERE telegram_id = ?"
+SQL_USER_ADD_FREE_DAYS = "UPDATE users SET free_days = free_days + ? WHERE telegram_id = ?"
+SQL_USER_SET_FREE_DAYS = "UPDATE users SET free_days = ? WHERE telegram_id = ?"
+SQL_USER_INC_REFERRAL_COUNT = "UPDATE users SET referral_count = referral_count + 1 WHERE id = ?"
+SQL_USER_SET_BLOCKED = "UPDATE users SET is_blocked = ? WHERE telegram_id = ?"
+SQL_USER_MARK_PROMO_USED = "UPDATE users SET promo_code_usage = 1 WHERE id = ? AND promo_code_usage = 0"
+SQL_USER_APPLY_PROMO = """
+    UPDATE users
+    SET promo_code = ?, promo_code_usage = 0, subscription_end = ?, subscription_active = 1
+    WHERE telegram_id = ?
+"""
+SQL_USER_SET_NOTIFIED = {
+    "notified_after_3_days": "UPDATE users SET notified_after_3_days = 1 WHERE telegram_id = ?",
+    "notified_after_7_days": "UPDATE users SET notified_after_7_days = 1 WHERE telegram_id = ?",
+}
+
+
+class UserRepo(_Repo):
+    __slots__ = ()
+
+    async def get(self, telegram_id) -> UserRow | None:
+        return UserRow.from_row(await self._one(SQL_USER_BY_TG, (telegram_id,)))
+
+    async def get_id(self, telegram_id) -> int | None:
+        return await self._scalar(SQL_USER_ID_BY_TG, (telegram_id,))
+
+    async def get_or_create_id(self, telegram_id) -> int:
+        user_id = await self.get_id(telegram_id)
+        if user_id is not None:
+            return user_id
+        cursor = await self.conn.execute(SQL_USER_INSERT_TG, (telegram_id,))
+        user_id = cursor.lastrowid
+        await cursor.close()
+        return user_id
+
+    async def telegram_id_by_referral_code(self, referral_code) -> int | None:
+        return await self._scalar(SQL_USER_TG_BY_REFERRAL_CODE, (referral_code,))
+
+    async def register(self, telegram_id, username, telegram_link, referral_code,
+                       referred_by, referrer_code, entry_date, is_blocked):
+        await self._write(SQL_USER_REGISTER, (
+            telegram_id, username, telegram_link, referral_code,
+            referred_by, referrer_code, entry_date, is_blocked
+        ))
+
+    async def touch(self, telegram_id, username, telegram_link, entry_date):
+        await self._write(SQL_USER_TOUCH, (username, telegram_link, entry_date, telegram_id))
+
+    async def set_referral_code(self, telegram_id, referral_code):
+        await self._write(SQL_USER_SET_REFERRAL_CODE, (referral_code, telegram_id))
+
+    async def mark_trial_used(self, telegram_id) -> bool:
+        """Ставит has_trial = 1. False — пользователя нет или пробный период уже был."""
+        return await self._write(SQL_USER_MARK_TRIAL, (telegram_id,)) > 0
+
+    async def mark_trial_seven_used(self, telegram_id):
+        await self._write(SQL_USER_MARK_TRIAL_SEVEN, (telegram_id,))
+
+    async def add_sum_my(self, telegram_id, amount):
+        await self._write(SQL_USER_ADD_SUM_MY, (amount, telegram_id))
+
+    async def add_sum_ref(self, telegram_id, amount):
+        await self._write(SQL_USER_ADD_SUM_REF, (amount, telegram_id))
+
+    async def reset_sum_ref(self, telegram_id):
+        await self._write(SQL_USER_RESET_SUM_REF, (telegram_id,))
+
+    async def add_free_days(self, telegram_id, days):
+        await self._write(SQL_USER_ADD_FREE_DAYS, (days, telegram_id))
+
+    async def set_free_days(self, telegram_id, days):
+        await self._write(SQL_USER_SET_FREE_DAYS, (days, telegram_id))
+
+    async def increment_referral_count(self, user_id):
+        await self._write(SQL_USER_INC_REFERRAL_COUNT, (user_id,))
+
+    async def set_blocked(self, telegram_id, blocked: bool) -> bool:
+        return await self._write(SQL_USER_SET_BLOCKED, (1 if blocked else 0, telegram_id)) > 0
+
+    async def mark_promo_used(self, user_id) -> bool:
+        """Помечает промокод пользователя использованным. False — уже был использован."""
+        return await self._write(SQL_USER_MARK_PROMO_USED, (user_id,)) > 0
+
+    async def apply_promo(self, telegram_id, promo_code, subscription_end):
+        await self._write(SQL_USER_APPLY_PROMO, (promo_code, subscription_end, telegram_id))
+
+    async def set_notified(self, telegram_id, column):
+        query = SQL_USER_SET_NOTIFIED.get(column)
+        if query is None:
+            raise ValueError(f"Неизвестный флаг уведомления: {column}")
+        await self._write(query, (telegram_id,))
+
+
+# --- user_emails / user_configs -----------------------------------------
+
+# user_configs.expires_at — expiryTime клиента из панели в миллисекундах:
+# > 0 — момент окончания, <= 0 — срок не задан, NULL — еще не получен с сервера.
+DAY_MS = 24 * 60 * 60 * 1000
+
+
+def day_start_ms(offset_days=0):
+    """Локальная полночь дня (сегодня + offset_days) в миллисекундах."""
+    midnight = datetime.combine(date.today() + timedelta(days=offset_days), time.min)
+    return int(midnight.timestamp() * 1000)
+
+
+def days_left_from_expiry(expires_at):
+    """
+    Сколько дней осталось до окончания подписки (разница календарных дат).
+    Для подписки без срока возвращает -1, как раньше хранилось в days_left.
+    """
+    if expires_at is None:
+        return None
+    if expires_at <= 0:
+        return -1
+    return (datetime.fromtimestamp(expires_at / 1000).date() - date.today()).days
+
+
+SQL_EMAILS_BY_TG = """
+    SELECT ue.email FROM user_emails ue
+    JOIN users u ON u.id = ue.user_id
+    WHERE u.telegram_id = ?
+"""
+SQL_SUBSCRIPTIONS_BY_TG = """
+    SELECT ue.user_id, ue.email, ue.id_server FROM user_emails ue
+    JOIN users u ON u.id = ue.user_id
+    WHERE u.telegram_id = ?
+"""
+SQL_SUBSCRIPTIONS_BY_EMAIL = "SELECT user_id, email, id_server FROM user_emails WHERE email = ?"
+SQL_SUBSCRIPTION_LINK = """
+    INSERT INTO user_emails (user_id, email, id_server, telegram_id)
+    SELECT ?, ?, ?, telegram_id
+    FROM users
+    WHERE id = ?
+      AND NOT EXISTS (
+          SELECT 1 FROM user_emails WHERE user_id = ? AND email = ? AND id_server = ?
+      )
+"""
+SQL_SUBSCRIPTION_LOCATIONS = "SELECT email, id_server FROM user_emails"
+SQL_SUBSCRIPTION_MOVE = "UPDATE user_emails SET id_server = ? WHERE email = ?"
+SQL_SUBSCRIPTION_DELETE = "DELETE FROM user_emails WHERE email = ?"
+SQL_CONFIG_UPSERT = """
+    INSERT INTO user_configs (email, config) VALUES (?, ?)
+    ON CONFLICT(email) DO UPDATE SET config = excluded.config
+"""
+SQL_CONFIG_BY_EMAIL = "SELECT config, expires_at FROM user_configs WHERE email = ?"
+SQL_CONFIG_EXPIRES_AT = "SELECT expires_at FROM user_configs WHERE email = ?"
+SQL_CONFIG_ALL_EXPIRES_AT = "SELECT email, expires_at FROM user_configs"
+# Строка не перезаписывается, если срок не изменился
+SQL_CONFIG_SET_EXPIRES_AT = "UPDATE user_configs SET expires_at = ? WHERE email = ? AND expires_at IS NOT ?"
+SQL_CONFIG_ADD_DAYS = "UPDATE user_configs SET expires_at = expires_at + ? WHERE email = ? AND expires_at > 0"
+SQL_CONFIG_EXPIRING = """
+    SELECT uc.email, uc.expires_at, u.telegram_id, u.notified_after_3_days, u.notified_after_7_days
+    FROM user_configs uc
+    JOIN user_emails ue ON uc.email = ue.email
+    JOIN users u ON ue.user_id = u.id
+    WHERE uc.expires_at >= ? AND uc.expires_at < ?
+      AND u.telegram_id IS NOT NULL
+"""
+SQL_CONFIG_EXPIRED_TG = """
+    SELECT DISTINCT u.telegram_id
+    FROM user_configs uc
+    JOIN user_emails ue ON uc.email = ue.email
+    JOIN users u ON ue.user_id = u.id
+    WHERE uc.expires_at > 0 AND uc.expires_at < ?
+"""
+
+
+class SubscriptionRepo(_Repo):
+    __slots__ = ()
+
+    async def emails(self, telegram_id) -> list[str]:
+        return [row[0] for row in await self._all(SQL_EMAILS_BY_TG, (telegram_id,))]
+
+    async def by_telegram_id(self, telegram_id) -> list[SubscriptionRow]:
+        return [SubscriptionRow(*row) for row in await self._all(SQL_SUBSCRIPTIONS_BY_TG, (telegram_id,))]
+
+    async def by_email(self, email) -> list[SubscriptionRow]:
+        return [SubscriptionRow(*row) for row in await self._all(SQL_SUBSCRIPTIONS_BY_EMAIL, (email,))]
+
+    async def locations(self):
+        """Пары (email, id_server) всех логинов."""
+        return await self._all(SQL_SUBSCRIPTION_LOCATIONS)
+
+    async def link(self, user_id, email, server_id) -> bool:
+        """Привязывает логин к пользователю и серверу, если такой записи еще нет."""
+        return await self._write(
+            SQL_SUBSCRIPTION_LINK,
+            (user_id, email, server_id, user_id, user_id, email, server_id)
+        ) > 0
+
+    async def move(self, email, server_id):
+        await self._write(SQL_SUBSCRIPTION_MOVE, (server_id, email))
+
+    async def delete_emails(self, emails):
+        await self.conn.executemany(SQL_SUBSCRIPTION_DELETE, [(email,) for email in emails])
+
+    async def save_config(self, email, config):
+        await self._write(SQL_CONFIG_UPSERT, (email, config))
+
+    async def config(self, email):
+        """(config, expires_at) логина или None."""
+        return await self._one(SQL_CONFIG_BY_EMAIL, (email,))
+
+    async def expires_at(self, email) -> int | None:
+        return await self._scalar(SQL_CONFIG_EXPIRES_AT, (email,))
+
+    async def all_expires_at(self) -> dict:
+        """Сроки всех логинов: {email: expires_at}."""
+        return dict(await self._all(SQL_CONFIG_ALL_EXPIRES_AT))
+
+    async def days_left(self, email) -> int | None:
+        return days_left_from_expiry(await self.expires_at(email))
+
+    async def set_expires_at(self, email, expires_at) -> bool:
+        """Записывает срок подписки; возвращает False, если он не изменился."""
+        return await self._write(SQL_CONFIG_SET_EXPIRES_AT, (expires_at, email, expires_at)) > 0
+
+    async def add_days(self, email, days):
+        """Сдвигает срок подписки на days дней (подписки без срока не меняются)."""
+        await self._write(SQL_CONFIG_ADD_DAYS, (days * DAY_MS, email))
+
+    async def expiring(self, from_day, to_day) -> list[ExpiringRow]:
+        """
+        Подписки, которые заканчиваются в дни [сегодня + from_day, сегодня + to_day],
+        вместе с telegram_id и флагами уведомлений владельца. Диапазон по индексу expires_at.
+        """
+        rows = await self._all(SQL_CONFIG_EXPIRING, (day_start_ms(from_day), day_start_ms(to_day + 1)))
+        return [ExpiringRow(*row) for row in rows]
+
+    async def expired_telegram_ids(self) -> list[int]:
+        """telegram_id пользователей, у которых хотя бы одна подписка закончилась (days_left <= 0)."""
+        return [row[0] for row in await self._all(SQL_CONFIG_EXPIRED_TG, (day_start_ms(1),))]
+
+
+# --- promo_codes / used_promo_codes -------------------------------------
+
+SQL_PROMO_BY_CODE = "SELECT id, code, discount, days, is_active FROM promo_codes WHERE code = ?"
+SQL_PROMO_ACTIVE_DISCOUNT = "SELECT discount FROM promo_codes WHERE code = ? AND is_active = 1"
+SQL_PROMO_LIST_ACTIVE = "SELECT id, code, discount, days, is_active FROM promo_codes WHERE is_active = 1"
+SQL_PROMO_ADD = "INSERT INTO promo_codes (code, discount, days, is_active) VALUES (?, ?, ?, 1)"
+SQL_PROMO_DELETE = "DELETE FROM promo_codes WHERE code = ?"
+SQL_PROMO_USED_COUNT = """
+    SELECT COUNT(*) FROM used_promo_codes
+    WHERE user_id = (SELECT id FROM users WHERE telegram_id = ?) AND promo_code = ?
+"""
+SQL_PROMO_RECORD_USE = """
+    INSERT INTO used_promo_codes (user_id, promo_code)
+    VALUES ((SELECT id FROM users WHERE telegram_id = ?), ?)
+"""
+
+
+class PromoRepo(_Repo):
+    __slots__ = ()
+
+    async def get(self, code) -> PromoRow | None:
+        return PromoRow.from_row(await self._one(SQL_PROMO_BY_CODE, (code,)))
+
+    async def active_discount(self, code) -> int | None:
+        return await self._scalar(SQL_PROMO_ACTIVE_DISCOUNT, (code,))
+
+    async def list_active(self) -> list[PromoRow]:
+        return [PromoRow(*row) for row in await self._all(SQL_PROMO_LIST_ACTIVE)]
+
+    async def add(self, code, discount, days):
+        await self._write(SQL_PROMO_ADD, (code, discount, days))
+
+    async def delete(self, code):
+        await self._write(SQL_PROMO_DELETE, (code,))
+
+    async def used_count(self, telegram_id, code) -> int:
+        return await self._scalar(SQL_PROMO_USED_COUNT, (telegram_id, code), default=0)
+
+    async def record_use(self, telegram_id, code):
+        await self._write(SQL_PROMO_RECORD_USE, (telegram_id, code))
+
+
+# --- referals / referral_links / referal_tables --------------------------
+
+SQL_REFERRAL_CODE_BY_TG = "SELECT referral_code FROM users WHERE telegram_id = ?"
+SQL_REFERRAL_LINK_ADD = "INSERT INTO referral_links (referrer_code, invited_user_id) VALUES (?, ?)"
+SQL_REFERRAL_INFO = "SELECT name, code, clicks FROM referals WHERE code = ?"
+SQL_REFERRAL_CLICK = "UPDATE referals SET clicks = clicks + 1 WHERE code = ?"
+SQL_REFERRAL_ADD_AMOUNT = "UPDATE referals SET amount = amount + ? WHERE code = ?"
+SQL_REFERRAL_CREATE = "INSERT INTO referals (user_id, name, code) VALUES (?, ?, ?)"
+SQL_REFERRAL_LIST_BY_OWNER = "SELECT name, code, clicks FROM referals WHERE user_id = ?"
+SQL_REFERRAL_SYNC_AMOUNTS = """
+    UPDATE referals
+    SET amount = (
+        SELECT COALESCE(SUM(u.sum_my), 0)
+        FROM referral_links rl
+        JOIN users u ON rl.invited_user_id = u.telegram_id
+        WHERE rl.referrer_code = referals.code
+    )
+"""
+SQL_REFERRAL_SYNC_AMOUNTS_FOR_INVITED = """
+    UPDATE referals
+    SET amount = (
+        SELECT COALESCE(SUM(u.sum_my), 0)
+        FROM referral_links rl
+        JOIN users u ON rl.invited_user_id = u.telegram_id
+        WHERE rl.referrer_code = referals.code
+    )
+    WHERE code IN (SELECT referrer_code FROM referral_links WHERE invited_user_id = ?)
+"""
+SQL_TICKET_ADD = "INSERT INTO referal_tables (telegram_user) VALUES (?)"
+SQL_TICKET_COUNTS = """
+    SELECT telegram_user, COUNT(*) as count
+    FROM referal_tables
+    GROUP BY telegram_user
+"""
+SQL_TICKET_DELETE_ONE = """
+    DELETE FROM referal_tables
+    WHERE id IN (
+        SELECT id FROM referal_tables
+        WHERE telegram_user = ?
+        LIMIT 1
+    )
+"""
+
+
+class ReferralRepo(_Repo):
+    __slots__ = ()
+
+    async def referral_code(self, telegram_id) -> str | None:
+        return await self._scalar(SQL_REFERRAL_CODE_BY_TG, (telegram_id,))
+
+    async def add_link(self, referrer_code, invited_user_id):
+        await self._write(SQL_REFERRAL_LINK_ADD, (referrer_code, invited_user_id))
+
+    async def info(self, code) -> ReferralRow | None:
+        return ReferralRow.from_row(await self._one(SQL_REFERRAL_INFO, (code,)))
+
+    async def list_by_owner(self, user_id) -> list[ReferralRow]:
+        return [ReferralRow(*row) for row in await self._all(SQL_REFERRAL_LIST_BY_OWNER, (user_id,))]
+
+    async def create(self, user_id, name, code):
+        await self._write(SQL_REFERRAL_CREATE, (user_id, name, code))
+
+    async def increment_clicks(self, code):
+        await self._write(SQL_REFERRAL_CLICK, (code,))
+
+    async def add_amount(self, code, amount):
+        await self._write(SQL_REFERRAL_ADD_AMOUNT, (amount, code))
+
+    async def sync_amounts(self):
+        """Пересчитывает суммы покупок приглашенных по всем реферальным ссылкам."""
+        await self._write(SQL_REFERRAL_SYNC_AMOUNTS)
+
+    async def sync_amounts_for(self, invited_user_id):
+        """Пересчитывает суммы только по ссылкам, по которым пришел этот пользователь."""
+        await self._write(SQL_REFERRAL_SYNC_AMOUNTS_FOR_INVITED, (invited_user_id,))
+
+    async def add_tickets(self, telegram_users):
+        await self.conn.executemany(SQL_TICKET_ADD, [(user,) for user in telegram_users])
+
+    async def ticket_counts(self):
+        return await self._all(SQL_TICKET_COUNTS)
+
+    async def delete_one_ticket(self, telegram_user):
+        await self._write(SQL_TICKET_DELETE_ONE, (telegram_user,))
+
+
+# --- servers.db ---------------------------------------------------------
+
+_SERVER_COLUMNS = ", ".join(ServerRow.__slots__)
+SQL_SERVER_BY_ID = f"SELECT {_SERVER_COLUMNS} FROM servers WHERE id = ?"
+SQL_SERVER_ALL = f"SELECT {_SERVER_COLUMNS} FROM servers ORDER BY id ASC"
+SQL_SERVER_NAMES = "SELECT id, name FROM servers"
+SQL_SERVER_IDS = "SELECT id FROM servers ORDER BY id ASC"
+SQL_SERVER_INSERT = f"INSERT INTO servers ({_SERVER_COLUMNS}) VALUES ({', '.join('?' * len(ServerRow.__slots__))})"
+SQL_SERVER_DELETE = "DELETE FROM servers WHERE id = ?"
+SQL_SERVER_UPDATE_FIELD = {
+    field: f"UPDATE servers SET {field} = ? WHERE id = ?"
+    for field in ServerRow.__slots__ if field != "id"
+}
+SQL_SERVER_IDS_LATEST = "SELECT server_ids FROM server_ids ORDER BY id DESC LIMIT 1"
+SQL_SERVER_IDS_COUNT = "SELECT COUNT(*) FROM server_ids"
+SQL_SERVER_IDS_INSERT = "INSERT INTO server_ids (server_ids) VALUES (?)"
+SQL_SERVER_IDS_UPDATE = "UPDATE server_ids SET server_ids = ?"
+SQL_GROUP_SERVER_IDS = "SELECT server_ids FROM server_groups WHERE group_name = ?"
+SQL_GROUP_ALL = "SELECT group_name, server_ids, strategy FROM server_groups"
+SQL_GROUP_STRATEGY = "SELECT strategy FROM server_groups WHERE group_name = ?"
+SQL_GROUP_UPSERT = "INSERT OR REPLACE INTO server_groups (group_name, server_ids, strategy) VALUES (?, ?, ?)"
+SQL_GROUP_DELETE = "DELETE FROM server_groups WHERE group_name = ?"
+
+
+class ServerRepo(_Repo):
+    __slots__ = ()
+
+    async def get(self, server_id) -> ServerRow | None:
+        return ServerRow.from_row(await self._one(SQL_SERVER_BY_ID, (server_id,)))
+
+    async def all(self) -> list[ServerRow]:
+        return [ServerRow(*row) for row in await self._all(SQL_SERVER_ALL)]
+
+    async def names(self):
+        return await self._all(SQL_SERVER_NAMES)
+
+    async def ids(self) -> list[int]:
+        return [row[0] for row in await self._all(SQL_SERVER_IDS)]
+
+    async def add(self, server: ServerRow):
+        await self._write(SQL_SERVER_INSERT, tuple(getattr(server, name) for name in ServerRow.__slots__))
+
+    async def update_field(self, server_id, field, value) -> bool:
+        query = SQL_SERVER_UPDATE_FIELD.get(field)
+        if query is None:
+            raise ValueError(f"Неизвестный параметр сервера: {field}")
+        return await self._write(query, (value, server_id)) > 0
+
+    async def delete(self, server_id) -> bool:
+        return await self._write(SQL_SERVER_DELETE, (server_id,)) > 0
+
+    async def active_server_ids(self) -> list[str]:
+        """Список из последней записи таблицы server_ids."""
+        value = await self._scalar(SQL_SERVER_IDS_LATEST)
+        return value.split(",") if value else []
+
+    async def set_active_server_ids(self, server_ids):
+        value = ",".join(map(str, server_ids))
+        if await self._scalar(SQL_SERVER_IDS_COUNT, default=0) == 0:
+            await self._write(SQL_SERVER_IDS_INSERT, (value,))
+        else:
+            await self._write(SQL_SERVER_IDS_UPDATE, (value,))
+
+    async def group_server_ids(self, group_name) -> str | None:
+        return await self._scalar(SQL_GROUP_SERVER_IDS, (group_name,))
+
+    async def groups(self):
+        return await self._all(SQL_GROUP_ALL)
+
+    async def group_strategy(self, group_name) -> str | None:
+        """Стратегия балансировки группы (handlers/balancing.py) или None."""
+        return await self._scalar(SQL_GROUP_STRATEGY, (group_name,))
+
+    async def upsert_group(self, group_name, server_ids, strategy=None):
+        await self._write(SQL_GROUP_UPSERT, (group_name, server_ids, strategy))
+
+    async def delete_group(self, group_name):
+        await self._write(SQL_GROUP_DELETE, (group_name,))
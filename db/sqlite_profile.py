@@ -0,0 +1,59 @@
+"""
+Профиль хранения SQLite для users.db и servers.db.
+
+WAL позволяет читателям работать параллельно с писателем (ночная синхронизация
+больше не блокирует меню и расчет цен), synchronous=NORMAL убирает fsync на
+каждый коммит, busy_timeout заменяет мгновенное "database is locked" ожиданием.
+
+journal_mode сохраняется в самом файле базы и применяется один раз при старте,
+остальные PRAGMA действуют только на текущее подключение, поэтому пул
+выставляет их для каждого нового подключения.
+"""
+
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_JOURNAL_MODE = os.getenv("DB_JOURNAL_MODE", "WAL")
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+# Отрицательное значение cache_size задается в килобайтах
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "16384"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+# Порог размера WAL, после которого чекпоинт делается с усечением файла
+DB_WAL_TRUNCATE_BYTES = int(os.getenv("DB_WAL_TRUNCATE_BYTES", str(64 * 1024 * 1024)))
+
+CONNECTION_PRAGMAS = (
+    f"PRAGMA synchronous = {DB_SYNCHRONOUS}",
+    f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}",
+    f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}",
+    f"PRAGMA mmap_size = {DB_MMAP_SIZE}",
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+def apply_storage_profile(connection):
+    """
+    Переводит базу в режим журнала из профиля и настраивает подключение.
+    Вызывается при старте из setup_tables / setup_tables_serv (sqlite3).
+    Возвращает фактический режим журнала.
+    """
+    journal_mode = connection.execute(f"PRAGMA journal_mode = {DB_JOURNAL_MODE}").fetchone()[0]
+    for pragma in CONNECTION_PRAGMAS:
+        connection.execute(pragma)
+    return journal_mode
+
+
+async def apply_connection_pragmas(conn):
+    """Настраивает новое подключение aiosqlite из пула."""
+    for pragma in CONNECTION_PRAGMAS:
+        await conn.execute(pragma)
+
+
+def wal_size(db_path):
+    """Размер файла -wal в байтах (0, если файла нет)."""
+    try:
+        return os.path.getsize(f"{db_path}-wal")
+    except OSError:
+        return 0
@@ -0,0 +1,150 @@
+"""
+Хранилища баз данных.
+
+Пулы подключений, писатель и репозитории не открывают файлы напрямую, а берут
+подключения у хранилища, выбранного переменной DB_BACKEND:
+
+- sqlite — файл базы на диске (по умолчанию, рабочий режим бота);
+- memory — база SQLite в памяти процесса (тесты и бенчмарки: та же схема и
+  тот же SQL из db/repo.py, но без диска, поэтому стоимость запросов к базе
+  можно отделить от стоимости запросов к панели).
+
+Хранилище выдается по пути базы через `get_storage(USERSDATABASE)`, поэтому
+код, который знает только путь (Database, ServerDatabase, пулы), работает с
+любым хранилищем. Новое хранилище (например, клиент-серверная база) —
+это подкласс StorageBackend, зарегистрированный в BACKENDS.
+"""
+
+import os
+import sqlite3
+
+import aiosqlite
+from dotenv import load_dotenv
+
+from log import logger
+from db.sqlite_profile import apply_storage_profile, apply_connection_pragmas
+
+load_dotenv()
+
+DB_BACKEND = os.getenv("DB_BACKEND", "sqlite").lower()
+# Сколько подготовленных выражений драйвер держит в кэше на каждое подключение.
+# Запросы из db/repo.py — постоянные строки, поэтому повторно не компилируются.
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", "256"))
+
+
+class StorageBackend:
+    """
+    Интерфейс хранилища.
+
+    connect()      — новое асинхронное подключение для пула и писателя;
+    connect_sync() — блокирующее подключение sqlite3 для миграций при старте;
+    path           — файл базы на диске или None, если файла нет
+                     (чекпоинт WAL и бекапы такие хранилища пропускают).
+    """
+    name = None
+
+    def __init__(self, location):
+        self.location = location
+
+    @property
+    def path(self):
+        return None
+
+    async def connect(self, isolation_level=""):
+        raise NotImplementedError
+
+    def connect_sync(self):
+        raise NotImplementedError
+
+    def prepare(self, connection):
+        """Настраивает базу при старте; возвращает режим журнала для лога."""
+        return connection.execute("PRAGMA journal_mode").fetchone()[0]
+
+    def close(self):
+        pass
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.location!r})"
+
+
+class SQLiteStorage(StorageBackend):
+    """Файл SQLite на диске с профилем хранения из db/sqlite_profile.py."""
+    name = "sqlite"
+
+    @property
+    def path(self):
+        return self.location
+
+    async def connect(self, isolation_level=""):
+        conn = await aiosqlite.connect(
+            self.location, timeout=30, cached_statements=DB_STATEMENT_CACHE,
+            isolation_level=isolation_level
+        )
+        await apply_connection_pragmas(conn)
+        return conn
+
+    def connect_sync(self):
+        return sqlite3.connect(self.location)
+
+    def prepare(self, connection):
+        return apply_storage_profile(connection)
+
+
+class MemoryStorage(StorageBackend):
+    """
+    База SQLite в памяти процесса (VFS memdb).
+
+    Все подключения к одному имени видят одну и ту же базу. Пока хранилище не
+    закрыто, оно держит собственное подключение, чтобы база не исчезла, когда
+    пул закроет свои.
+    """
+    name = "memory"
+
+    def __init__(self, location):
+        super().__init__(location)
+        db_name = os.path.splitext(os.path.basename(location))[0] or "db"
+        self.uri = f"file:/{db_name}?vfs=memdb"
+        self._anchor = None
+
+    def _keep_alive(self):
+        if self._anchor is None:
+            self._anchor = sqlite3.connect(self.uri, uri=True)
+            logger.info(f"🧠 База {self.location} открыта в памяти ({self.uri})")
+
+    async def connect(self, isolation_level=""):
+        self._keep_alive()
+        conn = await aiosqlite.connect(
+            self.uri, uri=True, timeout=30, cached_statements=DB_STATEMENT_CACHE,
+            isolation_level=isolation_level
+        )
+        await apply_connection_pragmas(conn)
+        return conn
+
+    def connect_sync(self):
+        self._keep_alive()
+        return sqlite3.connect(self.uri, uri=True)
+
+    def close(self):
+        """Удаляет базу из памяти (после закрытия всех подключений к ней)."""
+        if self._anchor is not None:
+            self._anchor.close()
+            self._anchor = None
+
+
+BACKENDS = {
+    SQLiteStorage.name: SQLiteStorage,
+    MemoryStorage.name: MemoryStorage,
+}
+
+_storages = {}
+
+
+def get_storage(location, backend=None) -> StorageBackend:
+    """Хранилище для базы location (путь из USERSDATABASE / SERVEDATABASE)."""
+    storage = _storages.get(location)
+    if storage is None:
+        backend = (backend or DB_BACKEND).lower()
+        if backend not in BACKENDS:
+            raise ValueError(f"Неизвестное хранилище DB_BACKEND={backend}, доступны: {', '.join(BACKENDS)}")
+        storage = _storages[location] = BACKENDS[backend](location)
+    return storage
@@ -0,0 +1,212 @@
+"""
+Единственный писатель для users.db.
+
+Записи из обработчиков (суммы покупок, бесплатные дни, флаги уведомлений,
+days_left, регистрация) не открывают каждая свою транзакцию, а ставятся в
+очередь. Фоновая задача забирает из очереди все, что накопилось за
+DB_WRITE_BATCH_MS, и выполняет пачку одной транзакцией (BEGIN IMMEDIATE …
+COMMIT), поэтому писатели не дерутся за блокировку базы.
+
+Операция — корутина `operation(conn, *args)`, которая пишет через переданное
+подключение (обычно через репозитории из db/repo.py) и НЕ вызывает commit.
+Каждая операция выполняется внутри своего SAVEPOINT: ошибка одной операции
+откатывает только ее, остальные операции пачки фиксируются.
+
+    await users_writer.submit(_add_sum_my, telegram_id, amount)
+
+`submit` возвращает результат операции после COMMIT, то есть когда изменения
+уже записаны на диск. `enqueue` возвращает future, если ждать не нужно.
+"""
+
+import asyncio
+import os
+import time
+
+from dotenv import load_dotenv
+
+from log import logger
+from db.pool import ConnectionPool, USERSDATABASE
+
+load_dotenv()
+
+# Сколько миллисекунд копить операции перед коммитом и сколько максимум в одной пачке
+DB_WRITE_BATCH_MS = float(os.getenv("DB_WRITE_BATCH_MS", "5"))
+DB_WRITE_BATCH_MAX = int(os.getenv("DB_WRITE_BATCH_MAX", "200"))
+# Ограничение очереди: при переполнении submit ждет, пока писатель разгрузится
+DB_WRITE_QUEUE_SIZE = int(os.getenv("DB_WRITE_QUEUE_SIZE", "10000"))
+
+_STOP = object()
+
+
+class WriteQueue:
+    def __init__(self, db_path, batch_ms=DB_WRITE_BATCH_MS, batch_max=DB_WRITE_BATCH_MAX,
+                 queue_size=DB_WRITE_QUEUE_SIZE):
+        self.db_path = db_path
+        self.batch_ms = batch_ms
+        self.batch_max = batch_max
+        self.queue_size = queue_size
+        # Писатель держит собственное подключение, не занимая место в общем пуле
+        self._pool = ConnectionPool(db_path, size=1, isolation_level=None)
+        self._queue = None
+        self._task = None
+        # Метрики
+        self._batches = 0
+        self._operations = 0
+        self._failed = 0
+        self._commit_ms_last = 0.0
+        self._commit_ms_total = 0.0
+        self._commit_ms_max = 0.0
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        """Запускает фоновую задачу писателя. Повторный вызов ничего не делает."""
+        if self.running:
+            return
+        await self._pool.open()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"✍️ Писатель {self.db_path} запущен (пачка до {self.batch_max} операций / {self.batch_ms} мс)")
+
+    async def stop(self):
+        """Дописывает все, что уже в очереди, и останавливает писателя."""
+        if not self.running:
+            # Подключение могли открыть записи без запущенного писателя
+            await self._pool.close()
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+        await self._pool.close()
+        logger.info(f"✍️ Писатель {self.db_path} остановлен. {self._format_stats()}")
+
+    def enqueue(self, operation, *args):
+        """
+        Ставит операцию в очередь и возвращает future с ее результатом.
+        Future завершается после COMMIT пачки, в которую попала операция.
+        """
+        return asyncio.ensure_future(self.submit(operation, *args))
+
+    async def submit(self, operation, *args):
+        """Выполняет операцию в очереди писателя и возвращает ее результат после COMMIT."""
+        future = asyncio.get_running_loop().create_future()
+        if not self.running:
+            # Писатель не запущен (скрипты, бенчмарки) — пишем сразу, пачкой
+            # из одной операции через подключение писателя к его базе
+            await self._commit_batch([(operation, args, future)])
+        else:
+            await self._queue.put((operation, args, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            item = await self._queue.get()
+            if item is _STOP:
+                return
+            # Даем соседним запросам несколько миллисекунд, чтобы попасть в ту же пачку
+            await asyncio.sleep(self.batch_ms / 1000)
+            batch = [item]
+            stop = False
+            while len(batch) < self.batch_max and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+
+            await self._commit_batch(batch)
+            if stop:
+                # Все, что поставили после сигнала остановки, тоже дописываем
+                while not self._queue.empty():
+                    item = self._queue.get_nowait()
+                    if item is not _STOP:
+                        await self._commit_batch([item])
+                return
+
+    async def _commit_batch(self, batch):
+        outcomes = []
+        started = time.monotonic()
+        try:
+            async with self._pool.acquire() as conn:
+                await conn.execute("BEGIN IMMEDIATE")
+                try:
+                    for operation, args, future in batch:
+                        await conn.execute("SAVEPOINT write_op")
+                        try:
+                            result = await operation(conn, *args)
+                            await conn.execute("RELEASE write_op")
+                            outcomes.append((future, result, None))
+                        except Exception as e:
+                            await conn.execute("ROLLBACK TO write_op")
+                            await conn.execute("RELEASE write_op")
+                            outcomes.append((future, None, e))
+                    await conn.execute("COMMIT")
+                except BaseException:
+                    if conn.in_transaction:
+                        await conn.execute("ROLLBACK")
+                    raise
+        except Exception as e:
+            logger.error(f"❌ Пачка из {len(batch)} записей в {self.db_path} не зафиксирована: {e}")
+            self._failed += len(batch)
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        commit_ms = (time.monotonic() - started) * 1000
+        self._batches += 1
+        self._operations += len(batch)
+        self._commit_ms_last = commit_ms
+        self._commit_ms_total += commit_ms
+        self._commit_ms_max = max(self._commit_ms_max, commit_ms)
+
+        for future, result, error in outcomes:
+            if future.done():
+                continue
+            if error is not None:
+                self._failed += 1
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def stats(self):
+        """Глубина очереди и задержка коммита для логов и админки."""
+        return {
+            "db_path": self.db_path,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self._batches,
+            "operations": self._operations,
+            "failed": self._failed,
+            "avg_batch": round(self._operations / self._batches, 1) if self._batches else 0,
+            "commit_ms_last": round(self._commit_ms_last, 2),
+            "commit_ms_avg": round(self._commit_ms_total / self._batches, 2) if self._batches else 0,
+            "commit_ms_max": round(self._commit_ms_max, 2),
+        }
+
+    def _format_stats(self):
+        s = self.stats()
+        return (
+            f"очередь: {s['queue_depth']}, пачек: {s['batches']}, операций: {s['operations']} "
+            f"(в среднем {s['avg_batch']} за коммит), ошибок: {s['failed']}, "
+            f"коммит: {s['commit_ms_last']} мс / ср. {s['commit_ms_avg']} мс / макс. {s['commit_ms_max']} мс"
+        )
+
+
+users_writer = WriteQueue(USERSDATABASE)
+
+
+async def start_writer():
+    """Запускает писателя users.db."""
+    await users_writer.start()
+
+
+async def stop_writer():
+    """Останавливает писателя, дописав очередь."""
+    await users_writer.stop()
+
+
+async def log_writer_stats():
+    """Периодически пишет в лог метрики очереди записи."""
+    logger.info(f"✍️ Писатель {users_writer.db_path}: {users_writer._format_stats()}")
@@ -0,0 +1,125 @@
+"""
+Стратегии распределения новых клиентов по серверам группы и по inbounds
+сервера.
+
+Стратегия получает список кандидатов (Candidate: занято, всего мест,
+задержка панели) и возвращает выбранного или None, если мест нет нигде.
+Кандидатов строит учет мест (handlers/capacity.py), так что выбор не ходит
+в панели:
+
+- most_free — больше всего свободных мест (прежнее поведение);
+- weighted — случайно, с вероятностью пропорционально свободным местам;
+- p2c — «сила двух выборов»: два случайных кандидата, из них менее
+  заполненный; устойчиво к устаревшим счетчикам при всплесках регистраций;
+- latency — наименьшая заполненность (с учетом нового клиента) с поправкой
+  на задержку ответа панели и на полуоткрытый предохранитель.
+
+Стратегия задается для группы в server_groups.strategy, по умолчанию —
+BALANCING_STRATEGY; inbound на сервере выбирает INBOUND_BALANCING_STRATEGY.
+"""
+
+import os
+import random
+
+from dotenv import load_dotenv
+
+from log import logger
+
+load_dotenv()
+
+BALANCING_STRATEGY = os.getenv("BALANCING_STRATEGY", "most_free")
+INBOUND_BALANCING_STRATEGY = os.getenv("INBOUND_BALANCING_STRATEGY", "most_free")
+# Задержка панели (сек), при которой сервер считается вдвое более загруженным
+BALANCING_LATENCY_REF = float(os.getenv("BALANCING_LATENCY_REF", "0.5"))
+
+
+class Candidate:
+    """Сервер или inbound, на который можно поставить клиента."""
+    __slots__ = ("id", "occupied", "total", "latency", "half_open")
+
+    def __init__(self, id, occupied, total, latency=None, half_open=False):
+        self.id = id
+        self.occupied = occupied
+        self.total = total
+        self.latency = latency  # сек, скользящее среднее ответов панели
+        self.half_open = half_open
+
+    @property
+    def free(self) -> int:
+        return max(0, self.total - self.occupied)
+
+    @property
+    def utilization(self) -> float:
+        return self.occupied / self.total if self.total > 0 else 1.0
+
+    def __repr__(self):
+        return f"Candidate(id={self.id}, occupied={self.occupied}, total={self.total})"
+
+
+class Strategy:
+    name = None
+
+    def choose(self, candidates: list[Candidate], rng=random) -> Candidate | None:
+        available = [candidate for candidate in candidates if candidate.free > 0]
+        if not available:
+            return None
+        return self._choose(available, rng)
+
+    def _choose(self, available, rng):
+        raise NotImplementedError
+
+
+class MostFree(Strategy):
+    name = "most_free"
+
+    def _choose(self, available, rng):
+        return max(available, key=lambda candidate: candidate.free)
+
+
+class WeightedByCapacity(Strategy):
+    name = "weighted"
+
+    def _choose(self, available, rng):
+        return rng.choices(available, weights=[candidate.free for candidate in available])[0]
+
+
+class PowerOfTwoChoices(Strategy):
+    name = "p2c"
+
+    def _choose(self, available, rng):
+        if len(available) == 1:
+            return available[0]
+        first, second = rng.sample(available, 2)
+        return first if first.utilization <= second.utilization else second
+
+
+class LatencyAware(Strategy):
+    name = "latency"
+
+    def _score(self, candidate):
+        # Заполненность после добавления клиента: у пустого сервера она не
+        # нулевая, иначе поправки на задержку и предохранитель его не касаются
+        score = (candidate.occupied + 1) / candidate.total
+        if candidate.latency is not None:
+            score *= 1 + candidate.latency / BALANCING_LATENCY_REF
+        if candidate.half_open:
+            score *= 2
+        return score
+
+    def _choose(self, available, rng):
+        return min(available, key=self._score)
+
+
+STRATEGIES = {
+    strategy.name: strategy
+    for strategy in (MostFree(), WeightedByCapacity(), PowerOfTwoChoices(), LatencyAware())
+}
+
+
+def get_strategy(name=None) -> Strategy:
+    """Стратегия по имени; пустое или неизвестное имя — BALANCING_STRATEGY."""
+    strategy = STRATEGIES.get((name or BALANCING_STRATEGY).strip())
+    if strategy is None:
+        logger.warning(f"⚠️ Неизвестная стратегия балансировки '{name}', используется {BALANCING_STRATEGY}")
+        strategy = STRATEGIES.get(BALANCING_STRATEGY, STRATEGIES["most_free"])
+    return strategy
@@ -0,0 +1,273 @@
+"""
+Учет занятых мест на серверах в памяти.
+
+Раньше каждый пробный период и каждая покупка перед выбором сервера
+скачивали все inbounds каждого сервера группы, чтобы посчитать клиентов.
+Теперь занятость и total_slots хранятся в памяти (по серверу и по inbound),
+и выбор сервера читает их без запросов к панелям:
+
+    free = await slot_tracker.free_slots([1, 2, 3])  # {1: 40, 2: None, 3: 0}
+
+None — панель сервера работает с перебоями. Пути записи обновляют счетчики
+сразу (добавление клиента, удаление, смена сервера), изменения настроек
+сервера и удаление истекших клиентов помечают сервер к пересчету, а задача
+планировщика reconcile_slots периодически сверяет счетчики со снимками
+панелей.
+
+Чтобы одновременные регистрации не выбрали одно и то же последнее место,
+место резервируется сразу при выборе сервера и занимает его до создания
+клиента:
+
+    token = slot_tracker.reserve(server_id)   # None — мест нет
+    ...
+    slot_tracker.commit(token, server_id, inbound_id)  # клиент создан
+    slot_tracker.release(token)                        # или поток оборвался
+
+Резерв, который не подтвердили и не сняли, истекает через
+SLOT_RESERVATION_TTL секунд.
+"""
+
+import asyncio
+import os
+import time
+import uuid
+
+from dotenv import load_dotenv
+
+from log import logger
+from handlers.panel import get_panel, PanelError, CircuitBreaker
+from handlers.balancing import Candidate
+from handlers.config import server_registry
+from handlers.health import server_health
+
+load_dotenv()
+
+# Сколько секунд держится резерв места (покупка ждет оплату)
+SLOT_RESERVATION_TTL = float(os.getenv("SLOT_RESERVATION_TTL", "900"))
+
+
+class SlotTracker:
+    def __init__(self):
+        self._total = {}  # server_id -> total_slots
+        self._occupied = {}  # server_id -> {inbound_id: клиентов}
+        self._panels = {}  # server_id -> XUIPanelClient
+        self._stale = set()  # серверы, которые нужно пересчитать перед чтением
+        self._reservations = {}  # token -> (server_id, time.monotonic() истечения)
+        self._lock = asyncio.Lock()
+        # Пока идет сверка, изменения пишутся сюда с моментом изменения
+        self._journal = None
+        self.built_at = None
+
+    async def ensure_built(self):
+        if self.built_at is None:
+            await self.reconcile()
+
+    def total(self, server_id) -> int:
+        return self._total.get(int(server_id), 0)
+
+    def occupied(self, server_id) -> int:
+        return sum(self._occupied.get(int(server_id), {}).values())
+
+    def reserved(self, server_id) -> int:
+        self._expire_reservations()
+        server_id = int(server_id)
+        return sum(1 for reserved_on, _ in self._reservations.values() if reserved_on == server_id)
+
+    def _free(self, server_id) -> int:
+        return max(0, self._total[server_id] - self.occupied(server_id) - self.reserved(server_id))
+
+    def _expire_reservations(self):
+        now = time.monotonic()
+        expired = [token for token, (_, expires_at) in self._reservations.items() if expires_at <= now]
+        for token in expired:
+            server_id, _ = self._reservations.pop(token)
+            logger.warning(f"⌛ Резерв места на сервере {server_id} истек без создания клиента")
+
+    def reserve(self, server_id, ttl=SLOT_RESERVATION_TTL) -> str | None:
+        """
+        Резервирует место на сервере; возвращает токен резерва или None, если
+        свободных мест (с учетом чужих резервов) нет. Проверка и резерв идут
+        без await, поэтому два потока не займут одно место.
+        """
+        server_id = int(server_id)
+        if server_id not in self._occupied or self._free(server_id) <= 0:
+            return None
+        token = uuid.uuid4().hex
+        self._reservations[token] = (server_id, time.monotonic() + ttl)
+        return token
+
+    def release(self, token):
+        """Снимает резерв (поток оборвался до создания клиента)."""
+        if token:
+            self._reservations.pop(token, None)
+
+    def commit(self, token, server_id, inbound_id):
+        """Клиент создан: резерв превращается в занятое место (даже если резерв уже истек)."""
+        self.release(token)
+        self.add(server_id, inbound_id)
+
+    def inbound_occupied(self, server_id) -> dict[int, int]:
+        """Клиентов по inbounds сервера."""
+        return dict(self._occupied.get(int(server_id), {}))
+
+    async def free_slots(self, server_ids) -> dict[int, int | None]:
+        """
+        Свободные места серверов: {server_id: мест}. None — панель с перебоями
+        или ни разу не ответила; серверов, которых нет в базе, в ответе нет.
+        """
+        await self.ensure_built()
+        server_ids = [int(server_id) for server_id in server_ids]
+        stale = [server_id for server_id in server_ids if server_id in self._stale]
+        if stale:
+            await self.reconcile(stale)
+
+        free = {}
+        for server_id in server_ids:
+            if server_id not in self._total:
+                continue
+            panel = self._panels.get(server_id)
+            if server_id not in self._occupied or (panel is not None and panel.degraded):
+                free[server_id] = None
+                continue
+            free[server_id] = self._free(server_id)
+        return free
+
+    async def candidates(self, server_ids) -> list[Candidate]:
+        """
+        Кандидаты для стратегии выбора сервера: без серверов с перебоями и без
+        не прошедших последнюю проверку здоровья, если есть другие.
+        """
+        free = await self.free_slots(server_ids)
+        reachable = [server_id for server_id, free_slots in free.items() if free_slots is not None]
+        online = [server_id for server_id in reachable if not server_health.offline(server_id)]
+        candidates = []
+        for server_id in online or reachable:
+            panel = self._panels.get(server_id)
+            latency = panel.latency if panel else None
+            candidates.append(Candidate(
+                server_id, self.occupied(server_id) + self.reserved(server_id), self._total[server_id],
+                latency=latency if latency is not None else server_health.rtt(server_id),
+                half_open=panel is not None and panel.breaker.state == CircuitBreaker.HALF_OPEN,
+            ))
+        return candidates
+
+    def inbound_candidates(self, server_id, inbound_ids) -> list[Candidate]:
+        """
+        Кандидаты для выбора inbound на сервере: места сервера делятся между
+        inbounds поровну (у inbound своего лимита нет).
+        """
+        counts = self._occupied.get(int(server_id), {})
+        total = self._total.get(int(server_id), 0)
+        share = -(-total // len(inbound_ids)) if total and inbound_ids else 0
+        if not share:
+            # Лимит сервера не задан — сравнивается только занятость
+            share = max((counts.get(inbound_id, 0) for inbound_id in inbound_ids), default=0) + 1
+        return [Candidate(inbound_id, counts.get(inbound_id, 0), share) for inbound_id in inbound_ids]
+
+    def _apply(self, server_id, inbound_id, delta):
+        counts = self._occupied.get(server_id)
+        if counts is None:
+            # Сервер еще не посчитан — его посчитает сверка
+            return
+        counts[inbound_id] = max(0, counts.get(inbound_id, 0) + delta)
+
+    def _change(self, server_id, inbound_id, delta):
+        if server_id is None:
+            return
+        server_id, inbound_id = int(server_id), int(inbound_id or 0)
+        self._apply(server_id, inbound_id, delta)
+        if self._journal is not None:
+            self._journal.append((time.monotonic(), server_id, inbound_id, delta))
+
+    def add(self, server_id, inbound_id, count=1):
+        """На сервер добавлены клиенты."""
+        self._change(server_id, inbound_id, count)
+
+    def remove(self, server_id, inbound_id, count=1):
+        """С сервера удалены клиенты."""
+        self._change(server_id, inbound_id, -count)
+
+    def invalidate(self, server_id=None):
+        """Помечает сервер (или все серверы) к пересчету при следующем чтении."""
+        if server_id is None:
+            self._stale.update(self._total)
+            self.built_at = None
+        else:
+            self._stale.add(int(server_id))
+
+    async def _count(self, server):
+        """Клиенты по inbounds сервера по свежему снимку панели или None."""
+        panel = get_panel(server)
+        self._panels[server.id] = panel
+        started = time.monotonic()
+        try:
+            snapshot = await panel.snapshot(max_age=0)
+        except PanelError as e:
+            logger.error(f"❌ Учет мест: панель сервера {server.id} недоступна: {e}")
+            return started, None
+        counts = {
+            inbound_id: len(snapshot.inbounds[inbound_id].clients)
+            for inbound_id in server.inbound_ids if inbound_id in snapshot.inbounds
+        }
+        return started, counts
+
+    async def reconcile(self, server_ids=None):
+        """Пересчитывает места серверов (всех или server_ids) по реестру серверов и снимкам панелей."""
+        async with self._lock:
+            started = time.monotonic()
+            self._journal = []
+            try:
+                servers = await server_registry.all()
+                if server_ids is None:
+                    known = {server.id for server in servers}
+                    for server_id in set(self._total) - known:
+                        self._forget(server_id)
+                else:
+                    wanted = {int(server_id) for server_id in server_ids}
+                    for server_id in wanted - {server.id for server in servers}:
+                        self._forget(server_id)
+                    servers = [server for server in servers if server.id in wanted]
+
+                unreachable = 0
+                results = await asyncio.gather(*[self._count(server) for server in servers])
+                for server, (requested_at, counts) in zip(servers, results):
+                    self._total[server.id] = int(server.total_slots or 0)
+                    self._stale.discard(server.id)
+                    if counts is None:
+                        # Про недоступный сервер оставляем прежние счетчики
+                        unreachable += 1
+                        continue
+                    # Изменения после отправки запроса могли не попасть в снимок:
+                    # применяем их повторно (лишний учет безопаснее переполнения)
+                    for changed_at, server_id, inbound_id, delta in self._journal:
+                        if server_id == server.id and changed_at >= requested_at:
+                            counts[inbound_id] = max(0, counts.get(inbound_id, 0) + delta)
+                    self._occupied[server.id] = counts
+                if server_ids is None:
+                    self.built_at = time.monotonic()
+            finally:
+                self._journal = None
+
+            logger.info(
+                f"🎫 Учет мест: {len(servers)} серверов, занято {sum(self.occupied(s.id) for s in servers)} "
+                f"(недоступно {unreachable}), {time.monotonic() - started:.1f} сек"
+            )
+
+    def _forget(self, server_id):
+        self._total.pop(server_id, None)
+        self._occupied.pop(server_id, None)
+        self._panels.pop(server_id, None)
+        self._stale.discard(server_id)
+        for token in [t for t, (reserved_on, _) in self._reservations.items() if reserved_on == server_id]:
+            del self._reservations[token]
+
+
+slot_tracker = SlotTracker()
+
+
+async def reconcile_slots():
+    """Задача планировщика: сверка счетчиков мест с панелями."""
+    try:
+        await slot_tracker.reconcile()
+    except Exception as e:
+        logger.error(f"❌ Ошибка сверки учета мест: {e}")
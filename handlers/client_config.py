@@ -0,0 +1,82 @@
+"""
+Шаблоны конфигов клиента: vless-ссылка, ссылка подписки и JSON-подписки.
+
+Параметры Reality (publicKey, fingerprint, sni, shortId, spiderX) одинаковы
+для всех клиентов inbound, поэтому из streamSettings они разбираются один
+раз: панель держит RealityParams для каждого inbound и пересобирает их,
+только когда при очередном чтении inbound изменились порт или
+streamSettings. Из параметров и данных сервера собирается ConfigTemplate —
+готовые куски строк, в которые при выдаче подставляются id, email и subId:
+
+    template = await config_template(panel, server_data, inbound_id)
+    vless = template.vless(client["id"], email)
+"""
+
+from log import logger
+
+
+class RealityParams:
+    """Параметры Reality inbound, собранные в query-строку vless-ссылки."""
+    __slots__ = ("port", "stream_settings", "query")
+
+    def __init__(self, port, stream_settings):
+        reality = stream_settings["realitySettings"]
+        settings = reality["settings"]
+        self.port = port
+        self.stream_settings = stream_settings
+        self.query = (
+            f"type={stream_settings['network']}&security={stream_settings['security']}"
+            f"&pbk={settings['publicKey']}&fp={settings['fingerprint']}"
+            f"&sni={reality['serverNames'][0]}&sid={reality['shortIds'][0]}"
+            f"&spx={settings['spiderX'].replace('/', '%2F')}&flow=xtls-rprx-vision"
+        )
+
+    @classmethod
+    def from_inbound(cls, inbound):
+        """RealityParams inbound или None, если inbound не Reality."""
+        try:
+            return cls(inbound.port, inbound.stream_settings)
+        except (KeyError, IndexError, TypeError):
+            return None
+
+    def matches(self, inbound) -> bool:
+        return self.port == inbound.port and self.stream_settings == inbound.stream_settings
+
+
+class ConfigTemplate:
+    """Заготовка конфигов клиентов одного inbound на одном сервере."""
+    __slots__ = ("params", "_vless_tail", "_sub_url", "_json_sub")
+
+    def __init__(self, server_data, params):
+        self.params = params
+        self._vless_tail = f"@{server_data['server_ip']}:{params.port}?{params.query}#"
+        self._sub_url = server_data['sub_url']
+        self._json_sub = server_data['json_sub']
+
+    def vless(self, client_id, email) -> str:
+        return f"vless://{client_id}{self._vless_tail}{email}"
+
+    def sub_url(self, sub_id) -> str:
+        return f"{self._sub_url}{sub_id}"
+
+    def json_url(self, sub_id) -> str:
+        return f"{self._json_sub}{sub_id}"
+
+
+_templates = {}  # (server_ip, sub_url, json_sub, inbound_id) -> ConfigTemplate
+
+
+async def config_template(panel, server_data, inbound_id) -> ConfigTemplate | None:
+    """
+    Шаблон конфигов inbound. Параметры Reality берутся из кэша панели;
+    шаблон пересобирается, только если панель заменила параметры.
+    """
+    params = await panel.reality(inbound_id)
+    if params is None:
+        return None
+    key = (server_data['server_ip'], server_data['sub_url'], server_data['json_sub'], inbound_id)
+    template = _templates.get(key)
+    if template is None or template.params is not params:
+        template = _templates[key] = ConfigTemplate(server_data, params)
+        logger.debug(f"🧩 Шаблон конфигов inbound {inbound_id} сервера {server_data['server_ip']} собран")
+    return template
@@ -1,50 +1,155 @@
-import aiosqlite
+"""
+Реестр серверов в памяти.
 
-async def get_server_data(server_selection):
-    """
-    Получает данные о сервере из базы данных по выбранному ID сервера.
+get_server_data раньше на каждый вызов открывал соединение с servers.db,
+читал строку сервера и заново собирал словарь URL, а вызывается он по
+нескольку раз на каждое действие пользователя и в каждой задаче
+планировщика. Теперь серверы, группы и список server_ids загружаются из базы
+один раз (при старте бота или при первом обращении) и хранятся в памяти:
+для каждого сервера — неизменяемый ServerConfig с готовыми URL.
 
-    Функция выполняет запрос к базе данных, чтобы извлечь информацию о сервере, включая общие настройки и URL-адреса для различных операций.
-    Возвращает словарь с данными о сервере, включая стандартные и кастомизированные URL.
+Таблицы серверов меняются только из админки: каждый путь записи в servers,
+server_groups или server_ids обязан вызвать `server_registry.invalidate()`
+после коммита, и следующее обращение перечитает базу.
+"""
 
-    Аргументы:
-        server_selection (int): ID выбранного сервера, данные о котором необходимо получить.
+import asyncio
+import re
+from collections.abc import Mapping
 
-    Возвращает:
-        dict: Словарь с данными о сервере, включая информацию о сервере и сформированные URL для различных операций.
-              Если сервер с данным ID не найден, возвращается None.
-    """
-    async with aiosqlite.connect("servers.db") as connection:
-        cursor = await connection.execute("SELECT * FROM servers WHERE id = ?", (server_selection,))
-        server_row = await cursor.fetchone()
+from log import logger
+from db.pool import servers_pool
+from db.repo import ServerRepo
 
-        if not server_row:
-            return None
+COMMON_URLS = {
+    "add_client_url": "/panel/api/inbounds/addClient",
+    "config_client_url": "/panel/api/inbounds/get",
+    "delete_depleted_clients_url": "/panel/inbound/delDepletedClients/-1",
+    "list_clients_url": "/panel/inbound/list",
+    "update_url": "/panel/api/inbounds/updateClient",
+    "delete_client_url": "/panel/api/inbounds/"
+}
 
-        columns = ["id", "total_slots", "name", "username", "password", "server_ip",
-                   "base_url", "subscription_base", "sub_url", "json_sub", "inbound_ids"]
-        server = dict(zip(columns, server_row))
 
-        server["inbound_ids"] = list(map(int, server["inbound_ids"].split(","))) if server["inbound_ids"] else []
+def parse_inbound_ids(value) -> tuple[int, ...]:
+    """inbound_ids из строки базы ("1,2" или "1;2", как пишет add_server)."""
+    return tuple(int(i) for i in re.split(r"[,;]", str(value or "")) if i.strip().isdigit())
 
-        common_urls = {
-            "add_client_url": "/panel/api/inbounds/addClient",
-            "config_client_url": "/panel/api/inbounds/get",
-            "delete_depleted_clients_url": "/panel/inbound/delDepletedClients/-1",
-            "list_clients_url": "/panel/inbound/list",
-            "update_url": "/panel/api/inbounds/updateClient",
-            "delete_client_url": "/panel/api/inbounds/"
-        }
 
-        server_data = {
+class ServerConfig(Mapping):
+    """
+    Данные сервера со сформированными URL; читаются как словарь
+    (server_data['base_url'], server_data.get('id')) или как атрибуты
+    (server.id, server.inbound_ids), но не изменяются.
+    """
+    __slots__ = ("_data",)
+
+    def __init__(self, server_row):
+        server = server_row.as_dict()
+        server["inbound_ids"] = parse_inbound_ids(server["inbound_ids"])
+        self._data = {
             **server,
-            **{key: f"{server['base_url']}{value}" for key, value in common_urls.items()},
-            **{key: f"{server['subscription_base']}{value}" for key, value in {
-                "sub_url": server["sub_url"],
-                "json_sub": server["json_sub"]
-            }.items()},
+            **{key: f"{server['base_url']}{value}" for key, value in COMMON_URLS.items()},
+            "sub_url": f"{server['subscription_base']}{server['sub_url']}",
+            "json_sub": f"{server['subscription_base']}{server['json_sub']}",
             "login_url": f"{server['base_url']}/login",
             "server": server['base_url']
         }
 
-        return server_data
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __getattr__(self, name):
+        if name == "_data":
+            raise AttributeError(name)
+        try:
+            return self._data[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f"ServerConfig(id={self._data['id']}, name={self._data['name']!r})"
+
+
+class ServerRegistry:
+    def __init__(self):
+        self._servers = {}  # server_id -> ServerConfig
+        self._groups = {}  # group_name -> (server_ids, strategy)
+        self._active_ids = ()  # последняя запись таблицы server_ids
+        self._loaded = False
+        self._lock = asyncio.Lock()
+        # Растет при каждой инвалидации: загрузка, начатая до записи,
+        # не должна считаться актуальной
+        self._version = 0
+
+    async def _ensure_loaded(self):
+        if not self._loaded:
+            await self.load()
+
+    async def load(self):
+        """Загружает серверы, группы и server_ids из базы (если реестр сброшен или еще не загружен)."""
+        async with self._lock:
+            if self._loaded:
+                return
+            version = self._version
+            async with servers_pool.acquire() as conn:
+                repo = ServerRepo(conn)
+                servers = await repo.all()
+                groups = await repo.groups()
+                active_ids = await repo.active_server_ids()
+
+            registry = {}
+            for server in servers:
+                try:
+                    registry[server.id] = ServerConfig(server)
+                except Exception as e:
+                    logger.error(f"❌ Реестр серверов: некорректные данные сервера {server.id}: {e}")
+            self._servers = registry
+            self._groups = {str(name): (server_ids, strategy) for name, server_ids, strategy in groups}
+            self._active_ids = tuple(active_ids)
+            self._loaded = version == self._version
+            logger.info(f"🗂 Реестр серверов загружен: {len(registry)} серверов, {len(self._groups)} групп")
+
+    def invalidate(self):
+        """Сбрасывает реестр после изменения серверов, групп или server_ids."""
+        self._version += 1
+        self._loaded = False
+
+    async def get(self, server_id) -> ServerConfig | None:
+        await self._ensure_loaded()
+        try:
+            return self._servers.get(int(server_id))
+        except (TypeError, ValueError):
+            return None
+
+    async def all(self) -> list[ServerConfig]:
+        await self._ensure_loaded()
+        return list(self._servers.values())
+
+    async def group(self, group_name) -> tuple[str | None, str | None]:
+        """(server_ids, strategy) группы или (None, None), если группы нет."""
+        await self._ensure_loaded()
+        return self._groups.get(str(group_name), (None, None))
+
+    async def active_server_ids(self) -> list[str]:
+        await self._ensure_loaded()
+        return list(self._active_ids)
+
+
+server_registry = ServerRegistry()
+
+
+async def get_server_data(server_selection):
+    """
+    Получает данные о сервере по выбранному ID сервера из реестра серверов.
+
+    Возвращает ServerConfig с данными о сервере, включая стандартные и кастомизированные URL
+    (читается как словарь). Если сервер с данным ID не найден, возвращается None.
+    """
+    return await server_registry.get(server_selection)
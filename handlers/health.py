@@ -0,0 +1,171 @@
+"""
+Фоновая проверка здоровья серверов.
+
+Раньше экран «О серверах» по нажатию кнопки по очереди читал данные каждого
+сервера и ждал ответа самой медленной панели. Теперь задача планировщика
+probe_servers раз в минуту проверяет панели активных серверов (таблица
+server_ids) параллельно: у каждой проверки свой таймаут
+(HEALTH_PROBE_TIMEOUT) и случайная задержка старта (до HEALTH_PROBE_JITTER
+секунд), чтобы проверки не приходили на панели одной пачкой. Статус и история RTT (последние HEALTH_HISTORY проверок)
+хранятся в памяти, и экран статусов и выбор сервера читают их мгновенно:
+
+    server_health.statuses()   # {server_id: "🟢 Сервер ...: онлайн, 85 мс"}
+    server_health.offline(3)   # последняя проверка сервера 3 не прошла
+"""
+
+import asyncio
+import os
+import random
+import statistics
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+
+from log import logger
+from handlers.panel import get_panel
+from handlers.config import server_registry
+
+load_dotenv()
+
+HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "5"))
+HEALTH_PROBE_JITTER = float(os.getenv("HEALTH_PROBE_JITTER", "10"))
+HEALTH_HISTORY = int(os.getenv("HEALTH_HISTORY", "30"))
+
+ONLINE = "online"
+DEGRADED = "degraded"
+OFFLINE = "offline"
+
+
+class ServerHealth:
+    """Результаты проверок одного сервера."""
+
+    def __init__(self, server_id, name):
+        self.server_id = server_id
+        self.name = name
+        self.status = None  # None — еще не проверяли
+        self.checked_at = None  # time.time() последней проверки
+        self.history = deque(maxlen=HEALTH_HISTORY)  # (time.time(), RTT сек или None)
+
+    def record(self, status, rtt):
+        self.status = status
+        self.checked_at = time.time()
+        self.history.append((self.checked_at, rtt))
+
+    @property
+    def rtt(self) -> float | None:
+        """Медиана RTT успешных проверок из истории, сек."""
+        samples = [rtt for _, rtt in self.history if rtt is not None]
+        return statistics.median(samples) if samples else None
+
+    @property
+    def availability(self) -> float | None:
+        """Доля успешных проверок в истории."""
+        if not self.history:
+            return None
+        return sum(1 for _, rtt in self.history if rtt is not None) / len(self.history)
+
+    def line(self) -> str:
+        if self.status == ONLINE:
+            rtt = self.history[-1][1]
+            return f"🟢 Сервер {self.name}: онлайн, {rtt * 1000:.0f} мс"
+        if self.status == DEGRADED:
+            return f"🟡 Сервер {self.name}: работает с перебоями"
+        if self.status == OFFLINE:
+            return f"🔴 Сервер {self.name}: в данный момент недоступен"
+        return f"⚪ Сервер {self.name}: статус проверяется"
+
+
+class HealthProber:
+    def __init__(self):
+        self._servers = {}  # server_id -> ServerHealth
+        self._running = None  # задача текущего обхода
+        self.probed_at = None
+
+    def get(self, server_id) -> ServerHealth | None:
+        return self._servers.get(int(server_id))
+
+    def offline(self, server_id) -> bool:
+        health = self.get(server_id)
+        return health is not None and health.status == OFFLINE
+
+    def rtt(self, server_id) -> float | None:
+        health = self.get(server_id)
+        return health.rtt if health else None
+
+    def statuses(self) -> dict:
+        """
+        Статусы серверов для экрана «О серверах» из последних проверок.
+        Если проверок еще не было, запускает обход в фоне.
+        """
+        if self.probed_at is None:
+            self.start()
+        return {server_id: health.line() for server_id, health in self._servers.items()}
+
+    def start(self):
+        """Запускает обход в фоне, если он еще не идет."""
+        if self._running is None or self._running.done():
+            self._running = asyncio.create_task(self.probe_all())
+        return self._running
+
+    async def _probe(self, server, health):
+        await asyncio.sleep(random.uniform(0, HEALTH_PROBE_JITTER))
+        panel = get_panel(server)
+        # Предохранитель разомкнут — не ждем таймаута, сервер недавно не отвечал
+        if panel.degraded:
+            health.record(DEGRADED, None)
+            return
+        started = time.monotonic()
+        try:
+            ok = await asyncio.wait_for(panel.ping(timeout=HEALTH_PROBE_TIMEOUT), HEALTH_PROBE_TIMEOUT)
+        except asyncio.TimeoutError:
+            ok = False
+        if ok:
+            health.record(ONLINE, time.monotonic() - started)
+        else:
+            health.record(OFFLINE, None)
+
+    async def probe_all(self):
+        """Проверяет активные серверы (server_ids) параллельно."""
+        started = time.monotonic()
+        servers = []
+        for server_id in await server_registry.active_server_ids():
+            server = await server_registry.get(server_id)
+            if server is not None:
+                servers.append(server)
+
+        known = {server.id for server in servers}
+        for server_id in set(self._servers) - known:
+            del self._servers[server_id]
+        for server in servers:
+            health = self._servers.get(server.id)
+            if health is None:
+                health = self._servers[server.id] = ServerHealth(server.id, server.name)
+            health.name = server.name
+
+        results = await asyncio.gather(
+            *[self._probe(server, self._servers[server.id]) for server in servers],
+            return_exceptions=True
+        )
+        for server, result in zip(servers, results):
+            if isinstance(result, Exception):
+                logger.error(f"❌ Ошибка проверки сервера {server.id}: {result}")
+                self._servers[server.id].record(OFFLINE, None)
+        self.probed_at = time.time()
+
+        down = [health.name for health in self._servers.values() if health.status != ONLINE]
+        logger.info(
+            f"🩺 Проверка серверов: {len(servers)} шт., недоступно или с перебоями {len(down)}"
+            f"{': ' + ', '.join(down) if down else ''}, {time.monotonic() - started:.1f} сек"
+        )
+
+
+server_health = HealthProber()
+
+
+async def probe_servers():
+    """Задача планировщика: проверка здоровья активных серверов."""
+    try:
+        await server_health.start()
+    except Exception as e:
+        logger.error(f"❌ Ошибка проверки здоровья серверов: {e}")
@@ -0,0 +1,142 @@
+"""
+Индекс «на каком сервере живет логин» по всему парку серверов.
+
+Раньше, чтобы найти логин, бот обходил все серверы из servers.db и искал
+email в каждом inbound. Теперь ответ берется из памяти:
+
+    server_ids = await locator.servers(email)
+
+Индекс собирается из user_emails.id_server и снимков панелей (панель главнее:
+если логин переехал или был удален на сервере, побеждает то, что видит
+панель). Пути записи обновляют индекс сразу — добавление клиента на панель,
+смена сервера, удаление логина, — а задача планировщика reconcile_locator
+периодически сверяет его с панелями целиком.
+"""
+
+import asyncio
+import time
+
+from log import logger
+from db.pool import users_pool
+from db.repo import SubscriptionRepo
+from handlers.panel import get_panel, PanelError
+from handlers.config import server_registry
+
+
+class FleetLocator:
+    def __init__(self):
+        self._servers = {}  # email -> {server_id, ...}
+        self._lock = asyncio.Lock()
+        # Пока идет сверка, изменения копятся здесь и применяются к новому индексу
+        self._pending = None
+        self.built_at = None
+
+    def __len__(self):
+        return len(self._servers)
+
+    async def ensure_built(self):
+        if self.built_at is None:
+            await self.reconcile()
+
+    async def servers(self, email) -> list[int]:
+        """Серверы, на которых есть логин (обычно один), или пустой список."""
+        await self.ensure_built()
+        return sorted(self._servers.get(email, ()))
+
+    async def server(self, email) -> int | None:
+        server_ids = await self.servers(email)
+        return server_ids[0] if server_ids else None
+
+    def _apply(self, index, op, email, server_id):
+        if op == "add":
+            index.setdefault(email, set()).add(server_id)
+        elif op == "move":
+            index[email] = {server_id}
+        elif op == "remove":
+            if server_id is None:
+                index.pop(email, None)
+            else:
+                server_ids = index.get(email)
+                if server_ids is not None:
+                    server_ids.discard(server_id)
+                    if not server_ids:
+                        del index[email]
+
+    def _change(self, op, email, server_id):
+        server_id = int(server_id) if server_id is not None else None
+        self._apply(self._servers, op, email, server_id)
+        if self._pending is not None:
+            self._pending.append((op, email, server_id))
+
+    def add(self, email, server_id):
+        """Логин добавлен на сервер."""
+        self._change("add", email, server_id)
+
+    def move(self, email, server_id):
+        """Логин переехал на сервер (со всех прежних)."""
+        self._change("move", email, server_id)
+
+    def remove(self, email, server_id=None):
+        """Логин удален с сервера (или отовсюду, если server_id не указан)."""
+        self._change("remove", email, server_id)
+
+    async def reconcile(self):
+        """Пересобирает индекс из user_emails и свежих снимков всех панелей."""
+        async with self._lock:
+            started = time.monotonic()
+            self._pending = []
+            try:
+                async with users_pool.acquire() as conn:
+                    locations = await SubscriptionRepo(conn).locations()
+                servers = await server_registry.all()
+
+                index = {}
+                for email, server_id in locations:
+                    if email and server_id is not None:
+                        index.setdefault(email, set()).add(int(server_id))
+
+                async def load(server):
+                    try:
+                        snapshot = await get_panel(server).snapshot(max_age=0)
+                    except PanelError as e:
+                        logger.error(f"❌ Локатор: панель сервера {server.id} недоступна: {e}")
+                        return server.id, None
+                    return server.id, {
+                        email for email, (inbound_id, _) in snapshot.index.items()
+                        if inbound_id in server.inbound_ids
+                    }
+
+                unreachable = 0
+                for server_id, emails in await asyncio.gather(*[load(server) for server in servers]):
+                    if emails is None:
+                        # Про недоступный сервер верим базе
+                        unreachable += 1
+                        continue
+                    for email, server_ids in list(index.items()):
+                        if server_id in server_ids and email not in emails:
+                            self._apply(index, "remove", email, server_id)
+                    for email in emails:
+                        self._apply(index, "add", email, server_id)
+
+                for op, email, server_id in self._pending:
+                    self._apply(index, op, email, server_id)
+                self._servers = index
+                self.built_at = time.monotonic()
+            finally:
+                self._pending = None
+
+            logger.info(
+                f"🧭 Локатор логинов: {len(index)} логинов на {len(servers)} серверах "
+                f"(недоступно {unreachable}), {time.monotonic() - started:.1f} сек"
+            )
+
+
+locator = FleetLocator()
+
+
+async def reconcile_locator():
+    """Задача планировщика: сверка индекса логинов с панелями."""
+    try:
+        await locator.reconcile()
+    except Exception as e:
+        logger.error(f"❌ Ошибка сверки локатора логинов: {e}")
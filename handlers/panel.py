@@ -0,0 +1,783 @@
+"""
+Клиент API панели 3x-ui.
+
+Один XUIPanelClient на сервер держит долгоживущую сессию aiohttp с keep-alive
+и cookie авторизации, поэтому обработчики не логинятся на панель заново при
+каждом запросе. Cookie хранится до срока из ее Max-Age/Expires (или
+PANEL_SESSION_TTL, если панель срок не указала). Если панель все же ответила
+401 или редиректом на страницу входа, запрос повторяется ровно один раз после
+повторного входа. Вход выполняется single-flight: сколько бы запросов ни
+обнаружили протухшую cookie одновременно, на панель уходит один POST /login,
+остальные ждут его и используют новую cookie.
+
+    panel = get_panel(server_data)
+    inbound = await panel.get_inbound(inbound_id)
+    for client in inbound.clients:
+        ...
+
+Поиск клиента по email идет не по отдельному inbound, а по снимку всех
+inbounds сервера (InboundSnapshot): он загружается одним запросом /list,
+индексируется email → (inbound_id, client) и живет PANEL_SNAPSHOT_TTL секунд.
+Устаревший снимок отдается сразу, а свежий загружается в фоне; записи бота
+(addClient, updateClient, delClient) применяются к снимку на месте.
+
+    inbound, client = await panel.locate(email, server_data["inbound_ids"])
+
+Массовые операции (акции, перенос серверов, продление из админки) идут
+пакетами: add_clients_bulk кладет до PANEL_BATCH_SIZE клиентов в один
+addClient, update_clients_bulk обновляет клиентов inbound параллельно по
+одной keep-alive сессии. Обе возвращают BatchResult с итогом по каждому email.
+
+Каждая панель ограничена таймаутами подключения и чтения и числом
+одновременных запросов (PANEL_MAX_CONCURRENCY). После PANEL_BREAKER_FAILURES
+ошибок связи подряд срабатывает предохранитель: PANEL_BREAKER_RESET секунд
+запросы к панели сразу завершаются PanelUnavailable, а panel.degraded
+показывает выбору сервера и экрану статусов, что сервер работает с перебоями.
+
+Массовым проходам по всем клиентам (синхронизация сроков, уведомления,
+подсчет мест) достаточно нескольких полей клиента: get_inbound и
+list_inbounds с fields=CLIENT_FIELDS разбирают ответ потоково, без
+clientStats и лишних полей (см. handlers/panel_json.py). Такой Inbound
+только для чтения — в снимок и в записи он не попадает.
+
+Параметры Reality каждого inbound разбираются один раз и хранятся до его
+изменения (panel.reality) — из них собираются шаблоны конфигов клиентов
+(handlers/client_config.py).
+
+Ошибки сети и ответы панели выбрасываются как PanelError; ответ с
+success=false — как PanelRejected.
+"""
+
+import asyncio
+import json
+import os
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import quote
+
+import aiohttp
+from dotenv import load_dotenv
+
+from log import logger
+from handlers.panel_json import loads, loads_without_client_stats, parse_settings
+from handlers.client_config import RealityParams
+
+load_dotenv()
+
+# Сколько одновременных подключений держать к одной панели
+PANEL_CONNECTIONS = int(os.getenv("PANEL_CONNECTIONS", "20"))
+# Сколько секунд простаивающее подключение остается открытым
+PANEL_KEEPALIVE = float(os.getenv("PANEL_KEEPALIVE", "60"))
+PANEL_TIMEOUT = float(os.getenv("PANEL_TIMEOUT", "20"))
+PANEL_CONNECT_TIMEOUT = float(os.getenv("PANEL_CONNECT_TIMEOUT", "5"))
+PANEL_READ_TIMEOUT = float(os.getenv("PANEL_READ_TIMEOUT", "15"))
+# Сколько запросов к одной панели выполняется одновременно, остальные ждут
+PANEL_MAX_CONCURRENCY = int(os.getenv("PANEL_MAX_CONCURRENCY", "10"))
+# После скольких ошибок связи подряд панель считается недоступной
+PANEL_BREAKER_FAILURES = int(os.getenv("PANEL_BREAKER_FAILURES", "5"))
+# Сколько секунд после срабатывания запросы к панели отклоняются без попытки
+PANEL_BREAKER_RESET = float(os.getenv("PANEL_BREAKER_RESET", "30"))
+# У части панелей самоподписанный сертификат
+PANEL_VERIFY_SSL = os.getenv("PANEL_VERIFY_SSL", "1") not in ("0", "false", "False")
+# Срок cookie (сек), если панель не прислала Max-Age/Expires
+PANEL_SESSION_TTL = float(os.getenv("PANEL_SESSION_TTL", "3000"))
+# Запас до истечения cookie, чтобы не отправить запрос с cookie на последней секунде
+PANEL_SESSION_MARGIN = 60
+# Ответы панели на запрос без действующей cookie
+_RELOGIN_STATUSES = (301, 302, 303, 307, 308, 401, 404)
+# Сколько секунд снимок inbounds считается свежим
+PANEL_SNAPSHOT_TTL = float(os.getenv("PANEL_SNAPSHOT_TTL", "30"))
+# До какого возраста устаревший снимок еще отдается, пока в фоне грузится новый
+PANEL_SNAPSHOT_STALE = float(os.getenv("PANEL_SNAPSHOT_STALE", "120"))
+# Через сколько секунд без чтений inbound его параметры Reality перечитываются
+PANEL_REALITY_TTL = float(os.getenv("PANEL_REALITY_TTL", "3600"))
+# Сколько клиентов отправляется в одном запросе addClient
+PANEL_BATCH_SIZE = int(os.getenv("PANEL_BATCH_SIZE", "100"))
+# Сколько updateClient к одной панели выполняется одновременно при пакетном обновлении
+PANEL_BULK_CONCURRENCY = int(os.getenv("PANEL_BULK_CONCURRENCY", "8"))
+
+API = "/panel/api/inbounds"
+
+
+class PanelError(Exception):
+    """Панель недоступна или отклонила запрос."""
+    # Ошибка на стороне панели или сети (а не отказ в запросе) — считается предохранителем
+    server_fault = False
+    # HTTP-статус ответа, если ошибка в нем
+    status = None
+
+
+def _fault(message):
+    error = PanelError(message)
+    error.server_fault = True
+    return error
+
+
+def _status_error(message, status):
+    error = _fault(message) if status >= 500 else PanelError(message)
+    error.status = status
+    return error
+
+
+class PanelAuthError(PanelError):
+    """Панель не приняла логин и пароль."""
+
+
+class PanelUnavailable(PanelError):
+    """Предохранитель панели разомкнут — запрос не отправлялся."""
+
+
+class PanelRejected(PanelError):
+    """Панель ответила success=false (например, записи с таким email нет)."""
+
+
+class CircuitBreaker:
+    """
+    Предохранитель панели.
+
+    closed    — запросы идут как обычно, ошибки связи подряд считаются;
+    open      — после failure_threshold ошибок подряд запросы reset_after
+                секунд отклоняются сразу;
+    half_open — затем пропускается один пробный запрос: успех замыкает цепь,
+                ошибка снова размыкает ее.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold=PANEL_BREAKER_FAILURES, reset_after=PANEL_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self._probe = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at < self.reset_after:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._probe:
+            self._probe = True
+            return True
+        return False
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probe = False
+
+    def failure(self):
+        self.failures += 1
+        self._probe = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """Пробный запрос отменен, не дойдя до результата."""
+        self._probe = False
+
+
+class Inbound:
+    """Inbound панели с разобранными settings и streamSettings."""
+    __slots__ = (
+        "id", "port", "protocol", "remark", "enable", "settings", "stream_settings", "client_stats", "_by_email"
+    )
+
+    def __init__(self, id, port, protocol, remark, enable, settings, stream_settings, client_stats):
+        self.id = id
+        self.port = port
+        self.protocol = protocol
+        self.remark = remark
+        self.enable = enable
+        self.settings = settings
+        self.stream_settings = stream_settings
+        self.client_stats = client_stats
+        self._by_email = None
+
+    @classmethod
+    def from_api(cls, obj, fields=None):
+        """fields — оставить у клиентов только эти поля (clientStats при этом не разбираются)."""
+        return cls(
+            id=obj.get("id"),
+            port=obj.get("port"),
+            protocol=obj.get("protocol"),
+            remark=obj.get("remark"),
+            enable=obj.get("enable", True),
+            settings=parse_settings(obj.get("settings"), fields),
+            stream_settings=parse_settings(obj.get("streamSettings")),
+            client_stats=obj.get("clientStats") or [],
+        )
+
+    @property
+    def clients(self) -> list[dict]:
+        return self.settings.get("clients", [])
+
+    def find_client(self, email) -> dict | None:
+        """Клиент inbound по email или None."""
+        if self._by_email is None:
+            self._by_email = {client.get("email"): client for client in self.clients}
+        return self._by_email.get(email)
+
+    def put_client(self, client):
+        """Добавляет клиента или заменяет клиента с тем же id."""
+        clients = self.settings.setdefault("clients", [])
+        for i, existing in enumerate(clients):
+            if existing.get("id") == client.get("id"):
+                clients[i] = client
+                break
+        else:
+            clients.append(client)
+        self._by_email = None
+
+    def remove_client(self, client_id) -> dict | None:
+        clients = self.clients
+        for i, existing in enumerate(clients):
+            if existing.get("id") == client_id:
+                self._by_email = None
+                return clients.pop(i)
+        return None
+
+    def __repr__(self):
+        return f"Inbound(id={self.id}, port={self.port}, clients={len(self.clients)})"
+
+
+class InboundSnapshot:
+    """Все inbounds панели на момент загрузки с индексом email → (inbound_id, client)."""
+    __slots__ = ("inbounds", "index", "fetched_at")
+
+    def __init__(self, inbounds):
+        self.inbounds = {inbound.id: inbound for inbound in inbounds}
+        self.index = {}
+        for inbound in inbounds:
+            for client in inbound.clients:
+                self.index.setdefault(client.get("email"), (inbound.id, client))
+        self.fetched_at = time.monotonic()
+
+    @property
+    def age(self):
+        return time.monotonic() - self.fetched_at
+
+    def locate(self, email, inbound_ids=None):
+        """(inbound, client) по email или (None, None); inbound_ids ограничивает поиск inbounds сервера."""
+        entry = self.index.get(email)
+        if entry is not None and (inbound_ids is None or entry[0] in inbound_ids):
+            return self.inbounds[entry[0]], entry[1]
+        if inbound_ids is not None:
+            # Тот же email может быть и в другом inbound сервера
+            for inbound_id in inbound_ids:
+                inbound = self.inbounds.get(inbound_id)
+                client = inbound.find_client(email) if inbound is not None else None
+                if client is not None:
+                    return inbound, client
+        return None, None
+
+    def client(self, inbound_id, email) -> dict | None:
+        inbound = self.inbounds.get(inbound_id)
+        return inbound.find_client(email) if inbound is not None else None
+
+    def put_client(self, inbound_id, client):
+        inbound = self.inbounds.get(inbound_id)
+        if inbound is None:
+            return
+        inbound.put_client(client)
+        entry = self.index.get(client.get("email"))
+        if entry is None or entry[0] == inbound_id:
+            self.index[client.get("email")] = (inbound_id, client)
+
+    def remove_client(self, inbound_id, client_id):
+        inbound = self.inbounds.get(inbound_id)
+        removed = inbound.remove_client(client_id) if inbound is not None else None
+        if removed is not None:
+            email = removed.get("email")
+            entry = self.index.get(email)
+            if entry is not None and entry[0] == inbound_id:
+                del self.index[email]
+                # Если email есть еще в каком-то inbound, индекс указывает туда
+                for other in self.inbounds.values():
+                    client = other.find_client(email)
+                    if client is not None:
+                        self.index[email] = (other.id, client)
+                        break
+
+
+class BatchResult:
+    """Итог пакетной операции: email прошедших клиентов и ошибки по остальным."""
+    __slots__ = ("ok", "failed", "requests")
+
+    def __init__(self):
+        self.ok = []
+        self.failed = {}  # email -> текст ошибки
+        self.requests = 0
+
+    def __repr__(self):
+        return f"BatchResult(ok={len(self.ok)}, failed={len(self.failed)}, requests={self.requests})"
+
+
+def client_settings(inbound_id, clients):
+    """Тело запросов addClient / updateClient: settings передается строкой JSON."""
+    return {"id": inbound_id, "settings": json.dumps({"clients": clients})}
+
+
+class XUIPanelClient:
+    def __init__(self, base_url, username, password, name=None, connect_timeout=PANEL_CONNECT_TIMEOUT,
+                 read_timeout=PANEL_READ_TIMEOUT, max_concurrency=PANEL_MAX_CONCURRENCY):
+        self.base_url = base_url.rstrip("/")
+        self.username = username
+        self.password = password
+        self.name = name or self.base_url
+        self.timeout = aiohttp.ClientTimeout(total=PANEL_TIMEOUT, connect=connect_timeout, sock_read=read_timeout)
+        self._slots = asyncio.Semaphore(max(max_concurrency, 1))
+        self.breaker = CircuitBreaker()
+        self._session = None
+        self._logged_in = False
+        self._session_expires = 0.0  # time.monotonic(), до которого cookie считается действующей
+        self._login_lock = asyncio.Lock()
+        # Растет при каждом успешном входе: по нему ожидающие запросы понимают,
+        # что cookie уже обновил кто-то другой
+        self._login_generation = 0
+        self.logins = 0
+        # Скользящее среднее времени до заголовков ответа (сек), для выбора сервера
+        self.latency = None
+        self._snapshot = None
+        self._snapshot_task = None
+        # Есть ли на панели getClientTraffics (None — еще не проверяли)
+        self._client_endpoint = None
+        self._reality = {}  # inbound_id -> (RealityParams или None, time.monotonic() проверки)
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=PANEL_CONNECTIONS, keepalive_timeout=PANEL_KEEPALIVE,
+                ssl=None if PANEL_VERIFY_SSL else False
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                # Панели обычно адресуются по IP — без unsafe cookie для IP не сохраняются
+                cookie_jar=aiohttp.CookieJar(unsafe=True),
+                timeout=self.timeout,
+                headers={"Accept": "application/json"},
+            )
+            self._logged_in = False
+        return self._session
+
+    @property
+    def degraded(self) -> bool:
+        """Предохранитель разомкнут: панель недавно не отвечала, запросы к ней не отправляются."""
+        return self.breaker.state == CircuitBreaker.OPEN
+
+    def _unavailable(self):
+        return PanelUnavailable(
+            f"Панель {self.name} временно недоступна после {self.breaker.failures} ошибок подряд"
+        )
+
+    def _session_valid(self):
+        return self._logged_in and time.monotonic() < self._session_expires
+
+    def expire_session(self):
+        """Считает cookie недействительной — следующий запрос войдет заново."""
+        self._logged_in = False
+
+    @staticmethod
+    def _cookie_ttl(response):
+        """Срок жизни cookie из ответа на /login (сек) или None, если панель его не указала."""
+        for morsel in response.cookies.values():
+            if morsel["max-age"]:
+                try:
+                    return float(morsel["max-age"])
+                except ValueError:
+                    pass
+            if morsel["expires"]:
+                try:
+                    return parsedate_to_datetime(morsel["expires"]).timestamp() - time.time()
+                except (TypeError, ValueError):
+                    pass
+        return None
+
+    async def login(self) -> bool:
+        """Входит на панель; cookie сохраняется в сессии клиента."""
+        session = self._get_session()
+        try:
+            async with session.post(
+                f"{self.base_url}/login",
+                data={"username": self.username, "password": self.password}
+            ) as response:
+                if response.status != 200:
+                    raise PanelAuthError(f"Вход на панель {self.name}: статус {response.status}")
+                payload = await response.json(content_type=None)
+                ttl = self._cookie_ttl(response)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise _fault(f"Панель {self.name} недоступна: {e!r}") from e
+        except ValueError as e:
+            raise PanelAuthError(f"Вход на панель {self.name}: ответ не JSON") from e
+
+        if not payload.get("success", True):
+            raise PanelAuthError(f"Вход на панель {self.name} отклонен: {payload.get('msg')}")
+        if ttl is None or ttl <= 0:
+            ttl = PANEL_SESSION_TTL
+        self._session_expires = time.monotonic() + max(ttl - PANEL_SESSION_MARGIN, 0)
+        self._logged_in = True
+        self._login_generation += 1
+        self.logins += 1
+        logger.debug(f"🔐 Вход на панель {self.name} выполнен, cookie на {ttl:.0f} сек")
+        return True
+
+    async def _relogin(self, generation):
+        """
+        Single-flight вход: если пока ждали блокировку, cookie уже обновил
+        другой запрос (generation сменилась), повторно не логинимся.
+        """
+        async with self._login_lock:
+            if self._login_generation != generation and self._session_valid():
+                return
+            await self.login()
+
+    async def ensure_login(self):
+        """Входит на панель, только если нет действующей cookie."""
+        if self.degraded:
+            raise self._unavailable()
+        if not self._session_valid():
+            try:
+                await self._relogin(self._login_generation)
+            except PanelError as e:
+                if e.server_fault:
+                    self.breaker.failure()
+                raise
+
+    async def _request(self, method, path, **kwargs):
+        """Запрос к API панели; возвращает поле obj ответа."""
+        if not self.breaker.allow():
+            raise self._unavailable()
+        async with self._slots:
+            try:
+                payload = await self._send(method, path, **kwargs)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.breaker.failure()
+                raise _fault(f"Панель {self.name} недоступна: {e!r}") from e
+            except PanelError as e:
+                if e.server_fault:
+                    self.breaker.failure()
+                else:
+                    self.breaker.success()
+                raise
+            except ValueError as e:
+                self.breaker.success()
+                raise PanelError(f"{method} {path} на панели {self.name}: ответ не JSON") from e
+            except BaseException:
+                self.breaker.release()
+                raise
+            self.breaker.success()
+
+        if not payload.get("success", False):
+            raise PanelRejected(f"{method} {path} на панели {self.name}: {payload.get('msg')}")
+        return payload.get("obj")
+
+    def _observe_latency(self, elapsed):
+        self.latency = elapsed if self.latency is None else 0.8 * self.latency + 0.2 * elapsed
+
+    async def _send(self, method, path, loads=loads, **kwargs):
+        """HTTP-запрос с повторным входом при протухшей cookie; возвращает JSON ответа."""
+        for attempt in (1, 2):
+            generation = self._login_generation
+            if not self._session_valid():
+                await self._relogin(generation)
+                generation = self._login_generation
+            session = self._get_session()
+            started = time.monotonic()
+            async with session.request(
+                method, f"{self.base_url}{path}", allow_redirects=False, **kwargs
+            ) as response:
+                self._observe_latency(time.monotonic() - started)
+                # Без действующей cookie панель отвечает 404 или редиректом на страницу входа
+                if response.status in _RELOGIN_STATUSES or "json" not in response.content_type:
+                    if attempt == 1:
+                        await self._relogin(generation)
+                        continue
+                    raise _status_error(f"{method} {path} на панели {self.name}: статус {response.status}", response.status)
+                if response.status != 200:
+                    raise _status_error(f"{method} {path} на панели {self.name}: статус {response.status}", response.status)
+                return await response.json(content_type=None, loads=loads)
+
+    async def get_inbound(self, inbound_id, fields=None) -> Inbound | None:
+        """Inbound по id; с fields — облегченный, только для чтения (см. CLIENT_FIELDS)."""
+        obj = await self._request("GET", f"{API}/get/{inbound_id}", **self._reader(fields))
+        if not obj:
+            return None
+        inbound = Inbound.from_api(obj, fields)
+        self._remember_reality(inbound)
+        return inbound
+
+    async def list_inbounds(self, fields=None) -> list[Inbound]:
+        obj = await self._request("GET", f"{API}/list", **self._reader(fields))
+        inbounds = [Inbound.from_api(item, fields) for item in obj or [] if item is not None]
+        for inbound in inbounds:
+            self._remember_reality(inbound)
+        return inbounds
+
+    @staticmethod
+    def _reader(fields):
+        # Облегченный разбор не строит clientStats: на больших inbounds это
+        # половина ответа и заметная часть пиковой памяти
+        return {"loads": loads_without_client_stats} if fields else {}
+
+    def _remember_reality(self, inbound):
+        # Параметры пересобираются, только если inbound изменился
+        params, _ = self._reality.get(inbound.id, (None, 0))
+        if params is None or not params.matches(inbound):
+            params = RealityParams.from_inbound(inbound)
+        self._reality[inbound.id] = (params, time.monotonic())
+
+    async def reality(self, inbound_id) -> RealityParams | None:
+        """
+        Параметры Reality inbound из кэша. Кэш обновляется любым чтением inbound
+        (снимок, get, list); если inbound давно не читался, он перечитывается.
+        """
+        params, checked_at = self._reality.get(inbound_id, (None, None))
+        if checked_at is None or time.monotonic() - checked_at > PANEL_REALITY_TTL:
+            try:
+                await self.get_inbound(inbound_id, fields=("id",))
+            except PanelError as e:
+                if checked_at is None:
+                    raise
+                logger.warning(f"⚠️ Параметры Reality inbound {inbound_id} панели {self.name} не обновлены: {e}")
+                return params
+            params, _ = self._reality.get(inbound_id, (None, None))
+        return params
+
+    async def _load_snapshot(self):
+        try:
+            snapshot = InboundSnapshot(await self.list_inbounds())
+            self._snapshot = snapshot
+            logger.debug(
+                f"📸 Снимок панели {self.name}: {len(snapshot.inbounds)} inbounds, {len(snapshot.index)} клиентов"
+            )
+            return snapshot
+        finally:
+            self._snapshot_task = None
+
+    def _refresh_snapshot(self):
+        """Задача загрузки снимка; параллельные вызовы получают одну и ту же задачу."""
+        if self._snapshot_task is None:
+            self._snapshot_task = asyncio.ensure_future(self._load_snapshot())
+            self._snapshot_task.add_done_callback(self._log_refresh_error)
+        return self._snapshot_task
+
+    async def snapshot(self, max_age=PANEL_SNAPSHOT_TTL) -> InboundSnapshot:
+        """
+        Снимок всех inbounds панели. Снимок старше max_age, но моложе
+        PANEL_SNAPSHOT_STALE возвращается сразу, а новый грузится в фоне.
+        max_age=0 всегда загружает свежий снимок.
+        """
+        snapshot = self._snapshot
+        if snapshot is not None and max_age > 0:
+            age = snapshot.age
+            if age < max_age:
+                return snapshot
+            if age < max(PANEL_SNAPSHOT_STALE, max_age):
+                # Ошибку фонового обновления только логируем — снимок обновится при следующем запросе
+                self._refresh_snapshot()
+                return snapshot
+        return await asyncio.shield(self._refresh_snapshot())
+
+    def _log_refresh_error(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"❌ Не удалось обновить снимок панели {self.name}: {task.exception()}")
+
+    def invalidate_snapshot(self):
+        self._snapshot = None
+
+    async def locate(self, email, inbound_ids=None):
+        """Ищет клиента по email в снимке; возвращает (inbound, client) или (None, None)."""
+        return (await self.snapshot()).locate(email, inbound_ids)
+
+    async def get_client(self, inbound_id, email) -> dict | None:
+        """Клиент inbound по email из снимка."""
+        return (await self.snapshot()).client(inbound_id, email)
+
+    async def add_clients(self, inbound_id, clients: list[dict]):
+        await self._request("POST", f"{API}/addClient", json=client_settings(inbound_id, clients))
+        if self._snapshot is not None:
+            for client in clients:
+                self._snapshot.put_client(inbound_id, client)
+
+    async def update_client(self, inbound_id, client: dict):
+        """Заменяет клиента (по его id) переданными полями."""
+        await self._request(
+            "POST", f"{API}/updateClient/{client['id']}", json=client_settings(inbound_id, [client])
+        )
+        if self._snapshot is not None:
+            self._snapshot.put_client(inbound_id, client)
+
+    async def add_clients_bulk(self, inbound_id, clients: list[dict], batch_size=PANEL_BATCH_SIZE) -> BatchResult:
+        """
+        Добавляет клиентов пачками по batch_size в одном addClient.
+        Панель отклоняет addClient целиком, если хотя бы один email уже занят,
+        поэтому отклоненная пачка делится пополам и повторяется, пока ошибка не
+        останется только у тех клиентов, из-за которых она возникла.
+        """
+        result = BatchResult()
+
+        async def add(chunk):
+            result.requests += 1
+            try:
+                await self.add_clients(inbound_id, chunk)
+                result.ok.extend(client.get("email") for client in chunk)
+            except PanelError as e:
+                if len(chunk) == 1:
+                    result.failed[chunk[0].get("email")] = str(e)
+                    return
+                logger.warning(f"⚠️ Пачка из {len(chunk)} клиентов отклонена панелью {self.name}, делим пополам: {e}")
+                middle = len(chunk) // 2
+                await add(chunk[:middle])
+                await add(chunk[middle:])
+
+        batch_size = max(batch_size, 1)
+        for start in range(0, len(clients), batch_size):
+            await add(clients[start:start + batch_size])
+        return result
+
+    async def update_clients_bulk(self, inbound_id, clients: list[dict], concurrency=PANEL_BULK_CONCURRENCY) -> BatchResult:
+        """
+        Обновляет клиентов inbound за один проход. updateClient панели принимает
+        одного клиента, поэтому запросы идут параллельно (не больше concurrency)
+        по общей keep-alive сессии, а ошибка одного клиента не прерывает остальных.
+        """
+        result = BatchResult()
+        semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+        async def update(client):
+            async with semaphore:
+                try:
+                    await self.update_client(inbound_id, client)
+                    return client.get("email"), None
+                except PanelError as e:
+                    return client.get("email"), str(e)
+
+        for email, error in await asyncio.gather(*[update(client) for client in clients]):
+            result.requests += 1
+            if error is None:
+                result.ok.append(email)
+            else:
+                result.failed[email] = error
+        return result
+
+    async def delete_client(self, inbound_id, client_id):
+        await self._request("POST", f"{API}/{inbound_id}/delClient/{client_id}")
+        if self._snapshot is not None:
+            self._snapshot.remove_client(inbound_id, client_id)
+
+    async def delete_depleted_clients(self, inbound_id=-1):
+        """Удаляет клиентов с исчерпанным сроком или трафиком (-1 — во всех inbounds)."""
+        await self._request("POST", f"{API}/delDepletedClients/{inbound_id}")
+        self.invalidate_snapshot()
+
+    async def client_traffic(self, email) -> dict | None:
+        """Трафик и срок клиента по email (up, down, total, expiryTime, enable)."""
+        return await self._request("GET", f"{API}/getClientTraffics/{quote(email, safe='@')}")
+
+    async def client_state(self, email, inbound_ids=None) -> dict | None:
+        """
+        Срок, трафик и enable одного клиента: inboundId, email, expiryTime,
+        enable, up, down, total. Запрашивается через getClientTraffics — в
+        ответе только этот клиент, а не весь inbound. Если у панели нет этого
+        метода (старые версии 3x-ui), данные берутся из снимка inbounds.
+        """
+        if self._client_endpoint is not False:
+            try:
+                state = await self.client_traffic(email)
+            except PanelRejected:
+                # success=false: у панели нет записи трафика для этого email
+                return None
+            except PanelError as e:
+                # Ошибки входа, ответы не JSON и недоступность панели — не «клиента нет»
+                if e.status != 404 or self._client_endpoint:
+                    raise
+                self._client_endpoint = False
+                logger.warning(f"⚠️ На панели {self.name} нет getClientTraffics, клиенты читаются из снимка")
+            else:
+                self._client_endpoint = True
+                if not state or (inbound_ids is not None and state.get("inboundId") not in inbound_ids):
+                    return None
+                return state
+
+        inbound, client = await self.locate(email, inbound_ids)
+        if client is None:
+            return None
+        stats = next((stat for stat in inbound.client_stats if stat.get("email") == email), {})
+        return {
+            "inboundId": inbound.id,
+            "email": email,
+            "expiryTime": client.get("expiryTime", 0),
+            "enable": client.get("enable", True),
+            "up": stats.get("up", 0),
+            "down": stats.get("down", 0),
+            "total": stats.get("total", client.get("totalGB", 0)),
+        }
+
+    async def find_client(self, inbound_ids, email):
+        """Ищет клиента по email в inbounds сервера; возвращает (inbound, client) или (None, None)."""
+        return await self.locate(email, inbound_ids)
+
+    async def ping(self, timeout=None) -> bool:
+        """
+        Отвечает ли веб-сервер панели (для проверки здоровья серверов);
+        учитывается предохранителем. timeout — свой таймаут проверки, сек.
+        """
+        if not self.breaker.allow():
+            return False
+        kwargs = {"timeout": aiohttp.ClientTimeout(total=timeout)} if timeout else {}
+        try:
+            async with self._slots, self._get_session().get(self.base_url, allow_redirects=False, **kwargs) as response:
+                ok = response.status < 500
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Ошибка при проверке панели {self.name}: {e!r}")
+            ok = False
+        except BaseException:
+            self.breaker.release()
+            raise
+        if ok:
+            self.breaker.success()
+        else:
+            self.breaker.failure()
+        return ok
+
+    async def close(self):
+        if self._snapshot_task is not None:
+            self._snapshot_task.cancel()
+            self._snapshot_task = None
+        self._snapshot = None
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self.expire_session()
+
+
+_panels = {}
+
+
+def get_panel(server_data) -> XUIPanelClient:
+    """Клиент панели сервера из get_server_data(); создается один раз на сервер."""
+    key = server_data["base_url"]
+    panel = _panels.get(key)
+    if panel is None:
+        panel = _panels[key] = XUIPanelClient(
+            server_data["base_url"], server_data["username"], server_data["password"],
+            name=server_data.get("name")
+        )
+    elif (panel.username, panel.password) != (server_data["username"], server_data["password"]):
+        # Учетные данные сервера поменяли в админке — следующий запрос войдет заново
+        panel.username, panel.password = server_data["username"], server_data["password"]
+        panel.expire_session()
+    return panel
+
+
+async def close_panels():
+    """Закрывает сессии всех панелей при остановке бота."""
+    for panel in _panels.values():
+        await panel.close()
+    _panels.clear()
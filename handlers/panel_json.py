@@ -0,0 +1,121 @@
+"""
+Разбор ответов панели 3x-ui.
+
+settings у inbound — это строка JSON внутри JSON, поэтому список клиентов
+большого inbound разбирается дважды: сначала весь ответ, затем строка
+settings. Для обычных запросов используется orjson, если он установлен
+(иначе стандартный json).
+
+Массовым проходам по клиентам (ночная синхронизация сроков, уведомления,
+подсчет занятых мест) нужны только несколько полей клиента. Для них
+get_inbound(..., fields=CLIENT_FIELDS) вырезает массивы clientStats из
+ответа до разбора и читает settings потоково, по одному клиенту, оставляя
+от каждого только нужные поля, — пиковая память на inbound в 50 тыс.
+клиентов примерно на треть ниже (см. benchmarks/bench_inbound_parse.py).
+"""
+
+import json
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+# Поля клиента, которые читают массовые проходы
+CLIENT_FIELDS = ("id", "email", "expiryTime", "tgId", "enable", "subId")
+
+_decoder = json.JSONDecoder()
+_CLIENTS_START = re.compile(r'"clients"\s*:\s*\[')
+_SEPARATORS = re.compile(r"[\s,]*")
+_CLIENT_STATS_KEY = '"clientStats"'
+_ARRAY_START = re.compile(r"\s*:\s*\[")
+# Плоский массив (записи без вложенных массивов) до закрывающей скобки
+_FLAT_ARRAY_REST = re.compile(r'(?:[^"\[\]]++|"[^"\\]*+(?:\\.[^"\\]*+)*+")*+\]')
+# Строка JSON или скобка массива — для массивов с вложенными массивами
+_STRING_OR_BRACKET = re.compile(r'"(?:[^"\\]|\\.)*"|[\[\]]')
+
+
+def loads(data):
+    """json.loads на orjson, если он есть."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _skip_array(text, position):
+    """Позиция сразу за массивом, элементы которого начинаются с position (после '['); без разбора записей."""
+    match = _FLAT_ARRAY_REST.match(text, position)
+    if match is not None:
+        return match.end()
+    depth = 1
+    for token in _STRING_OR_BRACKET.finditer(text, position):
+        bracket = token.group()
+        if bracket == "[":
+            depth += 1
+        elif bracket == "]":
+            depth -= 1
+            if not depth:
+                return token.end()
+    raise ValueError("Ответ панели оборван внутри clientStats")
+
+
+def loads_without_client_stats(text):
+    """
+    Разбирает ответ get/list панели без записей clientStats: массивы по
+    ключу clientStats вырезаются из текста до разбора. Внутри строки
+    settings кавычки экранированы (\\"clients\\"), поэтому находятся
+    только ключи самого ответа.
+    """
+    if isinstance(text, (bytes, bytearray)):
+        text = text.decode()
+    parts, position = [], 0
+    found = text.find(_CLIENT_STATS_KEY)
+    while found != -1:
+        key_end = found + len(_CLIENT_STATS_KEY)
+        array = _ARRAY_START.match(text, key_end)
+        if array is not None and text[found - 1:found] != "\\":
+            parts.append(text[position:array.end()])
+            parts.append("]")
+            position = _skip_array(text, array.end())
+            key_end = position
+        found = text.find(_CLIENT_STATS_KEY, key_end)
+    if not parts:
+        return loads(text)
+    parts.append(text[position:])
+    return loads("".join(parts))
+
+
+def iter_clients(settings, fields=CLIENT_FIELDS):
+    """
+    Клиенты из строки settings по одному, только с полями fields.
+    Если массив clients не найден по шаблону, строка разбирается целиком.
+    """
+    match = _CLIENTS_START.search(settings)
+    if match is None:
+        for client in loads(settings).get("clients", []):
+            yield {field: client[field] for field in fields if field in client}
+        return
+
+    position, end = match.end(), len(settings)
+    while True:
+        position = _SEPARATORS.match(settings, position).end()
+        if position >= end or settings[position] == "]":
+            return
+        client, position = _decoder.raw_decode(settings, position)
+        yield {field: client[field] for field in fields if field in client}
+
+
+def parse_settings(value, fields=None) -> dict:
+    """settings inbound: целиком или (при fields) только {"clients": [...]} с полями fields."""
+    if not value:
+        return {}
+    if isinstance(value, dict):
+        if fields is None:
+            return value
+        value = json.dumps(value)
+    if fields is None:
+        return loads(value)
+    return {"clients": list(iter_clients(value, fields))}
@@ -1,89 +1,66 @@
-import requests
-from handlers.config import get_server_data
-import json
+from handlers.capacity import slot_tracker
+from handlers.balancing import get_strategy
 from log import logger
 from db.db import ServerDatabase
 
 
-async def get_optimal_server(selected_server, db: ServerDatabase):
+async def release_slot_reservation(state):
+    """Снимает резерв места из state (поток оформления оборвался до создания клиента)."""
+    data = await state.get_data()
+    token = data.get("slot_reservation")
+    if token:
+        slot_tracker.release(token)
+        await state.update_data(slot_reservation=None)
+
+
+async def get_optimal_server(selected_server, db: ServerDatabase, state=None):
     """
     Получает оптимальный сервер на основе выбранного сервера, сравнивая количество свободных мест.
 
     Эта функция выполняет запрос к базе данных для получения информации о серверах, сравнивает количество свободных мест на каждом сервере
-    и возвращает сервер с наибольшим количеством свободных мест. Если все сервера заняты, возвращается сообщение об этом.
+    и возвращает сервер, выбранный стратегией группы (по умолчанию — с наибольшим количеством свободных мест).
+    Если все сервера заняты, возвращается сообщение об этом.
+    Если передан state, на выбранном сервере резервируется место (slot_reservation в state),
+    и add_client подтверждает резерв после создания клиента.
     """
     try:
-        db.cursor.execute("SELECT server_ids FROM server_groups WHERE group_name = ?", (selected_server,))
-        result = db.cursor.fetchone()
+        group_server_ids = await db.get_group_server_ids(selected_server)
         
-        if not result:
+        if not group_server_ids:
             return "Сервер не найден"
         
-        servers_to_compare = result[0].split(",")
-        
-        available_servers = []
+        servers_to_compare = [server_num.strip() for server_num in group_server_ids.split(",") if server_num.strip()]
+        strategy = get_strategy(await db.get_group_strategy(selected_server))
+        if state is not None:
+            # Прежний резерв (пользователь выбирает сервер заново) больше не нужен
+            await release_slot_reservation(state)
+
+        # Занятость берется из памяти (handlers/capacity.py), без запросов к панелям.
+        # Между чтением кандидатов, выбором и резервом нет await, поэтому
+        # одновременные регистрации не займут одно и то же место.
+        candidates = await slot_tracker.candidates(servers_to_compare)
+        optimal_server = strategy.choose(candidates)
+        token = slot_tracker.reserve(optimal_server.id) if optimal_server is not None and state is not None else None
+
+        available = {candidate.id for candidate in candidates}
         for server_num in servers_to_compare:
-            clients_count = await fetch_all_clients(server_num)
-            server_data = await get_server_data(server_num)
-            if server_data:
-                free_slots = max(0, server_data["total_slots"] - clients_count)
+            if int(server_num) not in available and slot_tracker.total(server_num):
+                logger.warning(f"Сервер {server_num} работает с перебоями, пропускаем при выборе")
 
-                logger.info(f"Сервер {server_num}: Общее количество мест = {server_data['total_slots']}, "
-                            f"Занято клиентов = {clients_count}, Свободных мест = {free_slots}")
-                
-                if free_slots > 0:
-                    available_servers.append({
-                        "server": server_num,
-                        "free_slots": free_slots,
-                        "total_slots": server_data["total_slots"]
-                    })
+        for candidate in candidates:
+            logger.info(f"Сервер {candidate.id}: Общее количество мест = {candidate.total}, "
+                        f"Занято клиентов = {candidate.occupied}, Свободных мест = {candidate.free}")
 
-        if available_servers:
-            optimal_server = max(available_servers, key=lambda x: x["free_slots"], default=None)
-            logger.info(f"Оптимальный сервер: {optimal_server['server']} с {optimal_server['free_slots']} свободными местами.")
-            return optimal_server['server']
+        if optimal_server is not None:
+            if state is not None:
+                await state.update_data(slot_reservation=token)
+            logger.info(
+                f"Оптимальный сервер ({strategy.name}): {optimal_server.id} с {optimal_server.free} свободными местами."
+            )
+            return str(optimal_server.id)
         else:
             logger.warning("В этой локации нет свободных мест")
             return "Сервер полностью занят, попробуйте позже"
     except Exception as e:
         logger.error(f"Ошибка при выборе оптимального сервера: {e}")
         return "Ошибка при обработке запроса"
-
-async def fetch_all_clients(server_selection):
-    """
-    Получает список всех клиентов на сервере.
-
-    Эта функция выполняет запросы к серверу для получения данных о клиентах, связанных с данным сервером.
-    Возвращает количество клиентов на сервере, или сообщение об ошибке в случае неудачи.
-    """
-    server_data = await get_server_data(server_selection)
-    
-    if not server_data:
-        return 0
-
-    session = requests.Session()
-    login_response = session.post(server_data['login_url'], json={
-        "username": server_data['username'], 
-        "password": server_data['password']
-    })
-
-    if login_response.status_code != 200:
-        return f"Ошибка входа: {login_response.status_code}"
-
-    clients_list = []
-    for inbound_id in server_data["inbound_ids"]:
-        try:
-            inbound_url = f"{server_data['config_client_url']}/{inbound_id}"
-            inbound_response = session.get(inbound_url, headers={'Accept': 'application/json'})
-            
-            if inbound_response.status_code != 200:
-                continue
-            inbound_data = inbound_response.json().get('obj', {})
-            settings = json.loads(inbound_data.get('settings', '{}'))
-
-            for client in settings.get('clients', []):
-                if 'email' in client:
-                    clients_list.append(client['email'])
-        except Exception as e:
-            continue
-    return len(clients_list)
\ No newline at end of file
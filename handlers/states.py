@@ -6,7 +6,6 @@
 Основные классы состояний:
 
 - **TrialPeriodState**: Управление состоянием для обработки периода пробного использования.
-- **Database**: Класс для работы с базой данных, получением данных по email.
 - **AddClient**: Состояния для добавления нового клиента, включая данные о платеже, сроках и методе оплаты.
 - **GetConfig**: Состояния для ввода и получения конфигурации.
 - **UpdClient**: Состояния для обновления информации о клиенте.
@@ -24,28 +23,10 @@
 """
 
 from aiogram.fsm.state import State, StatesGroup
-import sqlite3
 
 class TrialPeriodState(StatesGroup):
     waiting_for_answer = State()
 
-class Database:
-    def __init__(self, db_path):
-        self.connection = sqlite3.connect(db_path)
-        self.cursor = self.connection.cursor()
-
-    def get_ids_by_email(self, email):
-        query = """
-            SELECT user_id
-            FROM user_emails
-            WHERE email = ?
-        """
-        self.cursor.execute(query, (email,))
-    
-        user_ids = [row[0] for row in self.cursor.fetchall()]
-
-        return user_ids
-
 class AddClient(StatesGroup):
     WaitingForPayment = State()
     WaitingForExpiryTime = State()
@@ -15,7 +15,11 @@ import client.upd_sub
 import admin.admin
 from middlewares import check_subscription
 from admin.sheduler import start_scheduler
-from db.db import Database, ServerDatabase, init_referal_table
+from db.db import Database, ServerDatabase
+from db.pool import init_pools, close_pools
+from db.writer import start_writer, stop_writer
+from handlers.panel import close_panels
+from handlers.config import server_registry
 from admin import admin, add_servers
 from client import dp_menu, upd_sub, referral, smena_servera
 from pay import process_bay, tgpay
@@ -65,8 +69,9 @@ async def on_startup():
         server_db = ServerDatabase(SERVEDATABASE)
         user_db.setup_tables()
         server_db.setup_tables_serv()
-
-        init_referal_table()
+        await init_pools()
+        await start_writer()
+        await server_registry.load()
 
         logger.info("✅ Базы данных успешно инициализированы.")
         
@@ -100,6 +105,9 @@ async def on_startup():
     except Exception as e:
         logger.error(f"❌ Ошибка при запуске бота: {e}", exc_info=True)
     finally:
+        await stop_writer()
+        await close_pools()
+        await close_panels()
         logger.info("🛑 Бот остановлен.")
 
 
@@ -52,7 +52,6 @@ class SubscriptionMiddleware(BaseMiddleware):
         telegram_id = event.from_user.id
         username = event.from_user.first_name or "Без имени"
         telegram_link = f"https://t.me/{event.from_user.username}" if event.from_user.username else None
-        referral_code = await get_user_referral_code(telegram_id) or str(uuid.uuid4())[:8]
         entry_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         referred_by = None
 
@@ -60,6 +59,7 @@ class SubscriptionMiddleware(BaseMiddleware):
         if isinstance(event, Message) and event.text and len(event.text.split()) > 1:
             referred_by = event.text.split()[1]
 
+        referral_code = await get_user_referral_code(telegram_id) or str(uuid.uuid4())[:8]
         await handle_user_registration(telegram_id, username, telegram_link, referral_code, referred_by, entry_date)
 
         # ✅ Теперь проверяем подписку
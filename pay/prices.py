@@ -15,9 +15,11 @@
 """
 
 from aiogram import types
-import sqlite3
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from log import logger
+from db.pool import users_pool
+from db.repo import PromoRepo
+from db.cache import profile_cache
 from buttons.client import BUTTON_TEXTS
 from dotenv import load_dotenv
 from aiogram.types import CallbackQuery
@@ -59,11 +61,11 @@ def get_expiry_time_description(expiry_time):
     return descriptions.get(expiry_time, "бесплатный период")
 
 # Расчет скидки пользователя, складывает скидку за количество рефералов и введенный промокод, если такой имеется.
-def get_price_with_referral_info(expiry_time_ms, telegram_id, promo_code=None):
+async def get_price_with_referral_info(expiry_time_ms, telegram_id, promo_code=None):
     """
     Рассчитывает стоимость подписки с учетом скидки за рефералов и промокод.
     """
-    referral_count = get_referral_count(telegram_id)
+    referral_count = await get_referral_count(telegram_id)
 
     if referral_count >= 10: #Если 10 и более
         referral_discount = 0.4  # 40%
@@ -76,42 +78,21 @@ def get_price_with_referral_info(expiry_time_ms, telegram_id, promo_code=None):
     promo_discount = 0
 
     if promo_code:
-        conn_users = sqlite3.connect(USERSDATABASE)
-        cursor_users = conn_users.cursor()
-        cursor_users.execute(""" 
-            SELECT promo_code_usage 
-            FROM users
-            WHERE telegram_id = ?
-        """, (telegram_id,))
-        promo_usage_data = cursor_users.fetchone()
-
-        if promo_usage_data and promo_usage_data[0] == 1:
-            cursor_users.close()
-            conn_users.close()
+        profile = await profile_cache.get(telegram_id)
+        if profile and profile.user.promo_code_usage == 1:
             return str(int(BASE_PRICES.get(expiry_time_ms, 0) * (1 - referral_discount))), f"{int(referral_discount * 100)}", referral_count
-        cursor_users.execute("""
-            SELECT COUNT(*) 
-            FROM used_promo_codes 
-            WHERE user_id = ? AND promo_code = ?
-        """, (telegram_id, promo_code))
-        used_count = cursor_users.fetchone()[0]
-
-        if used_count > 0:
-            cursor_users.close()
-            conn_users.close()
-            return str(int(BASE_PRICES.get(expiry_time_ms, 0) * (1 - referral_discount))), f"{int(referral_discount * 100)}", referral_count
-        cursor_users.execute("""
-            SELECT discount
-            FROM promo_codes
-            WHERE code = ? AND is_active = 1
-        """, (promo_code,))
-        promo_data = cursor_users.fetchone()
-
-        if promo_data:
-            promo_discount = promo_data[0] / 100
-
-        cursor_users.close()
-        conn_users.close()
+
+        async with users_pool.acquire() as conn_users:
+            promos = PromoRepo(conn_users)
+            used_count = await promos.used_count(telegram_id, promo_code)
+
+            if used_count > 0:
+                return str(int(BASE_PRICES.get(expiry_time_ms, 0) * (1 - referral_discount))), f"{int(referral_discount * 100)}", referral_count
+            discount = await promos.active_discount(promo_code)
+
+        if discount:
+            promo_discount = discount / 100
+
     total_discount = referral_discount + promo_discount
     if total_discount > 0.8:# Ограничение макисмальной скидки, не больше 80%
         total_discount = 0.8
@@ -299,59 +280,31 @@ def get_trial_windows():
 
 """end меню для пробной подписки"""
 
-def get_referral_count(telegram_id):
+async def get_referral_count(telegram_id):
     """
     Получает количество рефералов пользователя.
     """
-    conn = sqlite3.connect(USERSDATABASE)
-    cursor = conn.cursor() 
-    cursor.execute("SELECT referral_count FROM users WHERE telegram_id = ?", (telegram_id,))
-    referral_count = cursor.fetchone()
-    cursor.close()
-    conn.close()
-    if referral_count:
-        return referral_count[0]
-    else:
-        return 0
+    profile = await profile_cache.get(telegram_id)
+    return profile.referral_count if profile else 0
     
     
 #Показывать или нет кнопку с пробной подпиской    
-def has_active_subscription(telegram_id):
+async def has_active_subscription(telegram_id):
     """
     Проверяет, есть ли у пользователя активная пробная подписка.
     """
-    conn = sqlite3.connect(USERSDATABASE)
-    cursor = conn.cursor()
+    profile = await profile_cache.get(telegram_id)
 
-    cursor.execute('''
-        SELECT has_trial FROM users WHERE telegram_id = ?
-    ''', (telegram_id,))
+    return profile is not None and profile.has_trial
 
-    result = cursor.fetchone()
-    
-    cursor.close()
-    conn.close()
-
-    return result is not None and result[0] == 1
-
-def should_show_prodlit_button(telegram_id):
+async def should_show_prodlit_button(telegram_id):
     """
     Проверяет, нужно ли показывать кнопку 'Продлить' вместо 'Купить VPN'.
     Возвращает True если has_trial или sum_my не равны 0.
     """
-    conn = sqlite3.connect(USERSDATABASE)
-    cursor = conn.cursor()
-
-    cursor.execute('''
-        SELECT has_trial, sum_my FROM users WHERE telegram_id = ?
-    ''', (telegram_id,))
-
-    result = cursor.fetchone()
-    cursor.close()
-    conn.close()
+    profile = await profile_cache.get(telegram_id)
 
-    if result is None:
+    if profile is None:
         return False
 
-    has_trial, sum_my = result
-    return has_trial != 0 or sum_my != 0
\ No newline at end of file
+    return profile.user.has_trial != 0 or profile.user.sum_my != 0
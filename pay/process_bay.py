@@ -1,5 +1,4 @@
 import asyncio
-import aiosqlite
 import re, uuid
 from datetime import datetime, timedelta
 from uuid import uuid4
@@ -16,19 +15,16 @@ from log import logger
 from client.add_client import (
     add_client, 
     generate_config_from_pay, 
-    login, 
     send_config_from_state
 )
 from db.db import (
-    handle_database_operations, 
+    record_purchase,
     insert_or_update_user, 
-    update_user_trial_status,
-    update_sum_my,
-    update_sum_ref,
-    add_free_days
+    update_user_trial_status
 )
 from handlers.config import get_server_data
-from handlers.select_server import get_optimal_server
+from handlers.panel import get_panel, PanelError
+from handlers.select_server import get_optimal_server, release_slot_reservation
 from handlers.states import AddClient
 from pay.prices import *
 from pay.payments import (
@@ -45,7 +41,6 @@ from pay.payments import (
     check_yoomoney_payment_status
 )
 
-from pay.promocode import log_promo_code_usage
 from pay.pay_metod import PAYMENT_METHODS
 from client.menu import get_main_menu
 from client.add_client import generate_login
@@ -53,6 +48,7 @@ from buttons.client import BUTTON_TEXTS
 from dotenv import load_dotenv
 import os
 from db.db import ServerDatabase
+from db.pool import users_pool
 load_dotenv()
 
 
@@ -137,7 +133,7 @@ async def process_trial_subscription(callback_query: types.CallbackQuery, state:
     await callback_query.answer()
 
     # Проверка: есть ли уже активная подписка
-    if not has_active_subscription(telegram_id):
+    if not await has_active_subscription(telegram_id):
         logger.info(f"Пользователь {telegram_id} не имеет активной подписки. Продолжаем.")
 
         try:
@@ -160,7 +156,7 @@ async def process_trial_subscription(callback_query: types.CallbackQuery, state:
             logger.info(f"Статус пробной подписки обновлён для {telegram_id}")
 
             # Этап 5: Выбор сервера
-            selected_server = await get_optimal_server("random", server_db)
+            selected_server = await get_optimal_server("random", server_db, state=state)
             logger.info(f"Выбранный сервер: {selected_server}")
             if not selected_server:
                 logger.error(f"Не удалось выбрать сервер для {telegram_id}")
@@ -175,6 +171,7 @@ async def process_trial_subscription(callback_query: types.CallbackQuery, state:
             logger.info(f"Получены данные сервера: {selected_server}")
             if not server_data:
                 logger.error(f"Данные сервера {selected_server} не найдены.")
+                await release_slot_reservation(state)
                 await callback_query.message.edit_text(
                     "❌ Не удалось получить данные сервера.",
                     parse_mode="HTML"
@@ -186,12 +183,11 @@ async def process_trial_subscription(callback_query: types.CallbackQuery, state:
 
             # Этап 7: Авторизация
             logger.info(f"Авторизация на сервере {server_data['login_url']}")
-            session_id = await login(server_data['login_url'], {
-                "username": server_data['username'],
-                "password": server_data['password']
-            })
-            if not session_id:
-                logger.error(f"Авторизация не удалась на сервере {server_data['login_url']}")
+            try:
+                await get_panel(server_data).ensure_login()
+            except PanelError as e:
+                logger.error(f"Авторизация не удалась на сервере {server_data['login_url']}: {e}")
+                await release_slot_reservation(state)
                 await callback_query.message.edit_text(
                     "❌ Не удалось авторизоваться на сервере.",
                     parse_mode="HTML"
@@ -202,11 +198,7 @@ async def process_trial_subscription(callback_query: types.CallbackQuery, state:
             # Этап 8: Добавление клиента
             inbound_ids = server_data['inbound_ids']
             logger.info(f"Добавляем клиента {name} на сервер {selected_server}")
-            await add_client(
-                name, expiry_time, inbound_ids, telegram_id,
-                server_data['add_client_url'], server_data['login_url'],
-                {"username": server_data['username'], "password": server_data['password']}
-            )
+            await add_client(server_data, name, expiry_time, telegram_id, state=state)
             logger.info(f"Клиент {name} добавлен")
 
             # Этап 9: Сохранение в FSM
@@ -244,6 +236,7 @@ async def process_trial_subscription(callback_query: types.CallbackQuery, state:
 
         except Exception as e:
             logger.exception(f"Ошибка при оформлении пробной подписки: {e}")
+            await release_slot_reservation(state)
             await callback_query.message.edit_text(
                 "❌ Произошла ошибка при создании подписки. Попробуйте позже.",
                 parse_mode="HTML"
@@ -253,7 +246,7 @@ async def process_trial_subscription(callback_query: types.CallbackQuery, state:
         logger.warning(f"Пользователь {telegram_id} уже имеет активную подписку.")
         await callback_query.message.edit_text(
             "⚠ У вас уже есть активная подписка. Пробная доступна только один раз.",
-            reply_markup=get_main_menu(callback_query),
+            reply_markup=await get_main_menu(callback_query),
             parse_mode="HTML"
         )
 
@@ -331,7 +324,7 @@ async def confirmed_expiry_time(callback_query: types.CallbackQuery, state: FSMC
 
     # --- Выбор сервера ---
     logger.info(f"Начало выбора оптимального сервера для пользователя {telegram_id} (режим 'random')")
-    selected_server = await get_optimal_server("random", server_db)
+    selected_server = await get_optimal_server("random", server_db, state=state)
 
     if selected_server is None:
         logger.error(f"get_optimal_server вернул None для пользователя {telegram_id}")
@@ -463,28 +456,23 @@ async def process_paid_subscription(callback_query: types.CallbackQuery, state:
 
     # Этап 4: Получение промокода пользователя из БД
     logger.info(f"Запрос промокода пользователя {telegram_id} из базы данных.")
-    conn_users = sqlite3.connect(USERSDATABASE)
-    cursor_users = conn_users.cursor()
-
     try:
-        cursor_users.execute("""
-            SELECT promo_code 
-            FROM users 
-            WHERE telegram_id = ? 
-        """, (telegram_id,))
-        result = cursor_users.fetchone()
+        async with users_pool.acquire() as conn_users:
+            async with conn_users.execute("""
+                SELECT promo_code 
+                FROM users 
+                WHERE telegram_id = ? 
+            """, (telegram_id,)) as cursor_users:
+                result = await cursor_users.fetchone()
         user_promo_code = result[0] if result and result[0] else None
         logger.info(f"Промокод пользователя {telegram_id}: {user_promo_code}")
     except Exception as e:
         logger.exception(f"Ошибка при получении промокода из БД для пользователя {telegram_id}: {e}")
         user_promo_code = None
-    finally:
-        cursor_users.close()
-        conn_users.close()
 
     # Этап 5: Расчёт цены и скидки
     logger.info(f"Расчёт цены для пользователя {telegram_id} с expiry_time={expiry_time}, промокод={user_promo_code}")
-    price, total_discount, referral_count = get_price_with_referral_info(expiry_time, telegram_id, user_promo_code)
+    price, total_discount, referral_count = await get_price_with_referral_info(expiry_time, telegram_id, user_promo_code)
     expiry_time_description = get_expiry_time_description(expiry_time)
 
     logger.info(f"Цена: {price}, Скидка: {total_discount}%, Приглашённых: {referral_count}")
@@ -524,7 +512,7 @@ async def process_paid_subscription(callback_query: types.CallbackQuery, state:
 
     # Этап 9: Выбор оптимального сервера
     logger.info(f"Начало выбора оптимального сервера для страны с ID {server_selection}")
-    optimal_server = await get_optimal_server(server_selection, server_db)
+    optimal_server = await get_optimal_server(server_selection, server_db, state=state)
 
     if optimal_server == "Сервер полностью занят, попробуйте позже":
         logger.warning(f"Сервер для страны {server_selection} полностью занят.")
@@ -747,7 +735,7 @@ async def handle_payment_method_selection(callback_query: types.CallbackQuery, s
 
     # Этап 3: Расчёт финальной цены
     try:
-        price_info = get_price_with_referral_info(expiry_time, user_id, user_promo_code)
+        price_info = await get_price_with_referral_info(expiry_time, user_id, user_promo_code)
         final_price = int(price_info[0])
         logger.info(f"Рассчитана цена подписки: {final_price} RUB (user_id={user_id})")
     except Exception as e:
@@ -1097,12 +1085,10 @@ async def process_successful_payment(callback_query: types.CallbackQuery, state:
 
         # === 1. Вход в 3x UI ===
         logger.info(f"🔐 Вход в панель управления сервера: {server_data['login_url']}")
-        session_id = await login(server_data['login_url'], {
-            "username": server_data['username'],
-            "password": server_data['password']
-        })
-        if not session_id:
-            logger.error(f"❌ Не удалось авторизоваться на сервере {server_data['server_ip']}")
+        try:
+            await get_panel(server_data).ensure_login()
+        except PanelError as e:
+            logger.error(f"❌ Не удалось авторизоваться на сервере {server_data['server_ip']}: {e}")
             raise Exception("Не удалось войти в 3x UI")
 
         logger.info(f"✅ Успешная авторизация на сервере {server_data['name']}")
@@ -1110,11 +1096,7 @@ async def process_successful_payment(callback_query: types.CallbackQuery, state:
         # === 2. Добавляем клиента ===
         inbound_ids = server_data['inbound_ids']
         logger.info(f"➕ Добавление клиента на сервер: {name}, expiry_time={expiry_time}, inbounds={inbound_ids}")
-        await add_client(
-            name, expiry_time, inbound_ids, telegram_id,
-            server_data['add_client_url'], server_data['login_url'],
-            {"username": server_data['username'], "password": server_data['password']}
-        )
+        await add_client(server_data, name, expiry_time, telegram_id, state=state)
         logger.info(f"✅ Клиент {name} успешно добавлен на сервер {server_data['name']}")
 
         # === 3. Генерация и отправка конфигурации ===
@@ -1137,38 +1119,21 @@ async def process_successful_payment(callback_query: types.CallbackQuery, state:
         logger.info(f"📤 Отправка конфигурации пользователю {telegram_id} (билеты: {tickets_msg})")
         await send_config_from_state(callback_query.message, state, telegram_id, edit=False, tickets_message=tickets_msg)
 
-        # === 4. Обновление баз данных ===
-        logger.info(f"💾 Начало обновления баз данных для пользователя {telegram_id}")
-        await handle_database_operations(telegram_id, name, expiry_time)
-        await insert_or_update_user(telegram_id, name, selected_server)
-        await log_promo_code_usage(telegram_id, data.get('user_promo_code'))
-        await update_sum_my(telegram_id, final_price)
-        await update_sum_ref(telegram_id, final_price)
-        logger.info(f"✅ Все основные записи в БД успешно обновлены")
-
-        # === 5. Начисление билетов за оплату ===
+        # === 4. Обновление баз данных: покупка, реферал, билеты и бесплатные дни одной транзакцией ===
         insert_count = {1: 1, 3: 3, 12: 12}.get(approx_months, 0)
-        if insert_count > 0:
-            user = callback_query.from_user
-            telegram_ref = f"https://t.me/{user.username}" if user.username else user.first_name
-            logger.info(f"🎟️ Начисление {insert_count} билетов пользователю {telegram_id} через реферальную таблицу")
-            try:
-                async with aiosqlite.connect("users.db") as conn:
-                    await conn.execute('PRAGMA busy_timeout = 5000')
-                    await conn.executemany(
-                        "INSERT INTO referal_tables (telegram_user) VALUES (?)",
-                        [(telegram_ref,)] * insert_count
-                    )
-                    await conn.commit()
-                logger.info(f"✅ Успешно вставлено {insert_count} записей в referal_tables для {telegram_ref}")
-            except Exception as e:
-                logger.error(f"❌ Ошибка при вставке билетов в referal_tables: {e}", exc_info=True)
-
-        # === 6. Добавление бесплатных дней (например, +3 за первую оплату) ===
-        if FREE_DAYS > 0:
-            logger.info(f"🎁 Добавление {FREE_DAYS} бесплатных дней за первую оплату")
-            await add_free_days(telegram_id, FREE_DAYS)
-            logger.info(f"✅ Бесплатные дни успешно добавлены пользователю {telegram_id}")
+        user = callback_query.from_user
+        telegram_ref = f"https://t.me/{user.username}" if user.username else user.first_name
+        logger.info(
+            f"💾 Запись покупки пользователя {telegram_id}: билетов {insert_count}, "
+            f"бесплатных дней пригласившему {FREE_DAYS}"
+        )
+        await record_purchase(
+            telegram_id, final_price,
+            email=name, server_id=selected_server,
+            tickets_user=telegram_ref, tickets=insert_count,
+            free_days=FREE_DAYS
+        )
+        logger.info(f"✅ Все записи в БД успешно обновлены")
 
         # Этап финализации
         await state.clear()
@@ -1190,6 +1155,10 @@ async def process_successful_payment(callback_query: types.CallbackQuery, state:
             f"💥 Критическая ошибка при обработке платежа для пользователя {telegram_id} (task_id={task_id}): {e}",
             exc_info=True
         )
+        try:
+            await release_slot_reservation(state)
+        except Exception as release_error:
+            logger.debug(f"Не удалось снять резерв места пользователя {telegram_id}: {release_error}")
         try:
             await callback_query.message.answer("Произошла ошибка. Напишите в поддержку.")
         except Exception as send_error:
@@ -1436,13 +1405,13 @@ async def handle_cancel_payment(callback_query: types.CallbackQuery, state: FSMC
                 chat_id=callback_query.message.chat.id,
                 message_id=sent_message_id,
                 text="❌ Действие отменено.",
-                reply_markup=get_main_menu(callback_query)
+                reply_markup=await get_main_menu(callback_query)
             )
         else:
             await bot.send_message(
                 chat_id=callback_query.message.chat.id,
                 text="Нет активной покупки. Выберите опцию:",
-                reply_markup=get_main_menu(callback_query)
+                reply_markup=await get_main_menu(callback_query)
             )
 
         await state.clear()
@@ -1453,5 +1422,5 @@ async def handle_cancel_payment(callback_query: types.CallbackQuery, state: FSMC
         await bot.send_message(
             chat_id=callback_query.message.chat.id,
             text="Не удалось отменить покупку. Попробуйте снова.",
-            reply_markup=get_main_menu(callback_query)
+            reply_markup=await get_main_menu(callback_query)
         )
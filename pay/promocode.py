@@ -2,6 +2,9 @@
 import sqlite3
 from dotenv import load_dotenv
 import os
+from db.pool import users_pool
+from db.repo import UserRepo
+from db.cache import profile_cache
 load_dotenv()
 
 USERSDATABASE = os.getenv("USERSDATABASE")
@@ -14,30 +17,17 @@ async def log_promo_code_usage(telegram_id, user_promo_code):
     и, если нет, помечает его как использованный в базе данных.
     """
     try:
-        conn = sqlite3.connect(USERSDATABASE)
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, promo_code_usage
-            FROM users
-            WHERE telegram_id = ?
-        """, (telegram_id,))
-        user_data = cursor.fetchone()
+        async with users_pool.acquire() as conn:
+            users = UserRepo(conn)
+            user = await users.get(telegram_id)
 
-        if not user_data:
-            return "❌ User not found."
+            if not user:
+                return "❌ User not found."
 
-        user_id, promo_code_usage = user_data
-        if promo_code_usage > 0:
-            return "❌ Promo code has already been used by this user."
-        cursor.execute("""
-            UPDATE users
-            SET promo_code_usage = 1
-            WHERE id = ?
-        """, (user_id,))
-        conn.commit()
+            if not await users.mark_promo_used(user.id):
+                return "❌ Promo code has already been used by this user."
+            await conn.commit()
+        profile_cache.invalidate(telegram_id)
         return "✅ Promo code usage successfully logged and marked as used."
     except sqlite3.Error as e:
         return f"❌ Database error: {e}"
-    finally:
-        cursor.close()
-        conn.close()
@@ -9,19 +9,13 @@ from log import logger
 from client.add_client import (
     add_client,
     generate_config_from_pay,
-    login,
     send_config_from_state,
 )
-from db.db import (
-    handle_database_operations,
-    insert_or_update_user,
-    update_sum_my,
-    update_sum_ref
-)
-from pay.promocode import log_promo_code_usage
+from db.db import record_purchase
 from client.upd_sub import update_client_subscription
 from client.menu import get_back_button
 from handlers.config import get_server_data
+from handlers.select_server import release_slot_reservation
 
 router = Router()
 
@@ -60,13 +54,9 @@ async def update_client(message: types.Message, state: FSMContext, amount: float
         name = data.get("name")
         final_price = amount
         months = data.get("selected_months")
-        user_promo_code = data.get("user_promo_code")
         telegram_id = message.from_user.id
         await update_client_subscription(telegram_id, name, months)
-        await handle_database_operations(telegram_id, name, months)
-        await log_promo_code_usage(telegram_id, user_promo_code)
-        await update_sum_my(telegram_id, final_price)
-        await update_sum_ref(telegram_id, final_price)
+        await record_purchase(telegram_id, final_price)
         await message.answer(
             text=f"✅ Подписка продлена на {months} месяц(а)!",
             parse_mode='HTML',
@@ -92,15 +82,7 @@ async def first_add_client(message: types.Message, state: FSMContext, amount: fl
         selected_server = data['selected_server']
         telegram_id = message.from_user.id
         server_data = await get_server_data(selected_server)
-        session_id = await login(server_data['login_url'], {
-            "username": server_data['username'],
-            "password": server_data['password']
-        })
-        add_client_result = await add_client(
-            name, expiry_time, server_data['inbound_ids'], telegram_id,
-            server_data['add_client_url'], server_data['login_url'], 
-            {"username": server_data['username'], "password": server_data['password']}
-        )
+        add_client_result = await add_client(server_data, name, expiry_time, telegram_id, state=state)
 
         await state.update_data(
             email=name,
@@ -117,14 +99,11 @@ async def first_add_client(message: types.Message, state: FSMContext, amount: fl
 
         userdata, config, config2, config3 = await generate_config_from_pay(telegram_id, name, state)
         await send_config_from_state(message, state, telegram_id=message.from_user.id, edit=False)  
-        await handle_database_operations(telegram_id, name, expiry_time)
-        await insert_or_update_user(telegram_id, name, selected_server)
-        await log_promo_code_usage(telegram_id, user_promo_code)
-        await update_sum_my(telegram_id, final_price)
-        await update_sum_ref(telegram_id, final_price)
+        await record_purchase(telegram_id, final_price, email=name, server_id=selected_server)
         await state.clear()
         
     except Exception as e:
         logger.error(f"Ошибка при обработке платежа: {e}")
+        await release_slot_reservation(state)
         return    
     
\ No newline at end of file
@@ -0,0 +1,103 @@
+"""
+Общие настройки тестов.
+
+Тесты запускаются из корня проекта (`python -m pytest`) и импортируют модули
+бота напрямую, поэтому корень проекта добавляется в sys.path. Базы — в памяти
+процесса (DB_BACKEND=memory), панели — фейковые из benchmarks/fake_panel.py.
+Переменные окружения задаются до импорта модулей бота, потому что пулы и
+хранилища читают их при импорте.
+
+Тесты синхронные: корутины запускаются через фикстуру run, которая после
+теста закрывает пулы и сессии панелей в том же цикле событий.
+"""
+
+import asyncio
+import os
+import socket
+import sqlite3
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+os.environ["DB_BACKEND"] = "memory"
+os.environ["USERSDATABASE"] = "test_users.db"
+os.environ["SERVEDATABASE"] = "test_servers.db"
+
+import pytest
+
+from benchmarks.fake_panel import write_servers_db
+from db.migrate import run_migrations
+from db.pool import close_pools, USERSDATABASE, SERVEDATABASE
+from db.storage import get_storage
+from handlers import capacity, config, health, locator
+from handlers.panel import close_panels
+
+
+@pytest.fixture
+def run():
+    """Выполняет корутину в новом цикле событий и закрывает пулы и панели."""
+    def run(coroutine):
+        async def main():
+            try:
+                return await coroutine
+            finally:
+                await close_panels()
+                await close_pools()
+        return asyncio.run(main())
+    return run
+
+
+@pytest.fixture
+def users_db():
+    """users.db в памяти со всеми миграциями; возвращает sqlite3-подключение к ней."""
+    storage = get_storage(USERSDATABASE)
+    connection = storage.connect_sync()
+    run_migrations(connection)
+    yield connection
+    connection.close()
+    storage.close()
+
+
+@pytest.fixture
+def servers_db(tmp_path):
+    """
+    Заполняет servers.db в памяти через write_servers_db:
+    servers_db([(base_url, inbound_ids), ...], total_slots=10).
+    """
+    storage = get_storage(SERVEDATABASE)
+    connection = storage.connect_sync()
+
+    def fill(servers, **kwargs):
+        path = tmp_path / "servers.db"
+        write_servers_db(str(path), servers, **kwargs)
+        source = sqlite3.connect(path)
+        try:
+            source.backup(connection)
+        finally:
+            source.close()
+        return connection
+
+    yield fill
+    connection.close()
+    storage.close()
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Новый реестр серверов вместо синглтона (его блокировка привязана к прошлому циклу событий)."""
+    registry = config.ServerRegistry()
+    for module in (config, capacity, health, locator):
+        monkeypatch.setattr(module, "server_registry", registry)
+    return registry
+
+
+@pytest.fixture
+def unused_port():
+    """Свободный TCP-порт для фейковой панели."""
+    def unused_port():
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            return sock.getsockname()[1]
+    return unused_port
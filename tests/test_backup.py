@@ -0,0 +1,62 @@
+import asyncio
+import gzip
+import os
+import sqlite3
+
+import pytest
+
+from db.backup import create_backup, prune_backups, BackupError
+
+
+@pytest.fixture
+def source_db(tmp_path):
+    path = str(tmp_path / "users.db")
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE items (value TEXT)")
+    connection.executemany("INSERT INTO items VALUES (?)", [(f"value-{i}" * 20,) for i in range(2000)])
+    connection.commit()
+    yield path, connection
+    connection.close()
+
+
+def test_backup_is_compressed_consistent_copy(source_db, tmp_path):
+    path, connection = source_db
+    backup_dir = tmp_path / "backups"
+
+    target = asyncio.run(create_backup(path, backup_dir=str(backup_dir), pages=4, step_sleep=0))
+    assert os.path.dirname(target) == str(backup_dir)
+    assert os.path.basename(target).startswith("backup_users_") and target.endswith(".db.gz")
+    # Временный несжатый файл удален
+    assert os.listdir(backup_dir) == [os.path.basename(target)]
+
+    restored = tmp_path / "restored.db"
+    with gzip.open(target, "rb") as src:
+        restored.write_bytes(src.read())
+    copy = sqlite3.connect(restored)
+    try:
+        assert copy.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 2000
+        assert copy.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    finally:
+        copy.close()
+
+
+def test_backup_error_leaves_no_file(tmp_path):
+    backup_dir = tmp_path / "backups"
+    with pytest.raises(BackupError):
+        asyncio.run(create_backup(str(tmp_path / "missing" / "users.db"), backup_dir=str(backup_dir)))
+    assert os.listdir(backup_dir) == []
+
+
+def test_prune_keeps_latest_copies_of_one_database(tmp_path):
+    names = [f"backup_users_2024-01-0{day}_00-00-00.db.gz" for day in range(1, 6)]
+    others = ["backup_servers_2024-01-01_00-00-00.db.gz", "notes.txt"]
+    for name in names + others:
+        (tmp_path / name).write_bytes(b"")
+
+    removed = prune_backups("data/users.db", backup_dir=str(tmp_path), keep=2)
+    assert removed == names[:3]
+    assert sorted(os.listdir(tmp_path)) == sorted(names[3:] + others)
+
+
+def test_prune_missing_directory(tmp_path):
+    assert prune_backups("users.db", backup_dir=str(tmp_path / "missing")) == []
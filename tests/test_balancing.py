@@ -0,0 +1,59 @@
+import random
+from collections import Counter
+
+from handlers.balancing import Candidate, STRATEGIES, get_strategy
+
+
+def choose(name, candidates, seed=1):
+    chosen = STRATEGIES[name].choose(candidates, random.Random(seed))
+    return chosen.id if chosen is not None else None
+
+
+def test_full_servers_are_never_chosen():
+    candidates = [Candidate(1, 10, 10), Candidate(2, 5, 0)]
+    for name in STRATEGIES:
+        assert choose(name, candidates) is None
+        assert choose(name, candidates + [Candidate(3, 9, 10)]) == 3
+        assert choose(name, []) is None
+
+
+def test_most_free_picks_largest_free_capacity():
+    assert choose("most_free", [Candidate(1, 0, 10), Candidate(2, 50, 100), Candidate(3, 9, 10)]) == 2
+
+
+def test_weighted_follows_free_capacity():
+    rng = random.Random(1)
+    candidates = [Candidate(1, 0, 30), Candidate(2, 20, 30)]
+    counts = Counter(STRATEGIES["weighted"].choose(candidates, rng).id for _ in range(4000))
+    # Свободных мест 30 и 10: доля первого около 3/4
+    assert 0.7 < counts[1] / 4000 < 0.8
+
+
+def test_p2c_picks_less_utilized_of_two():
+    assert choose("p2c", [Candidate(1, 9, 10)]) == 1
+    # У первого больше свободных мест, но заполненность выше
+    candidates = [Candidate(1, 60, 100), Candidate(2, 1, 10)]
+    assert all(choose("p2c", candidates, seed) == 2 for seed in range(20))
+
+
+def test_latency_prefers_faster_panel_at_equal_load():
+    candidates = [Candidate(1, 5, 10, latency=2.0), Candidate(2, 5, 10, latency=0.01)]
+    assert choose("latency", candidates) == 2
+    # Без данных о задержке решает заполненность
+    assert choose("latency", [Candidate(1, 2, 10), Candidate(2, 5, 10)]) == 1
+
+
+def test_latency_penalties_apply_to_empty_servers():
+    # Пустой сервер с медленной панелью и полуоткрытым предохранителем
+    # не должен выигрывать только потому, что на нем ноль клиентов
+    candidates = [Candidate(1, 0, 100, latency=5.0, half_open=True), Candidate(2, 1, 100, latency=0.01)]
+    assert choose("latency", candidates) == 2
+    assert choose("latency", [Candidate(1, 0, 100, latency=5.0), Candidate(2, 1, 100, latency=0.01)]) == 2
+    assert choose("latency", [Candidate(1, 0, 100, half_open=True), Candidate(2, 0, 100)]) == 2
+
+
+def test_get_strategy_falls_back_to_default():
+    assert get_strategy("p2c") is STRATEGIES["p2c"]
+    assert get_strategy(" latency ") is STRATEGIES["latency"]
+    assert get_strategy(None) is STRATEGIES["most_free"]
+    assert get_strategy("unknown") is STRATEGIES["most_free"]
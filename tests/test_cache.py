@@ -0,0 +1,124 @@
+import asyncio
+
+from db.cache import ProfileCache, UserProfile
+from db.repo import UserRow
+
+
+class CountingCache(ProfileCache):
+    """Кэш, который загружает профили из словаря и считает загрузки."""
+
+    def __init__(self, users, **kwargs):
+        super().__init__(**kwargs)
+        self.users = users
+        self.loads = 0
+        self.gate = None  # asyncio.Event: загрузка ждет его, если задан
+
+    async def _load(self, telegram_id):
+        self.loads += 1
+        if self.gate is not None:
+            await self.gate.wait()
+        user = self.users.get(telegram_id)
+        return UserProfile(user, ["login"]) if user is not None else None
+
+
+def make_user(telegram_id, **fields):
+    user = UserRow(*([None] * len(UserRow.__slots__)))
+    user.telegram_id = telegram_id
+    for name, value in fields.items():
+        setattr(user, name, value)
+    return user
+
+
+def test_profile_properties():
+    profile = UserProfile(make_user(1, is_blocked=1, has_trial=1, referral_count=None), ["a", "b"])
+    assert profile.is_blocked is True
+    assert profile.has_trial is True
+    assert profile.referral_count == 0
+    assert profile.emails == ("a", "b")
+
+
+def test_hit_after_first_load():
+    cache = CountingCache({1: make_user(1)})
+
+    async def main():
+        first = await cache.get(1)
+        second = await cache.get(1)
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert first is second
+    assert cache.loads == 1
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_missing_user_is_not_cached():
+    cache = CountingCache({})
+
+    async def main():
+        assert await cache.get(1) is None
+        assert await cache.get(1) is None
+
+    asyncio.run(main())
+    assert cache.loads == 2
+    assert cache.stats()["size"] == 0
+
+
+def test_ttl_expiry():
+    cache = CountingCache({1: make_user(1)}, ttl=0)
+
+    async def main():
+        await cache.get(1)
+        await cache.get(1)
+
+    asyncio.run(main())
+    assert cache.loads == 2
+
+
+def test_lru_eviction():
+    cache = CountingCache({i: make_user(i) for i in range(3)}, maxsize=2)
+
+    async def main():
+        await cache.get(0)
+        await cache.get(1)
+        await cache.get(0)  # 0 становится самым свежим
+        await cache.get(2)  # вытесняет 1
+        loads = cache.loads
+        await cache.get(0)
+        assert cache.loads == loads
+        await cache.get(1)
+        assert cache.loads == loads + 1
+
+    asyncio.run(main())
+
+
+def test_invalidate_reloads_profile():
+    users = {1: make_user(1, sum_my=0)}
+    cache = CountingCache(users)
+
+    async def main():
+        assert (await cache.get(1)).user.sum_my == 0
+        users[1] = make_user(1, sum_my=100)
+        assert (await cache.get(1)).user.sum_my == 0
+        cache.invalidate(1, None, 2)
+        assert (await cache.get(1)).user.sum_my == 100
+
+    asyncio.run(main())
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_load_started_before_invalidation_is_not_cached():
+    cache = CountingCache({1: make_user(1)})
+
+    async def main():
+        cache.gate = asyncio.Event()
+        loading = asyncio.create_task(cache.get(1))
+        await asyncio.sleep(0)
+        # Запись прошла, пока загрузка ждала базу
+        cache.invalidate(1)
+        cache.gate.set()
+        assert await loading is not None
+        cache.gate = None
+        await cache.get(1)
+
+    asyncio.run(main())
+    assert cache.loads == 2
@@ -0,0 +1,128 @@
+import asyncio
+import time
+
+from benchmarks.fake_panel import FakePanel
+from handlers.capacity import SlotTracker
+
+
+def make_tracker(total, occupied):
+    """Трекер с готовыми счетчиками, без сверки с панелями."""
+    tracker = SlotTracker()
+    tracker._total = dict(total)
+    tracker._occupied = {server_id: dict(counts) for server_id, counts in occupied.items()}
+    tracker.built_at = time.monotonic()
+    return tracker
+
+
+def test_reserve_takes_free_slot():
+    tracker = make_tracker({1: 3}, {1: {1: 1}})
+    first = tracker.reserve(1)
+    second = tracker.reserve("1")
+    assert first and second and first != second
+    assert tracker.reserved(1) == 2
+    assert tracker.reserve(1) is None
+
+
+def test_reserve_unknown_or_uncounted_server():
+    tracker = make_tracker({1: 3, 2: 3}, {1: {}})
+    assert tracker.reserve(2) is None
+    assert tracker.reserve(3) is None
+
+
+def test_release_frees_slot():
+    tracker = make_tracker({1: 1}, {1: {}})
+    token = tracker.reserve(1)
+    assert tracker.reserve(1) is None
+    tracker.release(token)
+    tracker.release(token)
+    tracker.release(None)
+    assert tracker.reserved(1) == 0
+    assert tracker.reserve(1) is not None
+
+
+def test_commit_turns_reservation_into_occupied_slot():
+    tracker = make_tracker({1: 2}, {1: {1: 0}})
+    token = tracker.reserve(1)
+    tracker.commit(token, 1, 2)
+    assert tracker.reserved(1) == 0
+    assert tracker.occupied(1) == 1
+    assert tracker.inbound_occupied(1) == {1: 0, 2: 1}
+
+
+def test_commit_after_expiry_still_counts_client():
+    tracker = make_tracker({1: 1}, {1: {}})
+    token = tracker.reserve(1, ttl=0)
+    assert tracker.reserved(1) == 0
+    tracker.commit(token, 1, 1)
+    assert tracker.occupied(1) == 1
+    assert tracker.reserve(1) is None
+
+
+def test_reservation_expires():
+    tracker = make_tracker({1: 1}, {1: {}})
+
+    async def main():
+        tracker.reserve(1, ttl=0.01)
+        assert tracker.reserve(1) is None
+        await asyncio.sleep(0.02)
+        assert tracker.reserved(1) == 0
+        assert tracker.reserve(1) is not None
+
+    asyncio.run(main())
+
+
+def test_concurrent_reservations_do_not_overbook():
+    tracker = make_tracker({1: 10, 2: 5}, {1: {1: 8}, 2: {1: 4}})
+
+    async def signup(i):
+        await asyncio.sleep(0)
+        candidates = await tracker.candidates([1, 2])
+        server_id = max(candidates, key=lambda candidate: candidate.free).id if candidates else 1
+        token = tracker.reserve(server_id)
+        await asyncio.sleep(0.01)
+        if token and i % 2:
+            tracker.commit(token, server_id, 1)
+        return token
+
+    async def main():
+        return await asyncio.gather(*[signup(i) for i in range(100)])
+
+    tokens = [token for token in asyncio.run(main()) if token]
+    assert len(tokens) == 3
+    for server_id in (1, 2):
+        assert tracker.occupied(server_id) + tracker.reserved(server_id) == tracker.total(server_id)
+    assert tracker.reserve(1) is None and tracker.reserve(2) is None
+
+
+def test_candidates_count_reservations():
+    tracker = make_tracker({1: 4}, {1: {1: 1}})
+    tracker.reserve(1)
+
+    async def main():
+        return await tracker.candidates([1])
+
+    [candidate] = asyncio.run(main())
+    assert candidate.id == 1
+    assert candidate.free == 2
+
+
+def test_slot_tracker_counts_semicolon_inbound_ids(run, registry, servers_db, unused_port):
+    async def main():
+        first = FakePanel(inbounds=2, clients=3, seed=1)
+        second = FakePanel(inbounds=3, clients=1, seed=2)
+        connection = servers_db([(await first.start(port=unused_port()), [1, 2]),
+                                 (await second.start(port=unused_port()), [3])], total_slots=10)
+        # add_server пишет inbound_ids через ';'
+        connection.execute("UPDATE servers SET inbound_ids = '1;2' WHERE id = 1")
+        connection.commit()
+        try:
+            tracker = SlotTracker()
+            assert await tracker.free_slots([1, 2, 3]) == {1: 4, 2: 9}
+            assert tracker.inbound_occupied(1) == {1: 3, 2: 3}
+            # Клиенты inbounds, которых нет в inbound_ids сервера, не считаются
+            assert tracker.inbound_occupied(2) == {3: 1}
+        finally:
+            await first.stop()
+            await second.stop()
+
+    run(main())
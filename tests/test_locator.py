@@ -0,0 +1,127 @@
+import asyncio
+import json
+
+import pytest
+
+from handlers import locator as locator_module
+from handlers.locator import FleetLocator
+from handlers.panel import Inbound, InboundSnapshot, PanelError
+
+
+class SnapshotPanel:
+    """Панель, которая отдает снимок из словаря {inbound_id: [email, ...]} или ошибку."""
+
+    def __init__(self, inbounds=None, error=None):
+        self.inbounds = inbounds or {}
+        self.error = error
+        self.gate = None  # asyncio.Event: загрузка ждет его, если задан
+
+    async def snapshot(self, max_age=None):
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.error is not None:
+            raise self.error
+        return InboundSnapshot([
+            Inbound.from_api({"id": inbound_id, "settings": json.dumps({
+                "clients": [{"id": f"{inbound_id}-{email}", "email": email} for email in emails]
+            })})
+            for inbound_id, emails in self.inbounds.items()
+        ])
+
+
+@pytest.fixture
+def panels(monkeypatch):
+    """Панели по base_url вместо настоящих клиентов 3x-ui."""
+    panels = {}
+    monkeypatch.setattr(locator_module, "get_panel", lambda server_data: panels[server_data["base_url"]])
+    return panels
+
+
+def link(users_db, email, server_id):
+    users_db.execute("INSERT INTO user_emails (user_id, email, id_server) VALUES (1, ?, ?)", (email, server_id))
+    users_db.commit()
+
+
+def test_changes_update_index():
+    locator = FleetLocator()
+    locator.add("a", 1)
+    locator.add("a", "2")
+    assert locator._servers == {"a": {1, 2}}
+    locator.move("a", 3)
+    assert locator._servers == {"a": {3}}
+    locator.remove("a", 1)
+    assert locator._servers == {"a": {3}}
+    locator.add("b", 1)
+    locator.remove("a", 3)
+    locator.remove("b")
+    assert len(locator) == 0
+
+
+def test_reconcile_prefers_panel_over_database(run, registry, users_db, servers_db, panels):
+    servers_db([("http://one", [1, 2]), ("http://two", [1])])
+    panels["http://one"] = SnapshotPanel({1: ["a"], 2: ["b"], 3: ["other-inbound"]})
+    panels["http://two"] = SnapshotPanel({1: ["moved"]})
+    link(users_db, "a", 1)
+    link(users_db, "moved", 1)
+    link(users_db, "deleted", 2)
+
+    async def main():
+        locator = FleetLocator()
+        assert await locator.servers("a") == [1]
+        assert await locator.server("b") == 1
+        assert await locator.servers("moved") == [2]
+        assert await locator.servers("deleted") == []
+        # Клиенты inbounds, которых нет в inbound_ids сервера, не индексируются
+        assert await locator.servers("other-inbound") == []
+        assert len(locator) == 3
+
+    run(main())
+
+
+def test_unreachable_panel_keeps_database_locations(run, registry, users_db, servers_db, panels):
+    servers_db([("http://one", [1]), ("http://two", [1])])
+    panels["http://one"] = SnapshotPanel({1: ["a"]})
+    panels["http://two"] = SnapshotPanel(error=PanelError("timeout"))
+    link(users_db, "b", 2)
+
+    async def main():
+        locator = FleetLocator()
+        assert await locator.servers("a") == [1]
+        assert await locator.servers("b") == [2]
+
+    run(main())
+
+
+def test_changes_during_reconcile_are_not_lost(run, registry, users_db, servers_db, panels):
+    servers_db([("http://one", [1])])
+    panel = panels["http://one"] = SnapshotPanel({1: ["a"]})
+
+    async def main():
+        locator = FleetLocator()
+        panel.gate = asyncio.Event()
+        reconcile = asyncio.create_task(locator.reconcile())
+        await asyncio.sleep(0.01)
+        # Клиент добавлен и удален, пока снимок панели грузился
+        locator.add("new", 1)
+        locator.remove("a", 1)
+        panel.gate.set()
+        await reconcile
+        assert await locator.servers("new") == [1]
+        assert await locator.servers("a") == []
+
+    run(main())
+
+
+def test_reconcile_reads_semicolon_inbound_ids(run, registry, users_db, servers_db, panels):
+    # add_server пишет inbound_ids через ';'
+    connection = servers_db([("http://one", [1, 2])])
+    connection.execute("UPDATE servers SET inbound_ids = '1;2'")
+    connection.commit()
+    panels["http://one"] = SnapshotPanel({1: ["a"], 2: ["b"]})
+
+    async def main():
+        locator = FleetLocator()
+        assert await locator.servers("a") == [1]
+        assert await locator.servers("b") == [1]
+
+    run(main())
@@ -0,0 +1,123 @@
+import os
+import shutil
+import sqlite3
+import time
+
+import pytest
+
+from db.migrate import run_migrations, current_version, table_columns, discover_migrations
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LATEST = max(version for version, _, _ in discover_migrations())
+
+
+def indexes(connection, table):
+    return {row[1] for row in connection.execute(f"PRAGMA index_list({table})")}
+
+
+def versions(connection):
+    return [row[0] for row in connection.execute("SELECT version FROM schema_version ORDER BY version")]
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    """Копия users.db из репозитория: рабочая база без schema_version (версия 0)."""
+    path = tmp_path / "users.db"
+    shutil.copy(os.path.join(ROOT, "users.db"), path)
+    connection = sqlite3.connect(path)
+    yield connection
+    connection.close()
+
+
+def test_migrations_are_numbered_in_order():
+    assert [version for version, _, _ in discover_migrations()] == [1, 2, 3, 4]
+
+
+def test_empty_database(tmp_path):
+    connection = sqlite3.connect(tmp_path / "users.db")
+    assert run_migrations(connection) == LATEST
+    assert versions(connection) == [1, 2, 3, 4]
+    for table in ("users", "user_emails", "promo_codes", "used_promo_codes", "referals",
+                  "user_configs", "referral_links", "referal_tables"):
+        assert table_columns(connection.cursor(), table), table
+    connection.close()
+
+
+def test_existing_database_from_version_zero(legacy_db):
+    users_before = legacy_db.execute("SELECT telegram_id FROM users ORDER BY id").fetchall()
+    emails_before = legacy_db.execute("SELECT email, id_server FROM user_emails ORDER BY id").fetchall()
+    assert current_version(legacy_db.cursor()) == 0
+
+    assert run_migrations(legacy_db) == LATEST
+    assert versions(legacy_db) == [1, 2, 3, 4]
+
+    # Данные не потерялись
+    assert legacy_db.execute("SELECT telegram_id FROM users ORDER BY id").fetchall() == users_before
+    assert legacy_db.execute("SELECT email, id_server FROM user_emails ORDER BY id").fetchall() == emails_before
+
+    # m0002: колонки, которые раньше добавлялись вручную
+    cursor = legacy_db.cursor()
+    assert {"sum_my", "free_days", "is_blocked", "used_trial_seven"} <= set(table_columns(cursor, "users"))
+    assert "days" in table_columns(cursor, "promo_codes")
+    # m0003: индексы под горячие запросы, лишние удалены
+    assert {"idx_user_emails_user_email_server", "idx_user_emails_email"} <= indexes(legacy_db, "user_emails")
+    assert "idx_user_emails_user_id" not in indexes(legacy_db, "user_emails")
+    assert "ux_user_configs_email" in indexes(legacy_db, "user_configs")
+    assert not {"idx_user_configs_email", "idx_user_configs_config"} & indexes(legacy_db, "user_configs")
+    assert "idx_used_promo_codes_user_code" in indexes(legacy_db, "used_promo_codes")
+    # m0004: expires_at заполнен из days_left
+    assert "idx_user_configs_expires_at" in indexes(legacy_db, "user_configs")
+    assert legacy_db.execute(
+        "SELECT COUNT(*) FROM user_configs WHERE expires_at IS NULL AND days_left IS NOT NULL"
+    ).fetchone()[0] == 0
+    assert legacy_db.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+
+
+def test_second_run_is_noop(legacy_db):
+    assert run_migrations(legacy_db) == LATEST
+    schema = legacy_db.execute("SELECT name, sql FROM sqlite_master ORDER BY name").fetchall()
+    assert run_migrations(legacy_db) == LATEST
+    assert versions(legacy_db) == [1, 2, 3, 4]
+    assert legacy_db.execute("SELECT name, sql FROM sqlite_master ORDER BY name").fetchall() == schema
+
+
+def test_user_configs_deduplicated_and_expiry_backfilled(legacy_db):
+    legacy_db.execute("DELETE FROM user_configs")
+    legacy_db.executemany(
+        "INSERT INTO user_configs (email, config, days_left) VALUES (?, ?, ?)",
+        [("a", "old", 3), ("a", "new", 10), ("b", "forever", -1)],
+    )
+    legacy_db.commit()
+
+    run_migrations(legacy_db)
+    rows = dict(
+        (email, (config, expires_at))
+        for email, config, expires_at in legacy_db.execute("SELECT email, config, expires_at FROM user_configs")
+    )
+    assert set(rows) == {"a", "b"}
+    # Из дублей остается последняя запись
+    assert rows["a"][0] == "new"
+    assert rows["b"] == ("forever", 0)
+    # Срок — начало дня через days_left дней (с точностью до суток и часового пояса)
+    days = (rows["a"][1] / 1000 - time.time()) / 86400
+    assert 8 < days <= 10.5
+    with pytest.raises(sqlite3.IntegrityError):
+        legacy_db.execute("INSERT INTO user_configs (email, config) VALUES ('a', 'dup')")
+
+
+def test_failed_migration_is_rolled_back(legacy_db, monkeypatch):
+    migrations = discover_migrations()
+    _, _, broken = migrations[2]
+
+    def upgrade(cursor):
+        cursor.execute("CREATE INDEX idx_partial ON users (username)")
+        cursor.execute("SELECT * FROM no_such_table")
+
+    monkeypatch.setattr(broken, "upgrade", upgrade)
+    with pytest.raises(sqlite3.OperationalError):
+        run_migrations(legacy_db)
+    assert versions(legacy_db) == [1, 2]
+    assert "idx_partial" not in indexes(legacy_db, "users")
+
+    monkeypatch.undo()
+    assert run_migrations(legacy_db) == LATEST
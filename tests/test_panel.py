@@ -0,0 +1,110 @@
+import pytest
+from aiohttp import web
+
+from benchmarks.fake_panel import FakePanel
+from handlers.panel import XUIPanelClient, PanelError, PanelAuthError, PanelRejected
+
+
+class ScriptedPanel(FakePanel):
+    """Фейковая панель, у которой getClientTraffics отвечает заданным ответом."""
+
+    def __init__(self, response, **kwargs):
+        super().__init__(**kwargs)
+        self.response = response
+
+    async def client_traffics(self, request):
+        return self.response()
+
+
+def with_panel(run, unused_port, panel, check, password="admin"):
+    async def main():
+        base_url = await panel.start(port=unused_port())
+        client = XUIPanelClient(base_url, "admin", password)
+        try:
+            await check(client)
+        finally:
+            await client.close()
+            await panel.stop()
+
+    run(main())
+
+
+def test_client_state_found(run, unused_port):
+    async def check(client):
+        state = await client.client_state("user-2-1", [1, 2])
+        assert state["email"] == "user-2-1"
+        assert state["inboundId"] == 2
+        assert state["expiryTime"] > 0
+        assert client._client_endpoint is True
+
+    with_panel(run, unused_port, FakePanel(inbounds=2, clients=2, seed=1), check)
+
+
+def test_client_state_unknown_email(run, unused_port):
+    async def check(client):
+        # Панель отвечает success=true и obj=null
+        assert await client.client_state("nobody", [1]) is None
+        # Клиент есть, но в другом inbound
+        assert await client.client_state("user-1-0", [2]) is None
+
+    with_panel(run, unused_port, FakePanel(inbounds=1, clients=1, seed=1), check)
+
+
+def test_client_state_rejected_means_not_found(run, unused_port):
+    panel = ScriptedPanel(lambda: FakePanel._fail("record not found"))
+
+    async def check(client):
+        assert await client.client_state("nobody", [1]) is None
+        with pytest.raises(PanelRejected):
+            await client.client_traffic("nobody")
+
+    with_panel(run, unused_port, panel, check)
+
+
+def test_client_state_wrong_password_raises(run, unused_port):
+    async def check(client):
+        with pytest.raises(PanelAuthError):
+            await client.client_state("user-1-0", [1])
+
+    with_panel(run, unused_port, FakePanel(inbounds=1, clients=1), check, password="wrong")
+
+
+@pytest.mark.parametrize("response", [
+    lambda: web.Response(text="<html>oops</html>", content_type="application/json"),
+    lambda: web.Response(text="<html>oops</html>", content_type="text/html"),
+    lambda: web.json_response({"success": False, "msg": "internal", "obj": None}, status=500),
+], ids=["not-json", "html", "status-500"])
+def test_client_state_errors_are_not_missing_client(run, unused_port, response):
+    async def check(client):
+        with pytest.raises(PanelError) as error:
+            await client.client_state("user-1-0", [1])
+        assert not isinstance(error.value, PanelRejected)
+
+    with_panel(run, unused_port, ScriptedPanel(response, inbounds=1, clients=1), check)
+
+
+def test_client_state_falls_back_to_snapshot_without_endpoint(run, unused_port):
+    panel = ScriptedPanel(lambda: web.Response(status=404, text="404 page not found"), inbounds=2, clients=2, seed=1)
+
+    async def check(client):
+        state = await client.client_state("user-2-0", [1, 2])
+        assert state["email"] == "user-2-0"
+        assert state["inboundId"] == 2
+        assert client._client_endpoint is False
+        assert await client.client_state("nobody", [1, 2]) is None
+
+    with_panel(run, unused_port, panel, check)
+
+
+def test_client_state_404_after_endpoint_worked_raises(run, unused_port):
+    responses = [lambda: FakePanel._ok(None), lambda: web.Response(status=404, text="404 page not found")]
+    panel = ScriptedPanel(lambda: responses[0]())
+
+    async def check(client):
+        assert await client.client_state("nobody", [1]) is None
+        assert client._client_endpoint is True
+        responses.pop(0)
+        with pytest.raises(PanelError):
+            await client.client_state("nobody", [1])
+
+    with_panel(run, unused_port, panel, check)
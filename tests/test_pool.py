@@ -0,0 +1,58 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from db.pool import ConnectionPool, PoolTimeoutError
+from db.storage import get_storage
+
+
+@pytest.fixture
+def pool():
+    pool = ConnectionPool("test_pool.db", size=1, timeout=0.1)
+    yield pool
+    get_storage("test_pool.db").close()
+
+
+def test_failed_reconnect_keeps_the_slot(pool, monkeypatch):
+    async def main():
+        connect = pool._connect
+
+        async def fail():
+            raise sqlite3.OperationalError("unable to open database file")
+
+        try:
+            async with pool.acquire() as conn:
+                # Подключение сломалось, и база недоступна при возврате в пул
+                await conn.close()
+                monkeypatch.setattr(pool, "_connect", fail)
+            assert pool.stats()["free"] == 1
+
+            # Переподключение повторяется при выдаче; пока база недоступна — ошибка, место остается
+            with pytest.raises(sqlite3.OperationalError):
+                async with pool.acquire():
+                    pass
+            assert pool.stats()["free"] == 1
+
+            monkeypatch.setattr(pool, "_connect", connect)
+            async with pool.acquire() as conn:
+                async with conn.execute("SELECT 1") as cursor:
+                    assert await cursor.fetchone() == (1,)
+            assert pool.stats() == {"db_path": "test_pool.db", "size": 1, "free": 1, "in_use": 0}
+        finally:
+            await pool.close()
+
+    asyncio.run(main())
+
+
+def test_checkout_times_out_when_pool_is_busy(pool):
+    async def main():
+        try:
+            async with pool.acquire():
+                with pytest.raises(PoolTimeoutError):
+                    async with pool.acquire():
+                        pass
+        finally:
+            await pool.close()
+
+    asyncio.run(main())
@@ -0,0 +1,309 @@
+import ast
+import asyncio
+import os
+import sqlite3
+
+import aiosqlite
+import pytest
+
+from db.migrate import run_migrations
+from db.repo import (
+    UserRepo, SubscriptionRepo, PromoRepo, ReferralRepo, ServerRepo,
+    UserRow, PromoRow, ServerRow, DAY_MS, day_start_ms, days_left_from_expiry,
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS_SCHEMA = '''
+    CREATE TABLE servers (
+        id INTEGER PRIMARY KEY, total_slots INTEGER, name TEXT, username TEXT, password TEXT,
+        server_ip TEXT, base_url TEXT, subscription_base TEXT, sub_url TEXT, json_sub TEXT, inbound_ids TEXT
+    );
+    CREATE TABLE server_ids (id INTEGER PRIMARY KEY AUTOINCREMENT, server_ids TEXT);
+    CREATE TABLE server_groups (group_name TEXT PRIMARY KEY, server_ids TEXT, strategy TEXT);
+'''
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """users.db со всеми миграциями."""
+    path = tmp_path / "users.db"
+    connection = sqlite3.connect(path)
+    run_migrations(connection)
+    connection.close()
+    return path
+
+
+@pytest.fixture
+def servers_path(tmp_path):
+    path = tmp_path / "servers.db"
+    connection = sqlite3.connect(path)
+    connection.executescript(SERVERS_SCHEMA)
+    connection.close()
+    return path
+
+
+def with_conn(path, check):
+    async def main():
+        async with aiosqlite.connect(path) as conn:
+            await check(conn)
+            await conn.commit()
+
+    asyncio.run(main())
+
+
+def test_row_attributes_and_unpacking():
+    row = PromoRow(1, "SALE", 20, 30, 1)
+    assert (row.id, row.code, row.discount, row.days, row.is_active) == (1, "SALE", 20, 30, 1)
+    row_id, code, discount, days, is_active = row
+    assert code == "SALE" and days == 30
+    assert PromoRow.from_row(None) is None
+    assert repr(row) == "PromoRow(id=1, code='SALE', discount=20, days=30, is_active=1)"
+    # Строки — не кортежи: порядок колонок меняется, обращаться надо по имени
+    with pytest.raises(TypeError):
+        row[0]
+
+
+def test_user_register_and_get(db_path):
+    async def check(conn):
+        users = UserRepo(conn)
+        await users.register(100, "alice", "https://t.me/alice", "REF1", None, None, "2024-01-01", 0)
+        user = await users.get(100)
+        assert isinstance(user, UserRow)
+        assert (user.telegram_id, user.username, user.referral_code) == (100, "alice", "REF1")
+        assert user.sum_my == 0 and user.is_blocked == 0
+        assert await users.get(999) is None
+        assert await users.get_id(100) == user.id
+        assert await users.telegram_id_by_referral_code("REF1") == 100
+
+        new_id = await users.get_or_create_id(200)
+        assert await users.get_or_create_id(200) == new_id
+
+        await users.touch(100, "alice2", "https://t.me/alice2", "2024-02-01")
+        await users.add_sum_my(100, 150)
+        await users.add_free_days(100, 3)
+        user = await users.get(100)
+        assert (user.username, user.sum_my, user.free_days) == ("alice2", 150, 3)
+
+    with_conn(db_path, check)
+
+
+def test_user_flags_report_whether_they_changed(db_path):
+    async def check(conn):
+        users = UserRepo(conn)
+        await users.register(100, "alice", None, "REF1", None, None, "2024-01-01", 0)
+        assert await users.mark_trial_used(100) is True
+        assert await users.mark_trial_used(100) is False
+        assert await users.mark_trial_used(999) is False
+        assert await users.set_blocked(100, True) is True
+        assert (await users.get(100)).is_blocked == 1
+        with pytest.raises(ValueError):
+            await users.set_notified(100, "is_blocked")
+
+    with_conn(db_path, check)
+
+
+def test_subscriptions(db_path):
+    async def check(conn):
+        users, subscriptions = UserRepo(conn), SubscriptionRepo(conn)
+        user_id = await users.get_or_create_id(100)
+        assert await subscriptions.link(user_id, "login", 1) is True
+        assert await subscriptions.link(user_id, "login", 1) is False
+        assert await subscriptions.emails(100) == ["login"]
+        [row] = await subscriptions.by_telegram_id(100)
+        assert (row.user_id, row.email, row.server_id) == (user_id, "login", 1)
+
+        await subscriptions.move("login", 2)
+        assert [row.server_id for row in await subscriptions.by_email("login")] == [2]
+
+        await subscriptions.save_config("login", "vless://a")
+        await subscriptions.save_config("login", "vless://b")
+        count, config = await (await conn.execute(
+            "SELECT COUNT(*), MAX(config) FROM user_configs WHERE email = 'login'"
+        )).fetchone()
+        assert (count, config) == (1, "vless://b")
+
+        await subscriptions.delete_emails(["login"])
+        assert await subscriptions.by_email("login") == []
+
+    with_conn(db_path, check)
+
+
+def test_subscription_expiry(db_path):
+    async def check(conn):
+        users, subscriptions = UserRepo(conn), SubscriptionRepo(conn)
+        await users.register(100, "alice", None, "REF1", None, None, "2024-01-01", 0)
+        user_id = await users.get_id(100)
+        for email in ("soon", "later", "forever"):
+            await subscriptions.link(user_id, email, 1)
+            await subscriptions.save_config(email, "vless://")
+
+        assert await subscriptions.expires_at("soon") is None
+        assert await subscriptions.days_left("soon") is None
+        soon = day_start_ms(3) + DAY_MS // 2
+        assert await subscriptions.set_expires_at("soon", soon) is True
+        assert await subscriptions.set_expires_at("soon", soon) is False
+        await subscriptions.set_expires_at("later", day_start_ms(30))
+        await subscriptions.set_expires_at("forever", 0)
+        assert await subscriptions.days_left("soon") == 3
+        assert await subscriptions.days_left("forever") == -1
+
+        await subscriptions.add_days("soon", 2)
+        await subscriptions.add_days("forever", 2)
+        assert await subscriptions.days_left("soon") == 5
+        assert await subscriptions.expires_at("forever") == 0
+
+        [row] = await subscriptions.expiring(5, 5)
+        assert (row.email, row.telegram_id, row.days_left) == ("soon", 100, 5)
+        assert await subscriptions.expired_telegram_ids() == []
+
+    with_conn(db_path, check)
+
+
+def test_days_left_from_expiry():
+    assert days_left_from_expiry(None) is None
+    assert days_left_from_expiry(0) == -1
+    assert days_left_from_expiry(-5) == -1
+    assert days_left_from_expiry(day_start_ms(0)) == 0
+    assert days_left_from_expiry(day_start_ms(-2)) == -2
+
+
+def test_promo_codes(db_path):
+    async def check(conn):
+        promos = PromoRepo(conn)
+        await promos.add("SALE", 20, 30)
+        await promos.add("MORE", 50, 7)
+
+        promo = await promos.get("SALE")
+        assert (promo.code, promo.discount, promo.days, promo.is_active) == ("SALE", 20, 30, 1)
+        assert await promos.active_discount("SALE") == 20
+        assert await promos.active_discount("NONE") is None
+
+        active = await promos.list_active()
+        assert [row.code for row in active] == ["SALE", "MORE"]
+        # Удаление идет по коду, а не по id
+        await promos.delete(active[0].code)
+        assert [row.code for row in await promos.list_active()] == ["MORE"]
+
+        await UserRepo(conn).get_or_create_id(100)
+        assert await promos.used_count(100, "MORE") == 0
+        await promos.record_use(100, "MORE")
+        assert await promos.used_count(100, "MORE") == 1
+
+    with_conn(db_path, check)
+
+
+def test_promo_deleted_by_code_from_listed_row(db_path):
+    async def check(conn):
+        promos = PromoRepo(conn)
+        await promos.add("SALE", 20, 30)
+        [row] = await promos.list_active()
+        # Ключ удаления — код, а не id первой колонки
+        await promos.delete(row.code)
+        assert await promos.list_active() == []
+
+    with_conn(db_path, check)
+
+
+def row_methods():
+    """Методы репозиториев, которые возвращают строки Row (по аннотации)."""
+    with open(os.path.join(ROOT, "db", "repo.py"), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return {
+        (cls.name, node.name)
+        for cls in tree.body if isinstance(cls, ast.ClassDef) and cls.name.endswith("Repo")
+        for node in cls.body
+        if isinstance(node, ast.AsyncFunctionDef) and node.returns is not None and "Row" in ast.unparse(node.returns)
+    }
+
+
+def indexed_rows(function, methods):
+    """Имена и строки, где строку репозитория читают по индексу: row[0]."""
+    repos, rows = {}, set()
+    for node in ast.walk(function):
+        if isinstance(node, ast.Assign) and isinstance(node.value, ast.Call) \
+                and isinstance(node.value.func, ast.Name) and node.value.func.id.endswith("Repo"):
+            repos.update({target.id: node.value.func.id for target in node.targets if isinstance(target, ast.Name)})
+    for node in ast.walk(function):
+        if isinstance(node, ast.Assign) and isinstance(node.value, ast.Await) and isinstance(node.value.value, ast.Call):
+            func = node.value.value.func
+            if not isinstance(func, ast.Attribute):
+                continue
+            owner = func.value
+            repo = owner.func.id if isinstance(owner, ast.Call) and isinstance(owner.func, ast.Name) \
+                else repos.get(owner.id) if isinstance(owner, ast.Name) else None
+            if (repo, func.attr) in methods:
+                rows.update(target.id for target in node.targets if isinstance(target, ast.Name))
+    for node in ast.walk(function):
+        if isinstance(node, (ast.For, ast.AsyncFor, ast.comprehension)) \
+                and isinstance(node.iter, ast.Name) and node.iter.id in rows and isinstance(node.target, ast.Name):
+            rows.add(node.target.id)
+    return [
+        (node.value.id, node.lineno) for node in ast.walk(function)
+        if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id in rows
+        and isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, int)
+    ]
+
+
+def test_repo_rows_are_not_read_by_index():
+    methods = row_methods()
+    assert ("PromoRepo", "list_active") in methods
+    found = []
+    for package in ("admin", "client", "db", "handlers", "middlewares", "pay"):
+        for dirpath, _, filenames in os.walk(os.path.join(ROOT, package)):
+            for filename in filenames:
+                if not filename.endswith(".py"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                with open(path, encoding="utf-8") as f:
+                    tree = ast.parse(f.read())
+                for function in ast.walk(tree):
+                    if isinstance(function, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                        found += [(os.path.relpath(path, ROOT), line, name) for name, line in indexed_rows(function, methods)]
+    assert found == []
+
+
+def test_referrals(db_path):
+    async def check(conn):
+        referrals = ReferralRepo(conn)
+        await referrals.create(1, "канал", "CODE")
+        await referrals.increment_clicks("CODE")
+        info = await referrals.info("CODE")
+        assert (info.name, info.code, info.clicks) == ("канал", "CODE", 1)
+        name, code, clicks = (await referrals.list_by_owner(1))[0]
+        assert (name, code, clicks) == ("канал", "CODE", 1)
+
+        await referrals.add_tickets(["a", "a", "b"])
+        await referrals.delete_one_ticket("a")
+        assert sorted(await referrals.ticket_counts()) == [("a", 1), ("b", 1)]
+
+    with_conn(db_path, check)
+
+
+def test_servers(servers_path):
+    async def check(conn):
+        servers = ServerRepo(conn)
+        await servers.add(ServerRow(1, 10, "Нидерланды", "admin", "secret", "1.2.3.4",
+                                    "https://panel", "https://sub", "/sub/", "/json/", "1,2"))
+        server = await servers.get(1)
+        assert server.as_dict()["inbound_ids"] == "1,2"
+        assert await servers.update_field(1, "total_slots", 20) is True
+        assert (await servers.get(1)).total_slots == 20
+        with pytest.raises(ValueError):
+            await servers.update_field(1, "id", 2)
+        assert await servers.ids() == [1]
+
+        await servers.set_active_server_ids([1, 2])
+        await servers.set_active_server_ids([1])
+        assert await servers.active_server_ids() == ["1"]
+
+        await servers.upsert_group("1", "1", "p2c")
+        assert await servers.group_server_ids("1") == "1"
+        assert await servers.group_strategy("1") == "p2c"
+        await servers.delete_group("1")
+        assert await servers.groups() == []
+
+        assert await servers.delete(1) is True
+        assert await servers.get(1) is None
+
+    with_conn(servers_path, check)
@@ -0,0 +1,58 @@
+import pytest
+
+from handlers.config import parse_inbound_ids, get_server_data
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("1,2", (1, 2)),
+    ("1;2", (1, 2)),
+    (" 3 ; 4,5 ", (3, 4, 5)),
+    ("7", (7,)),
+    (7, (7,)),
+    ("1,,x", (1,)),
+    ("", ()),
+    (None, ()),
+])
+def test_parse_inbound_ids(value, expected):
+    assert parse_inbound_ids(value) == expected
+
+
+def test_registry_reads_servers_groups_and_active_ids(run, registry, servers_db):
+    connection = servers_db([("http://127.0.0.1:1", [1, 2]), ("http://127.0.0.1:2", [3])], total_slots=10)
+    connection.execute("UPDATE servers SET inbound_ids = '1;2' WHERE id = 1")
+    connection.commit()
+
+    async def main():
+        server = await get_server_data("1")
+        assert server.id == server["id"] == 1
+        assert server.inbound_ids == (1, 2)
+        assert server["add_client_url"] == "http://127.0.0.1:1/panel/api/inbounds/addClient"
+        assert server["login_url"] == "http://127.0.0.1:1/login"
+        assert await registry.get("nope") is None
+        assert await registry.get(3) is None
+        assert [server.id for server in await registry.all()] == [1, 2]
+        assert await registry.group("1") == ("1,2", None)
+        assert await registry.group("missing") == (None, None)
+        assert await registry.active_server_ids() == ["1", "2"]
+
+        # Реестр не перечитывает базу, пока его не сбросят
+        connection.execute("INSERT INTO server_ids (server_ids) VALUES ('2')")
+        connection.commit()
+        assert await registry.active_server_ids() == ["1", "2"]
+        registry.invalidate()
+        assert await registry.active_server_ids() == ["2"]
+
+    run(main())
+
+
+def test_server_config_is_read_only(run, registry, servers_db):
+    servers_db([("http://127.0.0.1:1", [1])])
+
+    async def main():
+        server = await registry.get(1)
+        with pytest.raises(TypeError):
+            server["id"] = 2
+        with pytest.raises(AttributeError):
+            server.missing
+
+    run(main())
@@ -0,0 +1,144 @@
+import asyncio
+import json
+
+from handlers import panel as panel_module
+from handlers.panel import Inbound, InboundSnapshot, XUIPanelClient
+
+
+def make_inbound(inbound_id, emails):
+    clients = [{"id": f"{inbound_id}-{email}", "email": email, "expiryTime": 0} for email in emails]
+    return Inbound.from_api({"id": inbound_id, "settings": json.dumps({"clients": clients})})
+
+
+class CountingPanel(XUIPanelClient):
+    """Клиент панели без сети: inbounds берутся из inbounds, запросы записи считаются успешными."""
+
+    def __init__(self, inbounds):
+        super().__init__("http://panel.test", "admin", "admin")
+        self.inbounds = inbounds
+        self.loads = 0
+        self.gate = None  # asyncio.Event: загрузка ждет его, если задан
+
+    async def list_inbounds(self, *args, **kwargs):
+        self.loads += 1
+        if self.gate is not None:
+            await self.gate.wait()
+        return [make_inbound(inbound_id, emails) for inbound_id, emails in self.inbounds.items()]
+
+    async def _request(self, method, path, **kwargs):
+        return None
+
+
+def test_locate_by_email_and_inbound_ids():
+    snapshot = InboundSnapshot([make_inbound(1, ["a", "shared"]), make_inbound(2, ["b", "shared"])])
+    inbound, client = snapshot.locate("b")
+    assert inbound.id == 2 and client["email"] == "b"
+    assert snapshot.locate("b", [1]) == (None, None)
+    assert snapshot.locate("missing") == (None, None)
+    # Email есть в двух inbounds: поиск ограничен inbounds сервера
+    assert snapshot.locate("shared", [2])[0].id == 2
+    assert snapshot.client(1, "a")["id"] == "1-a"
+    assert snapshot.client(3, "a") is None
+
+
+def test_put_and_remove_client_keep_index():
+    snapshot = InboundSnapshot([make_inbound(1, ["a"]), make_inbound(2, ["a"])])
+    snapshot.put_client(1, {"id": "1-new", "email": "new"})
+    assert snapshot.locate("new")[0].id == 1
+
+    # Замена по id
+    snapshot.put_client(1, {"id": "1-new", "email": "new", "expiryTime": 5})
+    assert snapshot.client(1, "new")["expiryTime"] == 5
+    assert len(snapshot.inbounds[1].clients) == 2
+
+    # После удаления из первого inbound индекс указывает на второй
+    snapshot.remove_client(1, "1-a")
+    inbound, client = snapshot.locate("a")
+    assert inbound.id == 2 and client["id"] == "2-a"
+    snapshot.remove_client(2, "2-a")
+    assert snapshot.locate("a") == (None, None)
+
+
+def test_snapshot_is_cached_within_ttl():
+    panel = CountingPanel({1: ["a"]})
+
+    async def main():
+        first = await panel.snapshot(max_age=30)
+        assert await panel.snapshot(max_age=30) is first
+        assert (await panel.locate("a"))[1]["email"] == "a"
+
+    asyncio.run(main())
+    assert panel.loads == 1
+
+
+def test_concurrent_callers_share_one_load():
+    panel = CountingPanel({1: ["a"]})
+
+    async def main():
+        snapshots = await asyncio.gather(*[panel.snapshot() for _ in range(20)])
+        assert all(snapshot is snapshots[0] for snapshot in snapshots)
+
+    asyncio.run(main())
+    assert panel.loads == 1
+
+
+def test_stale_snapshot_served_while_refreshing(monkeypatch):
+    monkeypatch.setattr(panel_module, "PANEL_SNAPSHOT_STALE", 120)
+    panel = CountingPanel({1: ["a"]})
+
+    async def main():
+        old = await panel.snapshot(max_age=30)
+        old.fetched_at -= 60
+        panel.inbounds = {1: ["a", "b"]}
+        panel.gate = asyncio.Event()
+        # Устаревший снимок отдается сразу, новый грузится в фоне
+        assert await panel.snapshot(max_age=30) is old
+        assert await panel.snapshot(max_age=30) is old
+        panel.gate.set()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        fresh = await panel.snapshot(max_age=30)
+        assert fresh is not old
+        assert fresh.locate("b")[1] is not None
+
+        # Слишком старый снимок не отдается: ждем загрузку
+        fresh.fetched_at -= 500
+        assert await panel.snapshot(max_age=30) is not fresh
+
+    asyncio.run(main())
+    assert panel.loads == 3
+
+
+def test_writes_update_snapshot_in_place():
+    panel = CountingPanel({1: ["a"]})
+
+    async def main():
+        await panel.snapshot()
+        await panel.add_clients(1, [{"id": "1-b", "email": "b"}])
+        await panel.update_client(1, {"id": "1-a", "email": "a", "enable": False})
+        assert (await panel.get_client(1, "b"))["id"] == "1-b"
+        assert (await panel.get_client(1, "a"))["enable"] is False
+        await panel.delete_client(1, "1-b")
+        assert await panel.get_client(1, "b") is None
+        assert panel.loads == 1
+
+        await panel.delete_depleted_clients()
+        await panel.snapshot()
+        assert panel.loads == 2
+
+    asyncio.run(main())
+
+
+def test_max_age_zero_always_loads_fresh_snapshot():
+    panel = CountingPanel({1: ["a"]})
+
+    async def main():
+        first = await panel.snapshot(max_age=0)
+        panel.inbounds = {1: ["a", "b"]}
+        # Снимку доли секунды: без max_age=0 он был бы отдан из окна устаревания
+        fresh = await panel.snapshot(max_age=0)
+        assert fresh is not first
+        assert fresh.locate("b")[1] is not None
+
+    asyncio.run(main())
+    assert panel.loads == 2
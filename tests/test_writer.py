@@ -0,0 +1,112 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from db.storage import get_storage
+from db.writer import WriteQueue
+
+
+class Boom(Exception):
+    pass
+
+
+async def insert(conn, value):
+    await conn.execute("INSERT INTO items (value) VALUES (?)", (value,))
+    return value
+
+
+async def insert_and_fail(conn, value):
+    await conn.execute("INSERT INTO items (value) VALUES (?)", (value,))
+    raise Boom(value)
+
+
+@pytest.fixture
+def items_db():
+    """Отдельная база в памяти с таблицей items(value UNIQUE)."""
+    storage = get_storage("test_writer.db")
+    connection = storage.connect_sync()
+    connection.execute("CREATE TABLE items (value TEXT UNIQUE)")
+    connection.commit()
+    yield connection
+    connection.close()
+    storage.close()
+
+
+def values(connection):
+    return sorted(row[0] for row in connection.execute("SELECT value FROM items"))
+
+
+def test_failed_operation_rolls_back_only_its_savepoint(items_db):
+    writer = WriteQueue("test_writer.db", batch_ms=50)
+
+    async def main():
+        await writer.start()
+        try:
+            return await asyncio.gather(
+                writer.submit(insert, "a"),
+                writer.submit(insert_and_fail, "b"),
+                writer.submit(insert, "c"),
+                writer.submit(insert, "a"),  # нарушает UNIQUE
+                writer.submit(insert, "d"),
+                return_exceptions=True,
+            )
+        finally:
+            await writer.stop()
+
+    results = asyncio.run(main())
+    assert results[0] == "a" and results[2] == "c" and results[4] == "d"
+    assert isinstance(results[1], Boom)
+    assert isinstance(results[3], sqlite3.IntegrityError)
+    assert values(items_db) == ["a", "c", "d"]
+
+    stats = writer.stats()
+    assert stats["batches"] == 1
+    assert stats["operations"] == 5
+    assert stats["failed"] == 2
+
+
+def test_result_is_returned_after_commit(items_db):
+    writer = WriteQueue("test_writer.db", batch_ms=0)
+
+    async def main():
+        await writer.start()
+        try:
+            result = await writer.submit(insert, "a")
+            # Другое подключение уже видит запись
+            assert values(items_db) == ["a"]
+            return result
+        finally:
+            await writer.stop()
+
+    assert asyncio.run(main()) == "a"
+
+
+def test_stop_flushes_queued_operations(items_db):
+    writer = WriteQueue("test_writer.db", batch_ms=10, batch_max=2)
+
+    async def main():
+        await writer.start()
+        futures = [writer.enqueue(insert, value) for value in "abcde"]
+        await asyncio.sleep(0)
+        await writer.stop()
+        return await asyncio.gather(*futures)
+
+    assert asyncio.run(main()) == list("abcde")
+    assert values(items_db) == list("abcde")
+
+
+def test_submit_without_running_writer_writes_to_its_own_database(items_db):
+    # Писатель не запущен: запись идет сразу, в базу писателя, а не в users.db
+    writer = WriteQueue("test_writer.db")
+
+    async def main():
+        try:
+            assert await writer.submit(insert, "a") == "a"
+            with pytest.raises(Boom):
+                await writer.submit(insert_and_fail, "b")
+        finally:
+            await writer.stop()
+
+    asyncio.run(main())
+    assert values(items_db) == ["a"]